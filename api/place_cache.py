@@ -0,0 +1,52 @@
+# api/place_cache.py
+# serialized places for PlacesDetailAPIView, kept in Redis one key per place
+# dropped when a place or its geometry changes (utils.mapdata.handle_mapdata_change), when one
+# of its child records is saved (places.signals), and after bulk writes (places_changed_in_bulk)
+
+import json
+import logging
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+
+def place_detail_key(place_id):
+    return f"api:place_detail:{place_id}"
+
+
+def get_place_details(place_ids):
+    """Stored serializations of `place_ids`, as {place id (str): dict}; missing ones are left out"""
+    if not settings.PLACE_DETAIL_CACHE or not place_ids:
+        return {}
+    try:
+        values = get_redis_connection("property_cache").mget([place_detail_key(pid) for pid in place_ids])
+    except Exception as e:
+        logger.warning(f"Place detail cache unavailable: {e}")
+        return {}
+    return {str(pid): json.loads(value) for pid, value in zip(place_ids, values) if value}
+
+
+def set_place_details(details):
+    """Stores {place id: serialized place} for PLACE_DETAIL_CACHE_TIMEOUT seconds"""
+    if not settings.PLACE_DETAIL_CACHE or not details:
+        return
+    try:
+        pipeline = get_redis_connection("property_cache").pipeline(transaction=False)
+        for pid, detail in details.items():
+            pipeline.set(place_detail_key(pid), json.dumps(detail, cls=DjangoJSONEncoder),
+                         ex=settings.PLACE_DETAIL_CACHE_TIMEOUT)
+        pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Place detail cache unavailable: {e}")
+
+
+def drop_place_details(place_ids):
+    if not settings.PLACE_DETAIL_CACHE or not place_ids:
+        return
+    try:
+        get_redis_connection("property_cache").delete(*[place_detail_key(pid) for pid in place_ids])
+    except Exception as e:
+        logger.warning(f"Place detail cache unavailable: {e}")
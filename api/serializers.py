@@ -4,6 +4,7 @@ from html import escape
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.db.models import Exists, OuterRef, Subquery
 from django.urls import reverse
 
 from collection.models import Collection
@@ -14,7 +15,7 @@ from django.contrib.gis.geos import GEOSGeometry, Point, Polygon, MultiPolygon,
 from rest_framework import serializers
 from django.core import serializers as coreserializers
 from rest_framework_gis.serializers import GeoFeatureModelSerializer, GeometrySerializerMethodField
-from datasets.models import Dataset
+from datasets.models import Dataset, DatasetTask, Hit
 from areas.models import Area
 from main.choices import DATATYPES
 from places.models import *
@@ -48,7 +49,11 @@ class DatasetSerializer(serializers.HyperlinkedModelSerializer):
     place_count = serializers.SerializerMethodField('get_count')
 
     def get_count(self, ds):
-        return ds.places.count()
+        # nested in a list (PlaceTableSerializer), count each dataset once per response
+        counts = self.context.setdefault('dataset_place_counts', {})
+        if ds.id not in counts:
+            counts[ds.id] = ds.places.count()
+        return counts[ds.id]
 
     class Meta:
         model = Dataset
@@ -318,6 +323,13 @@ class PlaceNameSerializer(serializers.ModelSerializer):
     used in multiple views
 """
 
+# Place child relations read by PlaceSerializer and LPFSerializer
+PLACE_CHILD_RELATIONS = ('names', 'types', 'geoms', 'links', 'related', 'whens', 'descriptions', 'depictions')
+
+
+def prefetched(instance, relation):
+    return relation in getattr(instance, '_prefetched_objects_cache', {})
+
 
 class PlaceSerializer(serializers.ModelSerializer):
     dataset = serializers.ReadOnlyField(source='dataset.title')
@@ -325,13 +337,31 @@ class PlaceSerializer(serializers.ModelSerializer):
     names = PlaceNameSerializer(many=True, read_only=True)
     types = PlaceTypeSerializer(many=True, read_only=True)
     geoms = PlaceGeomSerializer(many=True, read_only=True)
-    extent = serializers.ReadOnlyField()
+    extent = serializers.SerializerMethodField('get_extent')
     links = PlaceLinkSerializer(many=True, read_only=True)
     related = PlaceRelatedSerializer(many=True, read_only=True)
     whens = PlaceWhenSerializer(many=True, read_only=True)
     descriptions = PlaceDescriptionSerializer(many=True, read_only=True)
     depictions = PlaceDepictionSerializer(many=True, read_only=True)
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Loads everything serialized here in a fixed number of queries, whatever the page size:
+        one for places and their datasets, and one per child relation.
+        """
+        return queryset.select_related('dataset').prefetch_related(*PLACE_CHILD_RELATIONS)
+
+    def get_extent(self, place):
+        # Place.extent aggregates in the database; with prefetched geoms, combine their extents here
+        if not prefetched(place, 'geoms'):
+            return place.extent
+        extents = [g.geom.extent for g in place.geoms.all() if g.geom]
+        if not extents:
+            return None
+        return (min(e[0] for e in extents), min(e[1] for e in extents),
+                max(e[2] for e in extents), max(e[3] for e in extents))
+
     # cid param passed only from place collection browse screen
     traces = serializers.SerializerMethodField('trace_anno')
 
@@ -393,6 +423,28 @@ class PlaceTableSerializer(serializers.ModelSerializer):
     dataset = DatasetSerializer()
     ds = serializers.SerializerMethodField()
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Annotates what the table cells need, so a page costs a fixed number of queries:
+        first geometry type, whether there are hits per authority, dataset and owner, and annotations.
+        """
+        return queryset.select_related('dataset', 'dataset__owner').prefetch_related('annos').annotate(
+            first_geom_type=Subquery(
+                PlaceGeom.objects.filter(place=OuterRef('pk')).order_by('id').values('jsonb__type')[:1]),
+            has_geom=Exists(PlaceGeom.objects.filter(place=OuterRef('pk'))),
+            has_hits_wd=Exists(Hit.objects.filter(place=OuterRef('pk'), authority__in=['wd', 'wdlocal'])),
+            has_hits_whg=Exists(Hit.objects.filter(place=OuterRef('pk'), authority__in=['whg', 'idx'])),
+            has_hits_tgn=Exists(Hit.objects.filter(place=OuterRef('pk'), authority='tgn')),
+        )
+
+    def review_task_id(self, dataset, task_name):
+        # latest successful task of a kind for a dataset, looked up once per response
+        task_ids = self.context.setdefault('review_task_ids', {})
+        if (dataset.id, task_name) not in task_ids:
+            task_ids[(dataset.id, task_name)] = DatasetTask.latest_task_id(dataset.id, task_name)
+        return task_ids[(dataset.id, task_name)]
+
     def get_ds(self, place):
         cell_value = '<a class="pop-link pop-dataset" data-id=' + str(place.dataset.id) + \
                      ' data-toggle="popover" title="Dataset Profile" data-content=""' + \
@@ -414,8 +466,8 @@ class PlaceTableSerializer(serializers.ModelSerializer):
     geo = serializers.SerializerMethodField()
 
     def get_geo(self, place):
-        if place.geom_count > 0:
-            gtype = place.geoms.all()[0].jsonb['type'].lower()
+        if place.has_geom:
+            gtype = (place.first_geom_type or '').lower()
             fn = "point" if 'point' in gtype else "polygon" if 'poly' in gtype else "linestring"
             return '<img src="/static/images/geo_' + fn + '.svg" width=12/>'
         else:
@@ -429,10 +481,9 @@ class PlaceTableSerializer(serializers.ModelSerializer):
     revwd = serializers.SerializerMethodField('rev_wd')
 
     def rev_wd(self, place):
-        tasks_wd = place.dataset.tasks.filter(task_name='align_wdlocal', status='SUCCESS')
         if place.review_wd == 1:
             val = '<i class="fa fa-check"></i>'
-        elif not place.hashits_wd:
+        elif not place.has_hits_wd:
             val = '<i>no hits</i>'
         elif place.review_wd == 0:
             val = '&#9744;'
@@ -440,26 +491,27 @@ class PlaceTableSerializer(serializers.ModelSerializer):
             val = 'altered'
         else:
             # direct link to deferred record
+            task_id = self.review_task_id(place.dataset, 'align_wdlocal')
             val = '<a href="/datasets/' + str(place.dataset.id) + '/review/' + \
-                  tasks_wd[0].task_id + '/def?pid=' + str(place.id) + '"><i>deferred</i></a>' \
-                if len(tasks_wd) > 0 else '<i>deferred</i>'
+                  task_id + '/def?pid=' + str(place.id) + '"><i>deferred</i></a>' \
+                if task_id else '<i>deferred</i>'
         return val
 
     revwhg = serializers.SerializerMethodField('rev_whg')
 
     def rev_whg(self, place):
-        tasks_whg = place.dataset.tasks.filter(task_name='align_idx', status='SUCCESS')
         if place.review_whg == 1:
             val = '<i class="fa fa-check"></i>'
-        elif not place.hashits_whg:
+        elif not place.has_hits_whg:
             val = '<i>no hits</i>'
         elif place.review_whg == 0:
             val = '&#9744;'
         else:
             # direct link to deferred record
+            task_id = self.review_task_id(place.dataset, 'align_idx')
             val = '<a href="/datasets/' + str(place.dataset.id) + '/review/' + \
-                  tasks_whg[0].task_id + '/def?pid=' + str(place.id) + '"><i>deferred</i></a>' \
-                if len(tasks_whg) > 0 else '<i>deferred</i>'
+                  task_id + '/def?pid=' + str(place.id) + '"><i>deferred</i></a>' \
+                if task_id else '<i>deferred</i>'
         return val
 
     revtgn = serializers.SerializerMethodField('rev_tgn')
@@ -467,7 +519,7 @@ class PlaceTableSerializer(serializers.ModelSerializer):
     def rev_tgn(self, place):
         if place.review_tgn == 1:
             val = '<i class="fa fa-check"></i>'
-        elif not place.hashits_tgn:
+        elif not place.has_hits_tgn:
             val = '<i>no hits</i>'
         elif place.review_tgn == 0:
             val = '&#9744;'
@@ -649,6 +701,16 @@ class LPFSerializer(serializers.Serializer):
 
     properties = serializers.SerializerMethodField('get_properties')
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Loads everything serialized here in a fixed number of queries, whatever the page size:
+        one for places and their datasets, and one per child relation (geometry included).
+        `names` is not read here: its source (placename_set) is not a relation of Place.
+        """
+        return queryset.select_related('dataset').prefetch_related(
+            *[relation for relation in PLACE_CHILD_RELATIONS if relation != 'names'])
+
     def get_properties(self, place) -> dict:
         props = {
             "place_id": place.id,
@@ -25,6 +25,9 @@ urlpatterns = [
     # 2022-09 name conflict with new remote api
     # path('datasets/', views.DatasetAPIView.as_view(), name='dataset-list'),
     path('datasets/', views.DatasetAPIView.as_view(), name='ds-list'),
+
+    # use: download a dataset's places, e.g. ?dataset=<label>&stream=ndjson&compress=gzip
+    path('download/', views.DownloadDatasetAPIView.as_view(), name='ds-download'),
         
     # *** DATASETS & COLLECTIONS
     path('gallery/<str:type>/', views.GalleryView.as_view(), name='gallery'), # type: datasets|collections
@@ -3,7 +3,9 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from django.core import serializers as coreserializers
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from elasticsearch8 import BadRequestError
 from rest_framework.request import Request
 
@@ -14,7 +16,7 @@ from django.contrib.gis.geos import Polygon, Point
 from django.contrib.gis.measure import D
 from django.db.models import Case, When, Min, Max, Subquery, OuterRef, Count, \
     IntegerField
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.views.generic import View
 from django.utils.decorators import method_decorator
@@ -36,6 +38,7 @@ from rest_framework.reverse import reverse
 from rest_framework.generics import ListAPIView
 from rest_framework.views import APIView
 from accounts.permissions import IsOwnerOrReadOnly
+from api.place_cache import get_place_details, set_place_details
 from api.serializers import (
     UserSerializer, DatasetSerializer, PlaceSerializer,
     PlaceTableSerializer, PlaceGeomSerializer, AreaSerializer,
@@ -48,8 +51,12 @@ from main.choices import FEATURE_CLASSES
 from main.models import Log
 from datasets.tasks import get_bounds_filter
 from places.models import PlaceGeom
+from traces.models import TraceAnnotation
+from utils.file_cache import cached_file
 import json
 import os, requests
+from urllib.parse import urlsplit
+import zlib
 
 import logging
 
@@ -475,7 +482,7 @@ class SpatialAPIView(generics.ListAPIView):
                 fclasses = list(set([x.upper() for x in fc.split(',')]))
                 qs = qs.filter(fclasses__overlap=fclasses)
 
-            filtered = qs[:pagesize]
+            filtered = LPFSerializer.setup_eager_loading(qs)[:pagesize]
             serializer = LPFSerializer(filtered, many=True, context={'request': self.request})
             result.update({
                 "count": qs.count(),
@@ -964,7 +971,7 @@ class SearchAPIView(generics.ListAPIView):
             if cc:
                 qs = qs.filter(ccodes__overlap=cc)
 
-        filtered = qs[:pagesize]
+        filtered = LPFSerializer.setup_eager_loading(qs)[:pagesize]
 
         serializer = LPFSerializer(filtered, many=True, context={'request': self.request})
         result = {
@@ -1029,7 +1036,8 @@ class SearchAPIView_DEPRECATED(generics.ListAPIView):
                 qs = qs.filter(dataset=ds) if ds else qs
                 qs = qs.filter(ccodes__overlap=cc) if cc else qs
 
-            filtered = qs[:pagesize] if pagesize and pagesize < 200 else qs[:20]
+            filtered = LPFSerializer.setup_eager_loading(qs)
+            filtered = filtered[:pagesize] if pagesize and pagesize < 200 else filtered[:20]
 
             # serial = LPFSerializer if context else SearchDatabaseSerializer
             serial = LPFSerializer
@@ -1065,7 +1073,7 @@ class PlaceAPIView(generics.ListAPIView):
         query = self.request.GET.get('q')
         if query is not None:
             qs = qs.filter(title__icontains=query)
-        return qs
+        return PlaceSerializer.setup_eager_loading(qs)
 
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
 
@@ -1077,35 +1085,84 @@ class PlaceAPIView(generics.ListAPIView):
 
 
 class DownloadDatasetAPIView(generics.ListAPIView):
-    """  Dataset as LPF FeatureCollection  """
+    """
+    Dataset as LPF FeatureCollection, or with ?stream=ndjson|geojsonseq one feature per line
+    (RFC 8142 record separators for geojsonseq), streamed as read; &compress=gzip gzips the stream
+    """
 
     # serializer_class = PlaceSerializer
     # pagination_class = StandardResultsSetPagination
+    stream_types = {'ndjson': ('application/x-ndjson', 'ndjson', ''),
+                    'geojsonseq': ('application/geo+json-seq', 'geojsons', '\x1e')}
+    chunk_size = 500
 
-    def get(self, format=None):
-        dslabel = self.request.GET.get('dataset')
+    def get(self, request, *args, **kwargs):
+        dslabel = request.GET.get('dataset')
         ds = get_object_or_404(Dataset, label=dslabel)
-        features = []
-        qs = ds.places.all()
-        for p in qs:
-            rec = {"type": "Feature",
-                   "properties": {"id": p.id, "src_id": p.src_id, "title": p.title, "ccodes": p.ccodes},
-                   "geometry": {"type": "GeometryCollection",
-                                "features": [g.jsonb for g in p.geoms.all()]},
-                   "names": [n.jsonb for n in p.names.all()],
-                   "types": [t.jsonb for t in p.types.all()],
-                   "links": [l.jsonb for l in p.links.all()],
-                   "whens": [w.jsonb for w in p.whens.all()],
-                   }
-            # print('rec',rec)
-            features.append(rec)
+        user = request.user
+        if not (ds.public or ds.core or user.is_superuser or
+                (user.is_authenticated and ds.owners.filter(id=user.id).exists())):
+            raise Http404
+        qs = ds.places.prefetch_related('geoms', 'names', 'types', 'links', 'whens').order_by('id')
+
+        stream = request.GET.get('stream')
+        if stream in self.stream_types:
+            return self.streaming_response(ds, qs, stream, request.GET.get('compress') == 'gzip')
 
+        features = [self.feature(p) for p in qs.iterator(chunk_size=self.chunk_size)]
         result = {"type": "FeatureCollection", "features": features}
         return JsonResponse(result, safe=False, json_dumps_params={'ensure_ascii': False, 'indent': 2})
 
+    @staticmethod
+    def feature(p):
+        return {"type": "Feature",
+                "properties": {"id": p.id, "src_id": p.src_id, "title": p.title, "ccodes": p.ccodes},
+                "geometry": {"type": "GeometryCollection",
+                             "features": [g.jsonb for g in p.geoms.all()]},
+                "names": [n.jsonb for n in p.names.all()],
+                "types": [t.jsonb for t in p.types.all()],
+                "links": [l.jsonb for l in p.links.all()],
+                "whens": [w.jsonb for w in p.whens.all()],
+                }
+
+    def feature_lines(self, qs, separator):
+        """
+        Encoded lines in blocks of chunk_size features, read through a server-side cursor
+        with each chunk's children prefetched, so memory use does not depend on dataset size
+        """
+        lines = []
+        for p in qs.iterator(chunk_size=self.chunk_size):
+            lines.append(separator + json.dumps(self.feature(p), ensure_ascii=False) + '\n')
+            if len(lines) == self.chunk_size:
+                yield ''.join(lines).encode('utf-8')
+                lines = []
+        if lines:
+            yield ''.join(lines).encode('utf-8')
+
+    def streaming_response(self, ds, qs, stream, compress):
+        content_type, extension, separator = self.stream_types[stream]
+        content = self.feature_lines(qs, separator)
+        if compress:
+            content = gzip_stream(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{ds.label}.{extension}"'
+        if compress:
+            # already encoded, so GZipMiddleware leaves it alone
+            response['Content-Encoding'] = 'gzip'
+        return response
+
     # permission_classes = [permissions.IsAuthenticatedOrReadOnly,IsOwnerOrReadOnly]
 
 
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 """
   /api/datasets? > query public datasets by id, label, term
 """
@@ -1298,6 +1355,45 @@ class PrettyJsonRenderer(JSONRenderer):
 #     context["query_params"] = self.request.query_params
 #     return context
 
+def alias_base_urls():
+    # aliases.json holds the members of an object, without its braces
+    return cached_file(os.path.join(settings.STATIC_ROOT, 'aliases.json'),
+                       lambda text: json.loads('{' + text + '}')['base_urls'])
+
+
+def country_labels():
+    return cached_file(os.path.join(settings.MEDIA_ROOT, 'data', 'regions_countries.json'),
+                       lambda text: {country['id']: country['text'] for item in json.loads(text)
+                                     if item.get('text') == 'Countries' for country in item.get('children', [])})
+
+
+def place_details(ids, request):
+    """
+    Serialized places by id (str), from the cache where present; the rest are read in one
+    pass with everything PlaceSerializer touches prefetched, and then cached. What depends on
+    the request (absolute urls) or on the dataset (its title) is not cached but added here.
+    """
+    details = get_place_details(ids)
+    missing = [pid for pid in ids if pid not in details]
+    if missing:
+        places = PlaceSerializer.setup_eager_loading(Place.objects.filter(id__in=missing))
+        fresh = {}
+        for place in places:
+            detail = dict(PlaceSerializer(place, context={'request': request}).data)
+            detail["attestation_year"] = place.attestation_year
+            detail["url"] = urlsplit(detail["url"]).path
+            del detail["dataset"]
+            fresh[str(place.id)] = json.loads(json.dumps(detail, cls=DjangoJSONEncoder))
+        set_place_details(fresh)
+        details.update(fresh)
+
+    titles = dict(Dataset.objects.filter(id__in={detail["dataset_id"] for detail in details.values()})
+                  .values_list('id', 'title'))
+    return {pid: {**detail, "url": request.build_absolute_uri(detail["url"]),
+                  "dataset": titles.get(detail["dataset_id"])}
+            for pid, detail in details.items()}
+
+
 class PlacesDetailAPIView(View):
     """  returns serialized multiple database place records by id  """
 
@@ -1313,8 +1409,6 @@ class PlacesDetailAPIView(View):
         else:
             pass
 
-        places = Place.objects.filter(id__in=ids)
-
         def sort_unique(arr, key=None, sort_key=None):
             unique_items = []
             seen_items = set()
@@ -1331,10 +1425,7 @@ class PlacesDetailAPIView(View):
 
             return unique_items
 
-        with open(os.path.join(settings.STATIC_ROOT, 'aliases.json')) as json_file:
-            json_data = json_file.read()
-        base_urls = json.loads('{' + json_data + '}')[
-            'base_urls']  # Wrap the contents in {} to create a valid JSON object
+        base_urls = alias_base_urls()
 
         def add_urls(data):
             return [
@@ -1354,28 +1445,24 @@ class PlacesDetailAPIView(View):
                 for item in data
             ]
 
-        # Serialize the Place records
-        serialized_places = []
-        attestation_years = set()
-        for place in places:
-            # Pass the request in the serializer context
-            serializer = PlaceSerializer(place, context={'cid': cid, 'request': request})
-            serialized_places.append(serializer.data)
-            if place.attestation_year:
-                attestation_years.add(place.attestation_year)
+        # Serialize the Place records, or take them from the cache
+        details = place_details(ids, request)
+        serialized_places = [details[pid] for pid in ids if pid in details]
+        attestation_years = {place["attestation_year"] for place in serialized_places if place["attestation_year"]}
 
-        # Calculate the overall extent
-        aggregated_extent = None
-        for place in serialized_places:
-            extent = place["extent"]
-            if extent:
-                polygon = Polygon.from_bbox(extent)
-                aggregated_extent = aggregated_extent.union(polygon) if aggregated_extent else polygon
+        # traces are per collection, so are not cached
+        if cid is not None:
+            traces = {}
+            for trace in json.loads(coreserializers.serialize("json", TraceAnnotation.objects.filter(
+                    place__in=[place["id"] for place in serialized_places], collection=cid, archived=False))):
+                traces.setdefault(trace["fields"]["place"], []).append(trace)
+            serialized_places = [{**place, "traces": traces.get(place["id"], [])} for place in serialized_places]
 
-        # Convert the overall extent to the format expected in the JSON response
-        aggregated_extent = aggregated_extent.extent if aggregated_extent else None
+        # Calculate the overall extent
+        extents = [place["extent"] for place in serialized_places if place["extent"]]
+        aggregated_extent = (min(e[0] for e in extents), min(e[1] for e in extents),
+                             max(e[2] for e in extents), max(e[3] for e in extents)) if extents else None
 
-        dataset_ids = set([place["dataset_id"] for place in serialized_places])
 
         # Extract the minmax values and filter out empty lists
         # minmax_values = [(place.get("minmax", [None, None])[0], place.get("minmax", [None, None])[1]) for place in serialized_places]
@@ -1389,9 +1476,7 @@ class PlacesDetailAPIView(View):
         min_value = min(min_values, default=None)
         max_value = max(max_values, default=None)
 
-        country_codes_mapping = {country['id']: country['text'] for item in
-                                 json.load(open('media/data/regions_countries.json')) if item.get('text') == 'Countries'
-                                 for country in item.get('children', [])}
+        country_codes_mapping = country_labels()
         unique_country_codes = {ccode for place in serialized_places for ccode in place.get("ccodes", [])}
         countries_with_labels = [{'ccode': ccode, 'label': country_codes_mapping.get(ccode, '')} for ccode in
                                  unique_country_codes]
@@ -1400,7 +1485,8 @@ class PlacesDetailAPIView(View):
         aggregated_place = {
             "id": "-".join(ids),  # Concatenate the IDs,
             "traces": [trace for place in serialized_places for trace in place["traces"]],
-            "datasets": sort_unique(list(Dataset.objects.filter(id__in=dataset_ids).values("id", "title")), 'title'),
+            "datasets": sort_unique([{"id": place["dataset_id"], "title": place["dataset"]}
+                                     for place in serialized_places], 'title'),
             "title": "|".join(set(place["title"] for place in serialized_places)),
             "names": sort_unique([name for place in serialized_places for name in place["names"]], 'toponym'),
             "types": add_urls(sort_unique([type for place in serialized_places for type in place["types"]], 'label')),
@@ -1615,7 +1701,7 @@ class PlaceTableViewSet(viewsets.ModelViewSet):
         query = self.request.GET.get('q')
         if query is not None:
             qs = qs.filter(title__istartswith=query)
-        return qs
+        return PlaceTableSerializer.setup_eager_loading(qs)
 
     def get_permissions(self):
         """
@@ -1658,7 +1744,7 @@ class PlaceTableCollViewSet(viewsets.ModelViewSet):
         # print('qs from PlaceTableCollViewSet()', qs)
         if query is not None:
             qs = qs.filter(title__istartswith=query)
-        return qs
+        return PlaceTableSerializer.setup_eager_loading(qs)
 
     def get_permissions(self):
         """
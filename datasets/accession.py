@@ -0,0 +1,311 @@
+# datasets/accession.py
+# write-behind queue for align_idx review decisions: review() records an IndexDecision and
+# returns; apply_queued_decisions() (Celery task apply_index_decisions) later applies queued
+# decisions to the whg index, oldest first, planning many of them into one _bulk request.
+# A decision that fails INDEX_DECISION_MAX_ATTEMPTS times returns its place to review.
+
+import logging
+from copy import deepcopy
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from elasticsearch8.helpers import streaming_bulk
+
+from datasets.models import Dataset, DatasetStats, Hit, IndexDecision
+from elastic.es_utils import makeDoc
+from places.models import Place
+
+logger = logging.getLogger('accession')
+
+# Postgres advisory lock key: a single applier keeps decisions on the same whg_id in order
+APPLY_LOCK = 0x77686769
+
+
+def queue_index_decision(place, task, user, matches):
+    """Records an accession decision; its index writes are applied after the transaction commits"""
+    from datasets.tasks import apply_index_decisions
+
+    decision, created = IndexDecision.objects.get_or_create(
+        key=f"{task.task_id}:{place.id}",
+        defaults={'place': place, 'task': task, 'user': user, 'matches': matches},
+    )
+    if created:
+        transaction.on_commit(lambda: apply_index_decisions.delay())
+    else:
+        logger.debug(f'Decision {decision.key} already recorded ({decision.status})')
+    return decision
+
+
+def withdraw_index_decisions(task_id, place_id):
+    """
+    Frees the key of a (task, place) decision when its review is undone, so the place's next
+    review is recorded as a new decision. The withdrawn one keeps its status: if still queued
+    it is applied first, as the index write was before decisions were queued.
+    """
+    for decision in IndexDecision.objects.filter(task__task_id=task_id, place_id=place_id) \
+            .exclude(key__contains=':withdrawn:'):
+        # only the key is written, so an applier holding this decision can still save its status
+        decision.key = f"{decision.key}:withdrawn:{decision.id}"
+        decision.save(update_fields=['key'])
+
+
+def return_to_review(decision):
+    """
+    A decision that failed for good: its place, flagged indexed when the decision was queued,
+    is unflagged and its hits are unreviewed, so it is reviewed again rather than missing from
+    the index unnoticed. The decision keeps its error.
+    """
+    place = decision.place
+    Place.objects.filter(id=place.id).update(indexed=False, review_whg=0)
+    if decision.task is not None:
+        Hit.objects.filter(task_id=decision.task.task_id, place_id=place.id).update(reviewed=False)
+        withdraw_index_decisions(decision.task.task_id, place.id)
+    Dataset.objects.filter(id=place.dataset_id, ds_status='indexed').update(ds_status='accessioning')
+    DatasetStats.mark_stale(['hits', 'places'], dataset_id=place.dataset_id)
+
+
+def apply_queued_decisions(batch_size=None):
+    """
+    Applies queued decisions in batches until none are left; returns how many were applied.
+    Returns at once if another applier holds the lock (it will reach anything queued now).
+    """
+    batch_size = batch_size or settings.INDEX_DECISION_BATCH_SIZE
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [APPLY_LOCK])
+        if not cursor.fetchone()[0]:
+            return 0
+
+    applied, retry = 0, False
+    try:
+        while not retry:
+            decisions = list(
+                IndexDecision.objects.filter(status='queued')
+                .select_related('place', 'place__dataset', 'task', 'user')
+                .order_by('id')[:batch_size]
+            )
+            if not decisions:
+                break
+            batch_applied, retry = apply_decisions(decisions)
+            applied += batch_applied
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [APPLY_LOCK])
+
+    if retry or IndexDecision.objects.filter(status='queued').exists():
+        # queued while the lock was being released, or to be retried after a failure
+        from datasets.tasks import apply_index_decisions
+        apply_index_decisions.apply_async(countdown=30 if retry else 1)
+    return applied
+
+
+class IndexState:
+    """
+    Documents of the whg index touched by a batch, as they will be after its decisions:
+    read once up front, changed in memory decision by decision, then written with one _bulk.
+    """
+
+    def __init__(self, es, idx):
+        self.es = es
+        self.idx = idx
+        self.docs = {}  # _id -> {'_source', '_routing'}
+        self.by_place = {}  # place_id -> _id
+        self.writes = {}  # _id -> 'index' | 'reindex' (delete, then index as a child)
+        self.owners = {}  # _id -> ids of the decisions that wrote it
+        self.next_whg_id = None
+
+    def _add(self, hit):
+        self.docs[hit['_id']] = {'_source': hit['_source'], '_routing': hit.get('_routing')}
+        self.by_place[int(hit['_source']['place_id'])] = hit['_id']
+
+    def load_places(self, place_ids):
+        place_ids = [int(pid) for pid in set(place_ids) if int(pid) not in self.by_place]
+        if place_ids:
+            res = self.es.search(index=self.idx, query={"terms": {"place_id": place_ids}}, size=len(place_ids) * 2)
+            for hit in res['hits']['hits']:
+                self._add(hit)
+
+    def load_ids(self, ids):
+        ids = [str(_id) for _id in set(ids) if str(_id) not in self.docs]
+        if ids:
+            for doc in self.es.mget(index=self.idx, ids=ids)['docs']:
+                if doc.get('found'):
+                    self._add(doc)
+
+    def for_place(self, place_id):
+        _id = self.by_place.get(int(place_id))
+        return (_id, self.docs[_id]['_source']) if _id else (None, None)
+
+    def source(self, _id):
+        doc = self.docs.get(str(_id))
+        return doc['_source'] if doc else None
+
+    def allocate_whg_id(self):
+        from datasets.tasks import maxID
+        if self.next_whg_id is None:
+            self.next_whg_id = maxID(self.es, self.idx) + 1
+        whg_id, self.next_whg_id = self.next_whg_id, self.next_whg_id + 1
+        return whg_id
+
+    def put(self, decision, _id, source, routing=None, action='index'):
+        _id = str(_id)
+        self.docs[_id] = {'_source': source, '_routing': routing}
+        self.by_place[int(source['place_id'])] = _id
+        # a document deleted and reindexed once in the batch stays so, whatever follows
+        if self.writes.get(_id) != 'reindex':
+            self.writes[_id] = action
+        self.owners.setdefault(_id, set()).add(decision.id)
+
+    def actions(self, old_routing):
+        for _id, action in self.writes.items():
+            doc = self.docs[_id]
+            if action == 'reindex':
+                yield {'_op_type': 'delete', '_index': self.idx, '_id': _id, 'routing': old_routing.get(_id)}
+            op = {'_op_type': 'index', '_index': self.idx, '_id': _id, '_source': doc['_source']}
+            if doc['_routing'] is not None:
+                op['routing'] = doc['_routing']
+            yield op
+
+
+def plan_parent(state, decision):
+    """No match, or a matched place not yet in the index: index the place as a new parent"""
+    place = decision.place
+    if state.for_place(place.id)[0]:
+        logger.debug(f'Place {place.id} already in index; not indexed as a new parent')
+        return
+    if decision.whg_id is None:
+        decision.whg_id = state.allocate_whg_id()
+        decision.save(update_fields=['whg_id'])
+    doc = makeDoc(place)
+    doc['relation'] = {"name": "parent"}
+    doc['whg_id'] = decision.whg_id
+    state.put(decision, decision.whg_id, doc)
+
+
+def plan_match(state, decision):
+    """One match: index the place as a child of the matched place's parent"""
+    place = decision.place
+    if not state.for_place(place.id)[0]:
+        return plan_parent(state, decision)
+    hit_pid = decision.matches[0]['pid']
+    _, hit = state.for_place(hit_pid)
+    if hit is None:
+        logger.warning(f"No index document for hit_pid={hit_pid}")
+        return
+    parent_whgid = state.by_place[int(hit_pid)] if hit['relation']['name'] != 'child' else hit['relation']['parent']
+    doc = makeDoc(place)
+    doc['relation'] = {"name": "child", "parent": parent_whgid}
+    state.put(decision, place.id, doc, routing=1)
+
+
+def plan_multi_match(state, decision):
+    """
+    Several matches: the highest scoring is the winner, to which the place is added as a child
+    and the other matched parents are demoted, their names and children going to the winner.
+    Returns (place_a, place_b) pairs for CloseMatch records.
+    """
+    place = decision.place
+    winner = max(decision.matches, key=lambda x: x['score'])
+    winner_id = str(winner['whg_id'])
+    winner_src = state.source(winner_id)
+    if winner_src is None:
+        raise LookupError(f"Winner {winner_id} not in index")
+    winner_src = deepcopy(winner_src)
+    demoted = [str(m['whg_id']) for m in decision.matches if str(m['whg_id']) != winner_id]
+
+    new_doc = makeDoc(place)
+    new_doc['relation'] = {"name": "child", "parent": winner['whg_id']}
+    addnames = [n['toponym'] for n in new_doc['names']]
+    if place.title not in addnames:
+        addnames.append(place.title)
+    addkids = [str(place.id)]
+    state.put(decision, place.id, new_doc, routing=1)
+
+    for _id in demoted:
+        srcd = state.source(_id)
+        if srcd is None or srcd['relation'].get('parent') == winner['whg_id']:
+            logger.debug(f'{_id} not in index or already demoted to child of {winner_id}')
+            continue
+        addnames.extend(srcd.get('searchy', []))
+        addkids.append(str(srcd['place_id']))
+        addkids.extend(str(kid) for kid in srcd.get('children', []))
+
+        newsrcd = deepcopy(srcd)
+        newsrcd['relation'] = {"name": "child", "parent": winner['whg_id']}
+        newsrcd['children'] = []
+        newsrcd.pop('whg_id', None)
+        state.put(decision, _id, newsrcd, routing=1, action='reindex')
+
+    # unique additions only, so a decision applied twice leaves the winner unchanged
+    for field, values in (('children', addkids), ('searchy', addnames)):
+        existing = winner_src.setdefault(field, [])
+        existing.extend(v for v in dict.fromkeys(values) if v not in existing)
+    state.put(decision, winner_id, winner_src, routing=state.docs[winner_id]['_routing'])
+
+    # kids of the new record and of demoted parents are adopted by the winner
+    state.load_places(addkids)
+    for kid in addkids:
+        kid_id, kid_src = state.for_place(kid)
+        if kid_src is not None and kid_id != winner_id and kid_src['relation'].get('name') == 'child':
+            kid_src = dict(kid_src, relation={"name": "child", "parent": winner['whg_id']})
+            state.put(decision, kid_id, kid_src, routing=state.docs[kid_id]['_routing'],
+                      action=state.writes.get(kid_id, 'index'))
+    return [(int(kid), int(winner['pid'])) for kid in dict.fromkeys(addkids)]
+
+
+def apply_decisions(decisions):
+    """Plans and writes one batch; returns (number applied, whether any are to be retried)"""
+    from datasets.services import update_close_matches
+
+    es = settings.ES_CONN
+    idx = settings.ES_WHG
+    state = IndexState(es, idx)
+
+    # current state of everything the batch refers to, in two requests
+    state.load_places([d.place_id for d in decisions] + [m['pid'] for d in decisions for m in d.matches])
+    state.load_ids([m['whg_id'] for d in decisions if len(d.matches) > 1 for m in d.matches])
+    old_routing = {_id: doc['_routing'] for _id, doc in state.docs.items()}
+
+    relationships, failed = {}, {}
+    for decision in decisions:
+        try:
+            if not decision.matches:
+                plan_parent(state, decision)
+            elif len(decision.matches) == 1:
+                plan_match(state, decision)
+            else:
+                relationships[decision.id] = plan_multi_match(state, decision)
+        except Exception as e:
+            logger.exception(f'Could not plan decision {decision.key}')
+            failed[decision.id] = str(e)
+
+    # decisions whose documents were not all written are retried from the index state
+    for ok, item in streaming_bulk(es, state.actions(old_routing), raise_on_error=False,
+                                   raise_on_exception=False, refresh='wait_for'):
+        info = next(iter(item.values()))
+        if not ok and not (info.get('status') == 404 and 'delete' in item):
+            for decision_id in state.owners.get(str(info.get('_id')), ()):
+                failed.setdefault(decision_id, str(info.get('error')))
+
+    applied, retry = 0, False
+    now = timezone.now()
+    for decision in decisions:
+        if decision.id in failed:
+            decision.attempts += 1
+            decision.error = failed[decision.id]
+            decision.status = 'failed' if decision.attempts >= settings.INDEX_DECISION_MAX_ATTEMPTS else 'queued'
+            retry = retry or decision.status == 'queued'
+            decision.save(update_fields=['attempts', 'error', 'status'])
+            logger.error(f'Decision {decision.key} failed (attempt {decision.attempts}): {decision.error}')
+            if decision.status == 'failed':
+                return_to_review(decision)
+            continue
+        for place_a, place_b in relationships.get(decision.id, []):
+            update_close_matches(place_a, place_b, decision.user, decision.task)
+        decision.status = 'applied'
+        decision.applied = now
+        decision.save(update_fields=['status', 'applied'])
+        applied += 1
+
+    logger.info(f'Applied {applied} of {len(decisions)} accession decisions; {len(state.writes)} documents written')
+    return applied, retry
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Dataset, DatasetFile, Hit
+from .models import Dataset, DatasetFile, DatasetStats, Hit, ReconCheckpoint
 from guardian.admin import GuardedModelAdmin
 
 # class DatasetAdmin(GuardedModelAdmin):
@@ -19,4 +19,19 @@ class DatasetFileAdmin(GuardedModelAdmin):
     list_display = ('dataset_id_id', 'file', 'upload_date', 'df_status', 'format', 'datatype')
 admin.site.register(DatasetFile, DatasetFileAdmin)
 
-admin.site.register(Hit)
+# hits have no post_delete receiver (see datasets.signals)
+class HitAdmin(admin.ModelAdmin):
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        DatasetStats.mark_stale(['hits'], dataset_id=obj.dataset_id)
+
+    def delete_queryset(self, request, queryset):
+        dataset_ids = list(queryset.order_by().values_list('dataset_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        DatasetStats.mark_stale(['hits'], dataset_id__in=dataset_ids)
+admin.site.register(Hit, HitAdmin)
+
+class ReconCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('task_id', 'task_name', 'dataset', 'parent_task_id', 'id_min', 'id_max', 'last_place_id', 'complete', 'updated')
+    list_filter = ('task_name', 'complete')
+admin.site.register(ReconCheckpoint, ReconCheckpointAdmin)
@@ -10,6 +10,7 @@ import warnings
 from dateutil.parser import parse
 from itertools import zip_longest
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.gis.geos import GEOSGeometry
 from django.core.exceptions import ValidationError
@@ -20,11 +21,12 @@ from django.shortcuts import get_object_or_404, redirect
 from django.utils import timezone
 
 from .exceptions import DelimInsertError, DataAlreadyProcessedError
-from .models import Dataset
+from .models import Dataset, DatasetStats
 from areas.models import Area
-from datasets.utils import aat_lookup, ccodesFromGeom, \
+from datasets.utils import aat_lookup, ccodesFromGeom, ccodesFromGeoms, \
     makeCoords, parse_wkt, parsedates_tsv
 from places.models import *
+from utils.pg_copy import copy_objects, reserve_ids
 from whgmail.messaging import WHGmail
 
 logger = logging.getLogger('validation')
@@ -124,7 +126,8 @@ def process_variants(row, newpl):
 
 
 # create PlaceType object for each aat_type; update Place with fclasses[]
-def process_types(row, newpl):
+# (commit=False leaves saving newpl to the caller, as in bulk mode)
+def process_types(row, newpl, commit=True):
     type_objects = []
     error_msgs = []
 
@@ -181,7 +184,8 @@ def process_types(row, newpl):
         fclass_list = list(set(fclass_list))
         # Update the Place object's fclasses field
         newpl.fclasses = fclass_list
-        newpl.save()
+        if commit:
+            newpl.save()
     except Exception as e:  # Catch all exceptions and store in variable e
         error_msgs.append(f"Error writing fclass codes for place <b>{newpl.title} ({newpl.src_id})</b>. Details: {e}")
 
@@ -213,60 +217,67 @@ class CustomDate:
         return f"{year_str}-{self.month:02d}-{self.day:02d}"
 
 
-def process_when(row, newpl):
-    error_msgs = []
+def pad_and_format_date(date_str):
+    if date_str.startswith('-'):
+        parts = date_str[1:].split('-')
+        parts[0] = parts[0].zfill(4)
+        formatted_date = '-' + '-'.join(parts)
+    else:
+        parts = date_str.split('-')
+        parts[0] = parts[0].zfill(4)
+        formatted_date = '-'.join(parts)
+
+    return formatted_date
+
+
+def parse_iso_date(date_str):
+    try:
+        padded_date_str = pad_and_format_date(date_str)
+        parts = padded_date_str.split('-')
 
-    def pad_and_format_date(date_str):
-        if date_str.startswith('-'):
-            parts = date_str[1:].split('-')
-            parts[0] = parts[0].zfill(4)
-            formatted_date = '-' + '-'.join(parts)
+        if padded_date_str.startswith('-'):
+            year = -int(parts[1])
+            remaining_parts = parts[1:]
         else:
-            parts = date_str.split('-')
-            parts[0] = parts[0].zfill(4)
-            formatted_date = '-'.join(parts)
+            year = int(parts[0])
+            remaining_parts = parts[1:]
+
+        if year < 0:
+            if len(remaining_parts) == 0:
+                date = CustomDate(year)
+            elif len(remaining_parts) == 1:
+                date = CustomDate(year, int(remaining_parts[0]))
+            elif len(remaining_parts) == 2:
+                date = CustomDate(year, int(remaining_parts[0]), int(remaining_parts[1]))
+            return date
+        else:
+            date = isoparse(padded_date_str)
+            return date
+    except (ValueError, ParserError) as e:
+        raise ValueError(f"Invalid ISO-8601 date: {date_str}. Error: {e}")
 
-        return formatted_date
 
-    def parse_iso_date(date_str):
-        try:
-            padded_date_str = pad_and_format_date(date_str)
-            parts = padded_date_str.split('-')
+# parse start, end, attestation_year of a row; raises ValueError
+def parse_when_row(row):
+    start = parse_iso_date(str(row['start'])) if 'start' in row and row.get('start', '') else None
+    end = parse_iso_date(str(row['end'])) if 'end' in row and row.get('end', '') else None
+    attestation_year = str(row['attestation_year']) if 'attestation_year' in row and not pd.isna(
+        row['attestation_year']) else None
+    # attestation_year = str(row['attestation_year']) if 'attestation_year' in row and row.get('attestation_year', '') else None
 
-            if padded_date_str.startswith('-'):
-                year = -int(parts[1])
-                remaining_parts = parts[1:]
-            else:
-                year = int(parts[0])
-                remaining_parts = parts[1:]
-
-            if year < 0:
-                if len(remaining_parts) == 0:
-                    date = CustomDate(year)
-                elif len(remaining_parts) == 1:
-                    date = CustomDate(year, int(remaining_parts[0]))
-                elif len(remaining_parts) == 2:
-                    date = CustomDate(year, int(remaining_parts[0]), int(remaining_parts[1]))
-                return date
-            else:
-                date = isoparse(padded_date_str)
-                return date
-        except (ValueError, ParserError) as e:
-            raise ValueError(f"Invalid ISO-8601 date: {date_str}. Error: {e}")
+    if start and end and isinstance(start, CustomDate) and isinstance(end, CustomDate) and start.year > end.year:
+        raise ValueError("Start date (" + str(start) + ") is greater than end date (" + str(end) + ")")
 
-    try:
-        start = parse_iso_date(str(row['start'])) if 'start' in row and row.get('start', '') else None
-        end = parse_iso_date(str(row['end'])) if 'end' in row and row.get('end', '') else None
-        attestation_year = str(row['attestation_year']) if 'attestation_year' in row and not pd.isna(
-            row['attestation_year']) else None
-        # attestation_year = str(row['attestation_year']) if 'attestation_year' in row and row.get('attestation_year', '') else None
+    dates = (start, end, attestation_year)
+
+    return parsedates_tsv(dates), attestation_year
 
-        if start and end and isinstance(start, CustomDate) and isinstance(end, CustomDate) and start.year > end.year:
-            raise ValueError("Start date (" + str(start) + ") is greater than end date (" + str(end) + ")")
 
-        dates = (start, end, attestation_year)
+def process_when(row, newpl):
+    error_msgs = []
 
-        datesobj = parsedates_tsv(dates)
+    try:
+        datesobj, attestation_year = parse_when_row(row)
 
         newpl.minmax = datesobj['minmax']
         newpl.attestation_year = attestation_year
@@ -445,11 +456,14 @@ def process_descriptions(row, newpl):
 """
 
 
-def ds_insert_delim(df, pk):
+def ds_insert_delim(df, pk, bulk=False):
     """
     :param df: dataframe
     :param pk: primary key of dataset
+    :param bulk: load with ds_insert_delim_bulk() (COPY, chunked)
     """
+    if bulk:
+        return ds_insert_delim_bulk(df, pk)
     # print('in ds_insert_delim() with df, pk', df, pk)
     # tidy up dataframe
     df.dropna(axis=1, how='all', inplace=True)
@@ -526,7 +540,168 @@ def ds_insert_delim(df, pk):
     PlaceRelated.objects.bulk_create(objlists['PlaceRelated'], batch_size=10000)
     PlaceWhen.objects.bulk_create(objlists['PlaceWhen'], batch_size=10000)
     PlaceDescription.objects.bulk_create(objlists['PlaceDescription'], batch_size=10000)
+    # bulk_create sends no post_save signals
+    DatasetStats.mark_stale(DatasetStats.SECTIONS, dataset=ds)
+
+
+
+"""
+  ds_insert_delim_bulk(df, pk)
+  bulk-load variant of ds_insert_delim(): no per-row queries or saves;
+  Place ids are reserved per chunk, rows are COPYed, all in one transaction
+"""
+
+# child models written by the delimited loaders; NB no depictions in LP-Delim
+DELIM_CHILD_MODELS = [PlaceName, PlaceType, PlaceGeom, PlaceWhen,
+                      PlaceLink, PlaceRelated, PlaceDescription]
+
+
+# PlaceGeom for a row, parsing each distinct geowkt only once
+def bulk_geom(row, newpl, wkt_cache):
+    geojson = None
+    if all(col in row for col in ['lat', 'lon']) and row['lat'] and row['lon']:
+        coords = [float(row['lon']), float(row['lat'])]
+        geojson = {
+            "type": "Point",
+            "coordinates": coords,
+            "geowkt": 'POINT(' + str(coords[0]) + ' ' + str(coords[1]) + ')'
+        }
+    elif 'geowkt' in row and row['geowkt']:
+        wkt = row['geowkt']
+        if wkt not in wkt_cache:
+            try:
+                wkt_cache[wkt] = parse_wkt(wkt)
+            except Exception as e:
+                wkt_cache[wkt] = e
+        if isinstance(wkt_cache[wkt], Exception):
+            raise DelimInsertError(
+                f"Error converting WKT for place <b>{newpl.title} ({newpl.src_id})</b>. Details: {wkt_cache[wkt]}")
+        geojson = dict(wkt_cache[wkt])
+
+    if not geojson:
+        return None
+    if 'geo_source' in row and row['geo_source']:
+        geojson['citation'] = {
+            'label': row['geo_source'],
+            'id': row['geo_id'] if 'geo_id' in row else None
+        }
+    try:
+        return PlaceGeom(
+            place=newpl,
+            src_id=newpl.src_id,
+            jsonb=geojson,
+            geom=GEOSGeometry(json.dumps(geojson))
+        )
+    except Exception as e:
+        raise DelimInsertError(
+            f"Error creating GEOSGeometry for place <b>{newpl.title} ({newpl.src_id})</b>. Details: {e}")
+
+
+# unsaved Place and related objects for one row; raises DelimInsertError
+def bulk_place(row, place_id, ds, valid_ccodes, when_cache, wkt_cache):
+    title = row['title'].strip()
+    ccodes = [] if not row.get('ccodes') else [x.strip().upper() for x in row['ccodes'].split(';')]
+    newpl = Place(id=place_id, src_id=row['id'], title=title, dataset=ds, ccodes=ccodes)
+    for ccode in ccodes:
+        if ccode not in valid_ccodes:
+            raise DelimInsertError(f"At least one invalid ccode: {ccode} for place <b>{newpl} ({newpl.src_id})</b>")
+
+    title_uri = None if pd.isnull(row.get('title_uri')) else row.get('title_uri')
+    children = {model.__name__: [] for model in DELIM_CHILD_MODELS}
+    children['PlaceName'].append(PlaceName(
+        place=newpl,
+        src_id=row['id'],
+        toponym=title,
+        jsonb={"toponym": title, "citations": [{"id": title_uri, "label": row['title_source']}]}
+    ))
+    if row.get('variants') not in ['', None]:
+        children['PlaceName'].extend(process_variants(row, newpl))
+
+    if any(row.get(col, None) not in ['', None] for col in ['types', 'aat_types', 'fclasses']):
+        children['PlaceType'].extend(process_types(row, newpl, commit=False))
+
+    # dates repeat heavily across rows; parse each combination once
+    when_key = (row.get('start'), row.get('end'), row.get('attestation_year'))
+    if when_key not in when_cache:
+        try:
+            when_cache[when_key] = parse_when_row(row)
+        except ValueError as e:
+            when_cache[when_key] = e
+    if isinstance(when_cache[when_key], Exception):
+        raise DelimInsertError(
+            f"Error processing dates for place <b>{newpl} ({newpl.src_id})</b>. Details: {when_cache[when_key]}")
+    datesobj, attestation_year = when_cache[when_key]
+    newpl.minmax = datesobj['minmax']
+    newpl.attestation_year = attestation_year
+    newpl.timespans = [datesobj['minmax']]
+    children['PlaceWhen'].append(PlaceWhen(place=newpl, src_id=newpl.src_id, jsonb=datesobj))
+
+    geom = bulk_geom(row, newpl, wkt_cache)
+    if geom:
+        children['PlaceGeom'].append(geom)
+    if row.get('matches'):
+        children['PlaceLink'].extend(process_links(row, newpl))
+    if row.get('parent_name'):
+        children['PlaceRelated'].extend(process_related(row, newpl))
+    if row.get('description'):
+        children['PlaceDescription'].extend(process_descriptions(row, newpl))
+
+    return newpl, children
+
+
+def ds_insert_delim_bulk(df, pk, chunk_rows=None):
+    """
+    :param df: dataframe
+    :param pk: primary key of dataset
+    :param chunk_rows: rows per COPY chunk (default settings.DELIM_INSERT_CHUNK_ROWS)
+
+    Same rules and errors as ds_insert_delim(), but memory is bounded by
+    chunk_rows rather than the whole file. Rows with a repeated id are skipped.
+    post_save signals are not sent; the dataset's mapdata is refreshed once.
+    """
+    from utils.mapdata import mark_mapdata_for_refresh
+
+    chunk_rows = chunk_rows or settings.DELIM_INSERT_CHUNK_ROWS
+    df.dropna(axis=1, how='all', inplace=True)
+    df.replace({np.nan: None}, inplace=True)
+    ds = get_object_or_404(Dataset, id=pk)
+
+    if Place.objects.filter(dataset=ds.label).exists():
+        raise DataAlreadyProcessedError("The data appears to have already been processed.")
 
+    dupes = df['id'].duplicated()
+    if dupes.any():
+        logger.warning(f"Skipping {dupes.sum()} rows with repeated ids in dataset {ds.label}")
+        df = df[~dupes]
+
+    valid_ccodes = {ccode.upper() for c in Area.objects.filter(type='country') for ccode in c.ccodes}
+    when_cache, wkt_cache = {}, {}
+    counts = {'Place': 0}
+
+    with transaction.atomic():
+        for start in range(0, len(df), chunk_rows):
+            rows = df.iloc[start:start + chunk_rows].to_dict('records')
+            ids = reserve_ids(Place, len(rows))
+            places = []
+            objlists = {model.__name__: [] for model in DELIM_CHILD_MODELS}
+            for row, place_id in zip(rows, ids):
+                newpl, children = bulk_place(row, place_id, ds, valid_ccodes, when_cache, wkt_cache)
+                places.append(newpl)
+                for name, objs in children.items():
+                    objlists[name].extend(objs)
+
+            counts['Place'] += copy_objects(Place, places, include_pk=True)
+            for model in DELIM_CHILD_MODELS:
+                counts[model.__name__] = counts.get(model.__name__, 0) + \
+                                         copy_objects(model, objlists[model.__name__])
+            logger.debug(f"ds_insert_delim_bulk {ds.label}: {counts['Place']} of {len(df)} rows")
+
+        counts['ccodes_from_geom'] = ccodesFromGeoms(label=ds.label)
+        DatasetStats.mark_stale(DatasetStats.SECTIONS, dataset=ds)
+        transaction.on_commit(lambda: mark_mapdata_for_refresh.delay('datasets', ds.id))
+
+    logger.info(f"ds_insert_delim_bulk {ds.label}: {counts}")
+    return counts
 
 # """
 #   ds_insert_json(data, pk)
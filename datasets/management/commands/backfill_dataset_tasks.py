@@ -0,0 +1,45 @@
+# datasets/management/commands/backfill_dataset_tasks.py
+
+import re
+
+from django.core.management.base import BaseCommand
+from django_celery_results.models import TaskResult
+
+from datasets.models import Dataset, DatasetTask
+
+# align_* tasks are dispatched with the dataset id as their only positional arg: '"(12,)"'
+TASK_ARGS = re.compile(r'^"?\((\d+),\)"?$')
+
+
+class Command(BaseCommand):
+    help = 'Link existing align_* TaskResults to their datasets (DatasetTask), or refresh their status'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk upsert')
+
+    def handle(self, *args, **options):
+        dataset_ids = set(Dataset.objects.values_list('id', flat=True))
+        results = TaskResult.objects.filter(task_name__startswith='align').values_list(
+            'task_id', 'task_name', 'task_args', 'status', 'date_done')
+
+        batch, linked, skipped = [], 0, 0
+        for task_id, task_name, task_args, status, date_done in results.iterator():
+            match = TASK_ARGS.match(task_args or '')
+            if not match or int(match.group(1)) not in dataset_ids:
+                # partitions (no positional args), or tasks of deleted datasets
+                skipped += 1
+                continue
+            batch.append(DatasetTask(dataset_id=int(match.group(1)), task_id=task_id, task_name=task_name,
+                                     status=status, date_done=date_done))
+            if len(batch) >= options['batch_size']:
+                linked += self.upsert(batch)
+                batch = []
+        linked += self.upsert(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Linked {linked} tasks to datasets; skipped {skipped}."))
+
+    @staticmethod
+    def upsert(batch):
+        DatasetTask.objects.bulk_create(batch, update_conflicts=True, unique_fields=['task_id'],
+                                        update_fields=['dataset', 'task_name', 'status', 'date_done'])
+        return len(batch)
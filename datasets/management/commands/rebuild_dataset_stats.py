@@ -0,0 +1,27 @@
+# datasets/management/commands/rebuild_dataset_stats.py
+
+from django.core.management.base import BaseCommand
+
+from datasets.models import Dataset, DatasetStats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the precomputed dashboard counts (DatasetStats) of all or some datasets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ids', type=int, nargs='+', default=None, help='Dataset ids (default: all)')
+        parser.add_argument('--sections', nargs='+', choices=DatasetStats.SECTIONS, default=DatasetStats.SECTIONS,
+                            help='Sections to recompute (default: all)')
+
+    def handle(self, *args, **options):
+        datasets = Dataset.objects.order_by('id')
+        if options['ids']:
+            datasets = datasets.filter(id__in=options['ids'])
+
+        total = datasets.count()
+        self.stdout.write(f"Rebuilding stats for {total} datasets...")
+        for ds in datasets.iterator():
+            stats = DatasetStats.rebuild(ds, options['sections'])
+            self.stdout.write(f"✓ {ds.label}: {stats.num_places} places, {stats.unindexed} unindexed")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {total} datasets."))
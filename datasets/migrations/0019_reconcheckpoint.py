@@ -0,0 +1,35 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datasets', '0018_alter_dataset_uri_base'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(max_length=50, unique=True)),
+                ('parent_task_id', models.CharField(blank=True, db_index=True, max_length=50, null=True)),
+                ('task_name', models.CharField(max_length=50)),
+                ('id_min', models.IntegerField(blank=True, null=True)),
+                ('id_max', models.IntegerField(blank=True, null=True)),
+                ('last_place_id', models.IntegerField(default=0)),
+                ('state', models.JSONField(default=dict)),
+                ('complete', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recon_checkpoints', to='datasets.dataset')),
+            ],
+            options={
+                'db_table': 'recon_checkpoints',
+                'managed': True,
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.1.7 on 2026-10-18 15:40
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datasets', '0019_reconcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetStats',
+            fields=[
+                ('dataset', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='datasets.dataset')),
+                ('places_version', models.IntegerField(default=1)),
+                ('places_computed', models.IntegerField(default=0)),
+                ('hits_version', models.IntegerField(default=1)),
+                ('hits_computed', models.IntegerField(default=0)),
+                ('num_places', models.IntegerField(default=0)),
+                ('unindexed', models.IntegerField(default=0)),
+                ('places_without_geoms', models.IntegerField(default=0)),
+                ('earliest', models.IntegerField(blank=True, null=True)),
+                ('latest', models.IntegerField(blank=True, null=True)),
+                ('extent', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), blank=True, null=True, size=4)),
+                ('num_names', models.IntegerField(default=0)),
+                ('names_added', models.IntegerField(default=0)),
+                ('num_links', models.IntegerField(default=0)),
+                ('links_added', models.IntegerField(default=0)),
+                ('q_count', models.IntegerField(default=0)),
+                ('num_geoms', models.IntegerField(default=0)),
+                ('geoms_added', models.IntegerField(default=0)),
+                ('review', models.JSONField(default=dict)),
+                ('task_passes', models.JSONField(default=dict)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'dataset_stats',
+                'managed': True,
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.7 on 2026-10-18 16:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datasets', '0020_datasetstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(max_length=255, unique=True)),
+                ('task_name', models.CharField(max_length=255)),
+                ('status', models.CharField(default='PENDING', max_length=50)),
+                ('date_done', models.DateTimeField(blank=True, null=True)),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_links', to='datasets.dataset')),
+            ],
+            options={
+                'db_table': 'dataset_tasks',
+                'managed': True,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='datasettask',
+            index=models.Index(fields=['dataset', 'task_name', 'status', '-date_done'], name='dataset_task_lookup_idx'),
+        ),
+    ]
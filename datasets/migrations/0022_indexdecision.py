@@ -0,0 +1,43 @@
+# Generated by Django 4.1.7 on 2026-10-18 17:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_celery_results', '0011_taskresult_periodic_task_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('places', '0021_alter_placelink_unique_together_and_more'),
+        ('datasets', '0021_datasettask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexDecision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('matches', models.JSONField(default=list)),
+                ('whg_id', models.IntegerField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('applied', 'applied'), ('failed', 'failed')], default='queued', max_length=12)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('applied', models.DateTimeField(blank=True, null=True)),
+                ('place', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='index_decisions', to='places.place')),
+                ('task', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='django_celery_results.taskresult')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'index_decisions',
+                'managed': True,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='indexdecision',
+            index=models.Index(fields=['status', 'id'], name='index_decision_queue_idx'),
+        ),
+    ]
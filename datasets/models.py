@@ -10,10 +10,12 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.core.cache import caches
 from django.db import models
-from django.db.models import JSONField, Exists, OuterRef, Q, Func, CharField, Min, Max
+from django.db.models import JSONField, Exists, OuterRef, Q, Func, CharField, Min, Max, Count, F
 from django.db.models.signals import pre_delete
 from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 # from django.shortcuts import get_object_or_404
 
@@ -23,7 +25,7 @@ from elastic.es_utils import escount_ds
 from geojson import Feature
 
 from main.choices import *
-from places.models import Place, PlaceGeom, PlaceLink
+from places.models import Place, PlaceGeom, PlaceLink, PlaceName
 import simplejson as json
 from shapely.geometry import box, mapping
 from utils.cluster_geometries import (
@@ -149,10 +151,15 @@ class Dataset(models.Model):
 
     @property
     def extent(self):
-        dsgeoms = PlaceGeom.objects.filter(place__dataset=self.label)
-        extent = dsgeoms.aggregate(Extent("geom"))["geom__extent"]
+        extent = self.statistics.extent
         return list(extent) if extent else (0, 0, 1, 1)
 
+    @cached_property
+    def statistics(self):
+        # precomputed counts, read once per instance (DatasetStats.for_dataset() reads them
+        # again, e.g. after writes); see DatasetStats
+        return DatasetStats.for_dataset(self)
+
     @property
     def carousel_metadata(self):
         cached_value = caches['property_cache'].get(f"dataset:{self.pk}:carousel_metadata")
@@ -368,31 +375,17 @@ class Dataset(models.Model):
 
     @property
     def minmax(self):
-        minmax_values = Place.objects.filter(dataset=self).aggregate(
-            # This ignores `None` values, effectively handling temporal sparsity [None, None]
-            earliest=Min("minmax__0"),
-            latest=Max("minmax__1"),
-        )
-        earliest = minmax_values["earliest"]
-        latest = minmax_values["latest"]
+        earliest = self.statistics.earliest
+        latest = self.statistics.latest
         return [earliest, latest] if earliest and latest else None
 
     @property
     def missing_geoms(self):
-        # Get all Place instances related to this Dataset
-        places = self.places.all()
-
-        # Check if any of these Place instances do not have a corresponding PlaceGeom
-        for place in places:
-            if not place.geoms.exists():
-                return True
-
-        # If we've gone through all Place instances and none are missing a PlaceGeom, return False
-        return False
+        return self.statistics.places_without_geoms > 0
 
     @property
     def num_places(self):
-        return Place.objects.filter(dataset=self.label).count()
+        return self.statistics.num_places
 
     @property
     def owners(self):
@@ -411,41 +404,29 @@ class Dataset(models.Model):
     # how many wikidata links?
     @property
     def q_count(self):
-        placeids = Place.objects.filter(dataset=self.label).values_list("id", flat=True)
-        return PlaceLink.objects.filter(
-            place_id__in=placeids, jsonb__icontains="Q"
-        ).count()
+        return self.statistics.q_count
 
     @property
     def recon_status(self):
-        # Format task_args as a string representation of a tuple
-        # because that's how Celery records it now
-        args_with_quotes = f'"({self.id},)"'
-        tasks = TaskResult.objects.filter(
-            task_args=args_with_quotes, task_name__startswith="align", status="SUCCESS"
-        )
+        tasks = self.tasks.filter(status="SUCCESS")
         # print('tasks', tasks)
         # Calculate the status based on the tasks and hits
+        stats = self.statistics
         result = {}
         for t in tasks:
-            hit_count = (
-                Hit.objects.filter(task_id=t.task_id, reviewed=False)
-                .values("place_id")
-                .distinct()
-                .count()
-            )
-            result[t.task_name[6:]] = hit_count
+            result[t.task_name[6:]] = stats.passes(t.task_id).get("total", 0)
 
         return result
 
     # count of reviewed places
     @property
     def reviewed_places(self):
-        result = {}
-        result["rev_wd"] = self.places.filter(review_wd=1).count()
-        result["rev_tgn"] = self.places.filter(review_tgn=1).count()
-        result["rev_whg"] = self.places.filter(review_whg=1).count()
-        return result
+        review = self.statistics.review
+        return {
+            "rev_wd": review["review_wd"]["reviewed"],
+            "rev_tgn": review["review_tgn"]["reviewed"],
+            "rev_whg": review["review_whg"]["reviewed"],
+        }
 
     # used in ds_compare()
     @property
@@ -469,59 +450,26 @@ class Dataset(models.Model):
 
     @property
     def tasks(self):
-        args_with_quotes = f'"({self.id},)"'
         return TaskResult.objects.filter(
-            task_args=args_with_quotes, task_name__startswith="align"
+            task_id__in=DatasetTask.objects.filter(dataset_id=self.id).values("task_id"),
+            task_name__startswith="align",
         )
 
     # tasks stats
     @property
     def taskstats(self):
-        def distinctPlaces(task):
-            # counts of distinct place records remaining to review fo reach pass
-            p_hits0 = (
-                Hit.objects.filter(
-                    task_id=t.task_id, query_pass="pass0", reviewed=False
-                )
-                .values("place_id")
-                .distinct()
-                .count()
-            )
-            p_hits1 = (
-                Hit.objects.filter(
-                    task_id=t.task_id, query_pass="pass1", reviewed=False
-                )
-                .values("place_id")
-                .distinct()
-                .count()
-            )
-            p_hits2 = (
-                Hit.objects.filter(
-                    task_id=t.task_id, query_pass="pass2", reviewed=False
-                )
-                .values("place_id")
-                .distinct()
-                .count()
-            )
-            p_hits3 = (
-                Hit.objects.filter(
-                    task_id=t.task_id, query_pass="pass3", reviewed=False
-                )
-                .values("place_id")
-                .distinct()
-                .count()
-            )
-            p_sum = p_hits0 + p_hits1 + p_hits2 + p_hits3
+        stats = self.statistics
 
+        def distinctPlaces(t):
+            # counts of distinct place records remaining to review for each pass
+            passes = stats.passes(t.task_id)
+            p_hits = {p: passes.get(p, 0) for p in ("pass0", "pass1", "pass2", "pass3")}
             return {
                 "tid": t.task_id,
                 # "task":t.task_name,
                 "date": t.date_done.strftime("%Y-%m-%d"),
-                "total": p_sum,
-                "pass0": p_hits0,
-                "pass1": p_hits1,
-                "pass2": p_hits2,
-                "pass3": p_hits3,
+                "total": sum(p_hits.values()),
+                **p_hits,
             }
 
         result = {}
@@ -536,16 +484,15 @@ class Dataset(models.Model):
         ]
         for tt in task_types:
             result[tt] = []
-            for t in self.tasks.filter(task_name=tt, status="SUCCESS"):
-                result[tt].append(distinctPlaces(t))
+        for t in self.tasks.filter(task_name__in=task_types, status="SUCCESS"):
+            result[t.task_name].append(distinctPlaces(t))
 
         # print(result)
         return result
 
     @property
     def unindexed(self):
-        unidxed = self.places.filter(indexed=False).count()
-        return unidxed
+        return self.statistics.unindexed
 
     # count of unreviewed hits
 
@@ -630,6 +577,244 @@ class Hit(models.Model):
         db_table = "hits"
 
 
+# progress of an align_* task, or of one place-id range partition of it;
+# lets a redelivered task resume instead of starting over
+class ReconCheckpoint(models.Model):
+    task_id = models.CharField(max_length=50, unique=True)
+    # partitions write hits under the task_id of the task that split them
+    parent_task_id = models.CharField(max_length=50, null=True, blank=True, db_index=True)
+    task_name = models.CharField(max_length=50)
+    dataset = models.ForeignKey(
+        Dataset, related_name="recon_checkpoints", on_delete=models.CASCADE
+    )
+    # inclusive place id range for partitions; null = whole dataset
+    id_min = models.IntegerField(null=True, blank=True)
+    id_max = models.IntegerField(null=True, blank=True)
+    last_place_id = models.IntegerField(default=0)
+    # running counters, seeds etc., as kept by the task
+    state = JSONField(default=dict)
+    complete = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.task_name}:{self.task_id} @ {self.last_place_id}"
+
+    @property
+    def hit_task_id(self):
+        return self.parent_task_id or self.task_id
+
+    class Meta:
+        managed = True
+        db_table = "recon_checkpoints"
+
+
+# precomputed counts for dataset dashboards, in sections that are recomputed separately:
+#   places: place, child record, review and temporal/spatial summaries
+#   hits: unreviewed places per task and query pass
+# writers bump a section's version (signals, or tasks after bulk writes); a section whose
+# computed version lags its version is recomputed when next read, see for_dataset()
+class DatasetStats(models.Model):
+    SECTIONS = ("places", "hits")
+    REVIEW_FIELDS = ("review_wd", "review_whg", "review_tgn")
+
+    dataset = models.OneToOneField(
+        Dataset, related_name="stats", primary_key=True, on_delete=models.CASCADE
+    )
+    places_version = models.IntegerField(default=1)
+    places_computed = models.IntegerField(default=0)
+    hits_version = models.IntegerField(default=1)
+    hits_computed = models.IntegerField(default=0)
+
+    num_places = models.IntegerField(default=0)
+    unindexed = models.IntegerField(default=0)
+    places_without_geoms = models.IntegerField(default=0)
+    earliest = models.IntegerField(null=True, blank=True)
+    latest = models.IntegerField(null=True, blank=True)
+    extent = ArrayField(models.FloatField(), size=4, null=True, blank=True)
+    num_names = models.IntegerField(default=0)
+    names_added = models.IntegerField(default=0)
+    num_links = models.IntegerField(default=0)
+    links_added = models.IntegerField(default=0)
+    q_count = models.IntegerField(default=0)
+    num_geoms = models.IntegerField(default=0)
+    geoms_added = models.IntegerField(default=0)
+    # {review_field: {got_hits, reviewed, deferred, remain}}
+    review = JSONField(default=dict)
+    # {task_id: {query_pass: distinct unreviewed places, ..., 'total': distinct unreviewed places}}
+    task_passes = JSONField(default=dict)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"stats for dataset {self.dataset_id}"
+
+    @classmethod
+    def mark_stale(cls, sections, **dataset_filter):
+        """Bumps the version of `sections` for datasets matching e.g. dataset_id=, dataset__label="""
+        cls.objects.filter(**dataset_filter).update(
+            **{f"{section}_version": F(f"{section}_version") + 1 for section in sections}
+        )
+
+    @classmethod
+    def for_dataset(cls, dataset):
+        """Current stats for a dataset: a single query unless a section needs recomputing"""
+        stats, created = cls.objects.get_or_create(dataset=dataset)
+        stats.dataset = dataset
+        stale = [section for section in cls.SECTIONS
+                 if getattr(stats, f"{section}_computed") < getattr(stats, f"{section}_version")]
+        if stale:
+            stats.refresh(stale)
+        # what dataset.statistics returns from now on
+        dataset.statistics = stats
+        return stats
+
+    @classmethod
+    def rebuild(cls, dataset, sections=SECTIONS):
+        """Recomputes `sections` now, e.g. after writes that bypass signals"""
+        cls.mark_stale(sections, dataset=dataset)
+        return cls.for_dataset(dataset)
+
+    def refresh(self, sections=SECTIONS):
+        values = {"updated": timezone.now()}
+        for section in sections:
+            # a write during the computation bumps the version again, leaving the section stale
+            values[f"{section}_computed"] = getattr(self, f"{section}_version")
+            values.update(getattr(self, f"compute_{section}")())
+        DatasetStats.objects.filter(pk=self.pk).update(**values)
+        for field, value in values.items():
+            setattr(self, field, value)
+
+    def compute_places(self):
+        label = self.dataset.label
+        places = Place.objects.filter(dataset=label)
+        review_counts, review_keys = {}, {}
+        for field in self.REVIEW_FIELDS:
+            for count, condition in (
+                    ("got_hits", Q(**{f"{field}__isnull": False})),
+                    ("reviewed", Q(**{field: 1})),
+                    ("deferred", Q(**{field: 2})),
+                    ("remain", Q(**{f"{field}__in": [0, 2]})),
+            ):
+                review_counts[f"{field}_{count}"] = Count("id", filter=condition)
+                review_keys[f"{field}_{count}"] = (field, count)
+        place_counts = places.aggregate(
+            num_places=Count("id"),
+            unindexed=Count("id", filter=Q(indexed=False)),
+            places_without_geoms=Count(
+                "id", filter=~Exists(PlaceGeom.objects.filter(place=OuterRef("pk")))
+            ),
+            # ignores `None` values, effectively handling temporal sparsity [None, None]
+            earliest=Min("minmax__0"),
+            latest=Max("minmax__1"),
+            **review_counts,
+        )
+        added = Count("id", filter=Q(task_id__isnull=False))
+        base = Count("id", filter=Q(task_id__isnull=True))
+        names = PlaceName.objects.filter(place__dataset=label).aggregate(base=base, added=added)
+        links = PlaceLink.objects.filter(place__dataset=label).aggregate(
+            base=base, added=added, q_count=Count("id", filter=Q(jsonb__icontains="Q"))
+        )
+        geoms = PlaceGeom.objects.filter(place__dataset=label).aggregate(
+            base=base, added=added, extent=Extent("geom")
+        )
+
+        review = {field: {} for field in self.REVIEW_FIELDS}
+        for key, (field, count) in review_keys.items():
+            review[field][count] = place_counts.pop(key)
+        return dict(
+            place_counts,
+            review=review,
+            extent=list(geoms["extent"]) if geoms["extent"] else None,
+            num_names=names["base"],
+            names_added=names["added"],
+            num_links=links["base"],
+            links_added=links["added"],
+            q_count=links["q_count"],
+            num_geoms=geoms["base"],
+            geoms_added=geoms["added"],
+        )
+
+    def compute_hits(self):
+        unreviewed = Hit.objects.filter(dataset_id=self.dataset_id, reviewed=False)
+        task_passes = {}
+        for row in unreviewed.values("task_id", "query_pass").annotate(
+                places=Count("place_id", distinct=True)):
+            task_passes.setdefault(row["task_id"], {})[row["query_pass"]] = row["places"]
+        for row in unreviewed.values("task_id").annotate(places=Count("place_id", distinct=True)):
+            task_passes[row["task_id"]]["total"] = row["places"]
+        return {"task_passes": task_passes}
+
+    def passes(self, task_id):
+        return self.task_passes.get(task_id, {})
+
+    class Meta:
+        managed = True
+        db_table = "dataset_stats"
+
+
+# align_* tasks run on a dataset, recorded when dispatched and updated when they finish
+# (TaskResult only records the dataset id inside its task_args text)
+class DatasetTask(models.Model):
+    dataset = models.ForeignKey(
+        Dataset, related_name="task_links", on_delete=models.CASCADE
+    )
+    task_id = models.CharField(max_length=255, unique=True)
+    task_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=50, default="PENDING")
+    date_done = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.task_name}:{self.task_id} ({self.status})"
+
+    @classmethod
+    def latest_task_id(cls, dataset_id, task_name, status="SUCCESS"):
+        return (
+            cls.objects.filter(dataset_id=dataset_id, task_name=task_name, status=status)
+            .order_by("-date_done")
+            .values_list("task_id", flat=True)
+            .first()
+        )
+
+    class Meta:
+        managed = True
+        db_table = "dataset_tasks"
+        indexes = [
+            models.Index(fields=["dataset", "task_name", "status", "-date_done"], name="dataset_task_lookup_idx"),
+        ]
+
+
+# an align_idx review decision, recorded when the reviewer submits it and applied to the
+# whg index afterwards, in order, by datasets.accession.apply_queued_decisions()
+class IndexDecision(models.Model):
+    STATUSES = [("queued", "queued"), ("applied", "applied"), ("failed", "failed")]
+
+    # one decision per task and place: a resubmitted review form is not applied twice
+    # (match_undo withdraws it, see accession.withdraw_index_decisions)
+    key = models.CharField(max_length=100, unique=True)
+    place = models.ForeignKey(Place, related_name="index_decisions", on_delete=models.CASCADE)
+    task = models.ForeignKey(TaskResult, null=True, on_delete=models.SET_NULL)
+    user = models.ForeignKey(User, null=True, on_delete=models.SET_NULL)
+    # matched hits: [{whg_id, pid, score, links}]; none = index as a new parent
+    matches = JSONField(default=list)
+    # whg_id allocated for a new parent, kept so a retry writes the same document
+    whg_id = models.IntegerField(null=True, blank=True)
+    status = models.CharField(max_length=12, choices=STATUSES, default="queued")
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    applied = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
+
+    class Meta:
+        managed = True
+        db_table = "index_decisions"
+        indexes = [
+            models.Index(fields=["status", "id"], name="index_decision_queue_idx"),
+        ]
+
+
 class DatasetUser(models.Model):
     dataset_id = models.ForeignKey(
         Dataset, related_name="collabs", default=-1, on_delete=models.CASCADE
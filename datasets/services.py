@@ -11,13 +11,12 @@ from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django_celery_results.models import TaskResult
 
-from datasets.models import Hit, Dataset
-from elastic.es_utils import makeDoc
+from datasets.accession import queue_index_decision
+from datasets.models import Hit, Dataset, DatasetStats
 from places.models import Place, PlaceGeom, PlaceName, PlaceLink, CloseMatch
 from whg import settings
 from .helpers import link_uri
 from .static.hashes.parents import ccodes as cchash
-from .tasks import maxID
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -300,22 +299,14 @@ def _process_matching_decisions(request, place, formset, task, auth, authname, k
                     logger.error(f"Hit with ID {hit_id} not found.")
 
     if task.task_name == "align_idx":
-        if not matched_for_idx:
-            logger.debug(f'review()->parent. user: {request.user}, place_post: {place.id}, task: {task}')
-            indexMatch(str(place.id), user=request.user, task=task)
-            place.indexed = True
-            place.save()
-        elif len(matched_for_idx) == 1:
-            parent_id = matched_for_idx[0]["pid"]
-            indexMatch(str(place.id), hit_pid=parent_id, user=request.user, task=task)
-            place.indexed = True
-            place.save()
-        elif len(matched_for_idx) > 1:
-            indexMultiMatch(place.id, matched_for_idx, user=request.user, task=task)
-            place.indexed = True
-            place.save()
-
-    if ds.unindexed == 0:
+        # index writes are applied in the background, in order, by datasets.accession
+        logger.debug(f'review()->queue. user: {request.user}, place_post: {place.id}, matches: {len(matched_for_idx)}')
+        queue_index_decision(place, task, request.user, matched_for_idx)
+        place.indexed = True
+        place.save()
+
+    # counts as changed by the saves above
+    if DatasetStats.for_dataset(ds).unindexed == 0:
         ds.ds_status = "indexed"
         ds.save()
 
@@ -326,208 +317,6 @@ def _process_matching_decisions(request, place, formset, task, auth, authname, k
     place.save()
 
 
-def indexMatch(pid, hit_pid=None, user=None, task=None):
-    """
-    Indexes a db record upon a single hit match in align_idx review.
-    If the place is already indexed, it is related as a child to an existing parent.
-    """
-    logger = logging.getLogger('accession')
-
-    logger.debug(f'indexMatch(): user: {user}; task: {str(hit_pid)}')
-    logger.debug(f'indexMatch(): pid {str(pid)}; hit_pid: {str(hit_pid)}')
-
-    es = settings.ES_CONN
-    idx = settings.ES_WHG
-
-    # Ensure valid Place object
-    try:
-        place = get_object_or_404(Place, id=int(pid))
-    except ValueError:
-        logger.error(f"Invalid 'pid': {pid} is not a valid integer.")
-        return
-    except Exception as e:
-        logger.error(f"Error fetching Place with id={pid}: {e}")
-        return
-
-    # Query Elasticsearch for place_id
-    try:
-        q_place = {"query": {"bool": {"must": [{"match": {"place_id": pid}}]}}}
-        res = es.search(index=idx, body=q_place)
-        logger.debug(f'Elasticsearch query for place_id={pid}: {res}')
-    except Exception as e:
-        logger.error(f"Elasticsearch query failed for place_id={pid}: {e}")
-        return
-
-    is_already_indexed = res['hits']['total']['value'] > 0
-
-    if not is_already_indexed:
-        # If the place is not indexed, create it as a new parent
-        logger.debug(f'Place {pid} not found in index. Creating as parent.')
-        try:
-            new_doc = makeDoc(place)
-            new_doc['relation'] = {"name": "parent"}
-            new_doc['whg_id'] = maxID(es, idx) + 1
-
-            es.index(index=idx, id=str(new_doc['whg_id']), body=json.dumps(new_doc))
-            place.indexed = True
-            place.save()
-            logger.info(f'Place {pid} indexed as new parent.')
-        except Exception as e:
-            logger.error(f"Failed to index Place {pid} as parent: {e}")
-        return
-
-    # If already indexed, handle relationship logic
-    try:
-        parent_record = res['hits']['hits'][0]
-        parent_id = parent_record['_id']
-        logger.debug(f'Place {pid} found in index. Parent ID: {parent_id}')
-
-        # Handle hit_pid logic
-        if hit_pid:
-            q_hit = {"query": {"bool": {"must": [{"match": {"place_id": hit_pid}}]}}}
-            res_hit = es.search(index=idx, body=q_hit)
-            if not res_hit['hits']['hits']:
-                logger.warning(f"No hits found for hit_pid={hit_pid}.")
-                return
-
-            hit = res_hit['hits']['hits'][0]
-            parent_whgid = hit['_id'] if hit['_source']['relation']['name'] != 'child' else hit['_source']['relation'][
-                'parent']
-
-            new_doc = makeDoc(place)
-            new_doc['relation'] = {"name": "child", "parent": parent_whgid}
-
-            es.index(index=idx, id=place.id, body=json.dumps(new_doc))
-            logger.info(f"Place {pid} added as child of parent {parent_whgid}.")
-        else:
-            logger.debug(f"No hit_pid provided for Place {pid}. No child-parent relationship created.")
-    except Exception as e:
-        logger.error(f"Error processing relationship for Place {pid}: {e}")
-
-
-def indexMultiMatch(pid, matchlist, user, task):
-    """
-      from datasets.views.review()
-      indexes a db record given multiple hit matches in align_idx review
-      a LOT has to happen (see _notes/accession-pseudocode.txt):
-        - pick a single 'winner' among the matched hits (max score)
-        - make new record its child
-        - demote all non-winners in index from parent to child
-          - whg_id and children[] ids (if any) added to winner
-          - name variants added to winner's searchy[] and suggest.item[] lists
-    """
-    from elasticsearch8 import RequestError
-    es = settings.ES_CONN
-    idx = settings.ES_WHG
-    place = Place.objects.get(id=pid)
-    from elastic.es_utils import makeDoc
-    new_obj = makeDoc(place)
-
-    # bins for new values going to winner
-    addnames = []
-    addkids = [str(pid)]  # pid will also be the new record's _id
-
-    # max score is winner
-    winner = max(matchlist, key=lambda x: x['score'])  # 14158663
-    winner_place_id = winner['pid']  # This is the place_id of the winner
-    # this is multimatch so there is at least one demoted (list of whg_ids)
-    demoted = [str(i['whg_id']) for i in matchlist if not (i['whg_id'] == winner['whg_id'])]  # ['14090523']
-
-    # complete doc for new record
-    new_obj['relation'] = {"name": "child", "parent": winner['whg_id']}
-    # copy its toponyms into addnames[] for adding to winner later
-    for n in new_obj['names']:
-        addnames.append(n['toponym'])
-    if place.title not in addnames:
-        addnames.append(place.title)
-
-    # New relationships for CloseMatch records
-    new_relationships = [(pid, winner_place_id)]  # Add the initial relationship
-
-    # generate script used to update winner w/kids and names
-    # from new record and any kids of 'other' matched parents
-    def q_updatewinner(addkids, addnames):
-        return {"script": {
-            "source": """ctx._source.children.addAll(params.newkids);
-          ctx._source.searchy.addAll(params.names);
-          """,
-            "lang": "painless",
-            "params": {
-                "newkids": addkids,
-                "names": addnames}
-        }}
-
-    # index the new record as child of winner
-    try:
-        es.index(index=idx, id=str(pid), routing=1, body=json.dumps(new_obj))
-    except RequestError as rq:
-        logger.exception(f'Error indexing new record {pid} as child of {winner["whg_id"]}: {rq.error} {rq.info}')
-
-    # demote others
-    for _id in demoted:
-        # get index record stuff, to be altered then re-indexed
-        # ES won't allow altering parent/child relations directly
-        q_demote = {"query": {"bool": {"must": [{"match": {"whg_id": _id}}]}}}
-        res = es.search(body=q_demote, index=idx)
-        srcd = res['hits']['hits'][0]['_source']
-        # add names in suggest to names[]
-        sugs = srcd['searchy']
-        for sug in sugs:
-            addnames.append(sug)
-        addnames = list(set(addnames))
-        # _id of demoted (a whg_id) belongs in winner's children[]
-        addkids.append(str(srcd['place_id']))
-
-        haskids = len(srcd['children']) > 0
-        # if demoted record has kids, add to addkids[] list
-        # for 'adoption' by topdog later
-        if haskids:
-            morekids = srcd['children']
-            for kid in morekids:
-                addkids.append(str(kid))
-
-        # update the 'winner' parent
-        q = q_updatewinner(list(set(addkids)), list(set(addnames)))  # ensure only unique
-        try:
-            es.update(index=idx, id=winner['whg_id'], body=q)
-        except RequestError as rq:
-            logger.exception(f'Error updating winner {winner["whg_id"]}: {rq.error} {rq.info}')
-
-        from copy import deepcopy
-        newsrcd = deepcopy(srcd)
-        # update it to reflect demotion
-        newsrcd['relation'] = {"name": "child", "parent": winner['whg_id']}
-        newsrcd['children'] = []
-        if 'whg_id' in newsrcd:
-            newsrcd.pop('whg_id')
-
-        # zap the demoted, reindex with same _id and modified doc (newsrcd)
-        try:
-            es.delete(index=idx, id=_id)
-            es.index(index=idx, id=_id, body=newsrcd, routing=1)
-        except RequestError as rq:
-            logger.exception(f'Error reindexing demoted record {_id}: {rq.error} {rq.info}')
-
-        # re-assign parent for kids of all/any demoted parents
-        if len(addkids) > 0:
-            for kid in addkids:
-                q_adopt = {"script": {
-                    "source": "ctx._source.relation.parent = params.new_parent; ",
-                    "lang": "painless",
-                    "params": {"new_parent": winner['whg_id']}
-                },
-                    "query": {"match": {"place_id": kid}}}
-                es.update_by_query(index=idx, body=q_adopt, conflicts='proceed')
-
-                # Add new relationships for CloseMatch
-                kid_place_id = kid  # Since addkids contains place_id values
-                new_relationships.append((int(kid_place_id), int(winner_place_id)))
-
-    # Create new CloseMatch records
-    for place_a, place_b in new_relationships:
-        update_close_matches(place_a, place_b, user, task)
-
-
 def recon_complete(ds):
     ds.ds_status = "wd-complete"
     ds.save()
@@ -6,12 +6,14 @@ import requests
 from django.conf import settings
 from django.core.cache import caches
 from django.db import transaction
-from django.db.models.signals import pre_delete, pre_save, post_save
+from django.db.models.signals import pre_delete, pre_save, post_save, post_delete
 from django.dispatch import receiver
 
 from utils.doi import doi
 from whgmail.messaging import WHGmail
-from .models import Dataset, DatasetFile
+from main.models import Comment
+from places.models import Place, PlaceGeom, PlaceLink, PlaceName, PlaceType, PlaceWhen
+from .models import Dataset, DatasetFile, DatasetStats, Hit
 from .utils import compute_dataset_bbox
 
 logger = logging.getLogger(__name__)
@@ -73,6 +75,7 @@ def check_featured_field_change(sender, instance, **kwargs):
 @receiver(pre_save, sender=Dataset)
 def handle_public_flag(sender, instance, **kwargs):
     from .tasks import index_to_pub, unindex_from_pub
+    from utils.download_artifacts import delete_download_artifacts
 
     if instance.id:  # Check if it's an existing instance, not new
         old_instance = sender.objects.get(pk=instance.pk)
@@ -100,6 +103,8 @@ def handle_public_flag(sender, instance, **kwargs):
             else:
                 # Changed from True to False, remove the records from the index
                 transaction.on_commit(lambda: unindex_from_pub.delay(instance.id))
+                # and its pre-built download zips, which are served as public media files
+                transaction.on_commit(lambda: delete_download_artifacts(instance.id))
                 # notify the owner
                 owner = instance.owner
                 WHGmail(context={
@@ -182,3 +187,39 @@ def remove_files(**kwargs):
     files = DatasetFile.objects.filter(dataset_id_id=ds_instance.id)
     files.delete()
     doi(ds_instance._meta.model_name, ds_instance.id, 'hide')
+
+
+# DatasetStats: record that counts have changed; they are recomputed when next read
+@receiver(post_save, sender=Place)
+@receiver(post_delete, sender=Place)
+def place_stats_changed(sender, instance, **kwargs):
+    DatasetStats.mark_stale(['places'], dataset__label=instance.dataset_id)
+
+
+# No post_delete receivers for names, links or hits: they would stop Django deleting them in
+# bulk (and cascading from places and datasets) without loading every row. Code deleting
+# them marks stats stale itself, directly or by utils.mapdata.places_changed_in_bulk, as do
+# their admins; geometries have post_delete receivers for mapdata anyway.
+@receiver(post_save, sender=PlaceName)
+@receiver(post_save, sender=PlaceLink)
+@receiver(post_save, sender=PlaceGeom)
+@receiver(post_delete, sender=PlaceGeom)
+def place_child_stats_changed(sender, instance, **kwargs):
+    DatasetStats.mark_stale(['places'], dataset__places__id=instance.place_id)
+
+
+# types, whens and comments are in downloads (see utils.download_artifacts.data_version)
+@receiver(post_save, sender=PlaceType)
+@receiver(post_save, sender=PlaceWhen)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def place_download_content_changed(sender, instance, **kwargs):
+    place_id = instance.place_id_id if sender is Comment else instance.place_id
+    DatasetStats.mark_stale(['places'], dataset__places__id=place_id)
+
+
+@receiver(post_save, sender=Hit)
+def hit_stats_changed(sender, instance, created=False, **kwargs):
+    # hits are created by align tasks, which mark hits stale when they start and finish
+    if not created:
+        DatasetStats.mark_stale(['hits'], dataset_id=instance.dataset_id)
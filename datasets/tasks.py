@@ -10,12 +10,14 @@ from django.core import serializers
 from django.db import transaction, connection
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
-from celery import shared_task
+from celery import chord, shared_task
+from celery.signals import task_postrun, task_prerun
 from celery.result import AsyncResult
 from celery.utils.log import get_task_logger
 import codecs, csv, datetime, itertools, os, re, sys, zipfile
@@ -29,10 +31,11 @@ from ratelimit import limits, sleep_and_retry
 
 from areas.models import Area
 from collection.models import Collection
-from datasets.models import Dataset, Hit
+from datasets.models import Dataset, DatasetStats, DatasetTask, Hit, ReconCheckpoint
 from datasets.static.hashes.parents import ccodes as cchash
 from datasets.static.hashes.qtypes import qtypes
-from elastic.es_utils import makeDoc, build_qobj, profileHit
+from elastic.es_utils import makeDoc, build_qobj, profileHit, prefetch_qobj_places, chunked
+from elastic.msearch import MsearchRunner, response_hits
 from datasets.utils import elapsed, getQ, \
     HitRecord, hully, parse_wkt, post_recon_update  # bestParent, makeNow,
 from main.models import Log, DownloadFile
@@ -167,6 +170,13 @@ def unindex_from_pub(dataset_id=None, place_id=None):
     logger.debug(f"Unindexing complete")
 
 
+# applies align_idx review decisions queued by datasets.accession.queue_index_decision()
+@shared_task(name="apply_index_decisions")
+def apply_index_decisions():
+    from datasets.accession import apply_queued_decisions
+    return apply_queued_decisions()
+
+
 # test task for uptimerobot
 @shared_task(name="testAdd")
 def testAdd(n1, n2):
@@ -498,44 +508,22 @@ def get_bounds_filter(bounds, idx):
     return filter
 
 
-def es_lookup_wdlocal(qobj, *args, logger=None, **kwargs):
+def wdlocal_queries(qobj, bounds, exclude_geonames, logger, area_filter=None):
     """
-    Perform an Elasticsearch lookup for a given query object against the
-    combined Wikidata and GeoNames index.
+    Build the pass0 (authids), pass1 (names + types) and pass2 (names + fclasses)
+    queries against the combined Wikidata and GeoNames index for one qobj.
 
     Args:
         qobj (dict): Query object containing place information.
-        *args: Additional positional arguments (unused).
-        logger (logging.Logger, optional): Logger instance for logging messages.
-        **kwargs: Additional keyword arguments, including bounds and geonames exclusion.
+        bounds (dict): Region or user area bounds from the task kwargs.
+        exclude_geonames (bool): If True, GeoNames records are excluded.
+        logger (logging.Logger): Logger instance for logging messages.
+        area_filter (dict, optional): Pre-built bounds filter, to avoid an Area query per place.
 
     Returns:
-        dict: A result object containing the place ID, hits, missed count,
-              and total hits.
+        tuple: (q0, q1, q2) query bodies.
     """
 
-    # Define the index for the search, combining Wikidata and GeoNames.
-    idx = 'wdgn'  # Wikidata + GeoNames
-
-    # If no logger is provided, use the default logger for this module.
-    if logger is None:
-        logger = logging.getLogger(__name__)  # Default logger
-
-    logger.info(f'kwargs in es_lookup_wdlocal(): {kwargs}')
-
-    # Determine if GeoNames should be excluded based on the value in kwargs.
-    exclude_geonames = kwargs.get('geonames') == 'on'
-    logger.info(f'exclude_geonames: {exclude_geonames}')
-
-    # Initialize hit count and prepare an empty result object.
-    hit_count = 0
-    result_obj = {
-        'place_id': qobj['place_id'],
-        'hits': [],
-        'missed': -1,
-        'total_hits': -1
-    }
-
     # Extract distinct name variants without language specifications.
     variants = list(set(qobj['variants']))
     logger.info(f'variants: {variants}')
@@ -550,8 +538,6 @@ def es_lookup_wdlocal(qobj, *args, logger=None, **kwargs):
     has_countries = len(countries) > 0
     logger.info(f'countries: {countries}')
 
-    # Extract the bounds object from kwargs.
-    bounds = kwargs['bounds']
     has_bounds = bounds.get('id', ['0']) != ['0']  # '0' is the default value for no bounds
     logger.info(f'bounds: {bounds if has_bounds else "None"}')
 
@@ -560,7 +546,7 @@ def es_lookup_wdlocal(qobj, *args, logger=None, **kwargs):
     logger.info(f'geom: {qobj["geom"] if has_geom else "None"}')
 
     if has_bounds:
-        area_filter = get_bounds_filter(bounds, 'wd')
+        area_filter = area_filter or get_bounds_filter(bounds, 'wd')
     if has_geom:
         shape_filter = {"geo_shape": {
             "location": {
@@ -650,6 +636,65 @@ def es_lookup_wdlocal(qobj, *args, logger=None, **kwargs):
     if len(qobj['fclasses']) > 0:
         q2['query']['bool']['must'].append({"terms": {"fclasses": qobj['fclasses']}})
 
+    return q0, q1, q2
+
+
+def new_wdlocal_result(qobj):
+    # empty result object
+    return {
+        'place_id': qobj['place_id'],
+        'hits': [],
+        'missed': -1,
+        'total_hits': -1,
+        'hit_count': 0
+    }
+
+
+def add_wdlocal_hits(result_obj, hits, pass_number):
+    """Tags hits with their pass and adds them to result_obj."""
+    for hit in hits:
+        result_obj['hit_count'] += 1
+        hit['pass'] = f'pass{pass_number}'
+        result_obj['hits'].append(hit)
+
+
+def mark_wdlocal_missed(result_obj, qobj, logger):
+    result_obj['missed'] = str(qobj['place_id']) + ': ' + qobj['title']
+    logger.info(f'No hits found for place {qobj["place_id"]}: {qobj["title"]}')
+
+
+def es_lookup_wdlocal(qobj, *args, logger=None, **kwargs):
+    """
+    Perform an Elasticsearch lookup for a given query object against the
+    combined Wikidata and GeoNames index.
+
+    Args:
+        qobj (dict): Query object containing place information.
+        *args: Additional positional arguments (unused).
+        logger (logging.Logger, optional): Logger instance for logging messages.
+        **kwargs: Additional keyword arguments, including bounds and geonames exclusion.
+
+    Returns:
+        dict: A result object containing the place ID, hits, missed count,
+              and total hits.
+    """
+
+    # Define the index for the search, combining Wikidata and GeoNames.
+    idx = 'wdgn'  # Wikidata + GeoNames
+
+    # If no logger is provided, use the default logger for this module.
+    if logger is None:
+        logger = logging.getLogger(__name__)  # Default logger
+
+    logger.info(f'kwargs in es_lookup_wdlocal(): {kwargs}')
+
+    # Determine if GeoNames should be excluded based on the value in kwargs.
+    exclude_geonames = kwargs.get('geonames') == 'on'
+    logger.info(f'exclude_geonames: {exclude_geonames}')
+
+    result_obj = new_wdlocal_result(qobj)
+    queries = wdlocal_queries(qobj, kwargs['bounds'], exclude_geonames, logger)
+
     # Perform query passes
     def perform_query_pass(q, pass_number):
         logger.info(f'Attempting Elasticsearch query for pass {pass_number}: {q}')
@@ -662,44 +707,172 @@ def es_lookup_wdlocal(qobj, *args, logger=None, **kwargs):
             logger.error(f'Error during pass {pass_number}: {str(e)}')
             raise e
 
-    # Pass 0
-    hits0 = perform_query_pass(q0, 0)
-    if hits0:
-        for hit in hits0:
-            hit_count += 1
-            hit['pass'] = 'pass0'
-            result_obj['hits'].append(hit)
+    # Pass 0, then Pass 1 and Pass 2 only while nothing has been found
+    for pass_number, q in enumerate(queries):
+        hits = perform_query_pass(q, pass_number)
+        if hits:
+            add_wdlocal_hits(result_obj, hits, pass_number)
+            break
     else:
-        # Pass 1
-        hits1 = perform_query_pass(q1, 1)
-        if hits1:
-            for hit in hits1:
-                hit_count += 1
-                hit['pass'] = 'pass1'
-                result_obj['hits'].append(hit)
-        else:
-            # Pass 2
-            hits2 = perform_query_pass(q2, 2)
-            if hits2:
-                for hit in hits2:
-                    hit_count += 1
-                    hit['pass'] = 'pass2'
-                    result_obj['hits'].append(hit)
-            else:
-                result_obj['missed'] = str(qobj['place_id']) + ': ' + qobj['title']
-                logger.info(f'No hits found for place {qobj["place_id"]}: {qobj["title"]}')
-    result_obj['hit_count'] = hit_count
+        mark_wdlocal_missed(result_obj, qobj, logger)
     return result_obj
 
 
-@shared_task(name="align_wdlocal")
+def lookup_wdlocal_batch(qobjs, bounds, exclude_geonames, runner, logger, area_filter=None):
+    """
+    Pipelined es_lookup_wdlocal() for a batch of qobjs: pass0 for every place
+    goes out in one _msearch, the places pass0 missed go to a pass1 _msearch,
+    and what pass1 missed goes to pass2. Returns {place_id: result_obj}, or the
+    exception for a place whose search failed.
+    """
+    plans = {qobj['place_id']: (qobj, wdlocal_queries(qobj, bounds, exclude_geonames, logger,
+                                                      area_filter=area_filter))
+             for qobj in qobjs}
+    results = {pid: new_wdlocal_result(qobj) for pid, (qobj, _) in plans.items()}
+
+    pending = list(plans)
+    for pass_number in range(3):
+        if not pending:
+            break
+        responses = runner.search([plans[pid][1][pass_number] for pid in pending])
+        missed = []
+        for pid, res in zip(pending, responses):
+            try:
+                hits = response_hits(res)
+            except Exception as e:
+                logger.error(f'Error during pass {pass_number} for place {pid}: {e}')
+                results[pid] = e
+                continue
+            if hits:
+                add_wdlocal_hits(results[pid], hits, pass_number)
+            else:
+                missed.append(pid)
+        pending = missed
+
+    for pid in pending:
+        mark_wdlocal_missed(results[pid], plans[pid][0], logger)
+    return results
+
+
+def build_wdlocal_qobj(place):
+    """Builds the query object for es_lookup_wdlocal() from a Place."""
+    qobj = {"place_id": place.id,
+            "src_id": place.src_id,
+            "title": place.title,
+            "fclasses": place.fclasses or []}
+
+    [variants, geoms, types, ccodes, parents, links] = [[], [], [], [], [], []]
+
+    # ccodes (2-letter iso codes)
+    for c in place.ccodes:
+        ccodes.append(c.upper())
+    qobj['countries'] = place.ccodes
+
+    # types (Getty AAT integer ids if available)
+    for t in place.types.all():
+        if t.jsonb['identifier'].startswith('aat:'):
+            types.append(int(t.jsonb['identifier'].replace('aat:', '')))
+    qobj['placetypes'] = types
+
+    # variants
+    variants.append(place.title)
+    for name in place.names.all():
+        variants.append(name.toponym)
+    qobj['variants'] = list(set(variants))
+
+    # parents
+    if len(place.related.all()) > 0:
+        for rel in place.related.all():
+            if rel.jsonb['relationType'] == 'gvp:broaderPartitive':
+                parents.append(rel.jsonb['label'])
+        qobj['parents'] = parents
+    else:
+        qobj['parents'] = []
+
+    # geoms
+    if len(place.geoms.all()) > 0:
+        g_list = [g.jsonb for g in place.geoms.all()]
+        # make simple polygon hull for ES shape filter
+        qobj['geom'] = hully(g_list)
+        # make a representative_point
+        # qobj['repr_point'] = pointy(g_list)
+
+    # 'P1566':'gn', 'P1584':'pleiades', 'P244':'loc', 'P214':'viaf', 'P268':'bnf', 'P1667':'tgn',
+    # 'P2503':'gov', 'P1871':'cerl', 'P227':'gnd'
+    # links
+    if len(place.links.all()) > 0:
+        l_list = [l.jsonb['identifier'] for l in place.links.all()]
+        qobj['authids'] = l_list
+    else:
+        qobj['authids'] = []
+    return qobj
+
+
+def wdlocal_hit_records(result_obj, place, qobj, ds, task_id, language, counters, hit_parade, logger):
+    """
+    Unsaved Hit instances for one place's wdlocal results; updates
+    the pass counters and hit_parade in place.
+    """
+    new_hits = []
+
+    # Collect geonames IDs from wikidata hits
+    geonames_ids_from_wikidata = set()
+
+    for hit in result_obj['hits']:
+        if hit['_source']['dataset'] == 'wikidata':
+            authids = hit['_source'].get('authids', [])
+            for authid in authids:
+                if authid.startswith('gn:'):
+                    geonames_id = authid.split(':')[1]
+                    geonames_ids_from_wikidata.add(geonames_id)
+
+    for hit in result_obj['hits']:
+        hit_id = hit['_source']['id']
+        logger.info(f'Pre-write hit["_source"]: {hit["_source"]}')
+
+        # Avoid writing geonames hit if its ID matches any geonames ID from wikidata
+        if hit['_source']['dataset'] == 'geonames' and hit_id in geonames_ids_from_wikidata:
+            continue
+
+        if hit['pass'] == 'pass0':
+            counters['count_p0'] += 1
+        if hit['pass'] == 'pass1':
+            counters['count_p1'] += 1
+        elif hit['pass'] == 'pass2':
+            counters['count_p2'] += 1
+        hit_parade["hits"].append(hit)
+        new_hits.append(Hit(
+            # authority = 'wd',
+            authority='wikidata' if 'Q' in hit_id else 'geonames',
+            authrecord_id=hit['_source']['id'],
+            dataset=ds,
+            place=place,
+            task_id=task_id,
+            query_pass=hit['pass'],
+            # prepare for consistent display in review screen
+            json=normalize(hit['_source'], 'wdlocal', language),
+            src_id=qobj['src_id'],
+            score=hit['_score'],
+            reviewed=False,
+            matched=False
+        ))
+    return new_hits
+
+
+@shared_task(name="align_wdlocal", acks_late=True, reject_on_worker_lost=True)
 def align_wdlocal(*args, **kwargs):
     """
     Manage the alignment and reconciliation of local entities to the
     Wikidata index. This function retrieves results for each place
     using the es_lookup_wdlocal function and processes the hits
     for review.
+
+    Progress is checkpointed (ReconCheckpoint) so a redelivered task resumes
+    where it stopped; kwargs 'partitions' > 1 splits the places into id ranges
+    run as parallel subtasks whose summaries merge_partitions() combines.
     """
+    from utils.mapdata import places_changed_in_bulk
+
     logger = logging.getLogger('reconciliation')
     logger.info(f'Starting align_wdlocal task with task_id: {align_wdlocal.request.id}')
     logger.info(f'request: {align_wdlocal.request}')
@@ -716,8 +889,7 @@ def align_wdlocal(*args, **kwargs):
     language = kwargs['lang']
 
     hit_parade = {"summary": {}, "hits": []}
-    [nohits, wdlocal_es_errors, features] = [[], [], []]
-    [count_hit, count_nohit, total_hits, count_p0, count_p1, count_p2] = [0, 0, 0, 0, 0, 0]
+    [nohits, features] = [[], []]
     start = datetime.datetime.now()
     # there is no test option for wikidata, but needs default
     test = 'off'
@@ -729,135 +901,127 @@ def align_wdlocal(*args, **kwargs):
     if scope_geom == 'geom_free':
         qs = qs.filter(geoms__isnull=True)
 
-    for place in qs:
-        # build query object
-        qobj = {"place_id": place.id,
-                "src_id": place.src_id,
-                "title": place.title,
-                "fclasses": place.fclasses or []}
-
-        [variants, geoms, types, ccodes, parents, links] = [[], [], [], [], [], []]
-
-        # ccodes (2-letter iso codes)
-        for c in place.ccodes:
-            ccodes.append(c.upper())
-        qobj['countries'] = place.ccodes
-
-        # types (Getty AAT integer ids if available)
-        for t in place.types.all():
-            if t.jsonb['identifier'].startswith('aat:'):
-                types.append(int(t.jsonb['identifier'].replace('aat:', '')))
-        qobj['placetypes'] = types
-
-        # variants
-        variants.append(place.title)
-        for name in place.names.all():
-            variants.append(name.toponym)
-        qobj['variants'] = list(set(variants))
-
-        # parents
-        if len(place.related.all()) > 0:
-            for rel in place.related.all():
-                if rel.jsonb['relationType'] == 'gvp:broaderPartitive':
-                    parents.append(rel.jsonb['label'])
-            qobj['parents'] = parents
-        else:
-            qobj['parents'] = []
-
-        # geoms
-        if len(place.geoms.all()) > 0:
-            g_list = [g.jsonb for g in place.geoms.all()]
-            # make simple polygon hull for ES shape filter
-            qobj['geom'] = hully(g_list)
-            # make a representative_point
-            # qobj['repr_point'] = pointy(g_list)
-
-        # 'P1566':'gn', 'P1584':'pleiades', 'P244':'loc', 'P214':'viaf', 'P268':'bnf', 'P1667':'tgn',
-        # 'P2503':'gov', 'P1871':'cerl', 'P227':'gnd'
-        # links
-        if len(place.links.all()) > 0:
-            l_list = [l.jsonb['identifier'] for l in place.links.all()]
-            qobj['authids'] = l_list
-        else:
-            qobj['authids'] = []
-
-        # TODO: ??? skip records that already have a Wikidata record in l_list
-        # they are returned as Pass 0 hits right now
-        # run pass0-pass2 ES queries
-        # in progress: lookup on wdgn index instead of wd
-        result_obj = es_lookup_wdlocal(qobj, bounds=bounds, geonames=geonames, logger=logger)
-        logger.info(f'result_obj: {result_obj}')
-        if result_obj['hit_count'] == 0:
-            count_nohit += 1
-            nohits.append(result_obj['missed'])
-        else:
-            # place/task status 0 (unreviewed hits)
-            place.review_wd = 0
-            place.save()
-
-            count_hit += 1
-            total_hits += len(result_obj['hits'])
-
-            # Collect geonames IDs from wikidata hits
-            geonames_ids_from_wikidata = set()
-
-            for hit in result_obj['hits']:
-                if hit['_source']['dataset'] == 'wikidata':
-                    authids = hit['_source'].get('authids', [])
-                    for authid in authids:
-                        if authid.startswith('gn:'):
-                            geonames_id = authid.split(':')[1]
-                            geonames_ids_from_wikidata.add(geonames_id)
-
-            for hit in result_obj['hits']:
-                hit_id = hit['_source']['id']
-                logger.info(f'Pre-write hit["_source"]: {hit["_source"]}')
-
-                # Avoid writing geonames hit if its ID matches any geonames ID from wikidata
-                if hit['_source']['dataset'] == 'geonames' and hit_id in geonames_ids_from_wikidata:
-                    continue
-
-                if hit['pass'] == 'pass0':
-                    count_p0 += 1
-                if hit['pass'] == 'pass1':
-                    count_p1 += 1
-                elif hit['pass'] == 'pass2':
-                    count_p2 += 1
-                hit_parade["hits"].append(hit)
-                new = Hit(
-                    # authority = 'wd',
-                    authority='wikidata' if 'Q' in hit_id else 'geonames',
-                    authrecord_id=hit['_source']['id'],
-                    dataset=ds,
-                    place=place,
-                    task_id=task_id,
-                    query_pass=hit['pass'],
-                    # prepare for consistent display in review screen
-                    json=normalize(hit['_source'], 'wdlocal', language),
-                    src_id=qobj['src_id'],
-                    score=hit['_score'],
-                    reviewed=False,
-                    matched=False
-                )
-                new.save()
-                logger.info(f'Hit record saved: {new}')
+    # split into range partitions on several workers?
+    if kwargs.get('partitions', settings.RECON_PARTITIONS) > 1 and not kwargs.get('id_range'):
+        return dispatch_partitions(align_wdlocal, task_id, qs, kwargs, logger)
+
+    # resume from the checkpoint left by an earlier delivery of this task, if any
+    checkpoint = open_checkpoint(task_id, 'align_wdlocal', ds, kwargs, logger)
+    hit_task_id = checkpoint.hit_task_id
+    qs = partition_queryset(qs, checkpoint)
+    place_count = qs.count()
+    counters = checkpoint.state or {
+        'count_hit': 0, 'count_nohit': 0, 'total_hits': 0,
+        'count_p0': 0, 'count_p1': 0, 'count_p2': 0, 'es_errors': []
+    }
+    remaining = remaining_places(qs, checkpoint)
+
+    if kwargs.get('batched', settings.RECON_BATCHED):
+        # pipelined pass0 -> pass1 -> pass2 over _msearch, per chunk of prefetched places
+        runner = MsearchRunner(es=settings.ES_CONN, index='wdgn')
+        exclude_geonames = geonames == 'on'
+        area_filter = get_bounds_filter(bounds, 'wd') if bounds.get('id', ['0']) != ['0'] else None
+
+        place_ids = list(remaining.values_list('id', flat=True))
+        for chunk in chunked(place_ids, settings.RECON_CHUNK_SIZE):
+            places = list(prefetch_qobj_places(chunk))
+            qobjs = {place.id: build_wdlocal_qobj(place) for place in places}
+            results = lookup_wdlocal_batch(list(qobjs.values()), bounds, exclude_geonames, runner, logger,
+                                           area_filter=area_filter)
+            new_hits, matched = [], []
+            for place in places:
+                result_obj = results[place.id]
+                if isinstance(result_obj, Exception):
+                    counters['es_errors'].append(place.id)
+                elif result_obj['hit_count'] == 0:
+                    counters['count_nohit'] += 1
+                    nohits.append(result_obj['missed'])
+                else:
+                    matched.append(place.id)
+                    counters['count_hit'] += 1
+                    counters['total_hits'] += len(result_obj['hits'])
+                    new_hits.extend(wdlocal_hit_records(result_obj, place, qobjs[place.id], ds, hit_task_id,
+                                                        language, counters, hit_parade, logger))
+            with transaction.atomic():
+                Hit.objects.bulk_create(new_hits)
+                # place/task status 0 (unreviewed hits)
+                Place.objects.filter(id__in=matched).update(review_wd=0)
+                places_changed_in_bulk(matched)
+                save_checkpoint(checkpoint, chunk[-1], counters)
+            logger.info(f'Processed chunk of {len(chunk)} places; msearch stats: {runner.stats}')
+    else:
+        new_hits, matched, last_place_id = [], [], None
+
+        def save_chunk():
+            # a chunk's hits and the checkpoint counting them are saved together, so a
+            # resumed task neither skips its places nor loses them from the summary
+            with transaction.atomic():
+                Hit.objects.bulk_create(new_hits)
+                # place/task status 0 (unreviewed hits)
+                Place.objects.filter(id__in=matched).update(review_wd=0)
+                places_changed_in_bulk(matched)
+                save_checkpoint(checkpoint, last_place_id, counters)
+            new_hits.clear()
+            matched.clear()
+
+        for index, place in enumerate(remaining):
+            # build query object
+            qobj = build_wdlocal_qobj(place)
+
+            # TODO: ??? skip records that already have a Wikidata record in l_list
+            # they are returned as Pass 0 hits right now
+            # run pass0-pass2 ES queries
+            # in progress: lookup on wdgn index instead of wd
+            result_obj = es_lookup_wdlocal(qobj, bounds=bounds, geonames=geonames, logger=logger)
+            logger.info(f'result_obj: {result_obj}')
+            if result_obj['hit_count'] == 0:
+                counters['count_nohit'] += 1
+                nohits.append(result_obj['missed'])
+            else:
+                matched.append(place.id)
+                counters['count_hit'] += 1
+                counters['total_hits'] += len(result_obj['hits'])
+                new_hits.extend(wdlocal_hit_records(result_obj, place, qobj, ds, hit_task_id,
+                                                    language, counters, hit_parade, logger))
+
+            last_place_id = place.id
+            if (index + 1) % settings.RECON_CHUNK_SIZE == 0:
+                save_chunk()
+        if last_place_id is not None and last_place_id != checkpoint.last_place_id:
+            save_chunk()
     end = datetime.datetime.now()
+    save_checkpoint(checkpoint, checkpoint.last_place_id, counters, complete=True)
 
-    logger.info(f'ES errors: {wdlocal_es_errors}')
+    logger.info(f'ES errors: {counters["es_errors"]}')
+    seconds = (end - start).total_seconds()
     hit_parade['summary'] = {
-        'count': qs.count(),
-        'got_hits': count_hit,
-        'total_hits': total_hits,
-        'pass0': count_p0,
-        'pass1': count_p1,
-        'pass2': count_p2,
-        'no_hits': {'count': count_nohit},
-        'elapsed': elapsed(end - start)
+        'count': place_count,
+        'got_hits': counters['count_hit'],
+        'total_hits': counters['total_hits'],
+        'pass0': counters['count_p0'],
+        'pass1': counters['count_p1'],
+        'pass2': counters['count_p2'],
+        'no_hits': {'count': counters['count_nohit']},
+        'elapsed': elapsed(end - start),
+        'places_per_sec': round(place_count / seconds, 2) if seconds else place_count,
     }
+    if counters['es_errors']:
+        hit_parade['summary']['es_errors'] = len(counters['es_errors'])
     logger.info(f'hit_parade summary: {hit_parade["summary"]}')
 
+    if checkpoint.parent_task_id:
+        # a partition: status and email are handled once, by merge_partitions()
+        return hit_parade['summary']
+
+    finalise_wdlocal(ds, user, hit_parade['summary'])
+
+    return hit_parade['summary']
+
+
+def finalise_wdlocal(ds, user, summary):
+    """Log entry, dataset status and owner email on completion of align_wdlocal."""
     # create log entry and update ds status
-    post_recon_update(ds, user, 'wdlocal', test)
+    post_recon_update(ds, user, 'wdlocal', 'off')
 
     # email owner when complete
     WHGmail(context={
@@ -869,34 +1033,35 @@ def align_wdlocal(*args, **kwargs):
         'dataset_title': ds.title if ds else 'N/A',
         'dataset_label': ds.label if ds else 'N/A',
         'dataset_id': ds.id if ds else 'N/A',
-        'counthit': count_hit,
-        'totalhits': total_hits,
+        'counthit': summary['got_hits'],
+        'totalhits': summary['total_hits'],
         'slack_notify': True,
     })
 
-    return hit_parade['summary']
-
 
 """
 # performs elasticsearch > whg index queries
 # from align_idx(), returns result_obj
-
+# the query building and hit collection steps are split out so the
+# batched engine (lookup_idx_batch) can run them over _msearch responses
 """
-def es_lookup_idx(qobj, *args, **kwargs):
-    # print('kwargs from es_lookup_idx',kwargs)
-    global whg_id
-    # idx = 'whg'
-    idx = settings.ES_WHG
-    bounds = kwargs['bounds']  # e.g. {'type': ['userarea'], 'id': ['0']}
-    [hitobjlist, _ids] = [[], []]
-
+def new_idx_result(qobj):
     # empty result object
-    result_obj = {
+    return {
         'place_id': qobj['place_id'],
         'title': qobj['title'],
         'hits': [], 'missed': -1, 'total_hits': 0,
         'hit_count': 0
     }
+
+
+def idx_queries(qobj, bounds, area_filter=None):
+    """
+    prepare queries from qobj
+    returns q0 (concordance identifiers), q1 (names + spatial context),
+    and the de-duped links; q0 holds a reference to linklist, which
+    collect_pass0a() extends for the pass0b crawl
+    """
     # de-dupe
     variants = list(set(qobj["variants"]))
     links = list(set(qobj["links"]))
@@ -910,7 +1075,7 @@ def es_lookup_idx(qobj, *args, **kwargs):
     has_countries = len(qobj["countries"]) > 0
 
     if has_bounds:
-        area_filter = get_bounds_filter(bounds, "whg")
+        area_filter = area_filter or get_bounds_filter(bounds, "whg")
         # print("area_filter", area_filter)
     if has_geom:
         # qobj["geom"] is always a polygon hull
@@ -926,9 +1091,6 @@ def es_lookup_idx(qobj, *args, **kwargs):
         countries_match = {"terms": {"ccodes": qobj["countries"]}}
         # print("countries_match", countries_match)
 
-    """
-    prepare queries from qobj
-    """
     # q0 is matching concordance identifiers
     q0 = {
         "query": {"bool": {"must": [
@@ -984,131 +1146,163 @@ def es_lookup_idx(qobj, *args, **kwargs):
 
     # grab a copy
     q1 = qbase
+    return q0, q1, links, linklist
+
+
+def profile_idx_hit(h, pass_label):
+    # pull some fields for analysis
+    relation = h["_source"]["relation"]
+    hitobj = {
+        "_id": h['_id'],
+        "pid": h["_source"]['place_id'],
+        "title": h["_source"]['title'],
+        "dataset": h["_source"]['dataset'],
+        "pass": pass_label,
+        "links": [l["identifier"] \
+                  for l in h["_source"]["links"]],
+        "role": relation["name"],
+        "children": h["_source"]["children"]
+    }
+    if "parent" in relation.keys():
+        hitobj["parent"] = relation["parent"]
+    return hitobj
 
-    # /\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\
-    # pass0a, pass0b (identifiers)
-    # /\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\
-    try:
-        result0a = es.search(index=idx, body=q0)
-        hits0a = result0a["hits"]["hits"]
-        # print('len(hits0)',len(hits0a))
-    except:
-        logger.exception(f'Error in es.search(q0a): {q0}', sys.exc_info())
+
+def collect_pass0a(result_obj, hits0a, linklist):
+    """
+    pass0a (identifiers): adds all hits to result_obj, extends linklist
+    with their links; returns (hitobjlist, _ids) for the later passes
+    """
+    hitobjlist, _ids = [], []
     if len(hits0a) > 0:
         # >=1 matching identifier
         result_obj['hit_count'] += len(hits0a)
         for h in hits0a:
             # add full hit to result
             result_obj["hits"].append(h)
-            # pull some fields for analysis
             h["pass"] = "pass0a"
-            relation = h["_source"]["relation"]
-            hitobj = {
-                "_id": h['_id'],
-                "pid": h["_source"]['place_id'],
-                "title": h["_source"]['title'],
-                "dataset": h["_source"]['dataset'],
-                "pass": "pass0",
-                "links": [l["identifier"] \
-                          for l in h["_source"]["links"]],
-                "role": relation["name"],
-                "children": h["_source"]["children"]
-            }
-            if "parent" in relation.keys():
-                hitobj["parent"] = relation["parent"]
             # add profile to hitlist
-            hitobjlist.append(hitobj)
+            hitobjlist.append(profile_idx_hit(h, "pass0"))
         _ids = [h['_id'] for h in hitobjlist]
         for hobj in hitobjlist:
             for l in hobj['links']:
                 linklist.append(l) if l not in linklist else linklist
+    return hitobjlist, _ids
 
-        # if new links, crawl again
-        if len(set(linklist) - set(links)) > 0:
-            try:
-                result0b = es.search(index=idx, body=q0)
-                hits0b = result0b["hits"]["hits"]
-            except:
-                logger.exception(f'Error in es.search(q0b): {q0}', sys.exc_info())
-            # add new results if any to hitobjlist and result_obj["hits"]
-            result_obj['hit_count'] += len(hits0b)
-            for h in hits0b:
-                if h['_id'] not in _ids:
-                    _ids.append(h['_id'])
-                    relation = h["_source"]["relation"]
-                    h["pass"] = "pass0b"
-                    hitobj = {
-                        "_id": h['_id'],
-                        "pid": h["_source"]['place_id'],
-                        "title": h["_source"]['title'],
-                        "dataset": h["_source"]['dataset'],
-                        "pass": "pass0b",
-                        "links": [l["identifier"] \
-                                  for l in h["_source"]["links"]],
-                        "role": relation["name"],
-                        "children": h["_source"]["children"]
-                    }
-                    if "parent" in relation.keys():
-                        hitobj["parent"] = relation["parent"]
-                    if hitobj['_id'] not in [h['_id'] for h in hitobjlist]:
-                        result_obj["hits"].append(h)
-                        hitobjlist.append(hitobj)
-                    result_obj['total_hits'] = len((result_obj["hits"]))
 
-    #
-    # /\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\
-    # run pass1 whether pass0 had hits or not
-    # q0 only found identifier matches
-    # now get other potential hits in normal manner
-    # /\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\
-    try:
-        result1 = es.search(index=idx, body=q1)
-        hits1 = result1["hits"]["hits"]
-    except:
-        logger.exception(f'Error in es.search(q1): {q1}', sys.exc_info())
-        h["pass"] = "pass1"
-
-    result_obj['hit_count'] += len(hits1)
-
-    for h in hits1:
-        # filter out _ids found in pass0
-        # any hit on identifiers will also turn up here based on context
+def collect_pass(result_obj, hits, pass_label, hitobjlist, _ids):
+    """pass0b, pass1: adds hits not already found in an earlier pass"""
+    result_obj['hit_count'] += len(hits)
+    for h in hits:
+        # filter out _ids found in earlier passes
+        # any hit on identifiers will also turn up in pass1 based on context
         if h['_id'] not in _ids:
             _ids.append(h['_id'])
-            relation = h["_source"]["relation"]
-            h["pass"] = "pass1"
-            hitobj = {
-                "_id": h['_id'],
-                "pid": h["_source"]['place_id'],
-                "title": h["_source"]['title'],
-                "dataset": h["_source"]['dataset'],
-                "pass": "pass1",
-                "links": [l["identifier"] \
-                          for l in h["_source"]["links"]],
-                "role": relation["name"],
-                "children": h["_source"]["children"]
-            }
-            if "parent" in relation.keys():
-                hitobj["parent"] = relation["parent"]
+            h["pass"] = pass_label
+            hitobj = profile_idx_hit(h, pass_label)
             if hitobj['_id'] not in [h['_id'] for h in hitobjlist]:
-                # result_obj["hits"].append(hitobj)
                 result_obj["hits"].append(h)
                 hitobjlist.append(hitobj)
             result_obj['total_hits'] = len(result_obj["hits"])
-    # ds_hits[p.id] = hitobjlist
-    # no more need for hitobjlist
+
+
+def es_lookup_idx(qobj, *args, **kwargs):
+    # print('kwargs from es_lookup_idx',kwargs)
+    # idx = 'whg'
+    idx = settings.ES_WHG
+    bounds = kwargs['bounds']  # e.g. {'type': ['userarea'], 'id': ['0']}
+
+    result_obj = new_idx_result(qobj)
+    q0, q1, links, linklist = idx_queries(qobj, bounds)
+
+    def search_hits(q, label):
+        try:
+            return es.search(index=idx, body=q)["hits"]["hits"]
+        except:
+            logger.exception(f'Error in es.search({label}): {q}', sys.exc_info())
+            raise
+
+    # /\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\
+    # pass0a, pass0b (identifiers)
+    # /\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\
+    hits0a = search_hits(q0, 'q0a')
+    hitobjlist, _ids = collect_pass0a(result_obj, hits0a, linklist)
+
+    # if new links, crawl again
+    if len(set(linklist) - set(links)) > 0:
+        hits0b = search_hits(q0, 'q0b')
+        collect_pass(result_obj, hits0b, "pass0b", hitobjlist, _ids)
+
+    #
+    # /\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\
+    # run pass1 whether pass0 had hits or not
+    # q0 only found identifier matches
+    # now get other potential hits in normal manner
+    # /\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\
+    hits1 = search_hits(q1, 'q1')
+    collect_pass(result_obj, hits1, "pass1", hitobjlist, _ids)
 
     # return index docs to align_idx() for Hit writing
     return result_obj
 
 
+def lookup_idx_batch(qobjs, bounds, runner, area_filter=None):
+    """
+    Batched es_lookup_idx() for a chunk of qobjs.
+
+    q0 and q1 for every place go out together through the runner's _msearch
+    (pass1 runs whether or not pass0 had hits, so it does not wait on it);
+    places whose pass0a hits contributed new links get a second round for
+    pass0b. Returns {place_id: result_obj}, or the exception for a place
+    whose searches failed, so the caller can count it as a failure.
+    """
+    plans = []
+    bodies = []
+    for qobj in qobjs:
+        q0, q1, links, linklist = idx_queries(qobj, bounds, area_filter=area_filter)
+        plans.append((qobj, q0, links, linklist))
+        bodies.extend([q0, q1])
+    responses = runner.search(bodies)
+
+    results = {}
+    crawl_again = []
+    for i, (qobj, q0, links, linklist) in enumerate(plans):
+        result_obj = new_idx_result(qobj)
+        try:
+            hits0a = response_hits(responses[2 * i])
+            hits1 = response_hits(responses[2 * i + 1])
+        except Exception as e:
+            logger.error(f'Error in msearch for place {qobj["place_id"]}: {e}')
+            results[qobj['place_id']] = e
+            continue
+        hitobjlist, _ids = collect_pass0a(result_obj, hits0a, linklist)
+        if len(set(linklist) - set(links)) > 0:
+            # q0 now carries the extended linklist
+            crawl_again.append((result_obj, q0, hits1, hitobjlist, _ids))
+        else:
+            collect_pass(result_obj, hits1, "pass1", hitobjlist, _ids)
+        results[qobj['place_id']] = result_obj
+
+    if crawl_again:
+        responses0b = runner.search([c[1] for c in crawl_again])
+        for (result_obj, q0, hits1, hitobjlist, _ids), res in zip(crawl_again, responses0b):
+            try:
+                collect_pass(result_obj, response_hits(res), "pass0b", hitobjlist, _ids)
+            except Exception as e:
+                logger.error(f'Error in msearch (q0b) for place {result_obj["place_id"]}: {e}')
+                results[result_obj['place_id']] = e
+                continue
+            collect_pass(result_obj, hits1, "pass1", hitobjlist, _ids)
+    return results
+
+
 @sleep_and_retry
 @limits(calls=CALLS_PER_SECOND, period=1)
 def throttled_lookup(es, qobj, bounds):
     return es_lookup_idx(qobj, bounds=bounds)
 
 
-@shared_task(name="align_idx")
+@shared_task(name="align_idx", acks_late=True, reject_on_worker_lost=True)
 def align_idx(*args, **kwargs):
     """
     Aligns and consolidates new place records with existing indexed place records in WHG index.
@@ -1128,10 +1322,19 @@ def align_idx(*args, **kwargs):
             - 'test' (str): Test mode ('on' or 'off'), controls whether indexing writes to the production index.
             - 'bounds' (dict): Geographic bounds for limiting the search.
             - 'scope' (str): Defines the scope of the search (e.g., 'all', 'unindexed').
+            - 'batched' (bool, optional): Use the batched _msearch engine; defaults to settings.RECON_BATCHED.
+            - 'partitions' (int, optional): If > 1, split the places into that many id ranges run as parallel subtasks.
+            - 'id_range' (list, optional): Inclusive place id range of a partition (set by dispatch_partitions).
+            - 'parent_task_id' (str, optional): Task that dispatched this partition; hits are written under its id.
+
+    Progress is checkpointed per chunk (ReconCheckpoint), so a task redelivered after its
+    worker died skips the places it already processed.
 
     Returns:
         dict: A summary of the alignment process, including counts of records processed, hits, and new indexed records.
     """
+    from utils.mapdata import places_changed_in_bulk
+
     logger = logging.getLogger('accession')
     logger.info(f'Starting align_idx task with kwargs: {kwargs}')
 
@@ -1146,50 +1349,99 @@ def align_idx(*args, **kwargs):
         es = settings.ES_CONN
         whg_id = maxID(es, settings.ES_WHG)  # get max whg_id for new parent docs
 
-        # Prepare tracking variables
-        hit_summary, tracking_vars, places_to_review, new_seeds = initialize_tracking()
-
         # Get places to process
         places = get_place_queryset(ds, kwargs.get('scope', 'unindexed'))
-        logger.info(f'places count: {places.count()}')
 
-        # Process each place
-        for index, place in enumerate(places):
-            try:
-                # logger.info(f'Processing place: {place.id} - {place.title}')
+        # split into range partitions on several workers?
+        if kwargs.get('partitions', settings.RECON_PARTITIONS) > 1 and not kwargs.get('id_range'):
+            return dispatch_partitions(align_idx, task_id, places, kwargs, logger)
 
-                # TODO: Comment out the following 2 lines for production (pushes all places directly to index)
-                # new_seeds.append(place.id)
-                # continue
+        # resume from the checkpoint left by an earlier delivery of this task, if any
+        checkpoint = open_checkpoint(task_id, 'align_idx', ds, kwargs, logger)
+        hit_task_id = checkpoint.hit_task_id
+        places = partition_queryset(places, checkpoint)
+        place_count = places.count()
+        logger.info(f'places count: {place_count}')
 
-                qobj = build_qobj(place)
-                result_obj = throttled_lookup(es, qobj, bounds=kwargs['bounds'])
+        # Prepare tracking variables
+        hit_summary, tracking_vars, places_to_review, new_seeds = initialize_tracking(checkpoint.state)
 
-                if not result_obj['hits']:
-                    new_seeds.append(place.id)
-                else:
-                    logger.info(f'Processing {len(result_obj["hits"])} hits found for place {place.id}')
-                    places_to_review.append(place.id)
-                    process_hits(place, result_obj, task_id, ds, tracking_vars, hit_summary, logger)
+        def state():
+            return {'tracking_vars': tracking_vars, 'new_seeds': new_seeds, 'places_to_review': places_to_review}
 
-            except Exception as e:
-                logger.error(f"Error processing place {place.id}: {e}", exc_info=True)
-                tracking_vars['count_fail'] += 1
+        remaining = remaining_places(places, checkpoint)
+        if kwargs.get('batched', settings.RECON_BATCHED):
+            # prefetched chunks of places, looked up through _msearch
+            run_idx_batched(remaining, kwargs['bounds'], hit_task_id, ds, tracking_vars, hit_summary,
+                            places_to_review, new_seeds, logger, checkpoint=checkpoint, state=state)
+        else:
+            hit_buffer, last_place_id = [], None
+
+            def save_chunk():
+                # a chunk's hits and the checkpoint counting them are saved together, so a
+                # resumed task neither skips its places nor loses them from the summary
+                with transaction.atomic():
+                    Hit.objects.bulk_create(hit_buffer)
+                    save_checkpoint(checkpoint, last_place_id, state())
+                hit_buffer.clear()
+
+            # Process each place
+            for index, place in enumerate(remaining):
+                try:
+                    # logger.info(f'Processing place: {place.id} - {place.title}')
+
+                    # TODO: Comment out the following 2 lines for production (pushes all places directly to index)
+                    # new_seeds.append(place.id)
+                    # continue
+
+                    qobj = build_qobj(place)
+                    result_obj = throttled_lookup(es, qobj, bounds=kwargs['bounds'])
+
+                    if not result_obj['hits']:
+                        new_seeds.append(place.id)
+                    else:
+                        logger.info(f'Processing {len(result_obj["hits"])} hits found for place {place.id}')
+                        counted, place_hits = dict(tracking_vars), []
+                        try:
+                            process_hits(place, result_obj, hit_task_id, ds, tracking_vars, hit_summary, logger,
+                                         hit_buffer=place_hits)
+                        except Exception:
+                            # none of a failed place's hits are counted or saved
+                            tracking_vars.update(counted)
+                            raise
+                        hit_buffer.extend(place_hits)
+                        places_to_review.append(place.id)
 
-            # if index == 600: # break after 600 places to avoid long-running tasks TODO: comment out for production
-            #     logger.info('Reached 600 places, breaking the loop for testing purposes.')
-            #     break
+                except Exception as e:
+                    logger.error(f"Error processing place {place.id}: {e}", exc_info=True)
+                    tracking_vars['count_fail'] += 1
 
-        if new_seeds:
-            batch_new_seeds.delay(new_seeds, test_mode, start_id=whg_id)
+                last_place_id = place.id
+                if (index + 1) % settings.RECON_CHUNK_SIZE == 0:
+                    save_chunk()
+
+                # if index == 600: # break after 600 places to avoid long-running tasks TODO: comment out for production
+                #     logger.info('Reached 600 places, breaking the loop for testing purposes.')
+                #     break
+            if last_place_id is not None and last_place_id != checkpoint.last_place_id:
+                save_chunk()
 
         if places_to_review:
             updated = Place.objects.filter(pk__in=places_to_review).update(review_whg=0)
+            places_changed_in_bulk(places_to_review)
             logger.info(f"Marked {updated} places for review.")
 
-        hit_summary = finalise_summary(hit_summary, places.count(), tracking_vars, new_seeds, start)
+        save_checkpoint(checkpoint, checkpoint.last_place_id, state(), complete=True)
+        hit_summary = finalise_summary(hit_summary, place_count, tracking_vars, new_seeds, start)
         logger.info(f'hit_summary: {hit_summary}')
 
+        if checkpoint.parent_task_id:
+            # a partition: seeds, status and email are handled once, by merge_partitions()
+            return {'summary': hit_summary['summary']}
+
+        if new_seeds:
+            batch_new_seeds.delay(new_seeds, test_mode, start_id=whg_id)
+
         # Finalise: Update dataset status, send email, and log results
         try:
             finalise_task(ds, user, test_mode, hit_summary, logger)
@@ -1203,9 +1455,14 @@ def align_idx(*args, **kwargs):
         raise e
 
 
-def initialize_tracking():
-    """Initializes the tracking variables for hits, errors, and seeds."""
+def initialize_tracking(state=None):
+    """
+    Initializes the tracking variables for hits, errors, and seeds,
+    restoring them from a checkpoint state if one is given.
+    """
     hit_summary = {"summary": {}, "hits": []}
+    if state:
+        return hit_summary, state['tracking_vars'], state['places_to_review'], state['new_seeds']
     tracking_vars = {
         'count_hit': 0,
         'count_nohit': 0,
@@ -1221,6 +1478,131 @@ def initialize_tracking():
     return hit_summary, tracking_vars, places_to_review, new_seeds
 
 
+def open_checkpoint(task_id, task_name, dataset, kwargs, logger):
+    """
+    Gets or creates the ReconCheckpoint for a task. A task redelivered after its
+    worker died (align tasks are acks_late) finds the checkpoint it left behind.
+    """
+    id_range = kwargs.get('id_range')
+    checkpoint, created = ReconCheckpoint.objects.get_or_create(
+        task_id=task_id,
+        defaults={
+            'task_name': task_name,
+            'dataset': dataset,
+            'parent_task_id': kwargs.get('parent_task_id'),
+            'id_min': id_range[0] if id_range else None,
+            'id_max': id_range[1] if id_range else None,
+        })
+    if not created:
+        logger.info(f'Resuming {task_name} task {task_id} after place {checkpoint.last_place_id}')
+    # hits are bulk-created from here on; counts are rebuilt by post_recon_update()
+    DatasetStats.mark_stale(['hits', 'places'], dataset=dataset)
+    return checkpoint
+
+
+def save_checkpoint(checkpoint, last_place_id, state, complete=False):
+    checkpoint.last_place_id = last_place_id
+    checkpoint.state = state
+    checkpoint.complete = complete
+    checkpoint.save(update_fields=['last_place_id', 'state', 'complete', 'updated'])
+
+
+def partition_queryset(places, checkpoint):
+    """Restricts places to the checkpoint's id range, if it is a partition."""
+    if checkpoint.id_min is not None:
+        places = places.filter(id__gte=checkpoint.id_min, id__lte=checkpoint.id_max)
+    return places
+
+
+def remaining_places(places, checkpoint):
+    """
+    Places not yet processed: past the checkpoint, and without hits already
+    written under this task_id (i.e. processed after the last checkpoint save).
+    """
+    return places.filter(id__gt=checkpoint.last_place_id) \
+        .exclude(hit__task_id=checkpoint.hit_task_id).order_by('id')
+
+
+def dispatch_partitions(task, task_id, places, kwargs, logger):
+    """
+    Splits places into kwargs['partitions'] contiguous id ranges of about equal size
+    and runs `task` on each as a chord, with merge_partitions() as the callback.
+    Partitions get no positional args, so they don't show up in Dataset.tasks;
+    their hits are written under this task's id.
+    """
+    place_ids = list(places.order_by('id').values_list('id', flat=True))
+    n = max(1, min(kwargs['partitions'], len(place_ids)))
+    size = -(-len(place_ids) // n) if place_ids else 0
+    ranges = [[part[0], part[-1]] for part in chunked(place_ids, size)] if size else []
+
+    subtasks = [
+        task.s(**dict(kwargs, id_range=id_range, parent_task_id=task_id, partitions=1))
+        for id_range in ranges
+    ]
+    chord(subtasks)(merge_partitions.s(task.name, task_id, kwargs, datetime.datetime.now().isoformat()))
+    logger.info(f'{task.name} {task_id}: dispatched {len(subtasks)} partitions {ranges}')
+    summary = {'count': len(place_ids), 'got_hits': 0, 'total_hits': 0,
+               'partitions': len(subtasks), 'status': 'partitioned'}
+    return {'summary': summary} if task.name == 'align_idx' else summary
+
+
+@task_prerun.connect
+def align_task_started(sender=None, task_id=None, **kwargs):
+    if sender is not None and sender.name.startswith('align'):
+        DatasetTask.objects.filter(task_id=task_id).update(status='STARTED')
+
+
+@task_postrun.connect
+def align_task_finished(sender=None, task_id=None, state=None, **kwargs):
+    # DatasetTask rows exist only for dispatched tasks (see ds_recon), not their partitions
+    if sender is not None and sender.name.startswith('align') and state:
+        DatasetTask.objects.filter(task_id=task_id).update(status=state, date_done=timezone.now())
+
+
+@shared_task(name="merge_partitions")
+def merge_partitions(results, task_name, task_id, kwargs, started):
+    """
+    Chord callback for dispatch_partitions(): sums the partition summaries,
+    runs the once-per-task finalisation (seed indexing, dataset status, email)
+    and writes the merged summary onto the dispatching task's result.
+    """
+    logger = logging.getLogger('accession' if task_name == 'align_idx' else 'reconciliation')
+    ds = get_object_or_404(Dataset, id=kwargs['ds'])
+    user = get_object_or_404(User, id=kwargs['user'])
+
+    summaries = [r['summary'] if 'summary' in r else r for r in results]
+    merged = {}
+    for summary in summaries:
+        for key, value in summary.items():
+            if isinstance(value, (int, float)):
+                merged[key] = merged.get(key, 0) + value
+    merged['no_hits'] = {'count': sum(s.get('no_hits', {}).get('count', 0) for s in summaries)}
+    elapsed_td = datetime.datetime.now() - datetime.datetime.fromisoformat(started)
+    merged['partitions'] = len(summaries)
+
+    if task_name == 'align_idx':
+        del merged['no_hits']
+        merged['elapsed_min'] = elapsed(elapsed_td)
+        test_mode = kwargs.get('test', 'on')
+        new_seeds = list(chain.from_iterable(
+            cp.state.get('new_seeds', []) for cp in
+            ReconCheckpoint.objects.filter(parent_task_id=task_id).order_by('id_min')))
+        if new_seeds:
+            batch_new_seeds.delay(new_seeds, test_mode, start_id=maxID(es, settings.ES_WHG))
+        result = {'summary': merged, 'hits': []}
+        finalise_task(ds, user, test_mode, result, logger)
+    else:
+        merged['elapsed'] = elapsed(elapsed_td)
+        seconds = elapsed_td.total_seconds()
+        merged['places_per_sec'] = round(merged.get('count', 0) / seconds, 2) if seconds else 0
+        result = merged
+        finalise_wdlocal(ds, user, merged)
+
+    TaskResult.objects.filter(task_id=task_id).update(result=json.dumps(result))
+    logger.info(f'{task_name} {task_id}: merged {len(summaries)} partitions: {merged}')
+    return result
+
+
 def get_place_queryset(dataset, scope):
     """Fetches the queryset of places to be processed based on the scope."""
     if scope == 'all':
@@ -1228,6 +1610,57 @@ def get_place_queryset(dataset, scope):
     return dataset.places.filter(indexed=False)
 
 
+def run_idx_batched(places, bounds, task_id, dataset, tracking_vars, hit_summary,
+                    places_to_review, new_seeds, logger, checkpoint=None, state=None):
+    """
+    Batched variant of the align_idx() place loop.
+
+    For each chunk of RECON_CHUNK_SIZE places: prefetches everything build_qobj()
+    needs, runs all lookups through a MsearchRunner (bounded worker pool with
+    adaptive back-pressure instead of the fixed CALLS_PER_SECOND limit), and
+    writes the chunk's Hits with one bulk_create. Seeds, review flags and
+    tracking counters come out the same as in the per-place loop. If a checkpoint
+    is given, it is saved with each chunk's Hits in one transaction.
+    """
+    runner = MsearchRunner(es=settings.ES_CONN, index=settings.ES_WHG)
+    # resolved once rather than per place
+    area_filter = get_bounds_filter(bounds, "whg") if bounds["id"] != ["0"] else None
+
+    place_ids = list(places.order_by('id').values_list('id', flat=True))
+    for chunk in chunked(place_ids, settings.RECON_CHUNK_SIZE):
+        chunk_places, qobjs = [], []
+        for place in prefetch_qobj_places(chunk):
+            try:
+                qobjs.append(build_qobj(place))
+                chunk_places.append(place)
+            except Exception as e:
+                logger.error(f"Error building query for place {place.id}: {e}", exc_info=True)
+                tracking_vars['count_fail'] += 1
+
+        results = lookup_idx_batch(qobjs, bounds, runner, area_filter=area_filter)
+
+        hit_buffer = []
+        for place in chunk_places:
+            result_obj = results[place.id]
+            try:
+                if isinstance(result_obj, Exception):
+                    raise result_obj
+                if not result_obj['hits']:
+                    new_seeds.append(place.id)
+                else:
+                    places_to_review.append(place.id)
+                    process_hits(place, result_obj, task_id, dataset, tracking_vars, hit_summary, logger,
+                                 hit_buffer=hit_buffer)
+            except Exception as e:
+                logger.error(f"Error processing place {place.id}: {e}", exc_info=True)
+                tracking_vars['count_fail'] += 1
+        with transaction.atomic():
+            Hit.objects.bulk_create(hit_buffer)
+            if checkpoint:
+                save_checkpoint(checkpoint, chunk[-1], state())
+        logger.info(f'Processed chunk of {len(chunk)} places; msearch stats: {runner.stats}')
+
+
 def wait_until_es_ready(timeout=60, sleep_interval=2):
     logger = logging.getLogger('accession')
     start = time.time()
@@ -1249,6 +1682,8 @@ def wait_until_es_ready(timeout=60, sleep_interval=2):
 
 @shared_task
 def batch_new_seeds(new_seeds, test_mode, start_id):
+    from utils.mapdata import places_changed_in_bulk
+
     logger = logging.getLogger('accession')
 
     if not wait_until_es_ready():
@@ -1315,6 +1750,8 @@ def batch_new_seeds(new_seeds, test_mode, start_id):
                                 )
 
                         Place.objects.filter(pk__in=[p.id for p in places_to_update]).update(indexed=True, idx_pub=False)
+                        DatasetStats.mark_stale(['places'], dataset__label__in={p.dataset_id for p in places_to_update})
+                        places_changed_in_bulk([p.id for p in places_to_update])
 
                     logger.info(f"Batch bulk indexing complete: {success_count} succeeded, {failure_count} failed.")
 
@@ -1330,8 +1767,11 @@ def batch_new_seeds(new_seeds, test_mode, start_id):
             logger.error(f"Error preparing place {new_seed} for bulk indexing: {e}", exc_info=True)
 
 
-def process_hits(place, result_obj, task_id, dataset, tracking_vars, hit_summary, logger):
-    """Handles the case where hits are found, and prepares them for review."""
+def process_hits(place, result_obj, task_id, dataset, tracking_vars, hit_summary, logger, hit_buffer=None):
+    """
+    Handles the case where hits are found, and prepares them for review.
+    If hit_buffer is given, unsaved Hit instances are appended to it for bulk creation.
+    """
     try:
         tracking_vars['count_hit'] += 1
 
@@ -1344,7 +1784,10 @@ def process_hits(place, result_obj, task_id, dataset, tracking_vars, hit_summary
         for parent in parents:
             merged_hit = merge_parent_child(parent, children)
             hit_summary['hits'].append(merged_hit)
-            save_hit_record(merged_hit, place, dataset, task_id, logger)
+            if hit_buffer is not None:
+                hit_buffer.append(build_hit_record(merged_hit, place, dataset, task_id))
+            else:
+                save_hit_record(merged_hit, place, dataset, task_id, logger)
             # logger.info(f"Saved hit record: {merged_hit}")
     except Exception as e:
         logger.error(f"Error processing hits for place {place.id}: {e}", exc_info=True)
@@ -1418,23 +1861,28 @@ def build_sources(parent, children):
     return sources
 
 
+def build_hit_record(hit_obj, place, dataset, task_id):
+    """Builds an unsaved whg Hit from a merged hit object."""
+    return Hit(
+        task_id=task_id,
+        authority='whg',
+        dataset=dataset,
+        place=place,
+        src_id=place.src_id,
+        authrecord_id=hit_obj['whg_id'],
+        query_pass=', '.join(hit_obj['passes']),
+        score=hit_obj['score'],
+        geom=hit_obj['geoms'],
+        reviewed=False,
+        matched=False,
+        json=hit_obj
+    )
+
+
 def save_hit_record(hit_obj, place, dataset, task_id, logger):
     """Saves a hit record to the database."""
     try:
-        new_hit = Hit(
-            task_id=task_id,
-            authority='whg',
-            dataset=dataset,
-            place=place,
-            src_id=place.src_id,
-            authrecord_id=hit_obj['whg_id'],
-            query_pass=', '.join(hit_obj['passes']),
-            score=hit_obj['score'],
-            geom=hit_obj['geoms'],
-            reviewed=False,
-            matched=False,
-            json=hit_obj
-        )
+        new_hit = build_hit_record(hit_obj, place, dataset, task_id)
         new_hit.save()
     except Exception as e:
         logger.error(f"Error saving hit record for place {place.id}: {e}", exc_info=True)
@@ -9,6 +9,7 @@ import simplejson as json
 from django.conf import settings
 from django.contrib.gis.db.models import Extent
 from django.contrib.gis.geos import GEOSGeometry, Polygon
+from django.db import connection
 from django.http import FileResponse, JsonResponse, HttpResponse, Http404
 from django.shortcuts import get_object_or_404  # , redirect
 from django.views.generic import View
@@ -16,7 +17,7 @@ from shapely.geometry import mapping
 from shapely.wkt import loads as wkt_loads
 
 from areas.models import Country
-from datasets.models import Dataset, Hit, DatasetFile
+from datasets.models import Dataset, Hit, DatasetFile, DatasetStats
 from datasets.static.hashes import aat_q
 from datasets.static.hashes import aliases as al
 # from datasets.tasks import make_download
@@ -496,6 +497,34 @@ def ccodesFromGeom(geom):
         return ccodes
 
 
+
+# set-based ccodesFromGeom() for places with empty ccodes, after a bulk load;
+# limited to a dataset label and/or a list of place ids
+def ccodesFromGeoms(label=None, place_ids=None):
+    filters, params = ["pl.ccodes = '{}'"], []
+    if label:
+        filters.append("pl.dataset = %s")
+        params.append(label)
+    if place_ids is not None:
+        filters.append("pl.id = ANY(%s)")
+        params.append(list(place_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE places p SET ccodes = c.ccodes
+            FROM (
+                SELECT g.place_id, array_agg(DISTINCT co.iso) AS ccodes
+                FROM place_geom g
+                JOIN places pl ON pl.id = g.place_id
+                JOIN countries co ON ST_Intersects(co.mpoly,
+                    CASE WHEN GeometryType(g.geom) = 'GEOMETRYCOLLECTION'
+                         THEN ST_ConvexHull(g.geom) ELSE g.geom END)
+                WHERE {' AND '.join(filters)}
+                GROUP BY g.place_id
+            ) c
+            WHERE p.id = c.place_id
+        """, params)
+        return cursor.rowcount
+
 # use: tasks
 def elapsed(delta):
     minutes, seconds = divmod(delta.seconds, 60)
@@ -594,6 +623,8 @@ def classy(gaz, typeArray):
 
 # log recon action & update status
 def post_recon_update(ds, user, task, test):
+    # hits were bulk-created and places bulk-updated, without signals
+    DatasetStats.rebuild(ds)
     if test == "off":
         if task == 'idx':
             ds.ds_status = 'indexed' if ds.unindexed == 0 else 'accessioning'
@@ -6,7 +6,7 @@ import os
 import shutil
 import sys
 import tempfile
-from collections import Counter
+import uuid
 from pathlib import Path
 from shutil import copyfile
 
@@ -57,7 +57,8 @@ from .forms import (
     DatasetUploadForm,
     DatasetCreateEmptyModelForm
 )
-from .models import DatasetUser
+from .accession import withdraw_index_decisions
+from .models import DatasetStats, DatasetTask, DatasetUser
 from .services import _get_task_details, _get_hit_counts, _filter_unreviewed_places, _get_review_page_and_field, \
     _get_place_and_hits, _build_dataset_details, _extract_passes, _get_country_names, _build_feature_collection, \
     _process_matching_decisions
@@ -486,9 +487,11 @@ def ds_recon(request, pk):
 
         # initiate celery/redis task
         # needs positional and declared ds.id; don't know why
+        # linked to the dataset before dispatch, so the task's state updates find the link
+        task_id = str(uuid.uuid4())
+        DatasetTask.objects.create(dataset=ds, task_id=task_id, task_name=func.name)
         try:
-            result = func.delay(
-                ds.id,
+            result = func.apply_async(args=(ds.id,), kwargs=dict(
                 ds=ds.id,
                 dslabel=ds.label,
                 owner=ds.owner.id,
@@ -501,11 +504,12 @@ def ds_recon(request, pk):
                 geonames=geonames,  # on/off
                 lang=language,
                 test=test,  # for idx only
-            )
+            ), task_id=task_id)
             messages.add_message(request, messages.INFO,
                                  "<span class='text-danger'>Your reconciliation task is under way.</span><br/>When complete, you will receive an email and if successful, results will appear below (you may have to refresh screen). <br/>In the meantime, you can navigate elsewhere.")
             return redirect('/datasets/' + str(ds.id) + '/reconcile')
         except:
+            DatasetTask.objects.filter(task_id=task_id).delete()
             logger.exception(f"Failed to start task align_{auth} for dataset {ds.id}", exc_info=True)
             messages.add_message(request, messages.INFO,
                                  "Sorry! Reconciliation services appear to be down. The system administrator has been notified.<br/>" + str(
@@ -527,6 +531,8 @@ def task_delete(request, tid, scope="foo"):
       hits + any geoms and links added by review
       reset Place.review_{auth} to null
     """
+    from utils.mapdata import places_changed_in_bulk
+
     try:
         tr = TaskResult.objects.get(task_id=tid)
     except TaskResult.DoesNotExist:
@@ -561,15 +567,21 @@ def task_delete(request, tid, scope="foo"):
 
     # Handle deletion based on scope
     if scope == 'task':
+        # places whose links and names are deleted in bulk, without signals
+        changed_ids = {p.id for p in places} | set(placelinks.values_list('place_id', flat=True)) \
+            | set(placenames.values_list('place_id', flat=True))
         tr.delete()
+        DatasetTask.objects.filter(task_id=tid).delete()
         hits.delete()
         placelinks.delete()
         placegeoms.delete()
         placenames.delete()
+        places_changed_in_bulk(changed_ids)
     elif scope == 'geoms':
         placegeoms.delete()
     else:
         logger.debug(f"Unsupported scope: {scope}")
+    DatasetStats.mark_stale(DatasetStats.SECTIONS, dataset=ds)
 
     # Remove dataset from index if not in test mode
     if auth in ['whg', 'idx'] and test == 'off':
@@ -591,6 +603,8 @@ def task_archive(tid, prior):
       reset Place.review_{auth} to null
       set task status to 'ARCHIVED'
     """
+    from utils.mapdata import places_changed_in_bulk
+
     hits = Hit.objects.all().filter(task_id=tid)
     tr = get_object_or_404(TaskResult, task_id=tid)
     dsid = tr.task_args[1:-1]
@@ -608,18 +622,26 @@ def task_archive(tid, prior):
             p.review_tgn = None
         p.save()
 
-    # zap hits
+    # zap hits (deleted in bulk, without signals: stats are marked stale below)
+    dataset_ids = set(hits.order_by().values_list('dataset_id', flat=True).distinct())
     hits.delete()
     if prior == 'na':
         tr.delete()
+        DatasetTask.objects.filter(task_id=tid).delete()
     else:
         # flag task as ARCHIVED
         tr.status = 'ARCHIVED'
         tr.save()
+        DatasetTask.objects.filter(task_id=tid).update(status='ARCHIVED')
         # zap prior links/geoms if requested
         if prior == 'zap':
-            PlaceLink.objects.all().filter(task_id=tid).delete()
+            placelinks = PlaceLink.objects.all().filter(task_id=tid)
+            # places whose links are deleted in bulk, without signals
+            changed_ids = set(placelinks.values_list('place_id', flat=True))
+            placelinks.delete()
             PlaceGeom.objects.all().filter(task_id=tid).delete()
+            places_changed_in_bulk(changed_ids)
+    DatasetStats.mark_stale(DatasetStats.SECTIONS, dataset_id__in=dataset_ids)
 
 
 def collab_add(request, dsid, v):
@@ -901,6 +923,8 @@ def ds_update(request):
       perform updates to database and index, given ds_compare() results
       params: dsid, format, keepg, keepl, compare_data (json string)
     """
+    from utils.mapdata import places_changed_in_bulk
+
     if request.method == 'POST':
         dsid = request.POST['dsid']
         ds = get_object_or_404(Dataset, id=dsid)
@@ -991,6 +1015,8 @@ def ds_update(request):
             # pids for index operations
             rows_add = []
             idx_delete = []
+            # pids whose related records were replaced in bulk, without signals
+            rows_changed = []
 
             place_fields = {'id', 'title', 'ccodes', 'start', 'end', 'attestation_year'}
             alldiffs = []
@@ -1149,6 +1175,7 @@ def ds_update(request):
                             idx_delete.append(p.id)
 
                     p.save()
+                    rows_changed.append(p.id)
                 except:
                     # no corresponding Place, create new one
                     count_new += 1
@@ -1171,6 +1198,8 @@ def ds_update(request):
                 #   print('update failed on ', row)
                 #   print('error', sys.exc_info())
 
+            places_changed_in_bulk(rows_changed + rows_add)
+
             # update numrows
             ds.numrows = ds.places.count()
             ds.save()
@@ -1476,6 +1505,8 @@ def match_undo(request, ds, tid, pid):
     link_matches = PlaceLink.objects.filter(task_id=tid, place_id=pid)
     geom_matches.delete()
     link_matches.delete()
+    # a later review of the place is queued for the index as a new decision
+    withdraw_index_decisions(tid, pid)
 
     # reset place.review_xxx to 0
     tasktype = TaskResult.objects.get(task_id=tid).task_name[6:]
@@ -1493,6 +1524,8 @@ def match_undo(request, ds, tid, pid):
 
     # match task_id, place_id in hits; set reviewed = false
     Hit.objects.filter(task_id=tid, place_id=pid).update(reviewed=False)
+    # links were deleted in bulk, without signals
+    DatasetStats.mark_stale(['hits', 'places'], dataset__label=place.dataset_id)
 
     return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
 
@@ -1513,18 +1546,11 @@ class DatasetStatusView(LoginRequiredMixin, UpdateView):
         context = super().get_context_data(*args, **kwargs)
 
         ds = self.get_object()
-        place_qs = ds.places.all()
-        place_ids = list(place_qs.values_list('id', flat=True))
-        place_count = len(place_ids)
+        stats = DatasetStats.for_dataset(ds)
+        place_count = stats.num_places
 
         def count_review_fields(field_name):
-            return {
-                "rows": place_count,
-                "got_hits": place_qs.exclude(**{f"{field_name}__isnull": True}).count(),
-                "reviewed": place_qs.filter(**{field_name: 1}).count(),
-                "deferred": place_qs.filter(**{field_name: 2}).count(),
-                "remain": place_qs.filter(**{f"{field_name}__in": [0, 2]}).count(),
-            }
+            return dict(stats.review[field_name], rows=place_count)
 
         context['wdgn_status'] = count_review_fields("review_wd")
         context['idx_status'] = count_review_fields("review_whg")
@@ -1539,32 +1565,18 @@ class DatasetStatusView(LoginRequiredMixin, UpdateView):
         context['task_wdgn'] = task_wdgn
         context['task_idx'] = task_idx
 
-        def placecounter(queryset):
-            values = queryset.values_list('query_pass', 'place_id').distinct()
-            seen = set()
-            counter = Counter()
-            for qpass, pid in values:
-                if (qpass, pid) not in seen:
-                    counter[qpass] += 1
-                    seen.add((qpass, pid))
+        def placecounter(task):
+            # distinct places with unreviewed hits, per pass
+            passes = stats.passes(task.task_id)
             return {
-                'p0': counter.get('pass0', 0),
-                'p1': counter.get('pass1', 0),
-                'p2': counter.get('pass2', 0),
-                'p0and1': counter.get('pass0', 0) + counter.get('pass1', 0),
+                'p0': passes.get('pass0', 0),
+                'p1': passes.get('pass1', 0),
+                'p2': passes.get('pass2', 0),
+                'p0and1': passes.get('pass0', 0) + passes.get('pass1', 0),
             }
 
-        if task_wdgn:
-            hits_wdgn = Hit.objects.filter(task_id=task_wdgn.task_id, reviewed=False)
-            context['wdgn_passes'] = placecounter(hits_wdgn)
-        else:
-            context['wdgn_passes'] = {}
-
-        if task_idx:
-            hits_idx = Hit.objects.filter(task_id=task_idx.task_id, reviewed=False)
-            context['idx_passes'] = placecounter(hits_idx)
-        else:
-            context['idx_passes'] = {}
+        context['wdgn_passes'] = placecounter(task_wdgn) if task_wdgn else {}
+        context['idx_passes'] = placecounter(task_idx) if task_idx else {}
 
         user = self.request.user
         user_groups = set(user.groups.values_list('name', flat=True))
@@ -1581,24 +1593,13 @@ class DatasetStatusView(LoginRequiredMixin, UpdateView):
 
         # Aggregated counts across related models
         context['numrows'] = place_count
-
-        def agg_counts(model):
-            return model.objects.filter(place_id__in=place_ids).aggregate(
-                base=Count('id', filter=Q(task_id=None)),
-                added=Count('id', filter=~Q(task_id=None))
-            )
-
-        name_counts = agg_counts(PlaceName)
-        link_counts = agg_counts(PlaceLink)
-        geom_counts = agg_counts(PlaceGeom)
-
         context.update({
-            'num_names': name_counts['base'],
-            'names_added': name_counts['added'],
-            'num_links': link_counts['base'],
-            'links_added': link_counts['added'],
-            'num_geoms': geom_counts['base'],
-            'geoms_added': geom_counts['added'],
+            'num_names': stats.num_names,
+            'names_added': stats.names_added,
+            'num_links': stats.num_links,
+            'links_added': stats.links_added,
+            'num_geoms': stats.num_geoms,
+            'geoms_added': stats.geoms_added,
         })
 
         context['vis_parameters_dict'] = ds.vis_parameters or {
@@ -15,6 +15,7 @@ from places.models import Place
 # from datasets.models import Dataset
 from datasets.static.hashes.parents import ccodes as cchash
 from copy import deepcopy
+from elasticsearch8.helpers import streaming_bulk
 import sys, logging
 
 logger = logging.getLogger(__name__)
@@ -273,6 +274,19 @@ def build_qobj(place):
     return qobj
 
 
+# related rows read by build_qobj()
+QOBJ_PREFETCH = ['links', 'types', 'names', 'related', 'geoms']
+
+
+def prefetch_qobj_places(place_ids):
+    """
+    Places for a chunk of ids with everything build_qobj() touches
+    prefetched, i.e. a fixed number of queries regardless of chunk size
+    """
+    return Place.objects.filter(id__in=place_ids) \
+        .prefetch_related(*QOBJ_PREFETCH).order_by('id')
+
+
 """
 Fetch place ids for a given whg_id
 HOTFIX: 2024-07-17 kg; added 'else:'; sometimes there are no hits
@@ -436,130 +450,262 @@ def profileHit(hit):
 #
 #     print(f"Indexing complete. Total indexed places: {success}. Failed documents: {len(failed)}")
 
+# related rows read by makeDoc()
+DOC_PREFETCH = ['names', 'types', 'geoms', 'links', 'descriptions', 'depictions', 'related']
+
+
+def prefetch_doc_places(place_ids):
+    """
+    Places for a chunk of ids with everything makeDoc() touches
+    prefetched, i.e. a fixed number of queries regardless of chunk size
+    """
+    return Place.objects.filter(id__in=place_ids).select_related('dataset') \
+        .prefetch_related(*DOC_PREFETCH).order_by('id')
+
+
+class IndexMutations:
+    """
+    Bulk promote/demote/replace/remove changes to the parent/child documents of a whg index.
+
+    The documents a chunk of place ids touches are read up front (one _msearch for the places,
+    one for their parents and children), each change is planned against that in-memory state,
+    and all the resulting writes go out through streaming_bulk with each document's routing
+    preserved. Later changes in a chunk see earlier ones, e.g. a child removed after its
+    parent was removed is dropped from the parent promoted in its place.
+    """
+
+    def __init__(self, es, idx, chunk_size=500):
+        self.es = es
+        self.idx = idx
+        self.chunk_size = chunk_size
+        self.written = 0
+        self.errors = []
+        self.reset()
+
+    def reset(self):
+        self.docs = {}  # _id -> {'_source', '_routing'}
+        self.by_place = {}  # place_id -> _id
+        self.writes = {}  # _id -> 'index' | 'delete', in planning order
+
+    # reading state
+
+    def _add(self, hit):
+        self.docs[hit['_id']] = {'_source': hit['_source'], '_routing': hit.get('_routing')}
+        self.by_place[int(hit['_source']['place_id'])] = hit['_id']
+
+    def _msearch(self, queries):
+        searches = []
+        for query, size in queries:
+            searches.extend([{}, {"query": query, "size": size}])
+        if searches:
+            for response in self.es.msearch(index=self.idx, searches=searches)['responses']:
+                if 'error' in response:
+                    raise RuntimeError(f"msearch failed on {self.idx}: {response['error']}")
+                for hit in response['hits']['hits']:
+                    self._add(hit)
+
+    def load(self, pids):
+        """Reads the documents of `pids`, then the parents and children they refer to"""
+        pids = [int(pid) for pid in pids if int(pid) not in self.by_place]
+        self._msearch([({"terms": {"place_id": pids}}, len(pids))] if pids else [])
+
+        parents, kids = set(), set()
+        for pid in pids:
+            doc = self.doc_for_place(pid)
+            if doc is None:
+                continue
+            relation = doc['_source']['relation']
+            if relation.get('name') == 'child' and relation.get('parent'):
+                parents.add(str(relation['parent']))
+            kids.update(int(kid) for kid in doc['_source'].get('children', []))
+        parents -= set(self.docs)
+        kids = [kid for kid in kids if kid not in self.by_place]
+        queries = []
+        if parents:
+            queries.append(({"ids": {"values": list(parents)}}, len(parents)))
+        if kids:
+            queries.append(({"terms": {"place_id": kids}}, len(kids)))
+        self._msearch(queries)
+
+    def doc_for_place(self, pid):
+        _id = self.by_place.get(int(pid))
+        return self.docs[_id] if _id is not None and _id in self.docs else None
+
+    # planning
+
+    def put(self, _id, source, routing=None):
+        _id = str(_id)
+        self.docs[_id] = {'_source': source, '_routing': routing}
+        self.by_place[int(source['place_id'])] = _id
+        self.writes[_id] = 'index'
+
+    def delete(self, _id):
+        _id = str(_id)
+        self.by_place.pop(int(self.docs[_id]['_source']['place_id']), None)
+        self.writes[_id] = 'delete'
+
+    def add_parent(self, place, whg_id):
+        """Indexes `place` as a new parent with _id and whg_id `whg_id`"""
+        doc = makeDoc(place)
+        doc['relation'] = {"name": "parent"}
+        doc['whg_id'] = whg_id
+        # add its own names and title to the searchy field
+        for n in doc['names']:
+            doc['searchy'].append(n['toponym'])
+        if place.title not in doc['searchy']:
+            doc['searchy'].append(place.title)
+        self.put(whg_id, doc)
+
+    def replace(self, place):
+        """Replaces the document of an indexed place with one made from its db record"""
+        current = self.doc_for_place(place.id)
+        if current is None:
+            return False
+        _id = self.by_place[place.id]
+        src = current['_source']
+        doc = makeDoc(place)
+        newnames = [n['toponym'] for n in doc['names']]
+        if src['relation']['name'] == 'child':
+            doc['relation'] = {"name": "child", "parent": src['relation']['parent']}
+            # the parent is searchable by the replacement's names too
+            parent = self.docs.get(str(src['relation']['parent']))
+            if parent is not None:
+                psrc = deepcopy(parent['_source'])
+                add_unique(psrc.setdefault('searchy', []), newnames)
+                if 'suggest' in psrc:
+                    add_unique(psrc['suggest'].setdefault('input', []), newnames)
+                self.put(str(src['relation']['parent']), psrc, parent['_routing'])
+        else:
+            doc['relation'] = {"name": "parent"}
+            doc['whg_id'] = src.get('whg_id', _id)
+            doc['children'] = src.get('children', [])
+            # merge old & new names
+            doc['searchy'] = list(set(newnames).union(
+                item for item in src.get('searchy', []) if not isinstance(item, list)))
+            if 'suggest' in src:
+                doc['suggest'] = {'input': doc['searchy']}
+        self.put(_id, doc, current['_routing'])
+        return True
+
+    def remove(self, pid, removing=()):
+        """
+        Removes the document of a place. A parent with children not in `removing` has the child
+        with most links promoted in its place, taking over the other children and its names;
+        a child is dropped from its parent's children.
+        """
+        current = self.doc_for_place(pid)
+        if current is None:
+            logger.debug(f'{pid} not in index, skipping')
+            return False
+        _id = self.by_place[int(pid)]
+        src = current['_source']
+
+        if src['relation']['name'] == 'parent':
+            eligible = [int(kid) for kid in src.get('children', [])
+                        if int(kid) not in removing and self.doc_for_place(kid) is not None]
+            if eligible:
+                self.promote(eligible, src)
+        else:
+            parent = self.docs.get(str(src['relation'].get('parent')))
+            if parent is not None and self.writes.get(str(src['relation']['parent'])) != 'delete':
+                psrc = deepcopy(parent['_source'])
+                psrc['children'] = [kid for kid in psrc.get('children', []) if str(kid) != str(pid)]
+                self.put(str(src['relation']['parent']), psrc, parent['_routing'])
+        self.delete(_id)
+        return True
+
+    def promote(self, eligible, old_parent):
+        """Makes the best-linked of `eligible` children the parent of the others"""
+        winner = max(eligible, key=lambda kid: len(self.doc_for_place(kid)['_source'].get('links') or []))
+        others = [kid for kid in eligible if kid != winner]
+        winner_doc = self.doc_for_place(winner)
+        winner_id = self.by_place[winner]
+
+        wsrc = deepcopy(winner_doc['_source'])
+        wsrc['whg_id'] = winner
+        wsrc['relation'] = {"name": "parent"}
+        wsrc['children'] = [str(kid) for kid in others]
+        add_unique(wsrc.setdefault('searchy', []),
+                   [item for item in old_parent.get('searchy', []) if not isinstance(item, list)])
+        self.put(winner_id, wsrc, winner_doc['_routing'])
+
+        for kid in others:
+            kid_doc = self.doc_for_place(kid)
+            ksrc = dict(kid_doc['_source'], relation={"name": "child", "parent": winner_id})
+            self.put(self.by_place[kid], ksrc, kid_doc['_routing'])
+
+    # writing
+
+    def actions(self):
+        for _id, op in self.writes.items():
+            doc = self.docs[_id]
+            action = {'_op_type': op, '_index': self.idx, '_id': _id}
+            if doc['_routing'] is not None:
+                action['routing'] = doc['_routing']
+            if op == 'index':
+                action['_source'] = doc['_source']
+            yield action
+
+    def flush(self):
+        """Writes the planned changes, waiting until they are searchable, and clears the state"""
+        for ok, item in streaming_bulk(self.es, self.actions(), chunk_size=self.chunk_size,
+                                       raise_on_error=False, raise_on_exception=False, refresh='wait_for'):
+            info = next(iter(item.values()))
+            if ok:
+                self.written += 1
+            elif not ('delete' in item and info.get('status') == 404):
+                self.errors.append(info)
+                logger.error(f"bulk {next(iter(item))} of {info.get('_id')} failed: {info.get('error')}")
+        self.reset()
+
+
+def add_unique(values, additions):
+    values.extend(v for v in dict.fromkeys(additions) if v not in values)
+
+
 # ***
 # index docs given place_id list
 # ***
 #
 def indexSomeParents(es, idx, pids):
     from datasets.tasks import maxID
-    from django.shortcuts import get_object_or_404
-    from places.models import Place
-    import sys, json
+    from utils.mapdata import places_changed_in_bulk
+    mutations = IndexMutations(es, idx)
     whg_id = maxID(es, idx)
-    for pid in pids:
-        place = get_object_or_404(Place, id=pid)
-        whg_id = whg_id + 1
-        # parent_obj = makeDoc(place,'none')
-        parent_obj = makeDoc(place)
-        parent_obj['relation'] = {"name": "parent"}
-        # parents get an incremented _id & whg_id
-        parent_obj['whg_id'] = whg_id
-        # add its own names to the searchy field
-        # suggest['input] field no longer in use
-        for n in parent_obj['names']:
-            parent_obj['searchy'].append(n['toponym'])
-            # parent_obj['suggest']['input'].append(n['toponym'])
-        # add its title
-        if place.title not in parent_obj['searchy']:
-            parent_obj['searchy'].append(place.title)
-        # print('parent_obj',parent_obj)
-        # index it
-        try:
-            res = es.index(index=idx, id=str(whg_id), body=json.dumps(parent_obj))
-        except:
-            logger.debug(f'failed indexing (as parent) {pid}: {sys.exc_info()}')
-            pass
-        place.indexed = True
-        place.review_whg = True
-        place.save()
-        # print('created parent:',idx, pid, place.title)
+    for batch in chunked(list(pids), mutations.chunk_size):
+        places = prefetch_doc_places(batch)
+        for place in places:
+            whg_id = whg_id + 1
+            mutations.add_parent(place, whg_id)
+        mutations.flush()
+        Place.objects.filter(id__in=[place.id for place in places]).update(indexed=True, review_whg=True)
+    mark_places_stale(pids)
+    places_changed_in_bulk(pids)
+    if mutations.errors:
+        logger.debug(f'failed indexing (as parent) {len(mutations.errors)} of {len(pids)} places')
+    return mutations.written
 
 
 # ***
-
 # replace docs in index given place_id list
 # ***
 def replaceInIndex(es, idx, pids):
-    from django.shortcuts import get_object_or_404
-    from places.models import Place
-    import simplejson as json
-    # from  . import makeDoc, esq_pid, esq_id, uriMaker
-    # set counter
+    mutations = IndexMutations(es, idx)
     repl_count = 0
-    for pid in pids:
-        # pid=6294527 (child of 13504937); also 6294533
-        # a parent: 6294563
-        res = es.search(index=idx, body=esq_pid(pid))
-        # make sure it's in the index; in test, might not be
-        if len(res['hits']['hits']) > 0:
-            hits = res['hits']['hits']
-            # get its key info
-            # TODO: what if more than one?
-            doc = hits[0]
-            src = doc['_source']
-            role = src['relation']['name']  # ; print(role)
-
-            # get the db instance
-            place = get_object_or_404(Place, pk=pid)
-
-            # index doc child or parent?
-            if role == 'child':
-                # get parent _id
-                parentid = src['relation']['parent']
-                # write a new doc from db place
-                # newchild = makeDoc(place, 'none')
-                newchild = makeDoc(place)
-                newchild['relation'] = {"name": "child", "parent": parentid}
-                # get names from replacement db record
-                newnames = [x.toponym for x in place.names.all()]
-                # update parent sugs and searchy
-                q_update = {"script": {
-                    "source": "ctx._source.suggest.input.addAll(params.sugs); \
-                      ctx._source.searchy.addAll(params.sugs);",
-                    "lang": "painless",
-                    "params": {"sugs": newnames}
-                },
-                    "query": {"match": {"place_id": parentid}}
-                }
-                try:
-                    es.update_by_query(index=idx, body=q_update)
-                except Exception as e:
-                    logger.critical('An unrecoverable error occurred', exc_info=True)
-                    sys.exit(1)
-
-                    # delete the old
-                es.delete_by_query(index=idx, body={"query": {"match": {"_id": doc['_id']}}})
-                # index the new
-                es.index(index=idx, id=doc['_id'],
-                         routing=1, body=json.dumps(newchild))
+    for batch in chunked(list(pids), mutations.chunk_size):
+        mutations.load(batch)
+        for place in prefetch_doc_places(batch):
+            # make sure it's in the index; in test, might not be
+            if mutations.replace(place):
                 repl_count += 1
-            elif role == 'parent':
-                # get id, children, sugs from existing index doc
-                kids_e = src['children']
-                sugs_e = list(set(src['suggest']['input']))  # distinct only
-
-                # new doc from db place; fill from existing
-                # newparent = makeDoc(place, None)
-                newparent = makeDoc(place)
-                newparent['children'] = kids_e
-
-                # merge old & new names in new doc
-                previous = set([q['toponym'] for q in newparent['names']])
-                names_union = list(previous.union(set(sugs_e)))
-                newparent['whg_id'] = doc['_id']
-                newparent['suggest']['input'] = names_union
-                newparent['searchy'] = names_union
-                newparent['relation'] = {"name": "parent"}
-
-                # out with the old
-                es.delete_by_query(index=idx, body=esq_id(doc['_id']))
-                # in with the new
-                es.index(index=idx, id=doc['_id'],
-                         routing=1, body=json.dumps(newparent))
+        mutations.flush()
+    return repl_count
 
-                repl_count += 1
-        else:
-            pass
+
+def mark_places_stale(pids, sections=('places',)):
+    from datasets.models import DatasetStats
+    labels = set(Place.objects.filter(id__in=pids).values_list('dataset_id', flat=True))
+    DatasetStats.mark_stale(sections, dataset__label__in=labels)
 
 
 # wrapper for removePlacesFromIndex()
@@ -588,8 +734,9 @@ def removeDatasetFromIndex(request=None, *args, **kwargs):
     removePlacesFromIndex(es, idx, all_pids)
 
     Dataset.objects.filter(id=ds.id).update(ds_status='wd-complete')
-    from datasets.models import Hit
+    from datasets.models import DatasetStats, Hit
     Hit.objects.filter(authority="whg", dataset_id=ds.id).delete()
+    DatasetStats.mark_stale(DatasetStats.SECTIONS, dataset=ds)
 
     # delete latest idx task
     tasks = ds.tasks.filter(task_name='align_idx', status="SUCCESS").order_by('-date_done')
@@ -612,22 +759,20 @@ def removePlacesFromIndex(es, idx, pids):
     Remove place documents from an Elasticsearch index based on a list of place IDs,
     handling parent-child relationships and updating index and database records accordingly.
 
-    This function processes each place ID (`pid`) provided:
+    Place IDs are processed in chunks, each planned by IndexMutations and written with one
+    streaming bulk request:
     - If the place is a **parent**:
-      - Checks if it has children.
-      - If children exist, promotes one eligible child to become the new parent.
-      - Transfers parent status, including updating `whg_id`, `children` list, and `searchy` fields.
-      - Marks the original parent for deletion.
-      - If no eligible children remain, marks the parent directly for deletion.
+      - If it has children not themselves being removed, the one with most links is
+        promoted to parent: it gets `whg_id`, the other children and the `searchy` names,
+        and the other children are re-pointed to it.
+      - The original parent is deleted.
     - If the place is a **child**:
-      - Attempts to remove the child reference from its parent's `children` array.
-      - Marks the child for deletion.
-      - Skips if the parent is also slated for deletion (a "zombie").
+      - It is removed from its parent's `children` array (unless the parent is also
+        being removed) and deleted.
 
-    After processing roles:
+    After each chunk:
     - Updates the corresponding Place database records by setting `indexed` to False,
       removing related `whg` authority hits, and resetting `review_whg` to None.
-    - Deletes all documents marked for removal from Elasticsearch in batches.
 
     Args:
         es (Elasticsearch): Elasticsearch client instance.
@@ -639,127 +784,34 @@ def removePlacesFromIndex(es, idx, pids):
                       were deleted and their IDs.
 
     Notes:
-        - To optimise performance, this function batches Elasticsearch queries and deletions.
-        - Painless scripting is used to safely update Elasticsearch documents atomically.
         - Places not found in the Elasticsearch index are skipped with a debug log.
-        - The function assumes that the `Place` Django model and related hit set exist.
+        - Documents that fail to write are logged; the rest of the chunk is still written.
         - TODO: Improve logic for selecting which child to promote when a parent is removed.
-
-    Raises:
-        Exception: On unrecoverable Elasticsearch update errors, the exception is raised to
-                   allow higher-level error handling.
     """
+    from datasets.models import Hit
+    from utils.mapdata import places_changed_in_bulk
 
+    pids = [int(pid) for pid in pids]
+    removing = set(pids)
+    mutations = IndexMutations(es, idx)
     delthese = []
 
-    # Fetch all documents matching pids in batches to avoid per-pid queries
-    all_docs = []
-    for batch in chunked(pids, 500):
-        q_batch = {"terms": {"place_id": batch}}
-        res = es.search(index=idx, query=q_batch, size=len(batch))
-        all_docs.extend(res['hits']['hits'])
-
-    # Map pid to doc source for quick lookup
-    pid_to_doc = {doc['_source']['place_id']: doc['_source'] for doc in all_docs}
-
-    for pid in pids:
-        src = pid_to_doc.get(pid)
-        if not src:
-            # Not found in index
-            logger.debug(f'{pid} not in index, skipping')
-            continue
-
-        role = src['relation']['name']
-        searchy = list(set(item for item in src.get('searchy', []) if not isinstance(item, list)))
-
-        if role == 'parent':
-            kids = [int(x) for x in src.get('children', [])]
-            eligible = list(set(kids) - set(pids))
-
-            if not eligible:
+    for batch in chunked(pids, mutations.chunk_size):
+        mutations.load(batch)
+        for pid in batch:
+            if mutations.remove(pid, removing):
                 delthese.append(pid)
-            else:
-                qeligible = {
-                    "bool": {
-                        "must": [{"terms": {"place_id": kids}}],
-                        "should": {"exists": {"field": "links"}}
-                    }
-                }
-                res = es.search(index=idx, query=qeligible)
-                linked = [h['_source'] for h in res['hits']['hits'] if 'links' in h['_source']]
-                linked_len = [{'pid': h['place_id'], 'len': len(h['links'])} for h in linked]
-                winner = max(linked_len, key=lambda x: x['len'])['pid'] if linked_len else eligible[0]
-                newparent = winner
-                newkids = [k for k in eligible if k != winner]
-
-                q_update = {
-                    "script": {
-                        "source": (
-                            "ctx._source.whg_id = params._id; "
-                            "ctx._source.relation.name = 'parent'; "
-                            "ctx._source.children = params.newkids; "
-                            "ctx._source.searchy.addAll(params.searchy);"
-                        ),
-                        "lang": "painless",
-                        "params": {"_id": newparent, "newkids": newkids, "searchy": searchy}
-                    },
-                    "query": {"term": {"place_id": newparent}}
-                }
-                try:
-                    es.update_by_query(index=idx, body=q_update)
-                    delthese.append(pid)
-                except Exception as e:
-                    logger.critical('Error updating new parent', exc_info=True)
-                    raise
-
-        elif role == 'child':
-            parent = src['relation'].get('parent')
-            if not parent:
-                delthese.append(pid)
-                continue
+        mutations.flush()
 
-            qget = {"term": {"place_id": parent}}
-            res = es.search(index=idx, query=qget)
-            if not res['hits']['hits']:
-                delthese.append(pid)
-                continue
-            psrc = res['hits']['hits'][0]['_source']
-
-            zombie = psrc['place_id'] in pids
-
-            if not zombie and psrc.get('children'):
-                q_update = {
-                    "script": {
-                        "lang": "painless",
-                        "source": "ctx._source.children.removeIf(c -> c == params.val)",
-                        "params": {"val": str(pid)}
-                    },
-                    "query": {"term": {"place_id": parent}}
-                }
-                try:
-                    es.update_by_query(index=idx, body=q_update)
-                    delthese.append(pid)
-                except Exception as e:
-                    logger.critical('Error removing child from parent', exc_info=True)
-                    raise
-            else:
-                delthese.append(pid)
-
-        # DB side actions, optionally batch if large
-        try:
-            place = Place.objects.get(id=pid)
-            place.indexed = False
-            place.hit_set.filter(authority='whg').delete()
-            place.review_whg = None
-            place.save()
-        except Place.DoesNotExist:
-            pass
-
-    # Delete all collected docs in batches
-    for batch in chunked(delthese, 500):
-        es.delete_by_query(index=idx, body={"query": {"terms": {"place_id": batch}}})
+        # DB side actions
+        Hit.objects.filter(place_id__in=batch, authority='whg').delete()
+        Place.objects.filter(id__in=batch).update(indexed=False, review_whg=None)
+    mark_places_stale(pids, sections=('places', 'hits'))
+    places_changed_in_bulk(pids)
 
     msg = f'deleted {len(delthese)}: {delthese}'
+    if mutations.errors:
+        msg += f'; {len(mutations.errors)} index writes failed'
     return JsonResponse({'msg': msg})
 
 
@@ -868,9 +920,7 @@ def esInit(idx):
 # called from makeDoc()
 # ***
 def uriMaker(place):
-    from django.shortcuts import get_object_or_404
-    from datasets.models import Dataset
-    ds = get_object_or_404(Dataset, id=place.dataset.id)
+    ds = place.dataset
     if 'whgazetteer' in ds.uri_base:
         return ds.uri_base + str(place.id)
     else:
@@ -0,0 +1,169 @@
+# elastic/msearch.py
+# concurrent, batched _msearch execution with adaptive back-pressure
+# used by the batched reconciliation engines in datasets.tasks
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from elasticsearch8 import ApiError, ConnectionTimeout, TransportError
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency gate for Elasticsearch requests.
+
+    The number of in-flight requests starts at `max_in_flight` and is halved
+    whenever Elasticsearch pushes back (HTTP 429, search thread-pool rejections,
+    timeouts); each successful request raises it by one again. While the limit
+    is reduced, callers also sleep for an exponentially growing pause before
+    retrying, so a struggling cluster is given room to recover instead of being
+    hit at a fixed rate.
+    """
+
+    def __init__(self, max_in_flight, min_pause=0.25, max_pause=30.0):
+        self.max_in_flight = max(1, max_in_flight)
+        self.limit = self.max_in_flight
+        self.in_flight = 0
+        self.min_pause = min_pause
+        self.max_pause = max_pause
+        self.pause = 0.0
+        self.rejections = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+            pause = self.pause
+        if pause:
+            time.sleep(pause)
+
+    def release(self, rejected=False):
+        with self._cond:
+            self.in_flight -= 1
+            if rejected:
+                self.rejections += 1
+                self.limit = max(1, self.limit // 2)
+                self.pause = min(self.max_pause, max(self.min_pause, self.pause * 2))
+            else:
+                self.limit = min(self.max_in_flight, self.limit + 1)
+                self.pause = self.pause / 2 if self.pause > self.min_pause else 0.0
+            self._cond.notify_all()
+
+
+def _is_rejection(response):
+    """True if a single msearch item was rejected for capacity reasons (retryable)."""
+    if 'error' not in response:
+        return False
+    if response.get('status') == 429:
+        return True
+    error = response['error']
+    return isinstance(error, dict) and 'rejected_execution' in str(error.get('type', ''))
+
+
+class MsearchRunner:
+    """
+    Sends many search bodies against one index through `_msearch`.
+
+    Bodies are split into sub-batches of `batch_size` and dispatched from a
+    bounded thread pool; an AdaptiveLimiter throttles in-flight requests.
+    Items rejected by the cluster are retried (up to `max_retries` times), so
+    callers get exactly one response per body, in input order. Non-retryable
+    per-item errors are returned as the error dict that Elasticsearch sent.
+
+    Only Elasticsearch calls run in worker threads; callers keep all ORM work
+    in their own thread.
+    """
+
+    def __init__(self, es=None, index=None, batch_size=None, workers=None, max_retries=8):
+        self.es = es or settings.ES_CONN
+        self.index = index
+        self.batch_size = batch_size or settings.RECON_MSEARCH_BATCH
+        self.workers = workers or settings.RECON_MSEARCH_WORKERS
+        self.max_retries = max_retries
+        self.limiter = AdaptiveLimiter(self.workers)
+        self.requests = 0
+        self.searches = 0
+
+    def _send(self, bodies):
+        searches = []
+        for body in bodies:
+            searches.append({})
+            searches.append(body)
+        self.requests += 1
+        self.searches += len(bodies)
+        return self.es.msearch(index=self.index, searches=searches)['responses']
+
+    def _run_batch(self, bodies):
+        responses = [None] * len(bodies)
+        pending = list(range(len(bodies)))
+        attempt = 0
+        while pending:
+            self.limiter.acquire()
+            rejected = False
+            try:
+                batch = self._send([bodies[i] for i in pending])
+            except (ConnectionTimeout, TransportError) as e:
+                rejected, batch = True, None
+                logger.warning(f'msearch transport error ({len(pending)} searches): {e}')
+            except ApiError as e:
+                if e.meta.status != 429:
+                    self.limiter.release()
+                    raise
+                rejected, batch = True, None
+                logger.warning(f'msearch rejected with 429 ({len(pending)} searches)')
+            if batch is not None:
+                retry = []
+                for i, res in zip(pending, batch):
+                    if _is_rejection(res):
+                        retry.append(i)
+                    else:
+                        responses[i] = res
+                rejected = bool(retry)
+                pending = retry
+            self.limiter.release(rejected=rejected)
+
+            if pending:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.error(f'msearch gave up on {len(pending)} searches after {self.max_retries} retries')
+                    for i in pending:
+                        responses[i] = {'error': {'type': 'retries_exhausted'}, 'status': 429}
+                    break
+        return responses
+
+    def search(self, bodies):
+        """Returns one msearch response per body, in the order given."""
+        bodies = list(bodies)
+        if not bodies:
+            return []
+        batches = [bodies[i:i + self.batch_size] for i in range(0, len(bodies), self.batch_size)]
+        if len(batches) == 1:
+            return self._run_batch(batches[0])
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(batches))) as pool:
+            results = pool.map(self._run_batch, batches)
+            return [res for batch in results for res in batch]
+
+    @property
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'searches': self.searches,
+            'rejections': self.limiter.rejections,
+        }
+
+
+def response_hits(response):
+    """
+    Hits list from one msearch response; raises if Elasticsearch returned an error
+    for that search, so callers can treat it like a failed es.search().
+    """
+    if 'error' in response:
+        raise RuntimeError(f"msearch item failed: {response['error']}")
+    return response['hits']['hits']
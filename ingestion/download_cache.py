@@ -0,0 +1,205 @@
+# ingestion/download_cache.py
+# persistent, content-addressed cache of remote dataset source files
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadCache:
+    """
+    Keeps downloaded source files on local disk between ingestion runs.
+
+    Files are stored under objects/ by the SHA-256 of their content; index/
+    holds one JSON entry per URL recording the digest, size, ETag and
+    Last-Modified of the download. Before a cached file is reused, a HEAD
+    request checks that the remote ETag (or, failing that, size and
+    Last-Modified) still matches; if the remote cannot be reached, the cached
+    copy is used. Entries unused for longer than `max_age` are evicted, then the
+    least recently used ones until the cache is under `max_bytes`.
+
+    A lock file per URL stops concurrent workers downloading the same file twice,
+    and eviction removing a file while it is fetched. Nor is anything used in the
+    last IN_USE_SECONDS evicted, as a worker may be about to open it.
+    """
+
+    IN_USE_SECONDS = 300
+
+    def __init__(self, location=None, max_bytes=None, max_age=None):
+        self.location = location or settings.INGESTION_CACHE_DIR
+        self.max_bytes = max_bytes or settings.INGESTION_CACHE_MAX_BYTES
+        self.max_age = max_age or settings.INGESTION_CACHE_MAX_AGE
+        self.objects_dir = os.path.join(self.location, 'objects')
+        self.index_dir = os.path.join(self.location, 'index')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def _entry_path(self, url):
+        return os.path.join(self.index_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest)
+
+    @contextmanager
+    def _lock(self, url, blocking=True):
+        """Holds the URL's lock; if not blocking, yields False at once when another worker holds it"""
+        with open(self._entry_path(url) + '.lock', 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_entry(self, url):
+        try:
+            with open(self._entry_path(url)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_entry(self, url, entry):
+        entry['last_used'] = time.time()
+        tmp_path = self._entry_path(url) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._entry_path(url))
+
+    @staticmethod
+    def _is_current(entry, headers):
+        """True if the remote headers describe the cached download"""
+        etag = headers.get('ETag')
+        if etag and entry.get('etag'):
+            return etag == entry['etag']
+        length = headers.get('Content-Length')
+        if length is not None and int(length) != entry['size']:
+            return False
+        last_modified = headers.get('Last-Modified')
+        if last_modified and entry.get('last_modified'):
+            return last_modified == entry['last_modified']
+        return length is not None
+
+    def fetch(self, url):
+        """Local path of an up-to-date copy of `url`, downloading it if necessary"""
+        with self._lock(url):
+            entry = self._read_entry(url)
+            if entry and os.path.exists(self._object_path(entry['sha256'])):
+                try:
+                    head = requests.head(url, allow_redirects=True, timeout=30)
+                    head.raise_for_status()
+                    current = self._is_current(entry, head.headers)
+                except requests.RequestException as e:
+                    logger.warning(f"Could not revalidate {url} ({e}); using cached copy")
+                    current = True
+                if current:
+                    self._write_entry(url, entry)  # touch
+                    logger.info(f"Using cached download of {url} ({entry['size']} bytes)")
+                    return self._object_path(entry['sha256'])
+
+            entry = self._download(url)
+            self._write_entry(url, entry)
+        self.evict(keep=entry['sha256'])
+        return self._object_path(entry['sha256'])
+
+    def _download(self, url):
+        logger.info(f"Downloading {url}")
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, suffix='.part')
+        try:
+            with requests.get(url, stream=True) as response:
+                response.raise_for_status()
+                with os.fdopen(fd, 'wb') as f:
+                    # raw bytes, as served: a transfer encoding must not be undone here
+                    for chunk in response.raw.stream(1024 * 1024, decode_content=False):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                headers = response.headers
+            expected = headers.get('Content-Length')
+            if expected is not None and int(expected) != size:
+                raise IOError(f"Incomplete download of {url}: {size} of {expected} bytes")
+            os.replace(tmp_path, self._object_path(digest.hexdigest()))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        logger.info(f"Downloaded {url} ({size} bytes)")
+        return {
+            'url': url,
+            'sha256': digest.hexdigest(),
+            'size': size,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched': time.time(),
+        }
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+    def evict(self, keep=None):
+        """
+        Drops stale entries, then least recently used ones until the cache fits in max_bytes.
+        Entries being fetched or used recently are skipped; a file already removed by a
+        concurrent eviction counts as evicted.
+        """
+        entries = []
+        for name in os.listdir(self.index_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.index_dir, name)
+            try:
+                with open(path) as f:
+                    entries.append((path, json.load(f)))
+            except (OSError, ValueError):
+                continue
+
+        now = time.time()
+        referenced = {}  # digest -> number of index entries using it
+        for _, entry in entries:
+            referenced[entry['sha256']] = referenced.get(entry['sha256'], 0) + 1
+        total = sum(self._size(self._object_path(d)) for d in referenced)
+
+        for path, entry in sorted(entries, key=lambda e: e[1].get('last_used', 0)):
+            digest = entry['sha256']
+            stale = now - entry.get('last_used', 0) > self.max_age
+            if digest == keep or (not stale and total <= self.max_bytes):
+                continue
+            if now - entry.get('last_used', 0) < self.IN_USE_SECONDS:
+                continue
+            with self._lock(entry['url'], blocking=False) as locked:
+                # skipped if being fetched, or fetched since it was read above
+                if not locked or self._read_entry(entry['url']) != entry:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+            referenced[digest] -= 1
+            object_path = self._object_path(digest)
+            try:
+                # unless downloaded again meanwhile, for another URL
+                if not referenced[digest] and now - os.path.getmtime(object_path) >= self.IN_USE_SECONDS:
+                    size = os.path.getsize(object_path)
+                    os.remove(object_path)
+                    total -= size
+            except FileNotFoundError:
+                pass
+            logger.info(f"Evicted cached download of {entry['url']}")
@@ -14,12 +14,15 @@ class Command(BaseCommand):
         parser.add_argument('dataset_name', type=str,
                             help='The name of the dataset (e.g., "Pleiades", "GeoNames", "Wikidata", "TGN")')
         parser.add_argument('--limit', type=int, default=None, help='Limit the number of items to ingest')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Items per batched write (default settings.INGESTION_BATCH_SIZE; 1 = item by item)')
 
     def handle(self, *args, **kwargs):
         dataset_name = kwargs['dataset_name']
         limit = kwargs.get('limit')
+        batch_size = kwargs.get('batch_size')
 
         # Call the Celery task for ingestion
-        process_dataset.delay(dataset_name, limit)
+        process_dataset.delay(dataset_name, limit, batch_size)
 
         self.stdout.write(self.style.SUCCESS(f'Successfully initiated ingestion for dataset: {dataset_name}'))
@@ -1,11 +1,12 @@
 # ingestion/models.py
 
-from django.db.models import JSONField, UniqueConstraint
-from django.db import models
+from django.conf import settings
+from django.db.models import JSONField, Max, Min, UniqueConstraint
+from django.db import connection, models, transaction
 
 import logging
-
-from ingestion.transformers import isocodes
+import time
+from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
@@ -119,32 +120,94 @@ class NPR(models.Model):
             return None
 
     @classmethod
-    def update_primary_names(cls):
+    def update_primary_names(cls, source=None, chunk_size=None):
         """
-        Iterate over all NPR instances and update their primary_name field using the preferred toponym.
+        Update primary_name of NPRs (optionally of one source) from the toponym of
+        their preferred Attestation (matched on npr_item_id), in chunks of NPR ids.
+        The preferred attestations are ranked once, into a temporary table.
         """
-        for npr in cls.objects.all():
-            # Get Attestations which have npr_item_id same as item_id of NPR
-            preferred_attestation = Attestation.objects.filter(npr_item_id=npr.item_id, is_preferred=True).first()
-            # logger.debug(f"Preferred attestation for NPR with item_id: {npr.item_id} - {preferred_attestation}")
-
-            if preferred_attestation and preferred_attestation.toponym:
-                # Update primary_name with the toponym associated with the preferred attestation
-                npr.primary_name = preferred_attestation.toponym.toponym
-                npr.save()
-            #     logger.info(f"Updated NPR primary_name to '{npr.primary_name}' for item_id: {npr.item_id}")
-            # else:
-            #     logger.info(f"No preferred attestation or toponym found for NPR with item_id: {npr.item_id}")
+        with temp_table('preferred_attestations', f"""
+            SELECT DISTINCT ON (npr_item_id, source) npr_item_id, source, toponym_id
+            FROM {Attestation._meta.db_table}
+            WHERE is_preferred
+              AND (%(source)s::text IS NULL OR source = %(source)s)
+            ORDER BY npr_item_id, source, id
+        """, {'source': source}, index='npr_item_id, source'):
+            return run_in_id_chunks(cls, 'update_primary_names', f"""
+                UPDATE {cls._meta.db_table} n SET primary_name = t.toponym
+                FROM preferred_attestations pa
+                JOIN {Toponym._meta.db_table} t ON t.id = pa.toponym_id
+                WHERE pa.npr_item_id = n.item_id AND pa.source = n.source
+                  AND n.primary_name IS DISTINCT FROM t.toponym
+                  AND n.id >= %(lo)s AND n.id < %(hi)s
+                  AND (%(source)s::text IS NULL OR n.source = %(source)s)
+            """, {'source': source}, chunk_size, source=source)
 
     @classmethod
-    def compute_ccodes(cls):
+    def compute_ccodes(cls, source=None, chunk_size=None):
         """
-        Iterate over all NPR instances and compute their ccodes field using the associated geometry.
+        Compute ccodes of NPRs (optionally of one source) which have none, from the
+        countries their point intersects, in chunks of NPR ids.
         """
-        for npr in cls.objects.all():
-            if not npr.ccodes and npr.latitude and npr.longitude:
-                npr.ccodes = isocodes([{'type': 'Point', 'coordinates': [npr.longitude, npr.latitude]}])
-                npr.save()
+        return run_in_id_chunks(cls, 'compute_ccodes', f"""
+            UPDATE {cls._meta.db_table} n SET ccodes = c.ccodes
+            FROM (
+                SELECT p.id, to_jsonb(array_agg(DISTINCT co.iso ORDER BY co.iso)) AS ccodes
+                FROM {cls._meta.db_table} p
+                JOIN countries co
+                  ON ST_Intersects(co.mpoly, ST_SetSRID(ST_MakePoint(p.longitude, p.latitude), 4326))
+                WHERE (p.ccodes IS NULL OR p.ccodes IN ('[]'::jsonb, 'null'::jsonb))
+                  AND p.latitude <> 0 AND p.longitude <> 0
+                  AND p.id >= %(lo)s AND p.id < %(hi)s
+                  AND (%(source)s::text IS NULL OR p.source = %(source)s)
+                GROUP BY p.id
+            ) c
+            WHERE n.id = c.id
+        """, {'source': source}, chunk_size, source=source)
+
+
+@contextmanager
+def temp_table(name, sql, params, index):
+    """
+    Materializes the result of `sql` once as temporary table `name`, indexed on `index`,
+    for the statements run within; it is dropped on leaving
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {name}")
+        cursor.execute(f"CREATE TEMPORARY TABLE {name} AS {sql}", params)
+        cursor.execute(f"CREATE INDEX ON {name} ({index})")
+        cursor.execute(f"ANALYZE {name}")
+    try:
+        yield name
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {name}")
+
+
+def run_in_id_chunks(model, label, sql, params, chunk_size=None, source=None):
+    """
+    Runs an UPDATE over consecutive id ranges of `model` (of its rows from `source`,
+    if given), bound as %(lo)s and %(hi)s (exclusive) in `sql`, so each statement
+    touches a bounded number of rows and commits on its own. Logs progress in
+    rows/sec; returns rows updated.
+    """
+    chunk_size = chunk_size or settings.INGESTION_POSTPROCESS_CHUNK
+    rows = model.objects.filter(source=source) if source else model.objects.all()
+    bounds = rows.aggregate(lo=Min('id'), hi=Max('id'))
+    lo, hi = bounds['lo'], bounds['hi']
+    if lo is None:
+        return 0
+
+    updated = 0
+    start = time.monotonic()
+    for chunk_lo in range(lo, hi + 1, chunk_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, {**params, 'lo': chunk_lo, 'hi': chunk_lo + chunk_size})
+            updated += cursor.rowcount
+        elapsed = time.monotonic() - start
+        logger.info(f"{label}: ids to {min(chunk_lo + chunk_size - 1, hi)} of {hi}, {updated} rows updated "
+                    f"({updated / elapsed if elapsed else 0:.0f} rows/sec)")
+    return updated
 
 
 class Attestation(models.Model):
@@ -167,6 +230,40 @@ class Attestation(models.Model):
             UniqueConstraint(fields=['npr', 'source_toponym_id', 'start', 'end'], name='unique_npr_source_toponym')
         ]
 
+    @classmethod
+    def link_toponyms(cls, source=None, chunk_size=None):
+        """
+        Set the toponym of Attestations (optionally of one source) from the
+        ToponymLookup with the same source_toponym_id, in chunks of Attestation ids.
+        The lookups are ranked once, into a temporary table.
+        """
+        with temp_table('first_toponym_lookups', f"""
+            SELECT DISTINCT ON (source_toponym_id) source_toponym_id, toponym_id
+            FROM {ToponymLookup._meta.db_table}
+            WHERE %(source)s::text IS NULL OR source_toponym_id IN (
+                SELECT source_toponym_id FROM {cls._meta.db_table} WHERE source = %(source)s)
+            ORDER BY source_toponym_id, id
+        """, {'source': source}, index='source_toponym_id'):
+            updated = run_in_id_chunks(cls, 'link_toponyms', f"""
+                UPDATE {cls._meta.db_table} a SET toponym_id = l.toponym_id
+                FROM first_toponym_lookups l
+                WHERE l.source_toponym_id = a.source_toponym_id
+                  AND a.toponym_id IS DISTINCT FROM l.toponym_id
+                  AND a.id >= %(lo)s AND a.id < %(hi)s
+                  AND (%(source)s::text IS NULL OR a.source = %(source)s)
+            """, {'source': source}, chunk_size, source=source)
+
+        unmatched = cls.objects.exclude(source_toponym_id__in=ToponymLookup.objects.exclude(
+            source_toponym_id=None).values('source_toponym_id'))
+        if source:
+            unmatched = unmatched.filter(source=source)
+        unmatched_count = unmatched.count()
+        if unmatched_count:
+            sample = list(unmatched.values_list('source_toponym_id', flat=True)[:10])
+            logger.error(f"{unmatched_count} attestations have no ToponymLookup for their source_toponym_id, "
+                         f"e.g. {sample}")
+        return updated
+
     @classmethod
     def create_or_update_attestation(cls, npr, **kwargs):
         """
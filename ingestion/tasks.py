@@ -10,11 +10,14 @@ import requests
 import gzip
 import ijson
 import logging
+import time
 
-from celery import shared_task
+from celery import chord, shared_task
 from django.conf import settings
-from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
 
+from .download_cache import DownloadCache
 from .models import ToponymLookup
 from .transformers import NPRTransformer  # Use NPRTransformer for data transformation
 
@@ -22,7 +25,7 @@ logger = logging.getLogger(__name__)
 
 
 class StreamFetcher:
-    def __init__(self, file, cache_key):
+    def __init__(self, file, cache=None):
         self.file_url = file['url']  # URL of the file to fetch
         self.file_type = file['file_type']  # Type of the file (json, csv, xml)
         self.filter = file.get('filter', None)  # Filter to apply to triples
@@ -30,9 +33,7 @@ class StreamFetcher:
         self.item_path = file.get('item_path', None)  # Path to the items in a JSON file
         self.fieldnames = file.get('fieldnames', None)  # Fieldnames for CSV files
         self.delimiter = file.get('delimiter', '\t')  # Delimiter for CSV files
-        self.cache_key = cache_key  # Unique cache key for this dataset
-        self.cache = caches['remote_datasets']
-        self.local_cache = None
+        self.cache = cache or DownloadCache()  # Local copies of source files, kept between runs
 
     def get_stream(self):
         if self.file_url.endswith('.gz'):
@@ -43,38 +44,11 @@ class StreamFetcher:
             raise ValueError("Unsupported file format")
 
     def _get_gzip_stream(self):
-        # Directly stream gzip file from URL
-        response = requests.get(self.file_url, stream=True)
-        response.raise_for_status()
-        return gzip.GzipFile(fileobj=response.raw)
+        return gzip.open(self.cache.fetch(self.file_url), 'rb')
 
     def _get_zip_stream(self):
-        # Check if the file is cached
-        cache_file_path = self.cache.get(self.cache_key)
-
-        if not cache_file_path:
-            try:
-                # Create a temporary file in the cache directory
-                cache_dir = settings.CACHES['remote_datasets']['LOCATION']
-                cache_file_path = os.path.join(cache_dir, f"{self.cache_key}.zip")
-
-                with requests.get(self.file_url, stream=True) as response:
-                    response.raise_for_status()
-                    with open(cache_file_path, 'wb') as cache_file:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            cache_file.write(chunk)
-
-                # Cache the file path in Django cache
-                self.cache.set(self.cache_key, cache_file_path)
-
-            except Exception as e:
-                # Clean up if something goes wrong
-                if os.path.exists(cache_file_path):
-                    os.remove(cache_file_path)
-                raise e
-
         # Open the zip file and return the stream of the specified file inside
-        with zipfile.ZipFile(cache_file_path, 'r') as zip_file:
+        with zipfile.ZipFile(self.cache.fetch(self.file_url), 'r') as zip_file:
             if self.file_name not in zip_file.namelist():
                 raise ValueError(f"{self.file_name} not found in the ZIP archive")
             return zip_file.open(self.file_name)
@@ -157,7 +131,12 @@ def get_dataset_config(dataset_name):
 
 
 @shared_task
-def process_dataset(dataset_name, limit=None):
+def process_dataset(dataset_name, limit=None, batch_size=None):
+    """
+    Ingests all files of a remote dataset. Files are independent, so each is
+    fetched, parsed and ingested by its own ingest_file task, run in parallel
+    as a chord whose callback, finalise_dataset, runs once they are all done.
+    """
     from ingestion.models import Attestation, NPR, Toponym
     config = get_dataset_config(dataset_name)
     if not config:
@@ -171,94 +150,304 @@ def process_dataset(dataset_name, limit=None):
     NPR.objects.filter(source=config).delete()
     logger.info(f"Deleted previous NPRs and their Attestations for dataset: {dataset_name}")
 
-    for index, file in enumerate(config['files']):
-        try:
-            fetcher = StreamFetcher(file, cache_key=f"{dataset_name}_{index}")
-            logger.debug(f"Instantiated fetcher: {fetcher}")
-            transform_and_ingest(fetcher.get_items(), limit, dataset_name, index)
+    chord(
+        ingest_file.si(dataset_name, index, limit, batch_size) for index in range(len(config['files']))
+    )(finalise_dataset.s(dataset_name))
 
-        except Exception as e:
-            logger.error(f"Failed to fetch data from {file['url']}: {e}")
 
-    logger.info(f"Finished ingestion for dataset: {dataset_name}")
+@shared_task
+def ingest_file(dataset_name, index, limit=None, batch_size=None):
+    file = get_dataset_config(dataset_name)['files'][index]
+    try:
+        fetcher = StreamFetcher(file)
+        logger.debug(f"Instantiated fetcher: {fetcher}")
+        return transform_and_ingest(fetcher.get_items(), limit, dataset_name, index, batch_size)
+
+    except Exception as e:
+        # reported rather than raised, so the chord callback still runs
+        logger.error(f"Failed to fetch data from {file['url']}: {e}")
+        return {'error': str(e)}
+
+
+@shared_task
+def finalise_dataset(file_results, dataset_name):
+    """Chord callback: dataset-wide post-processing, once all files are ingested"""
+    from ingestion.models import Attestation, NPR
+    logger.info(f"Finished ingestion for dataset: {dataset_name}; per-file results: {file_results}")
 
     if dataset_name == 'TGN':
-        NPR.compute_ccodes()
+        NPR.compute_ccodes(source=dataset_name)
 
         # Update Attestation toponym_ids by fetching from Toponym using source_toponym_id
-        for attestation in Attestation.objects.filter(npr__source=dataset_name):
-            try:
-                # Fetch and update the toponym based on the source_toponym_id
-                attestation.toponym = ToponymLookup.objects.get(source_toponym_id=attestation.source_toponym_id).toponym
-                attestation.save()
-            except ToponymLookup.DoesNotExist:
-                logger.error(f"Toponym with temp_id {attestation.source_toponym_id} not found")
+        Attestation.link_toponyms(source=dataset_name)
 
         # After updating all the toponym_ids, update the primary names for all NPR instances
-        NPR.update_primary_names()
+        NPR.update_primary_names(source=dataset_name)
 
+    return file_results
 
-def transform_and_ingest(items, limit, dataset_name, index=0):
-    from ingestion.models import NPR, Toponym, Attestation, ToponymLookup
+
+def transform_and_ingest(items, limit, dataset_name, index=0, batch_size=None):
+    """
+    Transforms items with the dataset's transformer and writes them to NPR,
+    Toponym, ToponymLookup and Attestation. With batch_size > 1 (default
+    settings.INGESTION_BATCH_SIZE) items go through BatchIngester; with 1, each
+    item is written on its own by ingest_item().
+    """
+    batch_size = batch_size or settings.INGESTION_BATCH_SIZE
+    ingester = BatchIngester(dataset_name, index, batch_size) if batch_size > 1 else None
     count = 0  # Counter for limiting the number of items
     for item in items:
         if limit is not None and count >= limit:
             break  # Stop processing if the limit is reached
-        try:
-            # Transform the item using the corresponding transformer
-            # logger.info(f"Transforming item: {item}")
-            transformed_item, alternate_names = NPRTransformer.transformers[dataset_name][index](item)
-            # logger.info(f"Transformed item: {transformed_item}")
-            # logger.info(f"Alternate names: {alternate_names}")
+        if ingester:
+            ingester.add(item)
+        else:
+            ingest_item(item, dataset_name, index)
+        count += 1
+    if ingester:
+        ingester.flush()
+        return ingester.stats
+    return {'items': count}
 
-            npr_instance = None
-            if transformed_item:
-                # Save the transformed NPR to the database (or get existing)
-                npr_instance = NPR.create_or_update(
-                    source=dataset_name,
-                    **transformed_item
-                )
-
-                # if npr_instance:
-                #     logger.info(f"Successfully ingested or fetched NPR: {npr_instance}")
-
-            if alternate_names:
-                # Save the alternate toponyms
-                for name_data in alternate_names:
-                    if 'toponym' in name_data:
-                        # Get or create the Toponym instance
-                        toponym_instance = Toponym.create_toponym(
-                            toponym=name_data.pop('toponym'),
-                            language=name_data.pop('language', None),  # Default to 'und' (undefined) if missing
-                            is_romanised=name_data.pop('is_romanised', False),
-                        )
-
-                        ToponymLookup.objects.create(
-                            toponym=toponym_instance,
-                            source_toponym_id=name_data.get('source_toponym_id', None),
-                        )
-                    else:
-                        toponym_instance = None
-
-                    name_data = {**name_data, 'source': dataset_name, 'toponym': toponym_instance}
-                    if npr_instance:
-                        # Create the attestation linking the NPR and the toponym
-                        Attestation.create_or_update_attestation(
-                            npr=npr_instance,
-                            **name_data  # Pass the remaining data as keyword arguments
-                        )
-
-            #     logger.info(f"Successfully added toponyms for item: {npr_instance}")
-            # else:
-            #     logger.info(f"No alternate names found for item: {npr_instance}")
 
-        except Exception as e:
-            error_message = (
-                f"Error processing NPR instance:\n"
-                f"Item: {item}\n"
-                f"Exception: {str(e)}\n"
-                f"Traceback: {traceback.format_exc()}"
+def log_item_error(item):
+    error_message = (
+        f"Error processing NPR instance:\n"
+        f"Item: {item}\n"
+        f"Traceback: {traceback.format_exc()}"
+    )
+    logger.error(error_message)
+
+
+def ingest_item(item, dataset_name, index=0):
+    from ingestion.models import NPR, Toponym, Attestation, ToponymLookup
+    try:
+        # Transform the item using the corresponding transformer
+        # logger.info(f"Transforming item: {item}")
+        transformed_item, alternate_names = NPRTransformer.transformers[dataset_name][index](item)
+        # logger.info(f"Transformed item: {transformed_item}")
+        # logger.info(f"Alternate names: {alternate_names}")
+
+        npr_instance = None
+        if transformed_item:
+            # Save the transformed NPR to the database (or get existing)
+            npr_instance = NPR.create_or_update(
+                source=dataset_name,
+                **transformed_item
             )
-            logger.error(error_message)
 
-        count += 1
+            # if npr_instance:
+            #     logger.info(f"Successfully ingested or fetched NPR: {npr_instance}")
+
+        if alternate_names:
+            # Save the alternate toponyms
+            for name_data in alternate_names:
+                if 'toponym' in name_data:
+                    # Get or create the Toponym instance
+                    toponym_instance = Toponym.create_toponym(
+                        toponym=name_data.pop('toponym'),
+                        language=name_data.pop('language', None),  # Default to 'und' (undefined) if missing
+                        is_romanised=name_data.pop('is_romanised', False),
+                    )
+
+                    ToponymLookup.objects.create(
+                        toponym=toponym_instance,
+                        source_toponym_id=name_data.get('source_toponym_id', None),
+                    )
+                else:
+                    toponym_instance = None
+
+                name_data = {**name_data, 'source': dataset_name, 'toponym': toponym_instance}
+                if npr_instance:
+                    # Create the attestation linking the NPR and the toponym
+                    Attestation.create_or_update_attestation(
+                        npr=npr_instance,
+                        **name_data  # Pass the remaining data as keyword arguments
+                    )
+
+        #     logger.info(f"Successfully added toponyms for item: {npr_instance}")
+        # else:
+        #     logger.info(f"No alternate names found for item: {npr_instance}")
+
+    except Exception:
+        log_item_error(item)
+
+
+def merge_npr_fields(npr, fields):
+    """Applies transformed NPR fields as NPR.create_or_update() does: feature_classes are merged, others replaced."""
+    for key, value in fields.items():
+        if key == 'feature_classes' and value and isinstance(npr.feature_classes, list):
+            npr.feature_classes = list(set(npr.feature_classes) | set(value))
+        else:
+            setattr(npr, key, value)
+
+
+class BatchIngester:
+    """
+    Set-based equivalent of ingest_item() for a stream of items.
+
+    Items are buffered and written batch_size at a time, each batch in one
+    transaction: NPRs for the batch's item_ids are read once, merged in memory
+    and written with bulk_update (existing) and bulk_create(update_conflicts=True)
+    on (source, item_id) (new); toponyms are deduplicated in memory and only the
+    missing ones inserted; lookups and new attestations are bulk-inserted and
+    existing attestations (matched on source_toponym_id) bulk-updated.
+
+    If a batch fails it is rolled back and replayed through ingest_item(), so a
+    bad item costs one slow batch rather than the batch's data.
+    """
+
+    def __init__(self, dataset_name, index=0, batch_size=None):
+        self.dataset_name = dataset_name
+        self.index = index
+        self.transformer = NPRTransformer.transformers[dataset_name][index]
+        self.batch_size = batch_size or settings.INGESTION_BATCH_SIZE
+        self.buffer = []
+        self.stats = {'items': 0, 'nprs': 0, 'toponyms': 0, 'lookups': 0,
+                      'attestations': 0, 'errors': 0, 'replayed_batches': 0}
+        self.start_time = time.monotonic()
+
+    def add(self, item):
+        self.buffer.append(item)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        items, self.buffer = self.buffer, []
+        try:
+            with transaction.atomic():
+                self.write_batch(items)
+        except Exception as e:
+            logger.error(f"{self.dataset_name}[{self.index}]: batch of {len(items)} items failed ({e}); "
+                         f"replaying item by item")
+            self.stats['replayed_batches'] += 1
+            for item in items:
+                ingest_item(item, self.dataset_name, self.index)
+        self.stats['items'] += len(items)
+        elapsed = time.monotonic() - self.start_time
+        logger.info(f"{self.dataset_name}[{self.index}]: {self.stats['items']} items "
+                    f"({self.stats['items'] / elapsed if elapsed else 0:.0f}/s); {self.stats}")
+
+    def write_batch(self, items):
+        from ingestion.models import NPR, Toponym, Attestation, ToponymLookup
+
+        # transform; NPR fields in item order, keyed by item_id
+        npr_updates = []  # (key, fields)
+        name_rows = []  # (npr key or None, name_data)
+        for i, item in enumerate(items):
+            try:
+                transformed_item, alternate_names = self.transformer(item)
+            except Exception:
+                log_item_error(item)
+                self.stats['errors'] += 1
+                continue
+            key = None
+            if transformed_item:
+                fields = dict(transformed_item)
+                item_id = fields.pop('item_id', None)
+                # NPRs without an item_id are never matched, as in NPR.create_or_update
+                key = str(item_id) if item_id is not None else ('no-item-id', i)
+                npr_updates.append((key, fields))
+            for name_data in alternate_names or []:
+                name_rows.append((key, dict(name_data)))
+
+        # NPRs
+        keys = {key for key, _ in npr_updates}
+        nprs = {npr.item_id: npr for npr in
+                NPR.objects.filter(source=self.dataset_name, item_id__in=[k for k in keys if isinstance(k, str)])}
+        existing = set(nprs)
+        touched = set()
+        for key, fields in npr_updates:
+            if key not in nprs:
+                nprs[key] = NPR(source=self.dataset_name, item_id=key if isinstance(key, str) else None)
+            merge_npr_fields(nprs[key], fields)
+            touched.update(fields)
+
+        changed = [nprs[key] for key in existing if key in keys]
+        new = [npr for key, npr in nprs.items() if key not in existing and isinstance(key, str)]
+        anonymous = [npr for key, npr in nprs.items() if not isinstance(key, str)]
+        if changed and touched:
+            now = timezone.now()
+            for npr in changed:
+                npr.date_modified = now
+            NPR.objects.bulk_update(changed, fields=sorted(touched) + ['date_modified'])
+        if new:
+            if touched:
+                NPR.objects.bulk_create(new, update_conflicts=True, unique_fields=['source', 'item_id'],
+                                        update_fields=sorted(touched) + ['date_modified'])
+            else:
+                NPR.objects.bulk_create(new, ignore_conflicts=True)
+            # upserts do not return primary keys
+            ids = dict(NPR.objects.filter(source=self.dataset_name, item_id__in=[npr.item_id for npr in new])
+                       .values_list('item_id', 'id'))
+            for npr in new:
+                npr.pk = ids[npr.item_id]
+        if anonymous:
+            NPR.objects.bulk_create(anonymous)
+        self.stats['nprs'] += len(changed) + len(new) + len(anonymous)
+
+        # Toponyms, deduplicated on (toponym, language, is_romanised)
+        toponym_keys = {(d['toponym'], d.get('language'), d.get('is_romanised', False))
+                        for _, d in name_rows if 'toponym' in d}
+        toponyms = {}
+
+        def fetch_toponyms(keys):
+            for t in Toponym.objects.filter(toponym__in={k[0] for k in keys}).order_by('id'):
+                key = (t.toponym, t.language, t.is_romanised)
+                if key in keys:
+                    toponyms.setdefault(key, t)
+
+        if toponym_keys:
+            fetch_toponyms(toponym_keys)
+            missing = toponym_keys - set(toponyms)
+            if missing:
+                Toponym.objects.bulk_create([Toponym(toponym=t, language=l, is_romanised=r) for t, l, r in missing],
+                                            ignore_conflicts=True)
+                fetch_toponyms(missing)
+                self.stats['toponyms'] += len(missing)
+
+        # ToponymLookups and Attestations
+        lookups = {}
+        attestation_rows = []
+        for key, name_data in name_rows:
+            toponym = None
+            if 'toponym' in name_data:
+                toponym = toponyms[(name_data.pop('toponym'), name_data.pop('language', None),
+                                    name_data.pop('is_romanised', False))]
+                source_toponym_id = name_data.get('source_toponym_id', None)
+                lookups.setdefault((toponym.pk, source_toponym_id),
+                                   ToponymLookup(toponym=toponym, source_toponym_id=source_toponym_id))
+            if key is not None:
+                attestation_rows.append((nprs[key], {**name_data, 'source': self.dataset_name, 'toponym': toponym}))
+        if lookups:
+            ToponymLookup.objects.bulk_create(list(lookups.values()), ignore_conflicts=True)
+            self.stats['lookups'] += len(lookups)
+
+        source_toponym_ids = {d['source_toponym_id'] for _, d in attestation_rows if d.get('source_toponym_id')}
+        matched = {}
+        for attestation in Attestation.objects.filter(source_toponym_id__in=source_toponym_ids).order_by('id'):
+            matched.setdefault(attestation.source_toponym_id, attestation)
+        existing = set(matched)
+        updated_fields = set()
+        new_attestations = []
+        for npr, data in attestation_rows:
+            source_toponym_id = data.get('source_toponym_id')
+            attestation = matched.get(source_toponym_id) if source_toponym_id else None
+            if attestation:
+                for field, value in data.items():
+                    setattr(attestation, field, value)
+                if source_toponym_id in existing:
+                    updated_fields.update(data)
+            else:
+                attestation = Attestation(npr=npr, **data)
+                new_attestations.append(attestation)
+                if source_toponym_id:
+                    matched[source_toponym_id] = attestation
+        if updated_fields:
+            Attestation.objects.bulk_update([matched[k] for k in existing], fields=sorted(updated_fields))
+        if new_attestations:
+            Attestation.objects.bulk_create(new_attestations, ignore_conflicts=True)
+        self.stats['attestations'] += len(new_attestations)
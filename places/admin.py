@@ -1,9 +1,25 @@
 # places.admin
 
 from django.contrib import admin
+from datasets.models import DatasetStats
 from .models import *
 
 
+class StatsOnDeleteMixin:
+    """
+    Marks dataset stats stale on deletes; these models have no post_delete receivers
+    (see datasets.signals)
+    """
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        DatasetStats.mark_stale(['places'], dataset__places__id=obj.place_id)
+
+    def delete_queryset(self, request, queryset):
+        place_ids = list(queryset.order_by().values_list('place_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        DatasetStats.mark_stale(['places'], dataset__places__id__in=place_ids)
+
+
 # appear in admin
 class PlaceAdmin(admin.ModelAdmin):
     list_display = ('id', 'dataset', 'title', 'ccodes', 'src_id')
@@ -21,21 +37,21 @@ class SourceAdmin(admin.ModelAdmin):
 admin.site.register(Source, SourceAdmin)
 
 
-class PlaceLinkAdmin(admin.ModelAdmin):
+class PlaceLinkAdmin(StatsOnDeleteMixin, admin.ModelAdmin):
     list_display = ('place_id', 'jsonb')
 
 
 admin.site.register(PlaceLink, PlaceLinkAdmin)
 
 
-class PlaceNameAdmin(admin.ModelAdmin):
+class PlaceNameAdmin(StatsOnDeleteMixin, admin.ModelAdmin):
     list_display = ('place_id', 'jsonb')
 
 
 admin.site.register(PlaceName, PlaceNameAdmin)
 
 
-class PlaceTypeAdmin(admin.ModelAdmin):
+class PlaceTypeAdmin(StatsOnDeleteMixin, admin.ModelAdmin):
     list_display = ('place_id', 'jsonb')
 
 
@@ -48,7 +64,12 @@ class PlaceGeomAdmin(admin.ModelAdmin):
 
 admin.site.register(PlaceGeom, PlaceGeomAdmin)
 
-admin.site.register(PlaceWhen)
+
+class PlaceWhenAdmin(StatsOnDeleteMixin, admin.ModelAdmin):
+    pass
+
+
+admin.site.register(PlaceWhen, PlaceWhenAdmin)
 admin.site.register(PlaceRelated)
 admin.site.register(PlaceDescription)
 admin.site.register(PlaceDepiction)
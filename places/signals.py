@@ -1,5 +1,5 @@
 from django.apps import apps
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
 
 import logging
@@ -37,3 +37,21 @@ def handle_index_change(sender, instance, **kwargs):
         # instance.idx_pub = False
         # Note: There's no need to save the instance here since the save operation is already in progress.
         # The pre_save signal is just used to perform some action before the actual save happens.
+
+
+# Cached place popups (api.place_cache) hold each place's names, types, links etc. Only saves
+# are received: post_delete receivers would stop these rows being deleted in bulk, so code
+# deleting them then saves the place or calls utils.mapdata.places_changed_in_bulk (places
+# and geometries are handled by utils.mapdata.handle_mapdata_change).
+@receiver(post_save, sender=apps.get_model('places', 'PlaceName'))
+@receiver(post_save, sender=apps.get_model('places', 'PlaceType'))
+@receiver(post_save, sender=apps.get_model('places', 'PlaceLink'))
+@receiver(post_save, sender=apps.get_model('places', 'PlaceRelated'))
+@receiver(post_save, sender=apps.get_model('places', 'PlaceWhen'))
+@receiver(post_save, sender=apps.get_model('places', 'PlaceDescription'))
+@receiver(post_save, sender=apps.get_model('places', 'PlaceDepiction'))
+def drop_cached_place_detail(sender, instance, **kwargs):
+    from django.db import transaction
+    from api.place_cache import drop_place_details
+    place_id = instance.place_id
+    transaction.on_commit(lambda: drop_place_details([place_id]))
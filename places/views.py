@@ -1,3 +1,4 @@
+import json
 import logging
 from collections import Counter
 from datetime import datetime
@@ -12,7 +13,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.gis.db.models.aggregates import Union
 from django.contrib.gis.db.models.functions import Centroid, Envelope
 from django.core.serializers import serialize
-from django.db.models import Q
+from django.db.models import F, Func, IntegerField, OuterRef, Prefetch, Q, Subquery
 from django.http import JsonResponse, HttpResponseRedirect, Http404
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
@@ -28,6 +29,7 @@ from collection.models import Collection
 from datasets.models import Dataset
 from places.models import Place, PlaceGeom
 from places.utils import attribListFromSet
+from traces.models import TraceAnnotation
 from elastic.es_utils import findPortalPlaces, findPortalPIDs
 
 User = get_user_model()
@@ -137,30 +139,35 @@ class PlacePortalView(TemplateView):
         alltitles, allvariants = set(), []
 
         try:
-            qs = Place.objects.filter(id__in=place_ids)
-            if not qs.exists():
+            # primary place first: the one with most links
+            qs = list(portal_places(place_ids))
+            if not qs:
                 raise Http404("No such place found.")
-            qs = sorted(qs, key=lambda place: (place.links.count(), place.id), reverse=True)
 
             collections, annotations, all_geoms = [], [], []
+            attest = {}
+            for place in qs:
+                attest[place.id] = [
+                    t.collection for t in place.active_traces
+                    if t.collection.status == "published" or t.collection.owner_id == user.id
+                ]
+            counts = collection_place_counts({col.id for cols in attest.values() for col in cols})
+
             for place in qs:
                 ds = place.dataset
                 alltitles.add(place.title)
 
                 names = attribListFromSet('names', place.names.all(), exclude_title=place.title)
                 types = attribListFromSet('types', place.types.all())
-                traces = list(place.traces.filter(archived=False))
-                attest_collections = [
-                    t.collection for t in traces
-                    if t.collection.status == "published" or t.collection.owner == user
-                ]
+                traces = place.active_traces
+                attest_collections = attest[place.id]
 
                 annotations += traces
                 collections = list(set(collections + attest_collections))
                 geoms = [geom.jsonb for geom in place.geoms.all()]
                 context['allts'] += list(t for t, _ in groupby(place.timespans)) if place.timespans else []
 
-                record = self._build_record(place, ds, names, types, geoms, attest_collections)
+                record = self._build_record(place, ds, names, types, geoms, attest_collections, counts)
                 allvariants.extend([name.get('label', '') for name in names if name.get('label', '') != place.title])
                 context['payload'].append(record)
                 all_geoms.extend(geoms)
@@ -185,7 +192,7 @@ class PlacePortalView(TemplateView):
 
         return context
 
-    def _build_record(self, place, ds, names, types, geoms, attest_collections):
+    def _build_record(self, place, ds, names, types, geoms, attest_collections, collection_counts):
         return {
             "dataset": {
                 "id": ds.id, "label": ds.label, "title": ds.title,
@@ -201,7 +208,7 @@ class PlacePortalView(TemplateView):
             "types": types,
             "geom": geoms,
             "related": [rel.jsonb for rel in place.related.all()],
-            "links": [link.jsonb for link in place.links.distinct('jsonb') if not link.jsonb['identifier'].startswith('whg')],
+            "links": [link.jsonb for link in distinct_links(place) if not link.jsonb['identifier'].startswith('whg')],
             "descriptions": [descr.jsonb for descr in place.descriptions.all()],
             "depictions": [depict.jsonb for depict in place.depictions.all()],
             "minmax": place.minmax,
@@ -210,16 +217,57 @@ class PlacePortalView(TemplateView):
                 "class": col.collection_class, "id": col.id,
                 "url": reverse('collection:place-collection-browse', args=[col.id]),
                 "title": col.title, "description": col.description,
-                "count": col.places_all.aggregate(place_count=Count('id'))['place_count']
+                "count": collection_counts.get(col.id, 0)
             } for col in attest_collections],
             "notes": [{
-                'id': comment.id, 'user': comment.user.id,
-                'place_id': comment.place_id.id, 'tag': comment.tag,
+                'id': comment.id, 'user': comment.user_id,
+                'place_id': comment.place_id_id, 'tag': comment.tag,
                 'note': comment.note, 'created': comment.created.isoformat()
-            } for comment in Comment.objects.filter(place_id_id=place.id)]
+            } for comment in place.portal_comments]
         }
 
 
+def portal_places(place_ids):
+    """
+    Places of a portal, most-linked first, with everything the portal shows loaded in a
+    fixed number of queries: places, one per prefetched relation, active traces, comments
+    """
+    return Place.objects.filter(id__in=place_ids) \
+        .select_related('dataset', 'dataset__owner') \
+        .annotate(link_count=Count('links', distinct=True)) \
+        .prefetch_related(
+            'names', 'types', 'geoms', 'related', 'links', 'descriptions', 'depictions',
+            Prefetch('traces', queryset=TraceAnnotation.objects.filter(archived=False)
+                     .select_related('collection').order_by('id'), to_attr='active_traces'),
+            Prefetch('comment_set', queryset=Comment.objects.order_by('id'), to_attr='portal_comments'),
+        ) \
+        .order_by('-link_count', '-id')
+
+
+def collection_place_counts(collection_ids):
+    """{collection id: number of places in Collection.places_all}, in one query"""
+    if not collection_ids:
+        return {}
+    places = Place.objects.filter(
+        Q(dataset__colldataset__collection=OuterRef('pk')) | Q(annos__collection=OuterRef('pk'))
+    ).order_by().annotate(
+        count=Func(F('id'), function='COUNT', template='%(function)s(DISTINCT %(expressions)s)')
+    ).values('count')
+    return dict(Collection.objects.filter(id__in=collection_ids)
+                .annotate(place_count=Subquery(places, output_field=IntegerField()))
+                .values_list('id', 'place_count'))
+
+
+def distinct_links(place):
+    """Links with distinct jsonb, as links.distinct('jsonb') but from the prefetched links"""
+    seen = set()
+    for link in place.links.all():
+        key = json.dumps(link.jsonb, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            yield link
+
+
 class PlaceFullView(PlacePortalView):
     def render_to_response(self, context, **response_kwargs):
         return JsonResponse(context, **response_kwargs)
@@ -0,0 +1,207 @@
+from copy import deepcopy
+from unittest.mock import MagicMock, patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import TestCase, override_settings
+from django_celery_results.models import TaskResult
+
+from datasets.accession import (APPLY_LOCK, IndexState, apply_queued_decisions, plan_match,
+                                plan_multi_match, plan_parent)
+from datasets.models import Dataset, Hit, IndexDecision
+from places.models import Place
+
+User = get_user_model()
+
+
+def bulk_results(ok=True, requests=None):
+    """
+    streaming_bulk stand-in: one result per action, all succeeding or all failing;
+    the actions of each request are appended to `requests`
+    """
+    def results(es, actions, **kwargs):
+        actions = list(actions)
+        if requests is not None:
+            requests.append(actions)
+        return [(ok, {action['_op_type']: {'_id': action['_id'], 'status': 200 if ok else 400,
+                                           'error': None if ok else 'mapper_parsing_exception'}})
+                for action in actions]
+    return results
+
+
+class AccessionTestBase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='accession', email='accession@example.com', password='pass')
+        cls.task = TaskResult.objects.create(task_id='accession-task', task_name='align_idx')
+        cls.dataset = Dataset.objects.create(
+            owner=cls.user, label='accession_ds', title='Accession dataset', description='Places to accession',
+            uri_base='https://whgazetteer.org/api/db/?id=', ds_status='indexed')
+        cls.place, cls.winner, cls.demoted, cls.kid = [
+            Place.objects.create(title=title, src_id=title.lower(), dataset=cls.dataset, ccodes=['BR'],
+                                 indexed=True, review_whg=1)
+            for title in ('New', 'Winner', 'Demoted', 'Kid')]
+
+    def decision(self, place, matches, **kwargs):
+        return IndexDecision.objects.create(key=f'{self.task.task_id}:{place.id}', place=place, task=self.task,
+                                            user=self.user, matches=matches, **kwargs)
+
+    def index_state(self):
+        """whg index with Winner (500) and Demoted (600) as parents, Kid a child of Demoted"""
+        state = IndexState(MagicMock(), 'test_index')
+        state._add({'_id': '500', '_source': {'place_id': self.winner.id, 'whg_id': 500, 'relation': {'name': 'parent'},
+                                              'children': [], 'searchy': ['Winner']}})
+        state._add({'_id': '600', '_source': {'place_id': self.demoted.id, 'whg_id': 600,
+                                              'relation': {'name': 'parent'}, 'children': [self.kid.id],
+                                              'searchy': ['Demoted']}})
+        state._add({'_id': str(self.kid.id), '_routing': '1',
+                    '_source': {'place_id': self.kid.id, 'relation': {'name': 'child', 'parent': 600}}})
+        return state
+
+    def multi_matches(self):
+        return [{'whg_id': 500, 'pid': self.winner.id, 'score': 30, 'links': 1},
+                {'whg_id': 600, 'pid': self.demoted.id, 'score': 20, 'links': 0}]
+
+
+# ./manage.py test tests.test_accession
+class PlanTest(AccessionTestBase):
+    """Planned index writes of each kind of decision"""
+
+    def test_parent_gets_a_new_whg_id_kept_for_retries(self):
+        state = self.index_state()
+        state.next_whg_id = 701
+        decision = self.decision(self.place, [])
+        plan_parent(state, decision)
+        self.assertEqual(state.writes, {'701': 'index'})
+        self.assertEqual(state.source('701')['relation'], {'name': 'parent'})
+        self.assertEqual(IndexDecision.objects.get(id=decision.id).whg_id, 701)
+
+        # a retry writes the same document
+        retry_state = self.index_state()
+        plan_parent(retry_state, decision)
+        self.assertEqual(list(retry_state.writes), ['701'])
+        self.assertIsNone(retry_state.next_whg_id)
+
+    def test_parent_already_indexed_is_not_written(self):
+        state = self.index_state()
+        plan_parent(state, self.decision(self.winner, []))
+        self.assertEqual(state.writes, {})
+
+    def test_match_to_parent_and_to_child(self):
+        for hit, parent in ((self.winner, '500'), (self.kid, 600)):
+            with self.subTest(hit=hit.title):
+                state = self.index_state()
+                state._add({'_id': str(self.place.id), '_source': {'place_id': self.place.id,
+                                                                  'relation': {'name': 'parent'}}})
+                plan_match(state, self.decision(self.place, [{'whg_id': None, 'pid': hit.id, 'score': 10}]))
+                self.assertEqual(state.writes, {str(self.place.id): 'index'})
+                self.assertEqual(state.source(self.place.id)['relation'], {'name': 'child', 'parent': parent})
+                self.assertEqual(state.docs[str(self.place.id)]['_routing'], 1)
+                IndexDecision.objects.all().delete()
+
+    def test_match_of_place_not_yet_indexed_makes_a_parent(self):
+        state = self.index_state()
+        state.next_whg_id = 701
+        plan_match(state, self.decision(self.place, [{'whg_id': 500, 'pid': self.winner.id, 'score': 10}]))
+        self.assertEqual(state.source('701')['relation'], {'name': 'parent'})
+
+    def test_multi_match_demotes_others_to_winner(self):
+        state = self.index_state()
+        pairs = plan_multi_match(state, self.decision(self.place, self.multi_matches()))
+
+        self.assertEqual(state.writes, {str(self.place.id): 'index', '600': 'reindex', '500': 'index',
+                                        str(self.kid.id): 'index'})
+        winner = state.source('500')
+        self.assertEqual(winner['children'], [str(self.place.id), str(self.demoted.id), str(self.kid.id)])
+        self.assertEqual(winner['searchy'], ['Winner', 'New', 'Demoted'])
+        demoted = state.source('600')
+        self.assertEqual(demoted['relation'], {'name': 'child', 'parent': 500})
+        self.assertEqual((demoted['children'], 'whg_id' in demoted), ([], False))
+        self.assertEqual(state.source(self.kid.id)['relation'], {'name': 'child', 'parent': 500})
+        self.assertEqual(state.source(self.place.id)['relation'], {'name': 'child', 'parent': 500})
+        self.assertEqual(pairs, [(self.place.id, self.winner.id), (self.demoted.id, self.winner.id),
+                                 (self.kid.id, self.winner.id)])
+        # a demoted parent is deleted with its old routing, then indexed as a child
+        actions = list(state.actions({'600': None}))
+        self.assertEqual(actions[1], {'_op_type': 'delete', '_index': 'test_index', '_id': '600', 'routing': None})
+        self.assertEqual(actions[2]['routing'], 1)
+
+    def test_multi_match_applied_twice_leaves_winner_unchanged(self):
+        state = self.index_state()
+        decision = self.decision(self.place, self.multi_matches())
+        plan_multi_match(state, decision)
+        winner = deepcopy(state.source('500'))
+        plan_multi_match(state, decision)
+        self.assertEqual(state.source('500'), winner)
+
+    def test_multi_match_without_winner_document_fails(self):
+        state = IndexState(MagicMock(), 'test_index')
+        with self.assertRaises(LookupError):
+            plan_multi_match(state, self.decision(self.place, self.multi_matches()))
+
+
+@override_settings(INDEX_DECISION_MAX_ATTEMPTS=2)
+class DrainTest(AccessionTestBase):
+    """apply_queued_decisions(): draining the queue under the advisory lock"""
+
+    def setUp(self):
+        self.es = MagicMock()
+        self.es.search.return_value = {'hits': {'hits': []}}
+        self.es.mget.return_value = {'docs': []}
+        es_patch = patch.object(settings, 'ES_CONN', self.es)
+        es_patch.start()
+        self.addCleanup(es_patch.stop)
+        reschedule_patch = patch('datasets.tasks.apply_index_decisions')
+        self.reschedule = reschedule_patch.start()
+        self.addCleanup(reschedule_patch.stop)
+
+    def test_drains_queue_in_batches(self):
+        places = [self.place, self.winner, self.demoted]
+        for place in places:
+            self.decision(place, [])
+        requests = []
+        with patch('datasets.accession.streaming_bulk', side_effect=bulk_results(requests=requests)):
+            self.assertEqual(apply_queued_decisions(batch_size=2), 3)
+        # oldest first
+        self.assertEqual([[action['_source']['place_id'] for action in actions] for actions in requests],
+                         [[self.place.id, self.winner.id], [self.demoted.id]])
+        self.assertEqual(set(IndexDecision.objects.values_list('status', flat=True)), {'applied'})
+        self.reschedule.apply_async.assert_not_called()
+
+    def test_returns_at_once_while_another_applier_holds_the_lock(self):
+        decision = self.decision(self.place, [])
+        other = connections.create_connection('default')
+        try:
+            with other.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_lock(%s)", [APPLY_LOCK])
+            with patch('datasets.accession.streaming_bulk', side_effect=bulk_results()) as bulk:
+                self.assertEqual(apply_queued_decisions(), 0)
+            bulk.assert_not_called()
+        finally:
+            other.close()
+        self.assertEqual(IndexDecision.objects.get(id=decision.id).status, 'queued')
+
+    def test_failed_write_is_retried(self):
+        decision = self.decision(self.place, [])
+        with patch('datasets.accession.streaming_bulk', side_effect=bulk_results(ok=False)):
+            self.assertEqual(apply_queued_decisions(), 0)
+        decision.refresh_from_db()
+        self.assertEqual((decision.status, decision.attempts), ('queued', 1))
+        self.reschedule.apply_async.assert_called_once_with(countdown=30)
+
+    def test_decision_failing_for_good_returns_place_to_review(self):
+        hit = Hit.objects.create(place=self.place, task_id=self.task.task_id, authority='whg', dataset=self.dataset,
+                                 query_pass='pass1', src_id='new', score=10, authrecord_id='500', reviewed=True)
+        decision = self.decision(self.place, [], attempts=1)
+        with patch('datasets.accession.streaming_bulk', side_effect=bulk_results(ok=False)):
+            apply_queued_decisions()
+        decision.refresh_from_db()
+        self.assertEqual(decision.status, 'failed')
+        self.assertIn(':withdrawn:', decision.key)
+        self.place.refresh_from_db()
+        self.assertEqual((self.place.indexed, self.place.review_whg), (False, 0))
+        hit.refresh_from_db()
+        self.assertFalse(hit.reviewed)
+        self.assertEqual(Dataset.objects.get(id=self.dataset.id).ds_status, 'accessioning')
@@ -0,0 +1,83 @@
+from django.contrib.auth import get_user_model
+from django.contrib.gis.geos import Point
+from django.test import TestCase, RequestFactory
+
+from api.serializers import LPFSerializer, PlaceSerializer, PlaceTableSerializer
+from datasets.models import Dataset
+from places.models import (Place, PlaceName, PlaceType, PlaceGeom, PlaceLink, PlaceWhen,
+                           PlaceRelated, PlaceDescription, PlaceDepiction)
+
+User = get_user_model()
+
+
+# ./manage.py test tests.test_api_queries
+class PlaceSerializerQueryCountTest(TestCase):
+    """Serializing a page of places must take the same number of queries whatever its size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='queries', email='queries@example.com', password='pass')
+        cls.dataset = Dataset.objects.create(
+            owner=cls.user, label='query_count_ds', title='Query count dataset',
+            description='Places for serializer query counts', datatype='place', public=True)
+        for i in range(12):
+            place = Place.objects.create(
+                title=f'Place {i}', src_id=f'qc{i}', dataset=cls.dataset, ccodes=['GB'], fclasses=['P'],
+                minmax=[1800, 1900], timespans=[[1800, 1900]])
+            PlaceName.objects.create(place=place, src_id=place.src_id, toponym=place.title,
+                                     jsonb={'toponym': place.title})
+            PlaceType.objects.create(place=place, src_id=place.src_id, fclass='P',
+                                     jsonb={'label': 'settlement', 'sourceLabel': 'town'})
+            for j in range(2):
+                PlaceGeom.objects.create(place=place, src_id=place.src_id, geom=Point(i, j, srid=4326),
+                                         jsonb={'type': 'Point', 'coordinates': [i, j]})
+            PlaceLink.objects.create(place=place, src_id=place.src_id,
+                                     jsonb={'type': 'closeMatch', 'identifier': f'wd:Q{i}'})
+            PlaceWhen.objects.create(place=place, src_id=place.src_id, minmax=[1800, 1900],
+                                     jsonb={'timespans': [{'start': {'in': 1800}, 'end': {'in': 1900}}]})
+            PlaceRelated.objects.create(place=place, src_id=place.src_id,
+                                        jsonb={'relationType': 'gvp:broaderPartitive', 'label': 'England'})
+            PlaceDescription.objects.create(place=place, src_id=place.src_id,
+                                            jsonb={'value': f'Description of place {i}'})
+            PlaceDepiction.objects.create(place=place, src_id=place.src_id,
+                                          jsonb={'@id': f'https://example.com/{i}.png'})
+
+    def setUp(self):
+        self.request = RequestFactory().get('/api/places/')
+        self.queryset = Place.objects.filter(dataset=self.dataset).order_by('id')
+
+    def serialize(self, serializer_class, page_size):
+        page = serializer_class.setup_eager_loading(self.queryset)[:page_size]
+        return serializer_class(page, many=True, context={'request': self.request}).data
+
+    def test_lpf_serializer_queries_do_not_grow_with_page_size(self):
+        # places + dataset, then one query for each of the 7 prefetched relations
+        for page_size in (2, 10):
+            with self.subTest(page_size=page_size), self.assertNumQueries(8):
+                data = self.serialize(LPFSerializer, page_size)
+            self.assertEqual(len(data), page_size)
+            self.assertEqual(data[0]['geometry']['type'], 'GeometryCollection')
+            self.assertEqual(data[0]['properties']['dataset_label'], self.dataset.label)
+
+    def test_place_serializer_queries_do_not_grow_with_page_size(self):
+        for page_size in (2, 10):
+            with self.subTest(page_size=page_size), self.assertNumQueries(9):
+                data = self.serialize(PlaceSerializer, page_size)
+            self.assertEqual(len(data), page_size)
+            self.assertEqual(len(data[0]['geoms']), 2)
+            self.assertEqual(data[0]['dataset'], self.dataset.title)
+
+    def test_prefetched_extent_matches_database_extent(self):
+        place = PlaceSerializer.setup_eager_loading(self.queryset)[1]
+        serializer = PlaceSerializer(context={'request': self.request})
+        self.assertEqual(tuple(serializer.get_extent(place)), tuple(Place.objects.get(pk=place.pk).extent))
+
+    def test_place_table_serializer_queries_do_not_grow_with_page_size(self):
+        # annotated places + dataset + owner, prefetched annos, dataset place count
+        for page_size in (2, 10):
+            with self.subTest(page_size=page_size), self.assertNumQueries(3):
+                data = self.serialize(PlaceTableSerializer, page_size)
+            self.assertEqual(len(data), page_size)
+            self.assertIn('geo_point', data[0]['geo'])
+            self.assertEqual(data[0]['revwd'], '<i>no hits</i>')
+            self.assertEqual(data[0]['dataset']['place_count'], 12)
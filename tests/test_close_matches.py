@@ -1,26 +1,23 @@
 from unittest.mock import patch, MagicMock
 from django.test import TestCase
 from places.models import Place, CloseMatch
-from datasets.models import Dataset
-from datasets.tasks import maxID
-from datasets.views import indexMatch
+from datasets.accession import apply_queued_decisions
+from datasets.models import Dataset, IndexDecision
 from django_celery_results.models import TaskResult
 from django.conf import settings
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
-class IndexMatchTestCase(TestCase):
 
-    @classmethod
-    def setUpClass(cls):
-        super().setUpClass()
-        # Mock the Elasticsearch settings once for all tests
-        settings.ES_CONN = MagicMock()
-        settings.ES_WHG = 'test_index'
+def bulk_ok(es, actions, **kwargs):
+    return [(True, {action['_op_type']: {'_id': action['_id'], 'status': 200}}) for action in actions]
+
+
+class IndexMatchTestCase(TestCase):
+    """CloseMatch records written when accession decisions are applied to the index"""
 
     def setUp(self):
-        # Ensure the user is created
         self.user, _ = User.objects.get_or_create(
             username='test_user',
             defaults={
@@ -30,7 +27,7 @@ class IndexMatchTestCase(TestCase):
                 'surname': 'User'
             }
         )
-        self.task = TaskResult.objects.create(task_name='test_task')
+        self.task = TaskResult.objects.create(task_id='close-match-task', task_name='align_idx')
 
         self.test_dataset = Dataset.objects.create(
             title='Test Dataset',
@@ -39,103 +36,53 @@ class IndexMatchTestCase(TestCase):
             description='Test description',
             uri_base='http://example.com'
         )
-
-    def tearDown(self):
-        # Clean up any created objects (if necessary)
-        TaskResult.objects.all().delete()
-        Dataset.objects.all().delete()
-        Place.objects.all().delete()
-        CloseMatch.objects.all().delete()
-        User.objects.all().delete()
-
-    def test_index_match(self):
-        # Create a mock place
-        place = Place.objects.create(
-            src_id='abc123',
-            dataset=self.test_dataset,
-            title='Test Place',
-            ccodes=['BR']
-        )
-        place_id = place.id
-        print(f"Created place with ID: {place_id}")
-
-        # Mock Elasticsearch response for place_id
-        es_response_no_hits = {
-            'hits': {
-                'total': {'value': 0},
-                'hits': []
-            }
-        }
-
-        es_response_hit = {
-            'hits': {
-                'total': {'value': 1},
-                'hits': [{
-                    '_id': '1001',
-                    '_source': {
-                        'relation': {'name': 'parent'},
-                        'place_id': 1001,
-                        'children': []
-                    }
-                }]
-            }
+        self.place, self.winner, self.other = [
+            Place.objects.create(src_id=src_id, dataset=self.test_dataset, title=src_id, ccodes=['BR'])
+            for src_id in ('abc123', 'def456', 'ghi789')
+        ]
+
+        # index: winner and other are parents
+        docs = {
+            '1001': {'place_id': self.winner.id, 'whg_id': 1001, 'relation': {'name': 'parent'},
+                     'children': [], 'searchy': []},
+            '1002': {'place_id': self.other.id, 'whg_id': 1002, 'relation': {'name': 'parent'},
+                     'children': [], 'searchy': []},
         }
 
-        # Mock the maxID function
-        def mock_maxID(es, idx):
-            return 1000
-
-        # Correct the way the mock values are returned
-        def mock_search(index, body):
-            print(f"Mock search query: {body}")
-            if body['query']['bool']['must'][0]['match'].get('place_id') == place_id:
-                return es_response_no_hits
-            elif body['query']['bool']['must'][0]['match'].get('place_id') == 1001:
-                return es_response_hit
-            return es_response_no_hits
-
-        # Mock the necessary functions
-        with patch('datasets.views.es.search', side_effect=mock_search), \
-             patch('datasets.tasks.maxID', side_effect=mock_maxID), \
-             patch('datasets.views.es.index', return_value={'result': 'created'}), \
-             patch('datasets.views.es.update_by_query', return_value={'updated': 1}):
-
-            # Test case: No match found, create new parent
-            indexMatch(place_id, user=self.user, task=self.task)
-
-            # Check that the Place object has been indexed as a parent
-            self.assertTrue(Place.objects.filter(id=place_id).exists())
-
-            # Check that no CloseMatch records have been created
-            self.assertEqual(CloseMatch.objects.filter(place_a_id=place_id).count(), 0)
-
-            # Test case: Match found, create new child and update parent
-            another_place = Place.objects.create(
-                src_id='def456',
-                dataset=self.test_dataset,
-                title='Another Place',
-                ccodes=['BR']
-            )
-            another_place_id = another_place.id
-            print(f"Created another place with ID: {another_place_id}")
-
-            # Call indexMatch with the correct hit_pid
-            indexMatch(another_place_id, hit_pid=1001, user=self.user, task=self.task)
-
-            # Check that the Place object has been indexed as a child
-            self.assertTrue(Place.objects.filter(id=another_place_id).exists())
-
-            # Debug: Print all CloseMatch records
-            close_matches = CloseMatch.objects.all()
-            for match in close_matches:
-                print(f"CloseMatch: place_a_id={match.place_a_id}, place_b_id={match.place_b_id}")
-
-            # Check that the CloseMatch record has been created
-            self.assertTrue(CloseMatch.objects.filter(place_a_id=1001, place_b_id=another_place_id).exists())
-
-    print('All tests passed!')
-
-# To run the tests
-if __name__ == '__main__':
-    from django.core.management import call_command
-    call_command('test', __name__)
+        def search(index, query=None, size=None, body=None):
+            place_ids = query['terms']['place_id'] if query else []
+            return {'hits': {'hits': [{'_id': _id, '_source': src} for _id, src in docs.items()
+                                      if src['place_id'] in place_ids]}}
+
+        def mget(index, ids):
+            return {'docs': [{'_id': _id, '_source': docs[_id], 'found': True} for _id in ids if _id in docs]}
+
+        es = MagicMock()
+        es.search.side_effect = search
+        es.mget.side_effect = mget
+        for p in (patch.object(settings, 'ES_CONN', es), patch('datasets.accession.streaming_bulk', bulk_ok),
+                  patch('datasets.tasks.apply_index_decisions')):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def decide(self, matches):
+        IndexDecision.objects.create(key=f'{self.task.task_id}:{self.place.id}', place=self.place,
+                                     task=self.task, user=self.user, matches=matches)
+        self.assertEqual(apply_queued_decisions(), 1)
+
+    def test_single_match_records_none(self):
+        self.decide([{'whg_id': 1001, 'pid': self.winner.id, 'score': 30, 'links': 0}])
+        self.assertEqual(CloseMatch.objects.count(), 0)
+
+    def test_multi_match(self):
+        CloseMatch.objects.create(place_a_id=min(self.other.id, self.winner.id),
+                                  place_b_id=max(self.other.id, self.winner.id),
+                                  created_by=self.user, task=self.task, basis='reviewed')
+        self.decide([{'whg_id': 1001, 'pid': self.winner.id, 'score': 30, 'links': 0},
+                     {'whg_id': 1002, 'pid': self.other.id, 'score': 20, 'links': 0}])
+
+        # the new place and the demoted parent are both close matches of the winner, recorded once
+        pairs = set(CloseMatch.objects.values_list('place_a_id', 'place_b_id'))
+        self.assertEqual(pairs, {tuple(sorted((self.place.id, self.winner.id))),
+                                 tuple(sorted((self.other.id, self.winner.id)))})
+        self.assertEqual(CloseMatch.objects.count(), 2)
@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from validation.feature_index import feature_offsets, feature_shards, read_feature_shard
+
+
+def feature(i, name):
+    return {"@id": f"https://example.com/{i}", "type": "Feature",
+            "properties": {"title": name, "features": [{"not": "a feature"}]},
+            "geometry": {"type": "Point", "coordinates": [i, i]},
+            "names": [{"toponym": name}]}
+
+
+# ./manage.py test tests.test_feature_index
+class FeatureIndexTest(SimpleTestCase):
+    """Byte offsets and shards of the features of an LPF file"""
+
+    def setUp(self):
+        names = ['Köln', '東京', 'Zürich "Limmat"', 'a\\b {[', 'Ἀθῆναι', 'plain']
+        self.features = [feature(i, name) for i, name in enumerate(names)]
+        collection = {
+            "type": "FeatureCollection",
+            "@context": "https://raw.githubusercontent.com/LinkedPasts/linked-places/master/linkedplaces-context-v1.1.jsonld",
+            "citation": {"title": "Über [features]", "features": ["not", "these"]},
+            "features": self.features,
+        }
+        handle, self.path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(handle, 'w', encoding='utf-8') as file:
+            # unescaped, so offsets must count the bytes of multi-byte characters
+            json.dump(collection, file, ensure_ascii=False, indent=2)
+        with open(self.path, 'rb') as file:
+            self.data = file.read()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_offsets_are_byte_ranges_of_features(self):
+        offsets = list(feature_offsets(self.path))
+        self.assertEqual(len(offsets), len(self.features))
+        for (start, end), expected in zip(offsets, self.features):
+            self.assertEqual(json.loads(self.data[start:end].decode('utf-8')), expected)
+
+    def test_small_read_size_gives_same_offsets(self):
+        # structure split across reads
+        from validation import feature_index
+        expected = list(feature_offsets(self.path))
+        read_size = feature_index.READ_SIZE
+        feature_index.READ_SIZE = 7
+        try:
+            self.assertEqual(list(feature_offsets(self.path)), expected)
+        finally:
+            feature_index.READ_SIZE = read_size
+
+    def test_shards_cover_features_in_order_within_size(self):
+        offsets = list(feature_offsets(self.path))
+        max_bytes = (offsets[1][1] - offsets[0][0]) + 1  # room for two features
+        shards = list(feature_shards(self.path, max_bytes=max_bytes))
+        self.assertGreater(len(shards), 1)
+        features = []
+        for shard in shards:
+            self.assertTrue(shard['end'] - shard['start'] <= max_bytes or shard['count'] == 1)
+            features.extend(read_feature_shard(shard))
+        self.assertEqual(features, self.features)
+        self.assertEqual([s['start'] for s in shards], [offsets[sum(s['count'] for s in shards[:i])][0]
+                                                        for i in range(len(shards))])
+
+    def test_feature_larger_than_shard_has_its_own_shard(self):
+        shards = list(feature_shards(self.path, max_bytes=1))
+        self.assertEqual([s['count'] for s in shards], [1] * len(self.features))
+        self.assertEqual([read_feature_shard(s)[0] for s in shards], self.features)
+
+    def test_one_shard_when_all_fit(self):
+        shard, = feature_shards(self.path, max_bytes=len(self.data))
+        self.assertEqual(shard['count'], len(self.features))
+        self.assertEqual(read_feature_shard(shard), self.features)
+
+    def test_shard_count_mismatch_is_an_error(self):
+        shard, = feature_shards(self.path, max_bytes=len(self.data))
+        with self.assertRaises(ValueError):
+            read_feature_shard(dict(shard, count=shard['count'] + 1))
+
+    def test_missing_features_array_is_an_error(self):
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump({"type": "FeatureCollection", "items": [{"features": []}]}, file)
+        with self.assertRaises(ValueError):
+            list(feature_offsets(self.path))
@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.gis.geos import Point
+from django.test import TestCase, RequestFactory
+
+from collection.models import Collection, CollPlace
+from datasets.models import Dataset
+from main.models import Comment
+from places.models import (Place, PlaceName, PlaceType, PlaceGeom, PlaceLink, PlaceRelated,
+                           PlaceDescription, PlaceDepiction)
+from places.views import PlacePortalView
+from traces.models import TraceAnnotation
+
+User = get_user_model()
+
+
+# ./manage.py test tests.test_portal_queries
+class PlacePortalQueryCountTest(TestCase):
+    """Portal data must take the same number of queries however many places it shows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='portal', email='portal@example.com', password='pass')
+        cls.dataset = Dataset.objects.create(
+            owner=cls.user, label='portal_ds', title='Portal dataset', description='Places for portal queries',
+            datatype='place', public=True, uri_base='https://whgazetteer.org/api/db/?id=')
+        cls.collection = Collection.objects.create(
+            owner=cls.user, title='Portal collection', description='Attesting collection',
+            collection_class='place', status='published')
+        cls.place_ids = []
+        for i in range(12):
+            place = Place.objects.create(
+                title=f'Place {i}', src_id=f'portal{i}', dataset=cls.dataset, ccodes=['GB'], fclasses=['P'],
+                minmax=[1800, 1900], timespans=[[1800, 1900]])
+            cls.place_ids.append(place.id)
+            PlaceName.objects.create(place=place, src_id=place.src_id, toponym=f'Variant {i}',
+                                     jsonb={'toponym': f'Variant {i}'})
+            PlaceType.objects.create(place=place, src_id=place.src_id, fclass='P',
+                                     jsonb={'label': 'settlement', 'sourceLabel': 'town'})
+            PlaceGeom.objects.create(place=place, src_id=place.src_id, geom=Point(i, i, srid=4326),
+                                     jsonb={'type': 'Point', 'coordinates': [i, i]})
+            # place 11 has most links, so comes first
+            for j in range(1 + i % 3 + (i == 11)):
+                PlaceLink.objects.create(place=place, src_id=place.src_id,
+                                         jsonb={'type': 'closeMatch', 'identifier': f'wd:Q{i}{j}'})
+            if i == 11:
+                # same link twice, shown once
+                PlaceLink.objects.create(place=place, src_id=place.src_id,
+                                         jsonb={'type': 'closeMatch', 'identifier': 'wd:Q110'})
+            PlaceRelated.objects.create(place=place, src_id=place.src_id,
+                                        jsonb={'relationType': 'gvp:broaderPartitive', 'label': 'England'})
+            PlaceDescription.objects.create(place=place, src_id=place.src_id,
+                                            jsonb={'value': f'Description of place {i}'})
+            PlaceDepiction.objects.create(place=place, src_id=place.src_id,
+                                          jsonb={'@id': f'https://example.com/{i}.png'})
+            CollPlace.objects.create(collection=cls.collection, place=place, sequence=i)
+            TraceAnnotation.objects.create(collection=cls.collection, place=place, owner=cls.user,
+                                           note=f'Trace {i}', archived=False)
+            Comment.objects.create(user=cls.user, place_id=place, note=f'Comment {i}')
+
+    def portal_data(self, place_ids):
+        view = PlacePortalView()
+        view.request = RequestFactory().get('/places/portal/')
+        return view._get_portal_data(place_ids, AnonymousUser())
+
+    def test_portal_queries_do_not_grow_with_place_count(self):
+        # places, 7 prefetched relations, traces, comments, collection counts, geometry union
+        for count in (2, 12):
+            with self.subTest(count=count), self.assertNumQueries(12):
+                data = self.portal_data(self.place_ids[:count])
+            self.assertEqual(len(data['payload']), count)
+            self.assertEqual(len(data['annotations']), count)
+
+    def test_portal_payload(self):
+        data = self.portal_data(self.place_ids)
+        primary = data['payload'][0]
+        self.assertEqual(primary['place_id'], self.place_ids[11])
+        self.assertEqual(len(primary['links']), 4)
+        self.assertEqual(len({link['identifier'] for link in primary['links']}), 4)
+        self.assertEqual(primary['collections'][0]['count'], 12)
+        self.assertEqual(primary['notes'][0]['note'], 'Comment 11')
+        self.assertEqual(primary['dataset']['owner'], self.user.name)
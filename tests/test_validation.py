@@ -10,8 +10,10 @@ from datasets.exceptions import DelimValidationError, DelimInsertError, LPFValid
 from datasets.insert import ds_insert_delim
 from datasets.models import Dataset
 from datasets.validation import validate_delim
+from places.models import Place, PlaceGeom, PlaceName, PlaceWhen
+from validation.tasks import validate_batch_geometries
 
-from django.test import TestCase, Client
+from django.test import TestCase, Client, SimpleTestCase
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 # ./manage.py test tests.test_validation.DatasetCreateViewTest
@@ -102,6 +104,35 @@ class DatasetCreateViewTest(TestCase):
                 self.assertTrue(any(expected_error in str(e) for expected_error in expected_errors))
                 print(f'Success: expected error found.')
 
+    def test_ds_insert_delim_bulk(self):
+        for i, (filename, expected_errors) in enumerate(self.insert_test_files):
+            print('processing file (bulk):', filename)
+            df = pd.read_csv(filename, sep='\t')
+            # bulk load is all-or-nothing, so each file gets its own dataset
+            ds = Dataset.objects.create(owner=self.user, label=f'bulk_test_{i}',
+                                        title='Bulk Test', description='Bulk Test Description')
+            try:
+                ds_insert_delim(df, ds.pk, bulk=True)
+            except DelimInsertError as e:
+                self.assertTrue(any(expected_error in str(e) for expected_error in expected_errors))
+                self.assertFalse(Place.objects.filter(dataset=ds.label).exists())
+                print(f'Success: expected error found.')
+
+    def test_ds_insert_delim_bulk_rows(self):
+        df = pd.read_csv('tests/data/valid_file.tsv', sep='\t')
+        counts = ds_insert_delim(df, self.dataset.pk, bulk=True)
+
+        places = Place.objects.filter(dataset=self.dataset.label)
+        self.assertEqual(counts['Place'], 3)
+        self.assertEqual(places.count(), 3)
+        # title + 2 variants each
+        self.assertEqual(PlaceName.objects.filter(place__in=places).count(), 9)
+        self.assertEqual(PlaceWhen.objects.filter(place__in=places).count(), 3)
+        self.assertEqual(PlaceGeom.objects.filter(place__in=places).count(), 3)
+        place = places.get(src_id='717_19')
+        self.assertEqual(place.minmax, [1480, 1491])
+        self.assertEqual(place.ccodes, ['PL'])
+
     # def test_end_to_end(self):
     #     # Define the form data
     #     form_data = {
@@ -126,6 +157,27 @@ class DatasetCreateViewTest(TestCase):
     #     # ... Add more assertions for each expected error message ...
     #
 
+# ./manage.py test tests.test_validation.BatchGeometryTest
+class BatchGeometryTest(SimpleTestCase):
+    def test_collection_with_multi_parts_is_repaired(self):
+        # make_valid gives GEOMETRYCOLLECTION (MULTILINESTRING (...), POINT (9 9))
+        degenerate = {'type': 'MultiPolygon', 'coordinates': [
+            [[[0, 0], [1, 0], [0, 0], [0, 0]]],
+            [[[5, 5], [6, 5], [5, 5], [5, 5]]],
+            [[[9, 9], [9, 9], [9, 9], [9, 9]]],
+        ]}
+        features = [{'type': 'Feature', 'geometry': degenerate},
+                    {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [1, 2]}}]
+        self.assertEqual(validate_batch_geometries(features), [(True, True), (False, True)])
+        self.assertEqual(features[0]['geometry']['type'], 'MultiLineString')
+        self.assertEqual(len(features[0]['geometry']['coordinates']), 2)
+
+    def test_unreadable_geometry_invalidates_only_its_feature(self):
+        features = [{'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [1, 2]}},
+                    {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [[[0, 0]]]}}]
+        self.assertEqual(validate_batch_geometries(features), [(False, True), (False, False)])
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,147 @@
+# download_artifacts.py
+# pre-built download zips of public datasets, keyed by (dataset id, format, data version)
+# built by utils.tasks.build_download_artifacts after a dataset changes, served by utils.tasks.downloader
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+from django.conf import settings
+
+from datasets.models import DatasetStats
+
+logger = logging.getLogger('tasks')
+
+FORMATS = ('lpf', 'tsv')
+EXTENSIONS = {'lpf': 'json', 'tsv': 'tsv'}
+
+
+def artifact_dir(ds_id):
+    return os.path.join(settings.DOWNLOAD_ARTIFACT_DIR, str(ds_id))
+
+
+def download_format(ds, req_format):
+    """The artifact format make_download would produce for a requested format"""
+    return 'tsv' if ds.format == 'delimited' and req_format in ('tsv', 'delimited') else 'lpf'
+
+
+def dataset_formats(ds):
+    return FORMATS if ds.format == 'delimited' else ('lpf',)
+
+
+def data_version(ds):
+    """
+    Changes whenever the content of a download would: the dataset's places version (bumped
+    by every change to its places and their names, types, links, geometries, whens and
+    comments) and a digest of the metadata in its README
+    """
+    places_version = DatasetStats.objects.filter(dataset=ds) \
+                         .values_list('places_version', flat=True).first() or 0
+    metadata = [ds.title, ds.description, ds.webpage, ds.source, ds.creator, ds.uri_base,
+                ds.citation_csl, str(ds.create_date)]
+    digest = hashlib.sha256(json.dumps(metadata, default=str).encode('utf-8')).hexdigest()[:12]
+    return f'{places_version}-{digest}'
+
+
+def data_filename(ds, fmt, version):
+    """Name of the data file inside the zip"""
+    return f'{ds.label}_v{version}.{EXTENSIONS[fmt]}'
+
+
+def artifact_path(ds, fmt, version):
+    return os.path.join(artifact_dir(ds.id), f'{data_filename(ds, fmt, version)}.zip')
+
+
+def current_artifact(ds, fmt, version=None):
+    """Path of the zip for the dataset as it is now, or None if it has not been built"""
+    path = artifact_path(ds, fmt, version or data_version(ds))
+    return path if os.path.exists(path) else None
+
+
+def artifact_url(path):
+    return settings.MEDIA_URL + os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+
+
+def user_copy(path, user_id):
+    """
+    Path of a user's own copy of an artifact, for their download history: it outlives the
+    artifact, which is removed when the dataset changes or is unpublished. Hard-linked where
+    the filesystem allows. None if the artifact has been removed meanwhile.
+    """
+    copy_path = os.path.join(settings.MEDIA_ROOT, 'downloads', f'{user_id}_{os.path.basename(path)}')
+    if os.path.exists(copy_path):
+        return copy_path
+    try:
+        os.link(path, copy_path)
+    except FileExistsError:
+        pass
+    except FileNotFoundError:
+        return None
+    except OSError:
+        # no hard links across filesystems
+        tmp_path = f'{copy_path}.{os.getpid()}.part'
+        try:
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, copy_path)
+        except FileNotFoundError:
+            return None
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return copy_path
+
+
+def remove_stale_artifacts(ds, version, started):
+    """
+    Removes zips of other versions; files written since `started`, by a build running
+    concurrently with this one, are left for that build to clean up
+    """
+    directory = artifact_dir(ds.id)
+    current = {os.path.basename(artifact_path(ds, fmt, version)) for fmt in FORMATS}
+    removed = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name in current:
+            continue
+        try:
+            if os.path.getmtime(path) < started:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    if removed:
+        logger.debug(f'Removed {removed} stale download artifacts of dataset {ds.id}')
+
+
+def build_artifact(ds, fmt, write_zip):
+    """
+    Builds the zip for the current version of `ds` unless it exists, by write_zip(path,
+    data_filename) into a temporary file renamed into place when complete. Returns its path.
+    """
+    started = time.time()
+    version = data_version(ds)
+    path = artifact_path(ds, fmt, version)
+    if not os.path.exists(path):
+        os.makedirs(artifact_dir(ds.id), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.part'
+        try:
+            write_zip(tmp_path, data_filename(ds, fmt, version))
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        logger.info(f'Built {fmt} download of dataset {ds.id}, version {version}')
+    remove_stale_artifacts(ds, version, started)
+    return path
+
+
+def delete_download_artifacts(ds_id):
+    """Removes all stored zips of a dataset; returns True if there were any"""
+    directory = artifact_dir(ds_id)
+    if not os.path.isdir(directory):
+        return False
+    shutil.rmtree(directory, ignore_errors=True)
+    return True
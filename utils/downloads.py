@@ -0,0 +1,285 @@
+# downloads.py
+# streaming builders for dataset and collection download files (LPF json, augmented TSV)
+# used by utils.tasks.make_download; data is written straight into its zip entry, one chunk
+# of places at a time, so memory use does not depend on the size of a dataset or collection
+
+import csv
+import logging
+import os
+import zipfile
+from copy import deepcopy
+
+import pandas as pd
+import simplejson as json
+from django.db.models import OuterRef, Prefetch, Q, Subquery
+
+from collection.models import CollPlace
+from main.models import Comment
+from places.models import PlaceWhen
+from traces.models import TraceAnnotation
+
+logger = logging.getLogger('tasks')
+
+LPF_CONTEXT = "https://raw.githubusercontent.com/LinkedPasts/linked-places/master/linkedplaces-context-v1.1.jsonld"
+CHUNK_SIZE = 1000
+PROGRESS_BYTES = 4 * 1024 * 1024  # report progress every 4MB written
+
+
+class ZipEntryStream:
+    """Text stream into an open zip entry, counting the bytes written"""
+
+    def __init__(self, entry, progress=None):
+        self.entry = entry
+        self.progress = progress
+        self.bytes_written = 0
+        self.items = 0  # features or rows, set by the writer
+        self.reported = 0
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.entry.write(data)
+        self.bytes_written += len(data)
+        if self.progress and self.bytes_written - self.reported >= PROGRESS_BYTES:
+            self.reported = self.bytes_written
+            self.progress(self)
+        return len(text)
+
+
+def write_download_zip(zipname, data_filename, readme, write_data, progress=None):
+    """
+    Writes README.txt and a data file named `data_filename` into zip `zipname`; the data is
+    produced by write_data(stream) as it goes. Returns the data stream, for its counts.
+    """
+    os.makedirs(os.path.dirname(zipname), exist_ok=True)
+    with zipfile.ZipFile(zipname, 'w', allowZip64=True) as zipf:
+        zipf.writestr('README.txt', readme)
+        with zipf.open(data_filename, 'w', force_zip64=True) as entry:
+            stream = ZipEntryStream(entry, progress)
+            write_data(stream)
+    if progress:
+        progress(stream)
+    return stream
+
+
+def blank_nulls(obj):
+    """null values written as "", as downloads always have been"""
+    if obj is None:
+        return ""
+    if isinstance(obj, dict):
+        return {k: blank_nulls(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [blank_nulls(v) for v in obj]
+    return obj
+
+
+def write_feature_collection(stream, header, features):
+    """A FeatureCollection: `header` members, then `features` written one at a time"""
+    head = json.dumps(blank_nulls(header), indent=2)
+    stream.write(head[:-2] + ',\n  "features": [')
+    for i, feature in enumerate(features):
+        body = json.dumps(blank_nulls(feature), indent=2).replace('\n', '\n    ')
+        stream.write(('\n    ' if i == 0 else ',\n    ') + body)
+        stream.items = i + 1
+    stream.write('\n  ]\n}')
+
+
+def keyset_chunks(qs, size=CHUNK_SIZE, keys=('id',)):
+    """
+    Lists of at most `size` objects from `qs` in `keys` order, each chunk selected by
+    the keys of the last object of the one before rather than by OFFSET
+    """
+    qs = qs.order_by(*keys)
+    last = None
+    while True:
+        page = qs
+        if last is not None:
+            # (k1, k2, ...) > (v1, v2, ...), spelled out for the ORM
+            after = Q()
+            for i, key in enumerate(keys):
+                step = Q(**{f'{key}__gt': last[i]})
+                for prior, value in zip(keys[:i], last[:i]):
+                    step &= Q(**{prior: value})
+                after |= step
+            page = qs.filter(after)
+        chunk = list(page[:size])
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < size:
+            return
+        last = [getattr(chunk[-1], key) for key in keys]
+
+
+def feature_geometry(place):
+    geoms = place.geoms.all()
+    if len(geoms) == 1:
+        return geoms[0].jsonb
+    return {"type": "GeometryCollection", "geometries": [g.jsonb for g in geoms]}
+
+
+# ***
+# datasets
+# ***
+def dataset_places(ds):
+    return ds.places.prefetch_related(
+        'geoms', 'names', 'types', 'links',
+        Prefetch('whens', queryset=PlaceWhen.objects.order_by('id')),
+        Prefetch('comment_set', queryset=Comment.objects.select_related('user').order_by('id'), to_attr='comments'),
+    )
+
+
+def dataset_features(ds, chunk_size=CHUNK_SIZE):
+    for chunk in keyset_chunks(dataset_places(ds), chunk_size):
+        for p in chunk:
+            whens = p.whens.all()
+            when = dict(whens[0].jsonb) if whens else {}
+            when.pop("minmax", None)
+            yield {
+                "type": "Feature",
+                "@id": ds.uri_base + (str(p.id) if "whgazetteer" in ds.uri_base else p.src_id),
+                "properties": {
+                    "pid": p.id,
+                    "src_id": p.src_id,
+                    "title": p.title,
+                    "ccodes": p.ccodes,
+                    "comment": [
+                        {
+                            "user": c.user.display_name,
+                            "note": c.note,
+                            "created": c.created.isoformat(),
+                        }
+                        for c in p.comments
+                    ],
+                },
+                "geometry": feature_geometry(p),
+                "names": [n.jsonb for n in p.names.all()],
+                "types": [t.jsonb for t in p.types.all()],
+                "links": [ln.jsonb for ln in p.links.all()],
+                "when": when,
+            }
+
+
+def write_dataset_lpf(stream, ds, filename):
+    citation = ds.citation_csl
+    header = {
+        "type": "FeatureCollection",
+        "@context": LPF_CONTEXT,
+        "citation": json.loads(citation) if citation else {},
+        "filename": "/" + filename,
+        "description": ds.description,
+    }
+    write_feature_collection(stream, header, dataset_features(ds))
+
+
+# ***
+# collections
+# ***
+def collection_features(coll, chunk_size=CHUNK_SIZE):
+    """Features in CollPlace sequence order, unsequenced places last in id order"""
+    qs = coll.places_all.annotate(
+        seq=Subquery(CollPlace.objects.filter(collection=coll, place=OuterRef('pk'))
+                     .order_by('id').values('sequence')[:1])
+    ).prefetch_related(
+        'geoms', 'names', 'types', 'links', 'whens',
+        Prefetch('traces', queryset=TraceAnnotation.objects.filter(collection=coll, archived=False)
+                 .order_by('id'), to_attr='coll_traces'),
+    )
+    chunks = [keyset_chunks(qs.filter(seq__isnull=False), chunk_size, keys=('seq', 'id')),
+              keyset_chunks(qs.filter(seq__isnull=True), chunk_size)]
+    for chunk in (chunk for pages in chunks for chunk in pages):
+        for p in chunk:
+            anno = p.coll_traces[0] if p.coll_traces else None
+            annotation = {
+                "place_id": p.id,
+                "sequence": p.seq,
+                "note": anno.note if anno else "",
+                "relation": anno.relation if anno else [],
+                "start": anno.start if anno else "",
+                "end": anno.end if anno else "",
+                "created": anno.created.strftime("%Y-%m-%d") if anno else "",
+            }
+            yield {
+                "type": "Feature",
+                "properties": {
+                    "id": p.id,
+                    "src_id": p.src_id,
+                    "title": p.title,
+                    "ccodes": p.ccodes,
+                    "annotation": annotation,
+                },
+                "geometry": feature_geometry(p),
+                "names": [n.jsonb for n in p.names.all()],
+                "types": [t.jsonb for t in p.types.all()],
+                "links": [ln.jsonb for ln in p.links.all()],
+                "whens": [w.jsonb for w in p.whens.all()],
+            }
+
+
+def write_collection_lpf(stream, coll, filename):
+    citation = coll.citation_csl
+    header = {
+        "type": "FeatureCollection",
+        "@context": LPF_CONTEXT,
+        "citation": json.loads(citation) if citation else {},
+        "filename": "/" + filename,
+    }
+    write_feature_collection(stream, header, collection_features(coll))
+
+
+# ***
+# augmented TSV: the uploaded delimited file, with matches and geometry filled in
+# ***
+def augmented_row(rowjs, header, missing, place):
+    newrow = deepcopy(rowjs)
+    for m in missing:
+        newrow[m] = ""
+    newrow["matches"] = ";".join(list(set([ln.jsonb["identifier"] for ln in place.links.all()])))
+
+    geoms = place.geoms.all()
+    if geoms:
+        geowkt = newrow.get("geowkt", None)
+        lonlat = (
+            [newrow.get("lon"), newrow.get("lat")]
+            if len(set(newrow.keys()) & {"lon", "lat"}) == 2
+            else None
+        )
+        if not geowkt and (not lonlat or None in lonlat or lonlat[0] == ""):
+            g = geoms[0]
+            newrow["geowkt"] = g.geom.wkt if g.geom else ""
+            xy = g.geom.coords[0] if g.jsonb["type"] == "MultiPoint" else g.jsonb["coordinates"]
+            newrow["lon"] = xy[0]
+            newrow["lat"] = xy[1]
+    return [newrow.get(column) for column in header]
+
+
+def write_augmented_tsv(stream, ds, chunk_size=CHUNK_SIZE):
+    dsf = ds.file
+    delimiter = dsf.delimiter if not dsf.delimiter == 'n/a' else '\t'
+    path = f"media/{dsf.file.name}"
+    columns = list(pd.read_csv(path, delimiter=delimiter, nrows=0, engine='python'))
+    newheader = list(set(columns + ["lon", "lat", "matches", "geo_id", "geo_source", "geowkt"]))
+    missing = list(set(newheader) - set(columns))
+    logger.debug(f"Augmented TSV header: {newheader}; added columns: {missing}")
+
+    writer = csv.writer(stream, delimiter="\t", quotechar="\"", quoting=csv.QUOTE_NONE)
+    writer.writerow(newheader)
+
+    reader = pd.read_csv(path, delimiter=delimiter, dtype={"id": "str", "aat_types": "str"},
+                         engine='python', chunksize=chunk_size)
+    for df in reader:
+        # the places of a chunk of rows, in one query plus one per prefetched relation
+        places = {}
+        for p in ds.places.filter(src_id__in=df["id"].dropna().unique().tolist()) \
+                .prefetch_related('links', 'geoms'):
+            places.setdefault(p.src_id, []).append(p)
+
+        for i, rowjs in zip(df.index, json.loads(df.to_json(orient='records'))):
+            matched = places.get(rowjs.get("id"), [])
+            if len(matched) != 1:
+                logger.error(f"Error processing row index {i}: {len(matched)} places with src_id {rowjs.get('id')}")
+                continue
+            try:
+                writer.writerow(augmented_row(rowjs, newheader, missing, matched[0]))
+                stream.items += 1
+            except Exception as e:
+                logger.error(f"Error processing row index {i}: {e}")
@@ -0,0 +1,23 @@
+# file_cache.py
+# module-level cache of parsed files, reloaded when a file's mtime changes
+
+import os
+import threading
+
+_cache = {}  # path -> (mtime_ns, parsed value)
+_lock = threading.Lock()
+
+
+def cached_file(path, parse):
+    """parse(text) of the file at `path`, reparsed only after the file has changed"""
+    mtime = os.stat(path).st_mtime_ns
+    entry = _cache.get(path)
+    if entry is not None and entry[0] == mtime:
+        return entry[1]
+    with _lock:
+        entry = _cache.get(path)
+        if entry is None or entry[0] != mtime:
+            with open(path, encoding='utf-8') as f:
+                entry = (mtime, parse(f.read()))
+            _cache[path] = entry
+    return entry[1]
@@ -2,7 +2,7 @@ import json
 import logging
 import time
 from collections import defaultdict
-from itertools import chain, islice
+from itertools import chain
 
 import networkx as nx
 import numpy as np
@@ -11,11 +11,11 @@ from django.contrib.gis.db.models.aggregates import Union
 from django.contrib.gis.geos import GeometryCollection, Polygon
 from django.core.cache import cache
 from django.core.cache.backends.filebased import FileBasedCache
+from django.db import transaction
 from django.db.models import Q, Prefetch
 from django.db.models.signals import post_save, post_delete
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
 from django_redis import get_redis_connection
 from shapely.geometry.geo import shape, mapping
 
@@ -26,6 +26,9 @@ from datasets.models import Dataset
 from datasets.utils import compute_dataset_bbox
 from places.models import Place, PlaceGeom, CloseMatch
 from traces.models import TraceAnnotation
+from utils.mapdata_artifacts import (
+    artifact_response, delete_mapdata_artifacts, load_artifact, read_artifact_meta, write_mapdata_artifacts
+)
 
 logger = logging.getLogger('mapdata')
 PENDING_REFRESH_KEY = "mapdata:pending_refresh"
@@ -33,10 +36,14 @@ PENDING_REFRESH_KEY = "mapdata:pending_refresh"
 
 def mapdata(request, category, id, refresh=False, carousel=False):
     try:
-        data = generate_mapdata(category, id, refresh)
-        if carousel:
-            data.pop('table', None)
-        return JsonResponse(data, safe=False, json_dumps_params={'ensure_ascii': False})
+        ds_id = f"{category}_{id}"
+        variant = "carousel" if carousel else "full"
+        meta = mapdata_artifact_meta(category, id, refresh)
+        try:
+            return artifact_response(request, ds_id, meta, variant)
+        except FileNotFoundError:
+            # Superseded by a concurrent regeneration after `meta` was read
+            return artifact_response(request, ds_id, read_artifact_meta(ds_id), variant)
     except Exception as e:
         logger.exception(f"Error generating mapdata for {category}:{id}")
         return JsonResponse({'error': str(e)}, status=500)
@@ -64,13 +71,13 @@ def mark_mapdata_for_refresh(category, id, delay=10):
 
 
 @shared_task
-def refresh_mapdata_cache(category, id):
+def refresh_mapdata_cache(category, id, full=False):
     try:
         redis_client = get_redis_client()
         cache_key = f"{category}_{id}"
         refresh_was_scheduled = redis_client.srem(PENDING_REFRESH_KEY, cache_key)
         if refresh_was_scheduled:
-            generate_mapdata(category, id, refresh=True)
+            regenerate_mapdata(category, id, full=full)
             logger.info(f"Regenerated mapdata for {category}:{id}, and removed from queue")
         else:
             logger.info(f"Mapdata refresh for {category}:{id} was already processed or not scheduled.")
@@ -99,11 +106,13 @@ def delete_mapdata_cache(category, id, refresh=10):
     """
     try:
         cache_key = f"{category}_{id}"
-        had_cache = cache.get(cache_key) is not None
+        had_cache = delete_mapdata_artifacts(cache_key)
+        cache.delete(cache_key)  # payload pickled by earlier versions, if any
+        if category == "datasets":
+            drop_place_fragments(id)
         redis_client = get_redis_client()
 
         if had_cache:
-            cache.delete(cache_key)
             logger.info(f"Mapdata cache deleted for {category}:{id}")
             if isinstance(refresh, int):
                 redis_client.sadd(PENDING_REFRESH_KEY, cache_key)
@@ -124,69 +133,63 @@ def delete_mapdata_cache(category, id, refresh=10):
         return {"status": "error", "category": category, "id": id, "error": str(e)}
 
 
-def generate_mapdata(category, id, refresh=False):
-    # TODO: Fix use of <category>/<id>/refresh/full to bypass geometry reduction in PLACE branch
-
-    maxNoCacheTime = 0.3  # Cache if generation time is greater than this (seconds)
-
-    ds_id = f"{category}_{id}"
+def stored_mapdata_meta(ds_id, refresh=False):
+    """Metadata of the stored payload, unless a refresh is requested or pending"""
     logger.debug(f"Mapdata requested for {ds_id} (refresh={refresh}).")
-
     redis_client = get_redis_client()
     refresh_was_scheduled = redis_client.srem(PENDING_REFRESH_KEY, ds_id)
+    if refresh or refresh_was_scheduled:
+        return None
+    return read_artifact_meta(ds_id)
+
+
+def mapdata_artifact_meta(category, id, refresh=False):
+    """Metadata of the stored (pre-serialized) payload, generating it first if necessary"""
+    meta = stored_mapdata_meta(f"{category}_{id}", refresh)
+    if meta is not None:
+        logger.debug("Found stored mapdata.")
+        return meta
+    return regenerate_mapdata(category, id, full=bool(refresh))[0]
 
-    # Check if cached data exists and return it if found
-    if not refresh and not refresh_was_scheduled:
-        cached_data = cache.get(ds_id)
-        if cached_data is not None:
-            logger.debug("Found cached mapdata.")
-            return cached_data
 
-    cache.delete(ds_id)
+def generate_mapdata(category, id, refresh=False):
+    """Mapdata payload as a dict"""
+    ds_id = f"{category}_{id}"
+    meta = stored_mapdata_meta(ds_id, refresh)
+    if meta is not None:
+        logger.debug("Found stored mapdata.")
+        return load_artifact(ds_id, meta)
+    return regenerate_mapdata(category, id, full=bool(refresh))[1]
+
+
+def regenerate_mapdata(category, id, full=False):
+    """
+    Builds the payload and stores it pre-serialized; returns (artifact metadata, payload).
+    An explicit refresh (full=True) recomputes every place's fragment, not only those dropped.
+    """
+    ds_id = f"{category}_{id}"
     start_time = time.time()
+    if full and category == "datasets":
+        drop_place_fragments(id)
+    mapdata_result = build_mapdata(category, id)
+    cache.delete(ds_id)  # payload pickled by earlier versions, if any
+    meta = write_mapdata_artifacts(ds_id, mapdata_result)
+    logger.debug(f"Mapdata generation time: {time.time() - start_time:.2f} seconds")
+    return meta, mapdata_result
 
-    mapdata = mapdata_dataset(id) if category == "datasets" else mapdata_collection(id)
-
-    # As a concept, `granularity` is a measure of the precision of the geometry. In LPF this is represented as
-    # `approximation` with a `type` of either:
-    # a) `geo:hasSpatialAccuracy` with a `tolerance` value in kilometres, or
-    # b) `geo:sfWithin` (for Polygons) without a `tolerance` value.
-    # WHG cannot at present handle different `granularity` values for different geometries in a GeometryCollection:
-    # instead, the largest `granularity` value is used for the entire GeometryCollection.
-    # If a feature's geometry has `granularity`, or if the geometry is a GeometryCollection with any subgeometry
-    # having `granularity`, copy the largest `granularity` value to the feature's properties.
-    for feature in mapdata["features"]:
-        geom = feature.get("geometry", None)
-        if geom is None:
-            continue
-
-        granularity = None
-
-        def extract_granularity(g):
-            approx = g.get("approximation")
-            if not approx or not isinstance(approx, dict):
-                return None
-            if approx.get("type") == "geo:hasSpatialAccuracy":
-                return approx.get("tolerance", 0)
-            elif approx.get("type") == "geo:sfWithin" and g.get("type") in ("Polygon", "MultiPolygon"):
-                return 0
-            return None
-
-        if geom.get("type") == "GeometryCollection":
-            granularities = []
-            for subgeom in geom.get("geometries", []):
-                g = extract_granularity(subgeom)
-                if g is not None:
-                    granularities.append(g)
-                subgeom.pop("approximation", None)
-            if granularities:
-                granularity = max(granularities)
-        else:
-            granularity = extract_granularity(geom)
-            geom.pop("approximation", None)
 
-        if granularity is not None:
-            feature.setdefault("properties", {})["granularity"] = granularity
+def build_mapdata(category, id):
+    # TODO: Fix use of <category>/<id>/refresh/full to bypass geometry reduction in PLACE branch
+
+    ds_id = f"{category}_{id}"
+
+    if category == "datasets":
+        ds = get_object_or_404(Dataset, pk=id)
+        mapdata = dataset_summary(ds)
+        fragments = dataset_fragments(ds)
+    else:
+        mapdata = mapdata_collection(id)
+        fragments = [feature_fragment(feature) for feature in mapdata["features"]]
 
     grouped = {
         "Table": [],
@@ -196,48 +199,13 @@ def generate_mapdata(category, id, refresh=False):
         "Granular": [],  # Lines and Polygons with granularity
     }
     multi_relations = set()
-    default_group = grouped["Point"]
-
-    # Properties to retain for map features
-    required_keys = {"min", "max", "relation", "granularity"}
-
-    def trim_properties(f, index, g):
-        """Return a copy of feature with minimal properties, rounded and validated geometry (or None if invalid)."""
-        geometry = None
-        if g:
-            try:
-                # Create a Shapely geometry from the rounded coordinates
-                rounded = {
-                    "type": g["type"],
-                    "coordinates": round_coords(g["coordinates"])
-                }
-
-                # Use Shapely to validate
-                shapely_geom = shape(rounded)
-                if shapely_geom.is_valid:
-                    geometry = mapping(shapely_geom)
-                else:
-                    logger.warning(f"Invalid geometry at index {index}; replacing with None.")
-
-            except Exception as e:
-                logger.warning(f"Error processing geometry {g} {rounded} at index {index}: {e}")
-                geometry = None
 
-        return {
-            "type": "Feature",
-            "geometry": geometry,
-            "properties": {k: v for k, v in f.get("properties", {}).items() if k in required_keys},
-            "id": index
-        }
-
-    for index, feature in enumerate(mapdata["features"]):
-
-        geom = feature.get("geometry")
-        props = feature.get("properties", {})
+    for index, fragment in enumerate(fragments):
+        props = fragment["properties"]
 
         grouped["Table"].append({
             "type": "Feature",
-            "geometry": {"type": geom["type"]} if geom and "type" in geom else None,
+            "geometry": {"type": fragment["geometry_type"]} if fragment["geometry_type"] else None,
             "properties": {**props, "dsid": id, "dslabel": mapdata["label"] if "label" in mapdata else None,
                            "ds_id": ds_id, "id": index},
         })
@@ -246,53 +214,14 @@ def generate_mapdata(category, id, refresh=False):
         if "|" in relation:
             multi_relations.add(relation)
 
-        if not geom:
-            default_group.append(trim_properties(feature, index, None))
-            continue
-
-        gtype = geom["type"]
-
-        if gtype == "GeometryCollection":
-
-            subgroups = defaultdict(list)
-            for subgeom in geom.get("geometries", []):
-                subtype = subgeom["type"]
-                subgroups[subtype].append(subgeom)
-
-            for subtype, geoms in subgroups.items():
-                base_type = "Point" if subtype.removeprefix("Multi") == "Point" else "Granular" if "granularity" in \
-                                                                                                   feature[
-                                                                                                       "properties"] else "Polygon"
-
-                if subtype.startswith("Multi"):
-                    # Already a multi-geometry, just collect their coordinates
-                    coords = []
-                    for g in geoms:
-                        coords.extend(g["coordinates"])
-                    new_geom = {
-                        "type": subtype,
-                        "coordinates": coords,
-                    }
-                else:
-                    if len(geoms) > 1:
-                        new_geom = {
-                            "type": f"Multi{subtype}",
-                            "coordinates": [g["coordinates"] for g in geoms],
-                        }
-                    else:
-                        new_geom = {
-                            "type": subtype,
-                            "coordinates": geoms[0]["coordinates"],
-                        }
-
-                grouped[base_type].append(trim_properties(feature, index, new_geom))
-
-        else:
-            base_type = "Point" if gtype.removeprefix("Multi") == "Point" else "Granular" if "granularity" in feature[
-                "properties"] else "Polygon"
-            trimmed = trim_properties(feature, index, geom)
-            if base_type in grouped:
-                grouped[base_type].append(trimmed)
+        trimmed_props = {k: v for k, v in props.items() if k in MAP_PROPERTY_KEYS}
+        for base_type, geometry in fragment["layers"]:
+            grouped[base_type].append({
+                "type": "Feature",
+                "geometry": geometry,
+                "properties": dict(trimmed_props),
+                "id": index
+            })
 
     mapdata_result = {
         key: ({"features": features} if key in ["table"] else {
@@ -333,7 +262,7 @@ def generate_mapdata(category, id, refresh=False):
         "max": minmax[1],
         "seqmin": mapdata.get("seqmin", None),
         "seqmax": mapdata.get("seqmax", None),
-        "num_places": len(mapdata["features"]),
+        "num_places": len(fragments),
         "bounds": json.loads(mapdata["bounds"].geojson),
         "extent": mapdata["extent"],  # Buffered bounds
         "globeMode": globeMode,
@@ -352,99 +281,251 @@ def generate_mapdata(category, id, refresh=False):
     # logger.debug("Resulting mapdata: %s", mapdata_result)
     # mapdata_result = mapdata
 
-    response_time = time.time() - start_time
-    logger.debug(f"Mapdata generation time: {response_time:.2f} seconds")
+    return mapdata_result
+
+
+"""
+Per-place fragments
+"""
+
+# Properties to retain for map features
+MAP_PROPERTY_KEYS = {"min", "max", "relation", "granularity"}
+PLACE_FEATURE_FIELDS = ('id', 'src_id', 'title', 'fclasses', 'review_wd', 'review_tgn', 'review_whg', 'minmax')
+
+
+def extract_granularity(g):
+    approx = g.get("approximation")
+    if not approx or not isinstance(approx, dict):
+        return None
+    if approx.get("type") == "geo:hasSpatialAccuracy":
+        return approx.get("tolerance", 0)
+    elif approx.get("type") == "geo:sfWithin" and g.get("type") in ("Polygon", "MultiPolygon"):
+        return 0
+    return None
 
-    if response_time > maxNoCacheTime:
-        logger.debug("Caching mapdata.")
-        cache.set(ds_id, mapdata_result)
+
+def apply_granularity(feature):
+    """
+    As a concept, `granularity` is a measure of the precision of the geometry. In LPF this is represented as
+    `approximation` with a `type` of either:
+    a) `geo:hasSpatialAccuracy` with a `tolerance` value in kilometres, or
+    b) `geo:sfWithin` (for Polygons) without a `tolerance` value.
+    WHG cannot at present handle different `granularity` values for different geometries in a GeometryCollection:
+    instead, the largest `granularity` value is used for the entire GeometryCollection.
+    If a feature's geometry has `granularity`, or if the geometry is a GeometryCollection with any subgeometry
+    having `granularity`, copy the largest `granularity` value to the feature's properties.
+    """
+    geom = feature.get("geometry", None)
+    if geom is None:
+        return
+
+    granularity = None
+    if geom.get("type") == "GeometryCollection":
+        granularities = []
+        for subgeom in geom.get("geometries", []):
+            g = extract_granularity(subgeom)
+            if g is not None:
+                granularities.append(g)
+            subgeom.pop("approximation", None)
+        if granularities:
+            granularity = max(granularities)
     else:
-        logger.debug("No need to cache mapdata.")
+        granularity = extract_granularity(geom)
+        geom.pop("approximation", None)
 
-    return mapdata_result
+    if granularity is not None:
+        feature.setdefault("properties", {})["granularity"] = granularity
 
 
-def mapdata_dataset(id, task_id=None, chunk_size=1000):
-    ds = get_object_or_404(Dataset, pk=id)
+def trim_geometry(g, ref):
+    """Return the geometry with rounded coordinates, validated by Shapely (or None if invalid)."""
+    rounded = None
+    try:
+        # Create a Shapely geometry from the rounded coordinates
+        rounded = {
+            "type": g["type"],
+            "coordinates": round_coords(g["coordinates"])
+        }
 
-    if task_id:
-        redis_client = get_redis_client()
-        redis_client.hset(task_id, 'mapdata_start_time', timezone.now().isoformat())
-        redis_client.hset(task_id, 'queued_features', ds.numrows)
+        # Use Shapely to validate
+        shapely_geom = shape(rounded)
+        if shapely_geom.is_valid:
+            return mapping(shapely_geom)
+        logger.warning(f"Invalid geometry for {ref}; replacing with None.")
+    except Exception as e:
+        logger.warning(f"Error processing geometry {g} {rounded} for {ref}: {e}")
+    return None
 
-    features = []
-    redis_batch_size = 100
-    index = 0
 
-    bbox = ds.bbox or compute_dataset_bbox(ds.label)
+def feature_fragment(feature):
+    """
+    Map-ready pieces of one feature: its table properties, geometry type, and the trimmed
+    geometry for each map layer it appears in. Fragments do not depend on the feature's
+    position in the payload, so they can be stored per place and re-assembled.
+    """
+    apply_granularity(feature)
+    geom = feature.get("geometry")
+    props = feature.get("properties", {})
+    ref = f"place {props['pid']}" if "pid" in props else "feature"
+    fragment = {
+        "properties": props,
+        "geometry_type": geom["type"] if geom and "type" in geom else None,
+        "layers": [],
+    }
+
+    if not geom:
+        fragment["layers"].append(["Point", None])
+        return fragment
+
+    def base_type_of(gtype):
+        if gtype.removeprefix("Multi") == "Point":
+            return "Point"
+        return "Granular" if "granularity" in props else "Polygon"
+
+    if geom["type"] == "GeometryCollection":
+        subgroups = defaultdict(list)
+        for subgeom in geom.get("geometries", []):
+            subgroups[subgeom["type"]].append(subgeom)
+
+        for subtype, geoms in subgroups.items():
+            if subtype.startswith("Multi"):
+                # Already a multi-geometry, just collect their coordinates
+                coords = []
+                for g in geoms:
+                    coords.extend(g["coordinates"])
+                new_geom = {"type": subtype, "coordinates": coords}
+            elif len(geoms) > 1:
+                new_geom = {"type": f"Multi{subtype}", "coordinates": [g["coordinates"] for g in geoms]}
+            else:
+                new_geom = {"type": subtype, "coordinates": geoms[0]["coordinates"]}
+            fragment["layers"].append([base_type_of(subtype), trim_geometry(new_geom, ref)])
+    else:
+        fragment["layers"].append([base_type_of(geom["type"]), trim_geometry(geom, ref)])
 
-    # Get the extent directly from the dataset's bbox
-    buffered_extent = buffered_extent_from_bbox(bbox)
+    return fragment
 
-    # Prefetch related geometries using Prefetch object
-    places_qs = ds.places.prefetch_related(
-        Prefetch(
-            'geoms',
-            queryset=PlaceGeom.objects.only('place_id', 'jsonb', 'geom'),
-            to_attr='prefetched_geoms'
+
+def place_feature(place, geom_list):
+    """Raw mapdata feature for a place, given its PLACE_FEATURE_FIELDS values and geometry jsonb list."""
+    minmax = place['minmax']
+    return {
+        "type": "Feature",
+        "properties": {
+            "pid": place['id'],
+            "src_id": place['src_id'],
+            "title": place['title'],
+            "fclasses": place['fclasses'],
+            "review_wd": place['review_wd'],
+            "review_tgn": place['review_tgn'],
+            "review_whg": place['review_whg'],
+            "min": "null" if minmax is None or minmax[0] is None else minmax[0],
+            "max": "null" if minmax is None or minmax[1] is None else minmax[1],
+        },
+        "geometry": geom_list[0] if len(geom_list) == 1
+        else (
+            None if len(geom_list) == 0
+            else {
+                "type": "GeometryCollection",
+                "geometries": geom_list
+            }
         )
-    ).values('id', 'src_id', 'title', 'fclasses', 'review_wd', 'review_tgn', 'review_whg', 'minmax').order_by('id')
+    }
 
-    place_iterator = iter(places_qs)
 
-    while True:
-        chunk = list(islice(place_iterator, chunk_size))
-        if not chunk:
-            break
+def place_fragments_key(dataset_id):
+    return f"mapdata:place_fragments:{dataset_id}"
 
-        place_ids = [place['id'] for place in chunk]
 
-        # Fetch full Place instances with prefetched geoms
-        full_places = ds.places.filter(id__in=place_ids).prefetch_related(
-            Prefetch(
-                'geoms',
-                queryset=PlaceGeom.objects.only('place_id', 'jsonb', 'geom'),
-                to_attr='prefetched_geoms'
-            )
-        )
+def dataset_fragments(ds, chunk_size=1000):
+    """
+    Fragments for every place in a dataset, in place id order.
 
-        place_map = {p.id: p for p in full_places}
+    Fragments are kept in a Redis hash per dataset (place id -> JSON); only places
+    without a stored fragment are read from the database and trimmed, so after an
+    edit only the changed places are recomputed (see drop_place_fragments).
+    """
+    redis_client = get_redis_client()
+    key = place_fragments_key(ds.id)
+    place_ids = list(ds.places.order_by('id').values_list('id', flat=True))
+
+    fragments = {}
+    missing = []
+    for start in range(0, len(place_ids), chunk_size):
+        chunk = place_ids[start:start + chunk_size]
+        for pid, stored in zip(chunk, redis_client.hmget(key, chunk)):
+            if stored is None:
+                missing.append(pid)
+            else:
+                fragments[pid] = json.loads(stored)
+
+    for start in range(0, len(missing), chunk_size):
+        chunk = missing[start:start + chunk_size]
+        geoms = defaultdict(list)
+        for place_id, jsonb in PlaceGeom.objects.filter(place_id__in=chunk).order_by('id').values_list(
+                'place_id', 'jsonb'):
+            geoms[place_id].append(jsonb)
+        computed = {
+            place['id']: feature_fragment(place_feature(place, geoms[place['id']]))
+            for place in ds.places.filter(id__in=chunk).values(*PLACE_FEATURE_FIELDS)
+        }
+        if computed:
+            redis_client.hset(key, mapping={pid: json.dumps(f) for pid, f in computed.items()})
+        fragments.update(computed)
 
-        for place in chunk:
-            place_obj = place_map[place['id']]
-            geom_list = [g.jsonb for g in getattr(place_obj, 'prefetched_geoms', [])]
+    # Drop fragments of places no longer in the dataset (e.g. removed without signals)
+    current = set(place_ids)
+    stale = [pid for pid in redis_client.hkeys(key) if int(pid) not in current]
+    if stale:
+        redis_client.hdel(key, *stale)
+
+    logger.debug(f"Mapdata fragments for dataset {ds.id}: {len(place_ids) - len(missing)} stored, "
+                 f"{len(missing)} computed, {len(stale)} dropped.")
+    return [fragments[pid] for pid in place_ids if pid in fragments]
 
-            feature = {
-                "type": "Feature",
-                "properties": {
-                    "pid": place['id'],
-                    "src_id": place['src_id'],
-                    "title": place['title'],
-                    "fclasses": place['fclasses'],
-                    "review_wd": place['review_wd'],
-                    "review_tgn": place['review_tgn'],
-                    "review_whg": place['review_whg'],
-                    "min": "null" if place['minmax'] is None or place['minmax'][0] is None else place['minmax'][0],
-                    "max": "null" if place['minmax'] is None or place['minmax'][1] is None else place['minmax'][1],
-                },
-                "geometry": geom_list[0] if len(geom_list) == 1
-                else (
-                    None if len(geom_list) == 0
-                    else {
-                        "type": "GeometryCollection",
-                        "geometries": geom_list
-                    }
-                )
-            }
-            features.append(feature)
 
-            if task_id and (index + 1) % redis_batch_size == 0:
-                redis_client.hincrby(task_id, 'queued_features', -redis_batch_size)
+def drop_place_fragments(dataset_id, place_ids=None):
+    """Forget stored fragments for some places of a dataset, or for the whole dataset if place_ids is None."""
+    redis_client = get_redis_client()
+    key = place_fragments_key(dataset_id)
+    if place_ids is None:
+        redis_client.delete(key)
+    elif place_ids:
+        redis_client.hdel(key, *place_ids)
 
-            index += 1
 
-    if task_id:
-        redis_client.hincrby(task_id, 'queued_features', -(index % redis_batch_size))
+def places_changed_in_bulk(place_ids):
+    """
+    For writes to places (or their names, links, geometries etc.) that bypass signals, e.g.
+    QuerySet.update(), delete() and bulk_create(): drops their stored fragments and cached popups,
+    marks their datasets' stats stale and queues refreshes of their mapdata and downloads, as
+    the signal receivers do for a single place. Runs after commit.
+    """
+    from datasets.models import DatasetStats
+    from api.place_cache import drop_place_details
+    from utils.tasks import mark_download_artifacts_for_refresh
+
+    place_ids = list(place_ids)
+    if not place_ids:
+        return
+
+    def drop_fragments():
+        by_dataset = defaultdict(list)
+        for place_id, dataset_id in Place.objects.filter(id__in=place_ids).values_list('id', 'dataset__id'):
+            by_dataset[dataset_id].append(place_id)
+        # a new places version first, so the downloads queued below are built as a new version
+        DatasetStats.mark_stale(['places'], dataset_id__in=list(by_dataset))
+        for dataset_id, ids in by_dataset.items():
+            drop_place_fragments(dataset_id, ids)
+            mark_mapdata_for_refresh.delay("datasets", dataset_id, delay=10)
+            mark_download_artifacts_for_refresh.delay(dataset_id)
+        drop_place_details(place_ids)
+
+    transaction.on_commit(drop_fragments)
+
+
+def dataset_summary(ds):
+    """Dataset-level mapdata fields, without features."""
+    bbox = ds.bbox or compute_dataset_bbox(ds.label)
 
     return {
         "title": ds.title,
@@ -455,11 +536,11 @@ def mapdata_dataset(id, task_id=None, chunk_size=1000):
         "creator": ds.creator,
         "minmax": ds.minmax,
         "bounds": bbox,
-        "extent": buffered_extent,
+        # Get the extent directly from the dataset's bbox
+        "extent": buffered_extent_from_bbox(bbox),
         "coordinate_density": ds.coordinate_density,
         "visParameters": ds.vis_parameters,
         "type": "FeatureCollection",
-        "features": features,
     }
 
 
@@ -746,11 +827,31 @@ def get_mapdata_targets(instance):
 
 def handle_mapdata_change(instance, **kwargs):
     """
-    Called on post_save and post_delete to queue cache deletion and refresh.
+    Called on post_save and post_delete to queue cache deletion and refresh
+    (of a dataset's pre-built downloads and of cached place popups, too).
     """
+    from api.place_cache import drop_place_details
+    from utils.download_artifacts import delete_download_artifacts
+    from utils.tasks import mark_download_artifacts_for_refresh
+
     targets = get_mapdata_targets(instance)
     redis_client = get_redis_client()
 
+    # Only the edited place's fragment needs recomputing when its dataset's mapdata is refreshed
+    if isinstance(instance, (Place, PlaceGeom)):
+        place_id = instance.id if isinstance(instance, Place) else instance.place_id
+        dataset_ids = [id for category, id in targets if category == "datasets"]
+
+        def drop_fragments():
+            for dataset_id in dataset_ids:
+                drop_place_fragments(dataset_id, [place_id])
+            drop_place_details([place_id])
+
+        transaction.on_commit(drop_fragments)
+    elif isinstance(instance, Dataset) and kwargs.get('signal') == post_delete:
+        drop_place_fragments(instance.id)
+        delete_download_artifacts(instance.id)
+
     if kwargs.get('signal') == post_delete and isinstance(instance, (Dataset, Collection)):
         for category, id in targets:
             cache_key = f"{category}_{id}"
@@ -760,6 +861,8 @@ def handle_mapdata_change(instance, **kwargs):
     else:
         for category, id in targets:
             mark_mapdata_for_refresh.delay(category, id, delay=10)
+            if category == "datasets":
+                mark_download_artifacts_for_refresh.delay(id)
 
 
 for model in models_to_watch:
@@ -0,0 +1,143 @@
+# mapdata_artifacts.py
+# pre-serialized, pre-compressed mapdata payloads, served with ETag/Last-Modified
+# written by utils.mapdata.regenerate_mapdata, served by utils.mapdata.mapdata
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import brotli
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+logger = logging.getLogger('mapdata')
+
+META_FILE = 'meta.json'
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+
+def artifact_dir(ds_id):
+    return os.path.join(settings.MAPDATA_ARTIFACT_DIR, ds_id)
+
+
+def artifact_path(ds_id, variant, digest, encoding=None):
+    return os.path.join(artifact_dir(ds_id), f"{variant}.{digest}.json{ENCODINGS.get(encoding, '')}")
+
+
+def read_artifact_meta(ds_id):
+    """Metadata of the stored payloads for `ds_id`, or None if there are none"""
+    try:
+        with open(os.path.join(artifact_dir(ds_id), META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_artifact(ds_id, meta, variant='full'):
+    """The stored payload as a dict"""
+    with open(artifact_path(ds_id, variant, meta['variants'][variant]['digest'])) as f:
+        return json.load(f)
+
+
+def write_mapdata_artifacts(ds_id, mapdata_result):
+    """
+    Serializes the payload once, as served by the full and carousel (no table) endpoints,
+    and stores each as plain JSON plus gzip and brotli variants named by content hash.
+    meta.json is replaced last, so readers always see a complete set; files of earlier
+    generations are then removed (open handles keep working).
+    """
+    directory = artifact_dir(ds_id)
+    os.makedirs(directory, exist_ok=True)
+
+    payloads = {
+        'full': mapdata_result,
+        'carousel': {key: value for key, value in mapdata_result.items() if key != 'table'},
+    }
+    meta = {'generated': time.time(), 'variants': {}}
+    for variant, payload in payloads.items():
+        body = json.dumps(payload, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        for encoding, data in (
+                (None, body),
+                ('gzip', gzip.compress(body, compresslevel=9)),
+                ('br', brotli.compress(body, quality=9)),
+        ):
+            _write_file(artifact_path(ds_id, variant, digest, encoding), data)
+        meta['variants'][variant] = {'digest': digest, 'size': len(body)}
+
+    _write_file(os.path.join(directory, META_FILE), json.dumps(meta).encode('utf-8'))
+
+    current = {os.path.basename(artifact_path(ds_id, variant, info['digest'], encoding))
+               for variant, info in meta['variants'].items() for encoding in (None, *ENCODINGS)}
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name == META_FILE or name in current or name.endswith('.part'):
+            continue
+        try:
+            # Leave files written by any generation running concurrently with this one
+            if os.path.getmtime(path) < meta['generated']:
+                os.remove(path)
+        except OSError:
+            pass
+
+    logger.debug(f"Stored mapdata artifacts for {ds_id} ({meta['variants']['full']['size']} bytes uncompressed).")
+    return meta
+
+
+def delete_mapdata_artifacts(ds_id):
+    """Removes stored payloads; returns True if there were any"""
+    directory = artifact_dir(ds_id)
+    if not os.path.isdir(directory):
+        return False
+    shutil.rmtree(directory, ignore_errors=True)
+    return True
+
+
+def _write_file(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def preferred_encoding(request):
+    accepted = {part.split(';')[0].strip().lower()
+                for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')}
+    return next((encoding for encoding in ENCODINGS if encoding in accepted), None)
+
+
+def artifact_response(request, ds_id, meta, variant='full'):
+    """
+    Sends a stored payload in the best encoding the client accepts, or 304 Not Modified
+    if the client's If-None-Match / If-Modified-Since already covers it.
+    """
+    digest = meta['variants'][variant]['digest']
+    encoding = preferred_encoding(request)
+    # Each encoding is a different representation, so needs its own (strong) ETag
+    etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+    last_modified = int(meta['generated'])
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = FileResponse(open(artifact_path(ds_id, variant, digest, encoding), 'rb'),
+                                content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,97 @@
+# pg_copy.py
+# stream unsaved model instances into Postgres with COPY ... FROM STDIN
+# used by the bulk dataset loaders (datasets.insert, validation.create_dataset)
+
+import datetime
+import io
+import json
+
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.geos import GEOSGeometry
+from django.contrib.postgres.fields import ArrayField
+from django.db import connections
+from django.db.models import JSONField
+
+NULL = r'\N'
+
+
+def copy_escape(text):
+    # COPY text format: backslash, tab and line breaks must be escaped
+    return text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def array_literal(values):
+    """Postgres array literal for a (flat) list, e.g. ['a', None] -> {"a",NULL}"""
+    items = []
+    for v in values:
+        if v is None:
+            items.append('NULL')
+        else:
+            items.append('"' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"')
+    return '{' + ','.join(items) + '}'
+
+
+def copy_value(field, value):
+    """COPY text representation of one field value"""
+    if value is None:
+        return NULL
+    if isinstance(field, JSONField):
+        return copy_escape(json.dumps(value, cls=field.encoder))
+    if isinstance(field, ArrayField):
+        return copy_escape(array_literal(value))
+    if isinstance(field, GeometryField):
+        geom = value if isinstance(value, GEOSGeometry) else GEOSGeometry(value)
+        if not geom.srid:
+            geom.srid = field.srid
+        return geom.hexewkb.decode()
+
+    value = field.get_prep_value(value)
+    if value is None:
+        return NULL
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return copy_escape(str(value))
+
+
+def copy_fields(model, include_pk=False):
+    return [f for f in model._meta.concrete_fields
+            if include_pk or not f.primary_key]
+
+
+def copy_objects(model, objs, include_pk=False, using='default'):
+    """
+    Writes unsaved instances of `model` with a single COPY.
+    Field values are taken as save() would (defaults, auto_now_add); the primary
+    key is only written if include_pk, otherwise the column default applies.
+    No signals are sent. Returns the number of rows written.
+    """
+    if not objs:
+        return 0
+    fields = copy_fields(model, include_pk)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+
+    buf = io.StringIO()
+    for obj in objs:
+        buf.write('\t'.join(copy_value(f, f.pre_save(obj, True)) for f in fields))
+        buf.write('\n')
+    buf.seek(0)
+
+    sql = 'COPY {} ({}) FROM STDIN'.format(
+        qn(model._meta.db_table), ', '.join(qn(f.column) for f in fields))
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(sql, buf)
+    return len(objs)
+
+
+def reserve_ids(model, count, using='default'):
+    """Takes `count` values from the model's id sequence in one round trip"""
+    if count <= 0:
+        return []
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+            [model._meta.db_table, model._meta.pk.column, count])
+        return [row[0] for row in cursor.fetchall()]
@@ -2,31 +2,33 @@
 # Generic Celery tasks and helpers 
 
 from __future__ import absolute_import, unicode_literals
-import csv
 import simplejson as json
 import os
-import zipfile
-from copy import deepcopy
 
-import pandas as pd
 from celery import shared_task
 from celery.utils.log import get_task_logger
-from celery.result import AsyncResult
 from django.conf import settings
 from django.core import serializers
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
+from django_redis import get_redis_connection
 
 from areas.models import Area
-from collection.models import Collection, CollPlace
+from collection.models import Collection
 from datasets.models import Dataset
 from datasets.utils import makeNow
-from main.models import DownloadFile, Log, Comment
+from main.models import DownloadFile, Log
 from places.models import Place
+from utils.download_artifacts import (artifact_url, build_artifact, current_artifact, dataset_formats,
+                                      delete_download_artifacts, download_format, user_copy)
+from utils.downloads import (write_download_zip, write_dataset_lpf, write_collection_lpf,
+                             write_augmented_tsv)
 from whgmail.messaging import WHGmail
 
 logger = get_task_logger('tasks')
 User = get_user_model()
+PENDING_ARTIFACTS_KEY = "downloads:pending_refresh:{}"
+PENDING_ARTIFACTS_TTL = 60 * 60  # seconds a queued rebuild may take to start before another can be queued
 
 
 def downloader(request, *args, **kwargs):
@@ -47,6 +49,10 @@ def downloader(request, *args, **kwargs):
                 logger.error('No dsid or collid provided')
                 return HttpResponse(status=400, content='Missing required parameters.')
 
+            artifact_response = serve_download_artifact(user, dsid, collid, format)
+            if artifact_response:
+                return artifact_response
+
             try:
                 userid = user.id if user.is_authenticated else 1
                 download_task = make_download.delay(
@@ -76,6 +82,39 @@ def downloader(request, *args, **kwargs):
     return HttpResponse(status=405, content='Method Not Allowed')
 
 
+def serve_download_artifact(user, dsid, collid, req_format):
+    """
+    Link to the pre-built zip of a public dataset if it is up to date, else None (and
+    the zip is queued for building, so the next request for it finds it)
+    """
+    if not dsid or collid:
+        return None
+    ds = Dataset.objects.filter(id=dsid, public=True).first()
+    if ds is None:
+        return None
+    path = current_artifact(ds, download_format(ds, req_format))
+    if path is None:
+        mark_download_artifacts_for_refresh.delay(ds.id, delay=0)
+        return None
+
+    userid = user.id if user.is_authenticated else 1
+    if user.is_authenticated:
+        # the download history links to the user's copy, which outlives the artifact
+        path = user_copy(path, user.id)
+        if path is None:
+            return None
+        create_downloadfile_record(user, ds, None, path)
+    Log.objects.create(
+        category="dataset",
+        logtype="ds_download",
+        note={"format": req_format, "name": user.username, "artifact": True},
+        dataset_id=ds.id,
+        user_id=userid,
+    )
+    logger.info(f'Serving pre-built download {path} to user {userid}')
+    return JsonResponse({'url': artifact_url(path)})
+
+
 def generate_zip_filename(data_dump_filename):
     try:
         data_filename = os.path.basename(data_dump_filename)
@@ -167,36 +206,35 @@ def collection_to_json(collid):
         raise
 
 
-def create_zipfile(data_dump_filename, dsid=None, collid=None):
+def readme_text(data_dump_filename, dsid=None, collid=None):
+    metadata = dataset_to_json(dsid) if dsid else collection_to_json(collid)
+    pretty_metadata = json.dumps(metadata, indent=1, sort_keys=False)
+    dl_class = "Dataset" if dsid else "Collection"
+    return (f'World Historical Gazetteer (WHG)\n{dl_class} Download\n'
+            f'data: {os.path.basename(data_dump_filename)}\n'
+            '********************************\n'
+            'This dataset conforms to the CC-BY 4.0 NC license.\n\n'
+            "This license enables reusers to distribute, remix, adapt, and build upon the material "
+            "in any medium or format for noncommercial purposes only, and only so long as attribution "
+            "is given to the creator. CC BY-NC includes the following elements:\n"
+            "* Attribution — You must give appropriate credit, provide a link to the license, and indicate "
+            "if changes were made.\n"
+            "* NonCommercial — You may not use the material for commercial purposes.\n\n"
+            "***********************************\n"
+            "Metadata:\n" + pretty_metadata)
+
+
+def create_zipfile(data_dump_filename, write_data, progress=None, dsid=None, collid=None):
+    """
+    Zip of README.txt and the data file, which write_data(stream) writes straight into
+    its zip entry; returns the zip file name
+    """
     try:
-        today = makeNow()
-        metadata = dataset_to_json(dsid) if dsid else collection_to_json(collid)
-        pretty_metadata = json.dumps(metadata, indent=1, sort_keys=False)
-        dl_class = "Dataset" if dsid else "Collection"
-        readme_content = (f'World Historical Gazetteer (WHG)\n{dl_class} Download\n'
-                          f'data: {os.path.basename(data_dump_filename)}\n'
-                          '********************************\n'
-                          'This dataset conforms to the CC-BY 4.0 NC license.\n\n'
-                          "This license enables reusers to distribute, remix, adapt, and build upon the material "
-                          "in any medium or format for noncommercial purposes only, and only so long as attribution "
-                          "is given to the creator. CC BY-NC includes the following elements:\n"
-                          "* Attribution — You must give appropriate credit, provide a link to the license, and indicate "
-                          "if changes were made.\n"
-                          "* NonCommercial — You may not use the material for commercial purposes.\n\n"
-                          "***********************************\n"
-                          "Metadata:\n" + pretty_metadata)
-
-        with open('README.txt', 'w') as f:
-            f.write(readme_content)
-
         zipname = generate_zip_filename(data_dump_filename)
-        with zipfile.ZipFile(zipname, 'w') as zipf:
-            zipf.write('README.txt', arcname='README.txt')
-            zipf.write(data_dump_filename, arcname=os.path.basename(data_dump_filename))
-
-        os.remove('README.txt')
-        os.remove(data_dump_filename)
-        logger.info(f'Created zip file: {zipname}')
+        stream = write_download_zip(zipname, os.path.basename(data_dump_filename),
+                                    readme_text(data_dump_filename, dsid, collid), write_data, progress)
+        logger.info(f'Created zip file: {zipname} ({stream.items} records, {stream.bytes_written} bytes)')
+        return zipname
     except Exception as e:
         logger.error(f'Error creating zip file: {e}')
         raise
@@ -213,94 +251,29 @@ def make_download(self, *args, **kwargs):
     logger.debug(f"make_download() userid: {user.id}, dsid: {dsid}, collid: {collid}, format: {req_format}")
     date = makeNow()
 
+    def progress(total_records):
+        # by bytes written, against a total extrapolated from the records written so far
+        def report(stream):
+            total = stream.bytes_written
+            if stream.items and stream.items < total_records:
+                total = int(stream.bytes_written / stream.items * total_records)
+            self.update_state(state="PROGRESS", meta={"current": stream.bytes_written, "total": total,
+                                                      "records": stream.items, "total_records": total_records})
+            logger.info(f"Task state: PROGRESS, {stream.items} of {total_records} records, "
+                        f"{stream.bytes_written} of ~{total} bytes")
+        return report
+
     # collection or dataset
     if collid and not dsid:
         coll = Collection.objects.get(id=collid)
-        colltitle = coll.title
-        collclass = coll.collection_class
-
-        qs = coll.places_all.all()
-        total_operations = qs.count()
-
+        total_operations = coll.places_all.count()
         req_format = "lpf"
 
         fn = os.path.join(settings.MEDIA_ROOT, 'downloads', f'{user.id}_{collid}_{date}.json')
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(fn), exist_ok=True)
-
-        with open(fn, "w", encoding="utf-8") as outfile:
-            features = []
-            for i, p in enumerate(qs):
-                geoms = p.geoms.all()
-                if len(geoms) == 1:
-                    geometry = geoms[0].jsonb
-                else:
-                    geometry = {
-                        "type": "GeometryCollection",
-                        "geometries": [g.jsonb for g in geoms],
-                    }
-                try:
-                    anno = p.traces.filter(collection_id=collid, archived=False).first()
-                    coll_place = CollPlace.objects.filter(
-                        collection=collid, place=p
-                    ).first()
-
-                    annotation = {
-                        "place_id": p.id,
-                        "sequence": coll_place.sequence if coll_place else None,
-                        "note": anno.note if anno else "",
-                        "relation": anno.relation if anno else [],
-                        "start": anno.start if anno else "",
-                        "end": anno.end if anno else "",
-                        "created": anno.created.strftime("%Y-%m-%d") if anno else "",
-                    }
-                except Exception as e:
-                    annotation = {}
-                    logger.error(f"Error fetching annotation or sequence for place {p.id}: {e}")
-
-                rec = {
-                    "type": "Feature",
-                    "properties": {
-                        "id": p.id,
-                        "src_id": p.src_id,
-                        "title": p.title,
-                        "ccodes": p.ccodes,
-                        "annotation": annotation,
-                    },
-                    "geometry": geometry,
-                    "names": [n.jsonb for n in p.names.all()],
-                    "types": [t.jsonb for t in p.types.all()],
-                    "links": [ln.jsonb for ln in p.links.all()],
-                    "whens": [w.jsonb for w in p.whens.all()],
-                }
-                features.append(rec)
-                if (i + 1) % 100 == 0:
-                    self.update_state(
-                        state="PROGRESS", meta={"current": i + 1, "total": total_operations}
-                    )
-                    logger.info(f"Task state: PROGRESS, current: {i + 1}, total: {total_operations}")
-
-            features_sorted = sorted(
-                (f for f in features if f is not None),  # Filter out None values
-                key=lambda x: x["properties"].get("annotation", {}).get("sequence") or float("inf")
-            )
-
-            logger.info(f"Download file for {total_operations} places in {colltitle}")
-            citation = coll.citation_csl
-            result = {
-                "type": "FeatureCollection",
-                "features": features_sorted,
-                "@context": "https://raw.githubusercontent.com/LinkedPasts/linked-places/master/linkedplaces-context-v1.1.jsonld",
-                "citation": json.loads(citation) if citation else {},
-                "filename": "/" + fn,
-            }
-
-            # Write the data as json to fn
-            outfile.write(json.dumps(result, indent=2).replace("null", '""'))
-        # Create zip with README.txt
-        create_zipfile(fn, None, collid)
+        logger.info(f"Download file for {total_operations} places in {coll.title}")
+        zipname = create_zipfile(fn, lambda stream: write_collection_lpf(stream, coll, fn),
+                                 progress(total_operations), None, collid)
         # Create DownloadFile record
-        zipname = generate_zip_filename(fn)
         create_downloadfile_record(user, None, coll, zipname)
 
     elif dsid:
@@ -311,203 +284,30 @@ def make_download(self, *args, **kwargs):
             logger.info(f"Solo dataset {dsid}")
         ds = Dataset.objects.get(pk=dsid)
         dslabel = ds.label
-        qs = ds.places.all()
-        total_operations = qs.count()
+        total_operations = ds.places.count()
 
         logger.debug(f"tasks.make_download() {{'format': {req_format}, 'ds': {dsid}}}")
 
         if ds.format == "delimited" and req_format in ["tsv", "delimited"]:
             logger.info("Making an augmented TSV file")
-
-            dsf = ds.file
-            dsf.delimiter = dsf.delimiter if not dsf.delimiter == 'n/a' else '\t'
-            df = pd.read_csv(
-                f"media/{dsf.file.name}",
-                delimiter=dsf.delimiter,
-                dtype={"id": "str", "aat_types": "str"},
-                engine='python'
-            )
-            logger.debug(f"DataFrame: {df}")
-
-            header = list(df)
-            logger.debug(f"Original header: {header}")
-
-            newheader = deepcopy(header)
-            newheader = list(
-                set(
-                    newheader
-                    + ["lon", "lat", "matches", "geo_id", "geo_source", "geowkt"]
-                )
-            )
-            logger.debug(f"New header with additional columns: {newheader}")
-
             fn = os.path.join(settings.MEDIA_ROOT, 'downloads', f'{user.id}_{dslabel}_{date}.tsv')
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(fn), exist_ok=True)
-
             logger.debug(f"Output file name: {fn}")
 
             try:
-                with open(fn, "w", newline="", encoding="utf-8") as csvfile:
-                    writer = csv.writer(csvfile, delimiter="\t", quotechar="\"", quoting=csv.QUOTE_NONE)
-                    writer.writerow(newheader)
-
-                    missing = list(set(newheader) - set(header))
-                    logger.debug(f"Missing columns: {missing}")
-
-                    for i, row in df.iterrows():
-                        dfrow = df.loc[i, :]
-                        try:
-                            p = qs.get(src_id=dfrow["id"], dataset=ds.label)
-                            logger.debug(f"Processing row index {i}, place ID {p.id}")
-
-                            rowjs = json.loads(dfrow.to_json())
-                            newrow = deepcopy(rowjs)
-                            for m in missing:
-                                newrow[m] = ""
-
-                            links = ";".join(
-                                list(set([ln.jsonb["identifier"] for ln in p.links.all()]))
-                            )
-                            newrow["matches"] = links
-                            logger.debug(f"Links for place ID {p.id}: {links}")
-
-                            geoms = p.geoms.all()
-                            if geoms.count() > 0:
-                                geowkt = newrow.get("geowkt", None)
-                                lonlat = (
-                                    [newrow.get("lon"), newrow.get("lat")]
-                                    if len(set(newrow.keys()) & set(["lon", "lat"])) == 2
-                                    else None
-                                )
-                                if not geowkt and (not lonlat or None in lonlat or lonlat[0] == ""):
-                                    g = geoms[0]
-                                    newrow["geowkt"] = g.geom.wkt if g.geom else ""
-                                    xy = (
-                                        g.geom.coords[0]
-                                        if g.jsonb["type"] == "MultiPoint"
-                                        else g.jsonb["coordinates"]
-                                    )
-                                    newrow["lon"] = xy[0]
-                                    newrow["lat"] = xy[1]
-                                    logger.debug(
-                                        f"Updated geowkt and coordinates for place ID {p.id}: geowkt={newrow['geowkt']}, lon={newrow['lon']}, lat={newrow['lat']}")
-
-                            index_map = {v: i for i, v in enumerate(newheader)}
-                            ordered_row = sorted(
-                                newrow.items(), key=lambda pair: index_map[pair[0]]
-                            )
-                            csvrow = [o[1] for o in ordered_row]
-                            writer.writerow(csvrow)
-
-                            if (i + 1) % 100 == 0:
-                                try:
-                                    self.update_state(
-                                        state="PROGRESS",
-                                        meta={"current": i + 1, "total": total_operations},
-                                    )
-                                    logger.info(f"Task state: PROGRESS, current: {i + 1}, total: {total_operations}")
-
-                                    task_id = self.request.id
-                                    task_result = AsyncResult(task_id)
-                                    logger.info(f"Immediate task state: {task_result.state}, info: {task_result.info}")
-                                except Exception as e:
-                                    logger.error(f"Error updating task state: {e}")
-
-                        except Exception as e:
-                            logger.error(f"Error processing row index {i}: {e}")
-
-            except Exception as e:
-                logger.error(f"Error writing to TSV file {fn}: {e}")
-                return {"msg": "Error writing TSV file", "error": str(e)}
-
-            # Create zip with README.txt
-            try:
-                create_zipfile(fn, ds.id, None)  # Single dataset
-                zipname = generate_zip_filename(fn)
+                zipname = create_zipfile(fn, lambda stream: write_augmented_tsv(stream, ds),
+                                         progress(total_operations), ds.id, None)
                 create_downloadfile_record(user, ds, None, zipname)
                 logger.info(f"Zip file created and download record created successfully.")
             except Exception as e:
-                logger.error(f"Error creating zip file or download record: {e}")
-                return {"msg": "Error creating zip file or download record", "error": str(e)}
+                logger.error(f"Error writing TSV download {fn}: {e}")
+                return {"msg": "Error writing TSV file", "error": str(e)}
 
         else:
-            logger.info("Building LPF file")
-
+            logger.info(f"Building LPF file for {total_operations} places")
             fn = os.path.join(settings.MEDIA_ROOT, 'downloads', f'{user.id}_{dslabel}_{date}.json')
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(fn), exist_ok=True)
-
-            with open(fn, "w", encoding="utf-8") as outfile:
-                features = []
-                for i, p in enumerate(qs):
-                    logger.debug(f"Place in make_download(): {p.__dict__}")
-                    whens = p.whens.all()
-                    if len(whens) > 0:
-                        when = p.whens.first().jsonb
-                        if "minmax" in when:
-                            del when["minmax"]
-                    else:
-                        when = {}
-                    geoms = p.geoms.all()
-                    if len(geoms) == 1:
-                        geometry = geoms[0].jsonb
-                    else:
-                        geometry = {
-                            "type": "GeometryCollection",
-                            "geometries": [g.jsonb for g in geoms],
-                        }
-                    rec = {
-                        "type": "Feature",
-                        "@id": ds.uri_base
-                               + (str(p.id) if "whgazetteer" in ds.uri_base else p.src_id),
-                        "properties": {
-                            "pid": p.id,
-                            "src_id": p.src_id,
-                            "title": p.title,
-                            "ccodes": p.ccodes,
-                            "comment": [
-                                {
-                                    "user": c.user.display_name,
-                                    "note": c.note,
-                                    "created": c.created.isoformat(),
-                                }
-                                for c in Comment.objects.filter(place_id=p)
-                            ],
-                        },
-                        "geometry": geometry,
-                        "names": [n.jsonb for n in p.names.all()],
-                        "types": [t.jsonb for t in p.types.all()],
-                        "links": [ln.jsonb for ln in p.links.all()],
-                        "when": when,
-                    }
-                    features.append(rec)
-                    if (i + 1) % 100 == 0:
-                        self.update_state(
-                            state="PROGRESS",
-                            meta={"current": i + 1, "total": total_operations},
-                        )
-                        logger.info(
-                            f"Task updated: current iteration is {i + 1}, total operations are {total_operations}")
-
-                logger.info(f"Download file for {total_operations} places")
-
-                citation = ds.citation_csl
-
-                result = {
-                    "type": "FeatureCollection",
-                    "@context": "https://raw.githubusercontent.com/LinkedPasts/linked-places/master/linkedplaces-context-v1.1.jsonld",
-                    "citation": json.loads(citation) if citation else {},
-                    "filename": "/" + fn,
-                    "description": ds.description,
-                    "features": features,
-                }
-
-                outfile.write(json.dumps(result, indent=2).replace("null", '""'))
-            # Create zip with README.txt
-            create_zipfile(fn, ds.id, None)
+            zipname = create_zipfile(fn, lambda stream: write_dataset_lpf(stream, ds, fn),
+                                     progress(total_operations), ds.id, None)
             # Create DownloadFile record
-            zipname = generate_zip_filename(fn)
             create_downloadfile_record(user, ds, None, zipname)
 
     logger.debug(f"@ Log create: user_id:{user.id}, dsid: {dsid}, collid: {collid}")  # DEBUG
@@ -533,3 +333,49 @@ def make_download(self, *args, **kwargs):
     logger.info("Task state: SUCCESS")
     completed_message = {"msg": f"{req_format} written", "filename": fn}
     return completed_message
+
+
+@shared_task(name="mark_download_artifacts_for_refresh")
+def mark_download_artifacts_for_refresh(ds_id, delay=None):
+    """
+    Queues a rebuild of a public dataset's download zips, once however many changes arrive;
+    a dataset that is not (or no longer) public has its zips removed
+    """
+    if not Dataset.objects.filter(id=ds_id, public=True).exists():
+        delete_download_artifacts(ds_id)
+        return
+    delay = settings.DOWNLOAD_ARTIFACT_DELAY if delay is None else delay
+    # expires in case the build task is lost, so a later change can queue another
+    if get_redis_connection("property_cache").set(PENDING_ARTIFACTS_KEY.format(ds_id), 1, nx=True,
+                                                  ex=delay * 60 + PENDING_ARTIFACTS_TTL):
+        build_download_artifacts.apply_async((ds_id,), countdown=delay * 60)
+        logger.info(f"Queued download artifacts for dataset {ds_id} in {delay} minutes")
+
+
+@shared_task(name="build_download_artifacts")
+def build_download_artifacts(ds_id):
+    """Builds the download zips of the current version of a public dataset, removing older ones"""
+    # cleared first, so changes made while building queue another build
+    get_redis_connection("property_cache").delete(PENDING_ARTIFACTS_KEY.format(ds_id))
+    ds = Dataset.objects.filter(id=ds_id).first()
+    if ds is None or not ds.public:
+        delete_download_artifacts(ds_id)
+        return {"status": "skipped", "id": ds_id}
+
+    writers = {
+        'lpf': lambda stream, name: write_dataset_lpf(stream, ds, name),
+        'tsv': lambda stream, name: write_augmented_tsv(stream, ds),
+    }
+    built = []
+    for fmt in dataset_formats(ds):
+        def write_zip(path, name, write=writers[fmt]):
+            write_download_zip(path, name, readme_text(name, ds.id), lambda stream: write(stream, name))
+        try:
+            built.append(build_artifact(ds, fmt, write_zip))
+        except Exception as e:
+            logger.error(f"Error building {fmt} download of dataset {ds_id}: {e}")
+    if not Dataset.objects.filter(id=ds_id, public=True).exists():
+        # unpublished while building
+        delete_download_artifacts(ds_id)
+        return {"status": "skipped", "id": ds_id}
+    return {"status": "success", "id": ds_id, "artifacts": built}
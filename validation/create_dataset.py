@@ -11,16 +11,16 @@ from django.conf import settings
 from django.contrib.gis.geos import GEOSGeometry
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.db import transaction, IntegrityError, DataError
-from django.db.models import Max
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django.utils import timezone
 
-from datasets.models import Dataset, DatasetFile
-from datasets.utils import aliasIt, ccodesFromGeom
+from datasets.models import Dataset, DatasetFile, DatasetStats
+from datasets.utils import aliasIt, ccodesFromGeoms
 from main.models import Log
 from places.models import PlaceGeom, PlaceWhen, PlaceLink, PlaceRelated, PlaceDescription, PlaceDepiction, PlaceName, \
     PlaceType, Place, Type
+from utils.pg_copy import copy_objects, reserve_ids
 from whgmail.messaging import slack_notification
 
 logger = logging.getLogger('validation')
@@ -30,63 +30,6 @@ def get_redis_client():
     return redis.StrictRedis.from_url(settings.CELERY_BROKER_URL)
 
 
-class PrimaryKeyManager:
-    """
-    Manages primary key values for database models using Redis. Ensures unique
-    and sequential primary keys across multiple processes by:
-    - Initializing Redis with the next available primary key based on the maximum
-      value from the database.
-    - Providing atomic increment operations to fetch the next primary key.
-    """
-
-    def __init__(self):
-        self.redis_client = get_redis_client()
-
-    def get_next_pk(self, model_name):
-        """Get the next primary key for the given model."""
-        key = f"{model_name}_max_pk"
-        # Increment the key and return the previous value
-        return self.redis_client.incr(key)
-
-    def initialize_pks(self, model_names):
-        """Initialize the primary keys for a list of models."""
-        for model_name in model_names:
-            key = f"{model_name}_max_pk"
-
-            # Check if the key already exists in Redis
-            redis_value = self.redis_client.get(key)
-            if redis_value is not None:
-                redis_value = int(redis_value)
-            else:
-                redis_value = None
-
-            # Get the maximum primary key from the database
-            max_pk = self.get_max_pk_from_db(model_name)
-
-            # Determine the initial value to set in Redis
-            if redis_value is None:
-                initial_value = max_pk + 1 if max_pk is not None else 1
-                self.redis_client.set(key, initial_value)
-            elif max_pk is not None and redis_value <= max_pk:
-                # Only update if the Redis value is less than or equal to the max_pk
-                self.redis_client.set(key, max_pk + 1)
-
-    def get_max_pk_from_db(self, model_name):
-        """Fetch the maximum primary key from the database for a given model."""
-        model_class = globals().get(f'Place{model_name}')
-        if model_class:
-            try:
-                # Fetch the maximum value from the database
-                max_pk = model_class.objects.aggregate(max_pk=Max('pk'))['max_pk']
-                return max_pk
-            except Exception as e:
-                logger.error(f"Error fetching max primary key from database for model {model_name}: {e}")
-                return None
-        else:
-            logger.error(f"Model class {model_name} not found.")
-            return None
-
-
 def safe_key(value):
     """Create a Redis-safe key by replacing unsafe characters."""
     return re.sub(r'\W+', '_', value)
@@ -164,6 +107,9 @@ def save_dataset(task_id):
             dataset.delete()
             raise
 
+        # so that the dataset's first dashboard reads precomputed counts
+        DatasetStats.rebuild(dataset)
+
         # Log the creation
         Log.objects.create(
             category='dataset',
@@ -270,7 +216,93 @@ def save_dataset(task_id):
     redis_client.hset(task_id, 'insertion_error', message)
 
 
+# Place* models written by ds_insert(), in COPY order after Place
+INSERT_MODELS = [PlaceName, PlaceType, PlaceGeom, PlaceWhen, PlaceLink, PlaceRelated,
+                 PlaceDescription, PlaceDepiction]
+
+
+def apply_fix(target, fix):
+    """Apply a fix to a target object based on the path and fix provided."""
+    logger.debug(f"apply_fix: {target}, {fix}")
+    if target is None or fix is None:
+        return
+    path = fix.get('path', '')
+    keys = path.split('.')
+    if len(keys) > 2:
+        keys = keys[2:]  # Ignore initial "features.0."
+    else:
+        return  # Path is not valid if it has fewer than 3 parts
+    value = fix.get('fix')
+    logger.debug(f"apply_fix path & value: {keys}, {value}")
+
+    current = target
+    for key in keys[:-1]:  # Traverse to the second-last key
+        current = current[int(key) if key.isdigit() else key]
+
+    last_key = keys[-1]
+    if value is None:
+        del current[last_key]
+    else:
+        current[last_key] = value
+
+    logger.debug(f"Updated target: {target}")
+
+
+def pop_batch_fixes(redis_client, task_id, feature_batch):
+    """
+    Fetches and removes the fixes (sorted by sort_fixes) for every feature in a
+    batch with one pipelined round trip; returns a list of fix lists, in batch order.
+    """
+    keys = [f"{task_id}_fixes_{safe_key(feat.get('@id', '-- no @id --'))}" for feat in feature_batch]
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.lrange(key, 0, -1)
+        pipe.delete(key)
+    results = pipe.execute()
+    return [[json.loads(fix) for fix in fixes] for fixes in results[::2]]
+
+
+def feature_objects(feat, newpl, fclass_list):
+    """Unsaved Place* objects for one feature, keyed by model"""
+    geometry = feat.get('geometry')
+    geoms = []
+    if geometry:
+        geoms = geometry['geometries'] if geometry['type'] == 'GeometryCollection' else [geometry]
+    return {
+        PlaceGeom: [PlaceGeom(place=newpl, src_id=newpl.src_id, jsonb=g, geom=GEOSGeometry(json.dumps(g)))
+                    for g in geoms],
+        PlaceWhen: [PlaceWhen(place=newpl, src_id=newpl.src_id, jsonb=feat['when'], minmax=newpl.minmax)]
+        if feat.get('when') else [],
+        PlaceLink: [PlaceLink(place=newpl, src_id=newpl.src_id,
+                              jsonb={"type": l['type'], "identifier": aliasIt(l['identifier'].rstrip('/'))})
+                    for l in feat.get('links') or []],
+        PlaceRelated: [PlaceRelated(place=newpl, src_id=newpl.src_id, jsonb=r)
+                       for r in feat.get('relations') or []],
+        PlaceDescription: [PlaceDescription(place=newpl, src_id=newpl.src_id, jsonb=des)
+                           for des in feat.get('descriptions') or []],
+        PlaceDepiction: [PlaceDepiction(place=newpl, src_id=newpl.src_id, jsonb=dep)
+                         for dep in feat.get('depictions') or []],
+        PlaceName: [PlaceName(place=newpl, src_id=newpl.src_id, toponym=n['toponym'].split(',')[0].strip(), jsonb=n)
+                    for n in feat.get('names') or [] if 'toponym' in n],
+        PlaceType: [PlaceType(place=newpl, src_id=newpl.src_id, jsonb=t, fclass=fc)
+                    for t, fc in zip(feat.get('types') or [], fclass_list)],
+    }
+
+
 def ds_insert(jsonld_filepath, ds, task_id):
+    """
+    Streams the features of a validated LPF file into the database.
+
+    Features are read in batches (read_json_features_in_batches), so memory use
+    does not grow with the file. Each batch gets its validation fixes from Redis
+    in one round trip and blocks of primary keys for Place and every Place*
+    table from their id sequences (so ORM inserts running meanwhile cannot
+    collide with them), and is then written with one COPY per table.
+    ccodes left null by the contributor are filled from geometry with a single
+    set-based update at the end. All of it runs in one transaction.
+    """
+    from utils.mapdata import mark_mapdata_for_refresh
+
     places_already_exist = Place.objects.filter(dataset=ds.label).exists()
     if places_already_exist:
         message = f"Database already contains places for dataset '{ds.label}'. Cannot add more."
@@ -281,104 +313,40 @@ def ds_insert(jsonld_filepath, ds, task_id):
     redis_client.hset(task_id, 'insert_start_time', timezone.now().isoformat())
     redis_client.hset(task_id, 'queued_features', ds.numrows)
 
-    data_mappings = {
-        'PlaceGeoms': ('Geom', 'geometry', lambda feat: [
-            PlaceGeom(place=newpl, src_id=newpl.src_id, jsonb=g, geom=GEOSGeometry(json.dumps(g)))
-            for g in feat['geometry']['geometries']] if feat['geometry']['type'] == 'GeometryCollection' else
-        [PlaceGeom(place=newpl, src_id=newpl.src_id, jsonb=feat['geometry'],
-                   geom=GEOSGeometry(json.dumps(feat['geometry'])))]),
-        'PlaceWhens': ('When', 'when', lambda feat: [
-            PlaceWhen(place=newpl, src_id=newpl.src_id, jsonb=feat['when'], minmax=newpl.minmax)]),
-        'PlaceLinks': ('Link', 'links', lambda feat: [
-            PlaceLink(place=newpl, src_id=newpl.src_id,
-                      jsonb={"type": l['type'], "identifier": aliasIt(l['identifier'].rstrip('/'))})
-            for l in feat['links']]),
-        'PlaceRelated': ('Related', 'relations', lambda feat: [
-            PlaceRelated(place=newpl, src_id=newpl.src_id, jsonb=r)
-            for r in feat['relations']]),
-        'PlaceDescriptions': ('Description', 'descriptions', lambda feat: [
-            PlaceDescription(place=newpl, src_id=newpl.src_id, jsonb=des)
-            for des in feat['descriptions']]),
-        'PlaceDepictions': ('Depiction', 'depictions', lambda feat: [
-            PlaceDepiction(place=newpl, src_id=newpl.src_id, jsonb=dep)
-            for dep in feat['depictions']]),
-        'PlaceNames': ('Name', 'names', lambda feat: [
-            PlaceName(place=newpl, src_id=newpl.src_id, toponym=n['toponym'].split(',')[0].strip(), jsonb=n)
-            for n in feat.get('names', []) if 'toponym' in n]),
-        'PlaceTypes': ('Type', 'types', lambda feat: [
-            PlaceType(place=newpl, src_id=newpl.src_id, jsonb=t, fclass=fc)
-            for t, fc in zip(feat.get('types', []), fclass_list)])
-    }
-
     errors = []
-    pk_manager = PrimaryKeyManager()
-    pk_manager.initialize_pks([model for model, _, _ in data_mappings.values()])
 
     sort_fixes(task_id)
 
-    def apply_fix(target, fix):
-        """Apply a fix to a target object based on the path and fix provided."""
-        logger.debug(f"apply_fix: {target}, {fix}")
-        if target is None or fix is None:
-            return
-        path = fix.get('path', '')
-        keys = path.split('.')
-        if len(keys) > 2:
-            keys = keys[2:]  # Ignore initial "features.0."
-        else:
-            return  # Path is not valid if it has fewer than 3 parts
-        value = fix.get('fix')
-        logger.debug(f"apply_fix path & value: {keys}, {value}")
-
-        current = target
-        for key in keys[:-1]:  # Traverse to the second-last key
-            current = current[int(key) if key.isdigit() else key]
-
-        last_key = keys[-1]
-        if value is None:
-            del current[last_key]
-        else:
-            current[last_key] = value
-
-        logger.debug(f"Updated target: {target}")
+    aat_fclasses = dict(Type.objects.values_list('aat_id', 'fclass'))
+    ccodes_from_geom = []  # ids of places whose ccodes are to be derived from geometry
 
     # Start a transaction to ensure atomicity
     with transaction.atomic():
         try:
             for feature_batch in read_json_features_in_batches(jsonld_filepath):
-                for feat in feature_batch:
-                    logger.debug(f"Inserting feature: {feat}")
-                    feature_id = feat.get("@id", "-- no @id --")
-                    fixes_key = f"{task_id}_fixes_{safe_key(feature_id)}"
-                    # logger.debug(f"Fixes key: {fixes_key}")
+                places = []
+                objs = {model: [] for model in INSERT_MODELS}
+                place_pks = reserve_ids(Place, len(feature_batch))
 
+                for feat, fixes, place_pk in zip(feature_batch,
+                                                 pop_batch_fixes(redis_client, task_id, feature_batch),
+                                                 place_pks):
                     # Apply fixes if available
-                    if redis_client.exists(fixes_key):
-                        while redis_client.llen(fixes_key) > 0:
-                            fix_json = redis_client.lpop(fixes_key)
-                            if fix_json:
-                                fix = json.loads(fix_json)
-                                apply_fix(feat, fix)
-                                logger.debug(f"Feature after applying fix: {feat}")
-                            # feat = apply_fix(feat, json.loads(redis_client.lpop(fixes_key)))
+                    for fix in fixes:
+                        apply_fix(feat, fix)
 
                     title = re.sub(r'\(.*?\)', '', feat.get('properties', {}).get('title', ''))
-                    # logger.debug(f'title: {title}')
                     geojson = feat.get('geometry')
-                    # logger.debug(f'geojson: {geojson}')
                     ccodes = feat.get('properties', {}).get('ccodes', [])
-                    if ccodes is None and geojson:
-                        ccodes = ccodesFromGeom(geojson)
-                    # logger.debug(f'ccodes: {ccodes}')
+                    if ccodes is None:
+                        ccodes = []
+                        if geojson:
+                            ccodes_from_geom.append(place_pk)
                     intervals, minmax = parse_dates(feat)
-                    # logger.debug(f"intervals: {intervals}")
-                    # logger.debug(f"minmax: {minmax}")
-                    fclass_list = get_fclass_list(feat)
-                    # logger.debug(f"fclass_list: {fclass_list}")
-
-                    logger.debug(f"New Place from feature: {feat}")
+                    fclass_list = get_fclass_list(feat, aat_fclasses)
 
                     newpl = Place(
+                        id=place_pk,
                         src_id=feat.get('@id') if ds.uri_base in ['', None] or not feat.get('@id').startswith(
                             ds.uri_base) else feat.get('@id')[len(ds.uri_base):],
                         dataset=ds,
@@ -389,34 +357,36 @@ def ds_insert(jsonld_filepath, ds, task_id):
                         timespans=intervals,
                         create_date=timezone.now()
                     )
-                    newpl.save()
-                    logger.debug(f'New place: {newpl}')
-
-                    objs = {key: list(filter(None, [item for sublist in map(create_func, [feat]) for item in sublist]))
-                            for key, (_, feat_key, create_func) in data_mappings.items()
-                            if feat.get(feat_key)}
-
-                    for model, obj_list in [(model, objs[key]) for key, (model, _, _) in data_mappings.items() if
-                                            objs.get(key)]:
-                        try:
-                            model_class = globals()[f'Place{model}']
-                            for obj in obj_list:
-                                obj.pk = pk_manager.get_next_pk(model_class.__name__)
-                                obj.save()
-                        except IntegrityError as e:
-                            errors.append({"field": model, "error": str(e)})
-                            raise IntegrityError(f"IntegrityError in database insertion for {model}: {e}")
-                        except ValidationError as e:
-                            errors.append({"field": model, "error": str(e)})
-                            raise ValidationError(f"ValidationError in database insertion for {model}: {e}")
-                        except DataError as e:
-                            errors.append({"field": model, "error": str(e)})
-                            raise DataError(f"Database insertion load for {model} failed on {newpl}: {e}")
-                        except Exception as e:
-                            errors.append({"field": model, "error": str(e)})
-                            raise Exception(f"Unexpected error in database insertion for {model}: {e}")
-
-                    redis_client.hincrby(task_id, 'queued_features', -1)
+                    places.append(newpl)
+                    for model, obj_list in feature_objects(feat, newpl, fclass_list).items():
+                        objs[model].extend(obj_list)
+
+                for model, obj_list in [(Place, places)] + list(objs.items()):
+                    if not obj_list:
+                        continue
+                    try:
+                        if model is not Place:  # Place pks were reserved above, as children refer to them
+                            for obj, pk in zip(obj_list, reserve_ids(model, len(obj_list))):
+                                obj.pk = pk
+                        copy_objects(model, obj_list, include_pk=True)
+                    except IntegrityError as e:
+                        errors.append({"field": model.__name__, "error": str(e)})
+                        raise IntegrityError(f"IntegrityError in database insertion for {model.__name__}: {e}")
+                    except DataError as e:
+                        errors.append({"field": model.__name__, "error": str(e)})
+                        raise DataError(f"Database insertion load for {model.__name__} failed: {e}")
+                    except Exception as e:
+                        errors.append({"field": model.__name__, "error": str(e)})
+                        raise Exception(f"Unexpected error in database insertion for {model.__name__}: {e}")
+
+                redis_client.hincrby(task_id, 'queued_features', -len(feature_batch))
+                logger.debug(f"ds_insert {ds.label}: wrote batch of {len(feature_batch)} features")
+
+            if ccodes_from_geom:
+                ccodesFromGeoms(place_ids=ccodes_from_geom)
+            # COPY sends no post_save signals
+            DatasetStats.mark_stale(DatasetStats.SECTIONS, dataset=ds)
+            transaction.on_commit(lambda: mark_mapdata_for_refresh.delay('datasets', ds.id))
 
         except Exception as e:
             logger.debug(f"Failed to insert data into dataset: {e}")
@@ -501,7 +471,8 @@ def parse_dates(feature):
     return merged_intervals, minmax
 
 
-def get_fclass_list(feat):
+def get_fclass_list(feat, aat_fclasses=None):
+    """fclasses for a feature's types; aat_fclasses ({aat_id: fclass}) saves a Type query per type"""
     # Mappings between GeoNames and Wikidata types
     geo_wd_mapping = {
         'A': ['Q56061', 'Q192611', 'Q102496', 'Q10864048', 'Q1799794', 'Q1149654', 'Q82794', 'Q15642541', 'Q217151'],
@@ -524,8 +495,13 @@ def get_fclass_list(feat):
         identifier = t.get('identifier')
         if identifier and identifier.startswith('aat:'):
             aat_id = int(identifier[4:])
+            if aat_fclasses is not None:
+                if aat_id in aat_fclasses:
+                    fclass_list.append(aat_fclasses[aat_id])
+                else:
+                    logger.warning(f"aat_id {aat_id} not found in Type model.")
             # Check if the aat_id exists in the database
-            if Type.objects.filter(aat_id=aat_id).exists():
+            elif Type.objects.filter(aat_id=aat_id).exists():
                 try:
                     fclass = get_object_or_404(Type, aat_id=aat_id).fclass
                     fclass_list.append(fclass)
@@ -0,0 +1,111 @@
+# validation/feature_index.py
+# byte-offset index of the features in an LPF (GeoJSON FeatureCollection) file, so that
+# validation workers can each read their own slice of an upload
+
+import json
+import logging
+import os
+import re
+
+from django.conf import settings
+
+logger = logging.getLogger('validation')
+
+STRUCTURAL = re.compile(rb'[{}\[\]"\\]')
+READ_SIZE = 4 * 1024 * 1024
+MAX_KEY_LENGTH = 64
+
+
+def feature_offsets(file_path):
+    """
+    Yields (start, end) byte offsets of each object in the top-level `features` array, found in
+    one pass over the file without parsing it: only brackets, braces, quotes and escapes are
+    examined, so memory use does not depend on the size of the file or of its features.
+    """
+    depth = 0
+    in_string = False
+    escaped_at = -1  # offset of a character escaped by a backslash
+    key_start = None  # offset of the opening quote of a string in the top-level object
+    last_key = None
+    features_depth = None  # depth inside the `features` array, once it has been found
+    feature_start = None
+    offset = 0
+
+    with open(file_path, 'rb') as file:
+        fd = file.fileno()
+        while True:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                break
+            for match in STRUCTURAL.finditer(chunk):
+                pos = offset + match.start()
+                if pos == escaped_at:
+                    continue
+                char = match.group()
+
+                if in_string:
+                    if char == b'\\':
+                        escaped_at = pos + 1
+                    elif char == b'"':
+                        in_string = False
+                        if key_start is not None:
+                            length = pos - key_start - 1
+                            last_key = os.pread(fd, length, key_start + 1) if length <= MAX_KEY_LENGTH else None
+                            key_start = None
+                    continue
+
+                if char == b'"':
+                    in_string = True
+                    if depth == 1 and features_depth is None:
+                        key_start = pos
+                elif char in (b'{', b'['):
+                    depth += 1
+                    if features_depth is None:
+                        # The last string before a value in the top-level object is that value's key
+                        if depth == 2 and char == b'[' and last_key == b'features':
+                            features_depth = depth
+                    elif depth == features_depth + 1 and char == b'{':
+                        feature_start = pos
+                elif char in (b'}', b']'):
+                    depth -= 1
+                    if features_depth is not None:
+                        if depth == features_depth and feature_start is not None:
+                            yield feature_start, pos + 1
+                            feature_start = None
+                        elif depth < features_depth:
+                            return
+            offset += len(chunk)
+
+    if features_depth is None:
+        raise ValueError(f"No `features` array found in {file_path}")
+
+
+def feature_shards(file_path, max_bytes=None):
+    """
+    Groups consecutive features into shard descriptors of at most `max_bytes` of source JSON
+    (but at least one feature each): {'path', 'start', 'end', 'count'}.
+    """
+    max_bytes = max_bytes or settings.VALIDATION_SHARD_BYTES
+    shard = None
+    for start, end in feature_offsets(file_path):
+        if shard and end - shard['start'] > max_bytes:
+            yield shard
+            shard = None
+        if shard is None:
+            shard = {'path': file_path, 'start': start, 'end': end, 'count': 0}
+        shard['end'] = end
+        shard['count'] += 1
+    if shard:
+        yield shard
+
+
+def read_feature_shard(shard):
+    """The features of a shard, parsed from its byte range of the file"""
+    with open(shard['path'], 'rb') as file:
+        file.seek(shard['start'])
+        data = file.read(shard['end'] - shard['start'])
+    features = json.loads(b'[' + data + b']')
+    if len(features) != shard['count']:
+        raise ValueError(f"Expected {shard['count']} features at bytes {shard['start']}-{shard['end']} "
+                         f"of {shard['path']}, found {len(features)}")
+    return features
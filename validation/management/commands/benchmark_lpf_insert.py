@@ -0,0 +1,112 @@
+# validation/management/commands/benchmark_lpf_insert.py
+
+import json
+import logging
+import os
+import resource
+import shutil
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from datasets.models import Dataset
+from validation.create_dataset import ds_insert, get_redis_client, read_json_features_in_batches
+from validation.views import parse_to_LPF
+
+logger = logging.getLogger('validation')
+
+TEST_DATA_DIR = os.path.join(settings.BASE_DIR, 'validation/test_data')
+LPF_EXTENSIONS = ['.jsonld', '.geojson', '.json']
+
+
+class Command(BaseCommand):
+    help = 'Time ds_insert() on the validation/test_data files, replicated 1x/10x/100x'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int, nargs='+', default=[1, 10, 100],
+                            help='Replication factors to load each file at')
+        parser.add_argument('--files', nargs='+', default=None,
+                            help='Files to load instead of everything in validation/test_data')
+        parser.add_argument('--owner', type=int, default=1, help='User id to own the benchmark datasets')
+        parser.add_argument('--keep', action='store_true',
+                            help='Commit the loaded datasets instead of rolling them back')
+
+    def handle(self, *args, **options):
+        files = options['files'] or sorted(
+            os.path.join(TEST_DATA_DIR, f) for f in os.listdir(TEST_DATA_DIR) if not f.startswith('.'))
+        tmpdir = tempfile.mkdtemp(prefix='lpf_benchmark_')
+        try:
+            for path in files:
+                name = os.path.basename(path)
+                try:
+                    lpf_path = self.to_lpf(path, tmpdir)
+                except Exception as e:
+                    self.stderr.write(self.style.WARNING(f'{name}: skipped, conversion to LPF failed ({e})'))
+                    continue
+
+                for factor in options['factors']:
+                    replica_path, feature_count = self.replicate(lpf_path, factor, tmpdir)
+                    seconds = self.load(replica_path, feature_count, options['owner'], options['keep'])
+                    os.remove(replica_path)
+                    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+                    self.stdout.write(
+                        f'{name:<50} x{factor:<4} {feature_count:>9} features {seconds:9.2f}s '
+                        f'{feature_count / seconds if seconds else 0:9.0f} features/s  peak RSS {peak_mb:8.1f} MB')
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def to_lpf(self, path, tmpdir):
+        """LPF file for a test file; delimited/spreadsheet files are converted as on upload"""
+        ext = os.path.splitext(path)[1].lower()
+        if ext in LPF_EXTENSIONS:
+            return path
+        # parse_to_LPF writes its output next to its input, so work on a copy
+        copy_path = os.path.join(tmpdir, f'{uuid.uuid4().hex}{ext}')
+        shutil.copy(path, copy_path)
+        return parse_to_LPF(copy_path, ext)[0]
+
+    def replicate(self, lpf_path, factor, tmpdir):
+        """Writes `factor` copies of the features in lpf_path to one file, with distinct @ids"""
+        replica_path = os.path.join(tmpdir, f'replica_{factor}x_{uuid.uuid4().hex}.jsonld')
+        feature_count = 0
+        with open(replica_path, 'w') as out:
+            out.write('{\n"type": "FeatureCollection",\n"features": [\n')
+            for copy in range(factor):
+                for feature_batch in read_json_features_in_batches(lpf_path):
+                    for feat in feature_batch:
+                        if copy:
+                            feat['@id'] = f"{feat.get('@id', '')}-{copy}"
+                        if feature_count:
+                            out.write(',\n')
+                        json.dump(feat, out, ensure_ascii=False)
+                        feature_count += 1
+            out.write('\n]}\n')
+        return replica_path, feature_count
+
+    def load(self, replica_path, feature_count, owner_id, keep):
+        """Runs ds_insert() on a new dataset; returns elapsed seconds"""
+        task_id = f'benchmark-{uuid.uuid4()}'
+        try:
+            with transaction.atomic():
+                label = f'bench_{uuid.uuid4().hex[:12]}'
+                ds = Dataset.objects.create(
+                    owner_id=owner_id,
+                    label=label,
+                    title=f'LPF insert benchmark ({label})',
+                    description='Created by the benchmark_lpf_insert command',
+                    numrows=feature_count,
+                    ds_status='uploaded'
+                )
+                start = time.perf_counter()
+                ds_insert(replica_path, ds, task_id)
+                seconds = time.perf_counter() - start
+                if not keep:
+                    transaction.set_rollback(True)
+        finally:
+            get_redis_client().delete(task_id)
+        logger.info(f'benchmark_lpf_insert: {feature_count} features in {seconds:.2f}s')
+        return seconds
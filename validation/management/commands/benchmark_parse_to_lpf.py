@@ -0,0 +1,86 @@
+# validation/management/commands/benchmark_parse_to_lpf.py
+
+import csv
+import logging
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from validation.views import parse_to_LPF
+
+logger = logging.getLogger('validation')
+
+COLUMNS = ['id', 'title', 'title_source', 'fclasses', 'aat_types', 'start', 'end', 'ccodes', 'variants',
+           'types', 'matches', 'lon', 'lat', 'description']
+
+
+class Command(BaseCommand):
+    help = 'Time parse_to_LPF() on generated LP-TSV files (default 10k/100k/500k rows), or on given files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 500000],
+                            help='Sizes of the generated TSV files')
+        parser.add_argument('--files', nargs='+', default=None,
+                            help='Delimited or spreadsheet files to convert instead of generated ones')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for generated rows')
+
+    def handle(self, *args, **options):
+        tmpdir = tempfile.mkdtemp(prefix='parse_to_lpf_benchmark_')
+        try:
+            if options['files']:
+                for path in options['files']:
+                    # parse_to_LPF writes its output next to its input, so work on a copy
+                    ext = os.path.splitext(path)[1].lower()
+                    copy_path = os.path.join(tmpdir, f'{uuid.uuid4().hex}{ext}')
+                    shutil.copy(path, copy_path)
+                    self.run(os.path.basename(path), copy_path, ext)
+            else:
+                rng = random.Random(options['seed'])
+                for rows in options['rows']:
+                    path = os.path.join(tmpdir, f'generated_{rows}.tsv')
+                    self.generate(path, rows, rng)
+                    self.run(f'generated TSV, {rows} rows', path, '.tsv')
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def run(self, name, path, ext):
+        size_mb = os.path.getsize(path) / 1024 ** 2
+        start = time.perf_counter()
+        lpf_path, feature_count, _, _ = parse_to_LPF(path, ext)
+        seconds = time.perf_counter() - start
+        os.remove(lpf_path)
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(
+            f'{name:<50} {size_mb:8.1f} MB {feature_count:>9} features {seconds:9.2f}s '
+            f'{feature_count / seconds if seconds else 0:9.0f} features/s  peak RSS {peak_mb:8.1f} MB')
+        logger.info(f'benchmark_parse_to_lpf: {name}: {feature_count} features in {seconds:.2f}s')
+
+    def generate(self, path, rows, rng):
+        """Writes an LP-TSV file of `rows` plausible, valid records"""
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+            writer.writerow(COLUMNS)
+            for i in range(rows):
+                start = rng.randint(-500, 1800)
+                writer.writerow([
+                    f'bench-{i}',
+                    f'Place {i}',
+                    'Benchmark gazetteer',
+                    rng.choice(['P', 'A', 'P;S', 'H']),
+                    rng.choice(['300008347', '300008375', '']),
+                    start,
+                    start + rng.randint(0, 300),
+                    rng.choice(['GB', 'FR;DE', 'IT', '']),
+                    f'Place {i}@en; Lieu {i}@fr',
+                    rng.choice(['settlement', 'town;port', '']),
+                    f'wd:Q{rng.randint(1, 10 ** 7)}',
+                    f'{rng.uniform(-180, 180):.6f}',
+                    f'{rng.uniform(-90, 90):.6f}',
+                    f'Generated record {i}',
+                ])
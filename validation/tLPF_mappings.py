@@ -3,6 +3,8 @@
 import re
 import logging
 
+import pandas as pd
+
 logger = logging.getLogger('validation')
 
 # Regex to capture toponyms and RFC 5646 language tags
@@ -77,52 +79,83 @@ def str_x(x, split=False):
         return stripped
 
 
+def str_x_column(series, split=False):
+    """str_x for a whole column at once; returns a list"""
+    stripped = series.astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+    if split:
+        return [s.split(';') if s else [] for s in stripped]
+    return [s or None for s in stripped]
+
+
+def float_column(series):
+    """safe_float_conversion for a whole column at once; returns a list"""
+    numbers = pd.to_numeric(series.astype(str).str.strip(), errors='coerce')
+    return [None if pd.isna(n) else float(n) for n in numbers]
+
+
+def split_items(parts):
+    return [item.strip() for item in parts if item.strip()]
+
+
 tLPF_mappings = {
     'id': {
         'lpf': '@id',
-        'converter': lambda x: str_x(x)
+        'converter': lambda x: str_x(x),
+        'column_converter': lambda s: str_x_column(s)
     },
     'title': {
         'lpf': 'names.0.toponym',
-        'converter': lambda x: str_x(x)
+        'converter': lambda x: str_x(x),
+        'column_converter': lambda s: str_x_column(s)
     },
     'title_source': {
         'lpf': 'names.0.citations.0.label',
-        'converter': lambda x: str_x(x)
+        'converter': lambda x: str_x(x),
+        'column_converter': lambda s: str_x_column(s)
     },
     'fclasses': {
         'lpf': 'properties.fclasses',
-        'converter': lambda x: [item.strip() for item in str_x(x, True) if item.strip()] or None
+        'converter': lambda x: [item.strip() for item in str_x(x, True) if item.strip()] or None,
+        'column_converter': lambda s: [split_items(parts) or None for parts in str_x_column(s, True)]
     },
     'aat_types': {
         'lpf': 'types',
         'converter': lambda x: [{'identifier': f'aat:{item.strip()}'} for item in str_x(x, True) if
-                                item.strip()] or None
+                                item.strip()] or None,
+        'column_converter': lambda s: [[{'identifier': f'aat:{item}'} for item in split_items(parts)] or None
+                                       for parts in str_x_column(s, True)]
     },
     'attestation_year': {
         'lpf': 'names.0.citations.0.year',
-        'converter': lambda x: str_x(x)
+        'converter': lambda x: str_x(x),
+        'column_converter': lambda s: str_x_column(s)
     },
     'start': {
         'lpf': 'when.timespans.0.start.in',
-        'converter': lambda x: str_x(x)
+        'converter': lambda x: str_x(x),
+        'column_converter': lambda s: str_x_column(s)
     },
     'end': {
         'lpf': 'when.timespans.0.end.in',
-        'converter': lambda x: str_x(x)
+        'converter': lambda x: str_x(x),
+        'column_converter': lambda s: str_x_column(s)
     },
     'title_uri': {
         'lpf': 'names.0.citations.0.@id',
-        'converter': lambda x: str_x(x)
+        'converter': lambda x: str_x(x),
+        'column_converter': lambda s: str_x_column(s)
     },
     'ccodes': {
         'lpf': 'properties.ccodes',
-        'converter': lambda x: [item.strip() for item in str_x(x, True) if item.strip()] or None
+        'converter': lambda x: [item.strip() for item in str_x(x, True) if item.strip()] or None,
+        'column_converter': lambda s: [split_items(parts) or None for parts in str_x_column(s, True)]
     },
     'matches': {
         'lpf': 'links',
         'converter': lambda x: [{'type': 'exactMatch', 'identifier': item.strip()} for item in str_x(x, True) if
-                                item.strip()] or None
+                                item.strip()] or None,
+        'column_converter': lambda s: [[{'type': 'exactMatch', 'identifier': item} for item in split_items(parts)]
+                                       or None for parts in str_x_column(s, True)]
     },
     'variants': {
         'lpf': 'additional_names',
@@ -130,7 +163,9 @@ tLPF_mappings = {
     },
     'types': {
         'lpf': 'additional_types',
-        'converter': lambda x: [{'label': item.strip()} for item in str_x(x, True) if item.strip()] or None
+        'converter': lambda x: [{'label': item.strip()} for item in str_x(x, True) if item.strip()] or None,
+        'column_converter': lambda s: [[{'label': item} for item in split_items(parts)] or None
+                                       for parts in str_x_column(s, True)]
     },
     'parent_name': {
         'lpf': 'relations.0',
@@ -138,31 +173,38 @@ tLPF_mappings = {
     },
     'parent_id': {
         'lpf': 'relations.0.relationTo',
-        'converter': lambda x: str_x(x)
+        'converter': lambda x: str_x(x),
+        'column_converter': lambda s: str_x_column(s)
     },
     'lon': {
         'lpf': 'geometry.coordinates.0',
-        'converter': lambda x: safe_float_conversion(x)
+        'converter': lambda x: safe_float_conversion(x),
+        'column_converter': lambda s: float_column(s)
     },
     'lat': {
         'lpf': 'geometry.coordinates.1',
-        'converter': lambda x: safe_float_conversion(x)
+        'converter': lambda x: safe_float_conversion(x),
+        'column_converter': lambda s: float_column(s)
     },
     'geowkt': {
         'lpf': 'geowkt',
-        'converter': lambda x: str_x(x)
+        'converter': lambda x: str_x(x),
+        'column_converter': lambda s: str_x_column(s)
     },
     'geo_source': {
         'lpf': 'geometry.citations.0.label',
-        'converter': lambda x: str_x(x)
+        'converter': lambda x: str_x(x),
+        'column_converter': lambda s: str_x_column(s)
     },
     'geo_id': {
         'lpf': 'geometry.citations.0.@id',
-        'converter': lambda x: str_x(x)
+        'converter': lambda x: str_x(x),
+        'column_converter': lambda s: str_x_column(s)
     },
     'description': {
         'lpf': 'descriptions.0.value',
-        'converter': lambda x: str_x(x)
+        'converter': lambda x: str_x(x),
+        'column_converter': lambda s: str_x_column(s)
     },
     'approximation': {
         'lpf': 'geometry.approximation',
@@ -173,3 +215,23 @@ tLPF_mappings = {
         )
     }
 }
+
+
+def convert_tLPF_chunk(df):
+    """
+    Converted tLPF records (dicts of mapped columns only) for a DataFrame chunk.
+    Each column is converted in one go, with its `column_converter` where it has one,
+    otherwise by applying its per-value `converter` down the column.
+    """
+    columns = {}
+    for key, mapping in tLPF_mappings.items():
+        if key in df.columns:
+            series = df[key]
+            if 'column_converter' in mapping:
+                columns[key] = mapping['column_converter'](series)
+            else:
+                columns[key] = [mapping['converter'](x) for x in series]
+
+    keys = list(columns)
+    for values in zip(*(columns[key] for key in keys)):
+        yield dict(zip(keys, values))
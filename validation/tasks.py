@@ -1,5 +1,6 @@
 # validation/tasks.py
 import os
+import hashlib
 import json
 import logging
 import time
@@ -10,24 +11,28 @@ from celery.result import AsyncResult
 from datetime import timedelta
 from itertools import chain
 
-from jsonschema import Draft7Validator, ValidationError
+from jsonschema import Draft7Validator, RefResolver, ValidationError
 from django.http import JsonResponse
 from django.utils import timezone
 from django.conf import settings
 import redis
 
-from shapely.geometry import shape
-from shapely.validation import make_valid
+import numpy as np
+import shapely
 from validation.create_dataset import save_dataset
+from validation.feature_index import read_feature_shard
 
 logger = logging.getLogger('validation')
 
+SCHEMA_KEY = "validation_schema:{}"
+_feature_validators = {}  # schema hash -> compiled feature validator, per worker process
+
 
 def get_redis_client():
     return redis.StrictRedis.from_url(settings.CELERY_BROKER_URL)
 
 
-def task_count(task_name='validation.tasks.validate_feature_batch'):
+def task_count(task_name='validation.tasks.validate_feature_shard'):
     app = Celery('whg')
     i = app.control.inspect()
 
@@ -199,6 +204,7 @@ def cleanup(task_id):
     redis_client = get_redis_client()
     revoke_all_subtasks(redis_client, task_id)
     redis_client.delete(f"{task_id}_errors")
+    redis_client.delete(f"{task_id}_error_count")
     redis_client.delete(f"{task_id}_fixes")
     redis_client.delete(f"{task_id}_metadata")
     redis_client.delete(task_id)
@@ -269,61 +275,136 @@ def get_task_status(request, task_id):
     })
 
 
-def validate_geometry(geometry):
+def collect_geometries(feature_batch):
     """
-    Validate and fix a single geometry using Shapely.
-    Apply buffer(0) first, then make_valid if necessary.
+    Single geometries to validate in a batch of features, and each feature's initial validity.
 
-    :param geometry: A dictionary representing a GeoJSON geometry
-    :return: Tuple of (geometry, fixed, valid)
+    Returns (targets, valid), where targets is a list of (feature index, geometry dict) and
+    valid[i] is False for features whose geometry is missing or malformed. Null geometries
+    are valid, and null members of a GeometryCollection are dropped.
     """
-    fixed = False
-    valid = False
+    targets = []
+    valid = [True] * len(feature_batch)
 
-    geometry_type = geometry.get('type', None)
-    geometry_coordinates = geometry.get('coordinates', None)
-    if geometry_type and geometry_coordinates:
-        try:
-            # Convert GeoJSON to Shapely geometry
-            geom = shape({
-                'type': geometry.get('type'),
-                'coordinates': geometry_coordinates
-            })
+    for index, feature in enumerate(feature_batch):
+        # Absence of `geometry` is otherwise left to JSON Schema validation
+        geometry = feature.get('geometry', None)
+        if 'geometry' not in feature:
+            valid[index] = False
+        elif geometry is None:
+            logger.debug("Feature has no geometry (null).")
+        elif not isinstance(geometry, dict):
+            logger.error("Invalid geometry format in feature.")
+            valid[index] = False
+        elif geometry.get('type', None) == 'GeometryCollection':
+            members = [geom for geom in geometry.get('geometries', []) if geom is not None]
+            geometry['geometries'] = members
+            targets.extend((index, geom) for geom in members)
+        elif geometry.get('type', None):
+            targets.append((index, geometry))
+        else:
+            logger.debug("Feature geometry lacks `type`.")
+            valid[index] = False
 
-            # Check if the geometry is valid
-            if not geom.is_valid:
-                logger.debug(f"Geometry is invalid: {geom}")
-
-                # First Tier Fix: Attempt to fix the geometry using buffer(0)
-                fixed_geom = geom.buffer(0)
-                if fixed_geom.is_valid:
-                    geometry['coordinates'] = fixed_geom.geometry['coordinates']
-                    logger.debug(f"Fixed invalid geometry with buffer(0).")
-                    fixed = True
-                    valid = True
-                else:
-                    logger.debug("Buffer(0) did not fix the geometry. Attempting make_valid...")
-
-                    # Second Tier Fix: Attempt to fix the geometry using make_valid
-                    fixed_geom = make_valid(geom)
-                    if fixed_geom.is_valid:
-                        geometry['coordinates'] = fixed_geom.geometry['coordinates']
-                        logger.debug(f"Fixed invalid geometry with make_valid.")
-                        fixed = True
-                        valid = True
-                    else:
-                        logger.error("Failed to fix geometry with make_valid.")
-            else:
-                logger.debug(f"Geometry passed validation.")
-                valid = True
+    return targets, valid
+
+
+def as_single_type(geom):
+    """make_valid can return a GeometryCollection: keep only its highest-dimension parts, as a Multi* geometry"""
+    if shapely.get_type_id(geom) != 7:  # GeometryCollection
+        return geom
+    parts = shapely.get_parts(geom)
+    # members can themselves be Multi* geometries (or collections): flatten until all are single
+    while parts.size and (shapely.get_type_id(parts) >= 4).any():
+        parts = shapely.get_parts(parts)
+    if not parts.size:
+        return geom
+    dimensions = shapely.get_dimensions(parts)
+    dimension = dimensions.max()
+    parts = parts[dimensions == dimension]
+    return {0: shapely.multipoints, 1: shapely.multilinestrings, 2: shapely.multipolygons}[dimension](parts)
 
+
+def repair_each(repair, geoms):
+    """
+    repair() applied to an array of geometries; if it fails on the array, applied to each
+    geometry in turn, with None (invalid) for any it fails on
+    """
+    try:
+        return repair(geoms)
+    except Exception as e:
+        logger.debug(f"Batch geometry repair failed ({e}); repairing one at a time.")
+    repaired = np.full(len(geoms), None, dtype=object)
+    for i, geom in enumerate(geoms):
+        try:
+            repaired[i] = repair(geom)
         except Exception as e:
-            logger.error(f"Error processing geometry: {e}")
-    else:
-        logger.error(f"Error: geometry lacks either type or coordinates.")
-        valid = False
+            logger.error(f"Could not repair geometry: {e}")
+    return repaired
 
-    return geometry, fixed, valid
+
+def validate_batch_geometries(feature_batch):
+    """
+    Validate and fix the geometries of a batch of GeoJSON features at once, with Shapely 2 array
+    operations. Invalid geometries are repaired with buffer(0) where that gives a valid, non-empty
+    result, otherwise with make_valid; repaired geometries are written back into the features.
+
+    :param feature_batch: List of GeoJSON features (modified in place)
+    :return: List of (fixed, valid) tuples, one per feature
+    """
+    targets, valid = collect_geometries(feature_batch)
+    fixed = [False] * len(feature_batch)
+    if not targets:
+        return list(zip(fixed, valid))
+
+    geojson_strings = np.array([
+        json.dumps({'type': g['type'], 'coordinates': g['coordinates']}) if g.get('coordinates') else ''
+        for _, g in targets
+    ], dtype=object)
+    has_coordinates = geojson_strings != ''
+    geoms = np.full(len(targets), None, dtype=object)
+    # Unreadable geometries stay None (and invalid)
+    geoms[has_coordinates] = shapely.from_geojson(geojson_strings[has_coordinates], on_invalid='ignore')
+
+    is_valid = shapely.is_valid(geoms)  # False for None
+    repairable = np.flatnonzero(~is_valid & ~shapely.is_missing(geoms))
+    if repairable.size:
+        logger.debug(f"{repairable.size} of {len(targets)} geometries in batch are invalid.")
+
+        # First Tier Fix: buffer(0)
+        repaired = repair_each(lambda g: shapely.buffer(g, 0), geoms[repairable])
+        repaired_ok = shapely.is_valid(repaired) & ~shapely.is_empty(repaired)
+
+        # Second Tier Fix: make_valid, for whatever buffer(0) did not fix
+        remaining = ~repaired_ok
+        if remaining.any():
+            repaired[remaining] = repair_each(shapely.make_valid, geoms[repairable[remaining]])
+            repaired_ok[remaining] = shapely.is_valid(repaired[remaining])
+
+        for i, position in enumerate(repairable):
+            if not repaired_ok[i]:
+                continue
+            index, geometry = targets[position]
+            try:
+                fixed_geometry = json.loads(shapely.to_geojson(as_single_type(repaired[i])))
+            except Exception as e:
+                # only this feature is invalid; the rest of the batch is still validated
+                logger.error(f"Could not write repaired geometry: {e}")
+                repaired_ok[i] = False
+                continue
+            geometry['type'] = fixed_geometry['type']
+            geometry['coordinates'] = fixed_geometry['coordinates']
+            is_valid[position] = True
+            fixed[index] = True
+        logger.debug(f"{int(repaired_ok.sum())} invalid geometries fixed.")
+
+    for (index, geometry), ok in zip(targets, is_valid):
+        if not ok:
+            if not geometry.get('coordinates'):
+                logger.error(f"Error: geometry lacks either type or coordinates.")
+            valid[index] = False
+
+    return list(zip(fixed, valid))
 
 
 def validate_feature_geometry(feature):
@@ -335,51 +416,7 @@ def validate_feature_geometry(feature):
     :return: Tuple of (feature, fixed, valid), where fixed is a boolean indicating if a fix was applied,
              and valid is a boolean indicating if the geometry is valid after fixing.
     """
-    fixed = False
-    valid = False
-
-    if 'geometry' in feature:
-        # Extract geometry from the feature
-        geometry = feature.get('geometry', None)
-
-        if geometry is None:
-            logger.debug("Feature has no geometry (null).")
-            valid = True  # null geometries are valid
-        elif isinstance(geometry, dict):
-            geometry_type = geometry.get('type', None)
-
-            if geometry_type == 'GeometryCollection':
-                geometries = geometry.get('geometries', [])
-                filtered_geometries = []
-                all_valid = True  # Assume all geometries are valid initially
-
-                for i, geom in enumerate(geometries):
-                    if geom is None:
-                        logger.debug(f"Skipping null geometry at index {i}.")
-                        continue
-
-                    logger.debug(f"Validating geometry {i} in GeometryCollection.")
-                    geom, geom_fixed, geom_valid = validate_geometry(geom)
-                    if geom_fixed:
-                        fixed = True
-                    if not geom_valid:
-                        all_valid = False
-                    filtered_geometries.append(geom)  # Collect valid geometries
-
-                # Update the feature with filtered geometries
-                feature['geometry']['geometries'] = filtered_geometries
-                valid = all_valid  # Set valid to True only if all geometries are valid
-            elif geometry_type:
-                # Handle single geometries
-                geometry, fixed, valid = validate_geometry(geometry)
-                feature['geometry'] = geometry
-            else:
-                logger.debug("Feature geometry lacks `type`.")
-
-        else:
-            logger.error("Invalid geometry format in feature.")
-
-    # No need to handle absence of `geometry` or other errors as this will be done by JSON Schema validation
+    (fixed, valid), = validate_batch_geometries([feature])
     return feature, fixed, valid
 
 
@@ -399,59 +436,117 @@ def revoke_all_subtasks(redis_client, task_id):
     logger.debug(f"Redis list '{task_id}_subtasks' has been deleted.")
 
 
+def schema_hash(schema):
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def register_schema(redis_client, schema):
+    """
+    Stores the schema in Redis for the validation workers, and returns the hash by which
+    validate_feature_shard messages refer to it (instead of each carrying the whole schema).
+    """
+    digest = schema_hash(schema)
+    redis_client.set(SCHEMA_KEY.format(digest), json.dumps(schema), ex=settings.VALIDATION_TIMEOUT)
+    return digest
+
+
+def get_feature_validator(redis_client, digest):
+    """
+    Compiled validator for a single LPF feature (#/definitions/feature of the registered schema),
+    built once per worker process for each schema hash.
+    """
+    validator = _feature_validators.get(digest)
+    if validator is None:
+        stored = redis_client.get(SCHEMA_KEY.format(digest))
+        if stored is None:
+            raise ValueError(f"Validation schema {digest} is not registered (or has expired).")
+        schema = json.loads(stored)
+        validator = Draft7Validator({"$ref": "#/definitions/feature"}, resolver=RefResolver.from_schema(schema))
+        _feature_validators[digest] = validator
+        logger.debug(f"Compiled feature validator for schema {digest}.")
+    return validator
+
+
+def flush_batch_results(redis_client, task_id, errors, fixes, processed):
+    """
+    Writes a batch's errors, fixes and progress in one pipeline; returns the task's total error
+    count, kept in an atomic counter so that concurrent batches need not read the error list.
+    """
+    pipe = redis_client.pipeline()
+    if errors:
+        pipe.rpush(f"{task_id}_errors", *errors)
+    if fixes:
+        pipe.rpush(f"{task_id}_fixes", *fixes)
+    pipe.incrby(f"{task_id}_error_count", len(errors))
+    if processed:
+        pipe.hincrby(task_id, 'queued_features', -processed)
+    pipe.hset(task_id, 'last_update', timezone.now().isoformat())
+    results = pipe.execute()
+    return results[int(bool(errors)) + int(bool(fixes))]
+
+
 @shared_task(bind=True)
-def validate_feature_batch(self, feature_batch, schema, task_id, namespaces=None):
+def validate_feature_shard(self, shard, schema_digest, task_id, namespaces=None):
     """
-    Validate a batch of features and manage subtasks.
-    
+    Validate the features in one shard of the uploaded LPF file: the worker reads them itself
+    from the shard's byte range (see validation.feature_index), so the message stays small.
+
     :param self: The Celery task instance.
-    :param feature_batch: List of GeoJSON features to validate.
-    :param schema: JSON schema for validation.
+    :param shard: Shard descriptor, as yielded by feature_shards.
+    :param schema_digest: Hash of the JSON schema for validation, as returned by register_schema.
     :param task_id: ID of the parent task.
     """
+    validate_features(self.request.id, read_feature_shard(shard), schema_digest, task_id, namespaces)
+
 
-    validator = Draft7Validator(schema)
+def validate_features(sub_task_id, feature_batch, schema_digest, task_id, namespaces=None):
     redis_client = get_redis_client()
+    validator = get_feature_validator(redis_client, schema_digest)
 
     # Store the current task ID as a subtask
-    sub_task_id = self.request.id
-    redis_client.rpush(f"{task_id}_subtasks", sub_task_id)
-    redis_client.hincrby(task_id, 'queued_batches', 1)
+    pipe = redis_client.pipeline()
+    pipe.rpush(f"{task_id}_subtasks", sub_task_id)
+    pipe.hincrby(task_id, 'queued_batches', 1)
+    pipe.get(f"{task_id}_error_count")
+    error_count = int(pipe.execute()[2] or 0)
+
+    errors = []
+    fixes = []
+    processed = 0
 
-    for feature in feature_batch:
+    geometry_results = validate_batch_geometries(feature_batch)
+
+    for feature, (fixed, valid) in zip(feature_batch, geometry_results):
         stopValidation = False
         fixAttempts = 0
 
-        feature, fixed, valid = validate_feature_geometry(feature)
         if not valid:
-            redis_client.rpush(f"{task_id}_errors", json.dumps({
+            errors.append(json.dumps({
                 "feature_id": feature.get("@id", "-- no @id --"),
                 "path": "features.feature.geometry",
                 "description": "Geometry failed validation and could not be fixed."
             }))
-            redis_client.hset(task_id, 'last_update', timezone.now().isoformat())
         if fixed:
-            redis_client.rpush(f"{task_id}_fixes", json.dumps({
+            fixes.append(json.dumps({
                 "feature_id": feature.get("@id", "-- no @id --"),
                 "path": "features.feature.geometry",
                 "fix": feature['geometry'],
                 "description": "Geometry fixed."
             }))
-            redis_client.hset(task_id, 'last_update', timezone.now().isoformat())
-
-        featureCollection = {
-            "type": "FeatureCollection",
-            "features": [feature]
-        }
 
         while not stopValidation:
             try:
                 # logger.debug(f'Validating feature: {feature}')
-                validator.validate(featureCollection)
+                validator.validate(feature)
                 stopValidation = True
                 # logger.debug(f'Validated feature: {feature}')
             except ValidationError as e:
                 # logger.debug(f'ValidationError: {e}')
+                # Report paths as within the uploaded FeatureCollection, as fix_feature expects
+                root_error = e
+                while root_error.parent is not None:
+                    root_error = root_error.parent
+                root_error.path.extendleft((0, "features"))
                 error_path = " -> ".join([str(p) for p in e.absolute_path])
                 detailed_error = parse_validation_error(e)
                 full_error = f"Validation error at {error_path}: {detailed_error}"
@@ -463,52 +558,46 @@ def validate_feature_batch(self, feature_batch, schema, task_id, namespaces=None
                 })
                 if fixAttempts < settings.VALIDATION_MAXFIXATTEMPTS:
                     try:
-                        featureCollection, fixes = fix_feature({
+                        featureCollection, feature_fixes = fix_feature({
                             "type": "FeatureCollection",
                             "features": [feature]
                         }, e, namespaces)
+                        feature = featureCollection["features"][0]
                         fixAttempts += 1
 
-                        if fixes:
-                            for fix in fixes:  # Iterate over the list of fixes
-                                try:
-                                    redis_client.rpush(f"{task_id}_fixes", json.dumps(fix))
-                                except Exception as e:
-                                    logger.error(f"Failed to push fix to Redis: {e}")
+                        if feature_fixes:
+                            fixes.extend(json.dumps(fix) for fix in feature_fixes)
                         else:
                             # No fixes applied; no point in revalidating
                             logger.error(full_error)
-                            redis_client.rpush(f"{task_id}_errors", json_error)
-                            redis_client.hset(task_id, 'last_update', timezone.now().isoformat())
+                            errors.append(json_error)
                             stopValidation = True
 
                     except Exception as fix_error:
                         logger.error(f"Failed to fix feature: {fix_error}")
                         logger.error(full_error)
-                        redis_client.rpush(f"{task_id}_errors", json_error)
-                        redis_client.hset(task_id, 'last_update', timezone.now().isoformat())
+                        errors.append(json_error)
                         stopValidation = True
                 else:
                     logger.error(full_error)
-                    redis_client.rpush(f"{task_id}_errors", json_error)
-                    redis_client.hset(task_id, 'last_update', timezone.now().isoformat())
+                    errors.append(json_error)
                     stopValidation = True
             except Exception as e:
                 logger.error(f"Unexpected error during validation: {e}")
-                redis_client.rpush(f"{task_id}_errors", str(e))
-                redis_client.hset(task_id, 'last_update', timezone.now().isoformat())
+                errors.append(str(e))
                 stopValidation = True
 
-            if stopValidation:
-                try:
-                    redis_client.hincrby(task_id, 'queued_features', -1)
-                    redis_client.hset(task_id, 'last_update', timezone.now().isoformat())
-                except Exception as e:
-                    logger.error(f"Error updating Redis status: {e}")
+            # Add a delay to each iteration for testing UI
+            time.sleep(settings.VALIDATION_TEST_DELAY)
+
+        processed += 1
 
-            # NB: Cannot keep tally of errors within this task because it may be running multiple times concurrently
-            errors = [error.decode('utf-8') for error in redis_client.lrange(f"{task_id}_errors", 0, -1)]
-            if len(errors) > settings.VALIDATION_MAX_ERRORS:
+        # NB: Cannot keep tally of errors within this task alone because it may be running multiple times
+        # concurrently: flush early once this batch's errors could take the task over the limit
+        if error_count + len(errors) > settings.VALIDATION_MAX_ERRORS:
+            error_count = flush_batch_results(redis_client, task_id, errors, fixes, processed)
+            errors, fixes, processed = [], [], 0
+            if error_count > settings.VALIDATION_MAX_ERRORS:
                 task_status = redis_client.hgetall(f"{task_id}_metadata")
                 task_status = {k.decode('utf-8'): v.decode('utf-8') for k, v in task_status.items()}
 
@@ -531,8 +620,10 @@ def validate_feature_batch(self, feature_batch, schema, task_id, namespaces=None
                     f"More than {settings.VALIDATION_MAX_ERRORS} errors found: aborting validation of feature batch.")
                 return
 
-                # Add a delay to each iteration for testing UI
-            time.sleep(settings.VALIDATION_TEST_DELAY)
+    try:
+        flush_batch_results(redis_client, task_id, errors, fixes, processed)
+    except Exception as e:
+        logger.error(f"Error updating Redis status: {e}")
 
     try:
         task_status = redis_client.hgetall(task_id)
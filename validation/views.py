@@ -7,16 +7,17 @@ import logging
 import subprocess
 import uuid
 import ijson
+import openpyxl
 from django.conf import settings
 from django.http import JsonResponse
 from django.utils import timezone
 from pyld import jsonld
 
-from validation.create_dataset import read_json_features_in_batches
-from validation.tasks import validate_feature_batch, cleanup
+from validation.feature_index import feature_shards
+from validation.tasks import validate_feature_shard, cleanup, register_schema
 import redis
 import sys
-from validation.tLPF_mappings import tLPF_mappings
+from validation.tLPF_mappings import tLPF_mappings, convert_tLPF_chunk
 from shapely import wkt
 from shapely.geometry import mapping as shapely_mapping
 import geojson
@@ -76,6 +77,68 @@ def get_file_info(file_path):
     return info
 
 
+def read_delimited_chunks(file_path, separator, chunk_rows):
+    """DataFrames of up to `chunk_rows` rows, read in a single pass over a CSV/TSV file."""
+    yield from pd.read_csv(file_path, chunksize=chunk_rows, header=0, sep=separator, encoding='utf-8',
+                           skipinitialspace=True, true_values=['true', 'True'], false_values=['false', 'False'],
+                           na_values=['NA', 'NaN'], na_filter=False)
+
+
+def check_spreadsheet_header(file_path, first_row_values):
+    if all(val is None or pd.isna(val) for val in first_row_values):
+        message = f"Empty first row in Excel file '{file_path}'. The first row should contain the LPF field names."
+        logger.error(message)
+        raise ValueError(message)
+    elif not any(isinstance(val, str) and val.strip() for val in first_row_values):
+        message = f"Invalid labels in the first row of Excel file '{file_path}'. The first row should contain the LPF field names."
+        logger.error(message)
+        raise ValueError(message)
+    logger.debug(f"Header: {list(first_row_values)}")
+
+
+def read_xlsx_chunks(file_path, chunk_rows):
+    """
+    DataFrames of up to `chunk_rows` rows from the first sheet of an .xlsx file, streamed
+    with a read-only openpyxl workbook. Cells are given as pd.read_excel would give them
+    with na_filter=False: empty cells as "", and blank rows dropped.
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        first_row = next(rows, None)
+        if first_row is None:
+            raise pd.errors.EmptyDataError(f"No rows in Excel file '{file_path}'.")
+        check_spreadsheet_header(file_path, first_row)
+        columns = [str(val).strip() if val is not None else f"Unnamed: {i}" for i, val in enumerate(first_row)]
+
+        batch = []
+        for row in rows:
+            if all(val is None or val == "" for val in row):
+                continue
+            values = ["" if val is None else val for val in row[:len(columns)]]
+            batch.append(values + [""] * (len(columns) - len(values)))
+            if len(batch) == chunk_rows:
+                yield pd.DataFrame(batch, columns=columns, dtype=object)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns, dtype=object)
+    finally:
+        workbook.close()
+
+
+def read_spreadsheet_chunks(file_path, chunk_rows):
+    """
+    DataFrames of up to `chunk_rows` rows from the first sheet of any other spreadsheet (.ods).
+    The odf reader has no streaming mode, so the sheet is read once and then sliced.
+    """
+    first_row = pd.read_excel(file_path, nrows=1, header=None, sheet_name=0, convert_float=False)
+    check_spreadsheet_header(file_path, first_row.iloc[0].tolist() if not first_row.empty else [])
+    df = pd.read_excel(file_path, header=0, sheet_name=0, convert_float=False, true_values=['true', 'True'],
+                       false_values=['false', 'False'], na_values=['NA', 'NaN'], na_filter=False)
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
 def parse_to_LPF(delimited_filepath, ext):
     try:
         _, ext = os.path.splitext(delimited_filepath)
@@ -103,56 +166,27 @@ def parse_to_LPF(delimited_filepath, ext):
         # Deletion is managed by validation.tasks.clean_tmp_files, triggered by beat_schedule in celery.py
         logger.debug(f"Processing [separator: {separator}] file '{delimited_filepath}'.")
 
-        converters = {key: mapping['converter'] for key, mapping in tLPF_mappings.items()}
         header = ""
 
         def get_df_reader():
             nonlocal header
-            configuration = {
-                'nrows': settings.VALIDATION_CHUNK_ROWS,
-                'header': 0,
-                'true_values': ['true', 'True'],
-                'false_values': ['false', 'False'],
-                'na_values': ['NA', 'NaN'],
-                'na_filter': False
-            }
-            try:  # read_excel does not support chunk-size, so implementation requires line-reading
-                skiprows_set = set()  # Keep track of the rows to skip, excluding the header (0th row)
-                skiprows_start = 1  # Start reading after the header
-
-                while True:
-                    if separator:
-                        if skiprows_start == 1:
-                            logger.debug(f"Reading from CSV (separator: '{separator}').")
-                        df_chunk = pd.read_csv(delimited_filepath, skiprows=lambda x: x != 0 and x in skiprows_set,
-                                               **configuration, sep=separator, encoding='utf-8', skipinitialspace=True)
-                        if header == "":  # Capture the header only once, from the first chunk
-                            header = ";".join(df_chunk.columns.tolist()) or ""
-                            logger.debug(f"Header: '{header}'.")
-                    else:
-                        if skiprows_start == 1:
-                            logger.debug(f"Reading from Excel.")
-                            first_row = pd.read_excel(delimited_filepath, nrows=1, header=None, sheet_name=0, convert_float=False)
-                            first_row_values = first_row.iloc[0].tolist()
-
-                            if all(pd.isna(val) for val in first_row_values):
-                                message = f"Empty first row in Excel file '{delimited_filepath}'. The first row should contain the LPF field names."
-                                logger.error(message)
-                                raise ValueError(message)
-                            elif not any(isinstance(val, str) and val.strip() for val in first_row_values):
-                                message = f"Invalid labels in the first row of Excel file '{delimited_filepath}'. The first row should contain the LPF field names."
-                                logger.error(message)
-                                raise ValueError(message)
-                            else:
-                                logger.debug(f"Header: {first_row_values}")
-
-                        df_chunk = pd.read_excel(delimited_filepath, skiprows=lambda x: x != 0 and x in skiprows_set,
-                                                 **configuration, sheet_name=0, convert_float=False)
-                    skiprows_set.update(range(skiprows_start, skiprows_start + settings.VALIDATION_CHUNK_ROWS))
-                    skiprows_start += settings.VALIDATION_CHUNK_ROWS
-                    if df_chunk.empty:
-                        break
-                    yield df_chunk
+            try:
+                if separator:
+                    logger.debug(f"Reading from CSV (separator: '{separator}').")
+                    chunks = read_delimited_chunks(delimited_filepath, separator, settings.VALIDATION_CHUNK_ROWS)
+                elif ext == '.xlsx':
+                    logger.debug(f"Reading from Excel.")
+                    chunks = read_xlsx_chunks(delimited_filepath, settings.VALIDATION_CHUNK_ROWS)
+                else:
+                    logger.debug(f"Reading from spreadsheet.")
+                    chunks = read_spreadsheet_chunks(delimited_filepath, settings.VALIDATION_CHUNK_ROWS)
+
+                for df_chunk in chunks:
+                    if separator and header == "":  # Capture the header only once, from the first chunk
+                        header = ";".join(df_chunk.columns.tolist()) or ""
+                        logger.debug(f"Header: '{header}'.")
+                    if not df_chunk.empty:
+                        yield df_chunk
 
             except pd.errors.EmptyDataError:
                 logger.warning("Empty chunk encountered; stopping.")
@@ -198,15 +232,11 @@ def parse_to_LPF(delimited_filepath, ext):
 
             for chunk in get_df_reader():
 
-                for _, record in chunk.iterrows():
-                    record = record.to_dict()  # Convert row to a dictionary
+                # Converters are applied per column: NB they cannot be applied during pd.read_excel due to the
+                # unhashable lists they produce
+                for record in convert_tLPF_chunk(chunk):
                     logger.debug(f"Processing record #{feature_count}: '{record}'.")
 
-                    # Apply converters: NB these cannot be applied during pd.read_excel due to the unhashable lists they produce
-                    for key, converter in converters.items():
-                        if key in record:
-                            record[key] = converter(record[key])
-
                     # Create the nested JSON structure
                     lpf_feature = {'type': 'Feature'}
                     for key, mapping in tLPF_mappings.items():
@@ -365,13 +395,14 @@ def validate_file(request, dataset_metadata):
     logger.debug(f"Dataset metadata saved to redis: {dataset_metadata}")
 
     try:
-        # Process each batch of features as a separate Celery task
-        for feature_batch in read_json_features_in_batches(dataset_metadata["jsonld_filepath"]):
-            # The following line could be implemented if the LP Ontology were correct
-            # feature_batch = [jsonld.compact(feature, context) for feature in feature_batch]
-            validate_feature_batch.delay(feature_batch, schema, task_id, namespaces)
-            feature_tally = len(feature_batch)
-            redis_client.hincrby(task_id, 'queued_features', feature_tally)
+        # Workers fetch the schema once by its hash, rather than receiving it with every batch
+        schema_digest = register_schema(redis_client, schema)
+
+        # Process each shard (byte range) of the file as a separate Celery task, which reads its own features
+        # NB: jsonld.compact of each feature could be implemented in the task if the LP Ontology were correct
+        for shard in feature_shards(dataset_metadata["jsonld_filepath"]):
+            redis_client.hincrby(task_id, 'queued_features', shard['count'])
+            validate_feature_shard.delay(shard, schema_digest, task_id, namespaces)
             redis_client.hset(task_id, 'last_update', timezone.now().isoformat())
 
         redis_client.hset(task_id, 'all_queued', 'true')
@@ -173,6 +173,9 @@ CELERY_TASK_EAGER_PROPAGATES = True
 CELERY_RESULT_EXTENDED = True
 CELERY_RESULT_EXPIRES = None
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+# align tasks are acks_late so a dead worker's task is redelivered and resumes from its checkpoint;
+# the visibility timeout must outlast the longest task or it is redelivered while still running
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 43200}
 
 CAPTCHA_NOISE_FUNCTIONS = (
     'captcha.helpers.noise_arcs',
@@ -504,6 +507,24 @@ DOI_ENCODED_CREDENTIALS = base64.b64encode(f"{DOI_USER_ID}:{DOI_PASSWORD}".encod
 # Page-specific settings
 DATASETS_PLACES_LIMIT = 100000
 
+# Pre-serialized mapdata payloads (utils.mapdata_artifacts), one directory per dataset/collection
+MAPDATA_ARTIFACT_DIR = os.path.join(BASE_DIR, 'cache', 'mapdata')
+
+# Pre-built download zips of public datasets (utils.download_artifacts), one directory per dataset
+DOWNLOAD_ARTIFACT_DIR = os.path.join(MEDIA_ROOT, 'downloads', 'datasets')
+DOWNLOAD_ARTIFACT_DELAY = 10  # minutes after a change before a dataset's downloads are rebuilt
+
+# Serialized places for /api/place/<ids>/ popups (api.place_cache), in Redis
+PLACE_DETAIL_CACHE = True
+PLACE_DETAIL_CACHE_TIMEOUT = 60 * 60  # seconds; bounds staleness from edits the mapdata signals don't see
+
+# Remote dataset ingestion (ingestion.tasks)
+INGESTION_BATCH_SIZE = 5000  # items per set-based write; 1 writes each item separately
+INGESTION_CACHE_DIR = os.path.join(BASE_DIR, 'remote_datasets_downloads')  # source files, by content hash
+INGESTION_CACHE_MAX_BYTES = 100 * 1024 ** 3  # least recently used downloads are evicted beyond this
+INGESTION_CACHE_MAX_AGE = 2678400  # seconds (31 days) a download may go unused before eviction
+INGESTION_POSTPROCESS_CHUNK = 50000  # ids per UPDATE in NPR/Attestation post-processing
+
 # Remote Dataset Configurations
 REMOTE_DATASET_CONFIGS = [
     {  # 2024: 37k+ places
@@ -661,8 +682,21 @@ VALIDATION_SUPPORTED_TYPES = [
 ]
 VALIDATION_CHUNK_ROWS = 500
 VALIDATION_BATCH_MEMORY_LIMIT = 1 * 1024 * 1024  # 1 MB
+VALIDATION_SHARD_BYTES = 2 * 1024 * 1024  # bytes of source JSON per validation task
 VALIDATION_MAXFIXATTEMPTS = 50  # Maximum number of errors to try to fix on each feature
 VALIDATION_MAX_ERRORS = 100  # Stop validation of dataset if this number of unfixed errors is reached (checked only on completion of each batch, so may exceed this number)
 VALIDATION_TIMEOUT = 3600  # seconds, after which tasks are revoked and records are removed from redis
 VALIDATION_TEST_DELAY = 0  # seconds to pause after each JSON schema validation attempt
 VALIDATION_INTEGRITY_RETRIES = 7
+DELIM_INSERT_CHUNK_ROWS = 5000  # rows per COPY chunk in datasets.insert.ds_insert_delim_bulk
+
+# Reconciliation (align_idx, align_wdlocal)
+RECON_BATCHED = True  # prefetch places in chunks and send ES queries through _msearch
+RECON_CHUNK_SIZE = 500  # places per prefetch/lookup chunk
+RECON_MSEARCH_BATCH = 50  # searches per _msearch request
+RECON_MSEARCH_WORKERS = 4  # maximum concurrent _msearch requests
+RECON_PARTITIONS = 1  # >1 splits a task into place-id range subtasks run in parallel
+
+# Accession review decisions (datasets.accession)
+INDEX_DECISION_BATCH_SIZE = 200  # queued decisions per _bulk request
+INDEX_DECISION_MAX_ATTEMPTS = 3  # after which a decision is marked failed
@@ -75,7 +75,12 @@ $(function() {
 			},
 			datatype: 'json',
 			success: function(response) {
-				if ($("#ds_downloads").length) {
+				if (response.url) {
+					// pre-built download of a public dataset
+					window.location.href = response.url;
+					return;
+				}
+				if (response.task_id && $("#ds_downloads").length) {
 					let task_id = response.task_id
 					var progressUrl = "/celery-progress/" + task_id + "/";
 					CeleryProgressBar.initProgressBar(progressUrl, {
@@ -212,6 +212,12 @@ export function initDownloadLinks() {
             },
             datatype: 'json',
             success: function (response) {
+                if (response.url) {
+                    // pre-built download of a public dataset
+                    $('#progress-message').text('download complete!');
+                    window.location.href = response.url;
+                    return;
+                }
                 let taskId = response.task_id;
                 console.log('.a-dl response:', response);
                 console.log('.a-dl response taskId:', taskId);